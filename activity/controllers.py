@@ -479,7 +479,8 @@ def notice_friend_endorsements_send(
         recipient_voter_we_vote_id='',
         invitation_message='',
         activity_tidbit_we_vote_id='',
-        position_name_list=[]):
+        position_name_list=[],
+        send_now=True):
     """
     We are sending an email to the speaker's friends who are
     subscribed to NOTIFICATION_FRIEND_OPINIONS_YOUR_BALLOT or NOTIFICATION_FRIEND_OPINIONS_OTHER_REGIONS
@@ -488,12 +489,15 @@ def notice_friend_endorsements_send(
     :param invitation_message:
     :param activity_tidbit_we_vote_id:
     :param position_name_list:
+    :param send_now: If False, only schedule the email, and leave sending to EmailManager.send_scheduled_email_list
     :return:
     """
     from email_outbound.controllers import schedule_email_with_email_outbound_description
-    from email_outbound.models import EmailManager, NOTICE_FRIEND_ENDORSEMENTS_TEMPLATE
+    from email_outbound.models import EmailManager, NOTICE_FRIEND_ENDORSEMENTS_TEMPLATE, TO_BE_PROCESSED, \
+        WAITING_FOR_BULK_SEND
     status = ""
     success = True
+    email_scheduled_id = 0
 
     voter_manager = VoterManager()
     voter_results = voter_manager.retrieve_voter_by_we_vote_id(speaker_voter_we_vote_id)
@@ -647,20 +651,23 @@ def notice_friend_endorsements_send(
         success = outbound_results['success']
         if outbound_results['email_outbound_description_saved']:
             email_outbound_description = outbound_results['email_outbound_description']
-            schedule_results = schedule_email_with_email_outbound_description(email_outbound_description)
+            schedule_results = schedule_email_with_email_outbound_description(
+                email_outbound_description, send_status=TO_BE_PROCESSED if send_now else WAITING_FOR_BULK_SEND)
             status += schedule_results['status'] + " "
             success = schedule_results['success']
             if schedule_results['email_scheduled_saved']:
-                # messages_to_send.append(schedule_results['email_scheduled_id'])
-                email_scheduled = schedule_results['email_scheduled']
-                send_results = email_manager.send_scheduled_email(email_scheduled)
-                email_scheduled_sent = send_results['email_scheduled_sent']
-                status += send_results['status']
-                success = send_results['success']
+                email_scheduled_id = schedule_results['email_scheduled_id']
+                if send_now:
+                    email_scheduled = schedule_results['email_scheduled']
+                    send_results = email_manager.send_scheduled_email(email_scheduled)
+                    email_scheduled_sent = send_results['email_scheduled_sent']
+                    status += send_results['status']
+                    success = send_results['success']
 
     results = {
         'success':                              success,
         'status':                               status,
+        'email_scheduled_id':                   email_scheduled_id,
     }
     return results
 
@@ -803,18 +810,22 @@ def notice_voter_daily_summary_send(  # NOTICE_VOTER_DAILY_SUMMARY
         recipient_voter_we_vote_id='',
         friend_activity_dict_list=[],
         introduction_line='',
-        subject=''):
+        subject='',
+        send_now=True):
     """
 
     :param recipient_voter_we_vote_id:
     :param friend_activity_dict_list:
     :param subject:
     :param introduction_line:
+    :param send_now: If False, only schedule the email, and leave sending to EmailManager.send_scheduled_email_list
     :return:
     """
     from email_outbound.controllers import schedule_email_with_email_outbound_description
-    from email_outbound.models import EmailManager, NOTICE_VOTER_DAILY_SUMMARY_TEMPLATE
+    from email_outbound.models import EmailManager, NOTICE_VOTER_DAILY_SUMMARY_TEMPLATE, TO_BE_PROCESSED, \
+        WAITING_FOR_BULK_SEND
     status = ""
+    email_scheduled_id = 0
 
     voter_manager = VoterManager()
     from organization.controllers import transform_web_app_url
@@ -920,20 +931,23 @@ def notice_voter_daily_summary_send(  # NOTICE_VOTER_DAILY_SUMMARY
         success = outbound_results['success']
         if outbound_results['email_outbound_description_saved']:
             email_outbound_description = outbound_results['email_outbound_description']
-            schedule_results = schedule_email_with_email_outbound_description(email_outbound_description)
+            schedule_results = schedule_email_with_email_outbound_description(
+                email_outbound_description, send_status=TO_BE_PROCESSED if send_now else WAITING_FOR_BULK_SEND)
             status += schedule_results['status'] + " "
             success = schedule_results['success']
             if schedule_results['email_scheduled_saved']:
-                # messages_to_send.append(schedule_results['email_scheduled_id'])
-                email_scheduled = schedule_results['email_scheduled']
-                send_results = email_manager.send_scheduled_email(email_scheduled)
-                email_scheduled_sent = send_results['email_scheduled_sent']
-                status += send_results['status']
-                success = send_results['success']
+                email_scheduled_id = schedule_results['email_scheduled_id']
+                if send_now:
+                    email_scheduled = schedule_results['email_scheduled']
+                    send_results = email_manager.send_scheduled_email(email_scheduled)
+                    email_scheduled_sent = send_results['email_scheduled_sent']
+                    status += send_results['status']
+                    success = send_results['success']
 
     results = {
         'success':                              success,
         'status':                               status,
+        'email_scheduled_id':                   email_scheduled_id,
     }
     return results
 
@@ -1054,6 +1068,10 @@ def process_activity_notice_seeds_triggered_by_batch_process():
             continue_retrieving_to_be_added_to_voter_summary = False
 
     # Send email notifications (notices_to_be_scheduled=True)
+    #  Daily summaries are scheduled one seed at a time, then sent in groups over one connection to the email server
+    from email_outbound.models import EMAIL_BULK_SEND_CHUNK_SIZE, EmailManager
+    email_manager = EmailManager()
+    daily_summary_email_scheduled_id_list = []
     continue_retrieving_notices_to_be_scheduled = True
     activity_notice_seed_id_already_reviewed_list = []  # Reset
     safety_valve_count = 0
@@ -1067,13 +1085,31 @@ def process_activity_notice_seeds_triggered_by_batch_process():
             activity_notice_seed = results['activity_notice_seed']
             activity_notice_seed_id_already_reviewed_list.append(activity_notice_seed.id)
             # activity_notice_seed_count += 1
-            schedule_results = schedule_activity_notices_from_seed(activity_notice_seed)
+            schedule_results = schedule_activity_notices_from_seed(
+                activity_notice_seed, email_scheduled_id_list=daily_summary_email_scheduled_id_list)
             # activity_notice_seed.activity_notices_scheduled = True  # Marked in function immediately above
             if not schedule_results['success']:
                 status += schedule_results['status']
             # activity_notice_count += create_results['activity_notice_count']
         else:
             continue_retrieving_notices_to_be_scheduled = False
+        if len(daily_summary_email_scheduled_id_list) >= EMAIL_BULK_SEND_CHUNK_SIZE or \
+                not continue_retrieving_notices_to_be_scheduled:
+            send_list_results = email_manager.send_scheduled_email_list(daily_summary_email_scheduled_id_list)
+            if not send_list_results['success']:
+                status += send_list_results['status']
+            daily_summary_email_scheduled_id_list = []
+
+    if len(daily_summary_email_scheduled_id_list):
+        # We stopped on time or the safety valve, before the last group was sent
+        send_list_results = email_manager.send_scheduled_email_list(daily_summary_email_scheduled_id_list)
+        if not send_list_results['success']:
+            status += send_list_results['status']
+
+    # Send what earlier runs scheduled but did not send (ex/ the process stopped, or the email server was down)
+    drain_results = email_manager.send_scheduled_emails_waiting_for_bulk_send()
+    if not drain_results['success']:
+        status += drain_results['status']
 
     results = {
         'success':                      success,
@@ -1416,11 +1452,19 @@ def update_or_create_voter_daily_summary_seeds_from_seed(activity_notice_seed):
     return results
 
 
-def schedule_activity_notices_from_seed(activity_notice_seed):
+def schedule_activity_notices_from_seed(activity_notice_seed, email_scheduled_id_list=None):
+    """
+    :param activity_notice_seed:
+    :param email_scheduled_id_list: If passed in, the daily summary email is only scheduled, and its EmailScheduled id
+      is appended here so the caller can send many of them together with EmailManager.send_scheduled_email_list
+    :return:
+    """
+    from email_outbound.models import EmailManager
     status = ''
     success = True
     activity_notice_count = 0
     activity_manager = ActivityManager()
+    email_manager = EmailManager()
 
     # This is a switch with different branches for NOTICE_FRIEND_ENDORSEMENTS_SEED
     #  and NOTICE_VOTER_DAILY_SUMMARY_SEED
@@ -1453,13 +1497,17 @@ def schedule_activity_notices_from_seed(activity_notice_seed):
                     position_name_list += position_name_list_for_public
 
                 activity_notice_list = results['activity_notice_list']
+                friend_endorsements_email_scheduled_id_list = []
                 for activity_notice in activity_notice_list:
                     send_results = notice_friend_endorsements_send(
                         speaker_voter_we_vote_id=activity_notice.speaker_voter_we_vote_id,
                         recipient_voter_we_vote_id=activity_notice.recipient_voter_we_vote_id,
                         activity_tidbit_we_vote_id=activity_notice_seed.we_vote_id,
-                        position_name_list=position_name_list)
+                        position_name_list=position_name_list,
+                        send_now=False)
                     activity_notice_id_already_reviewed_list.append(activity_notice.id)
+                    if positive_value_exists(send_results.get('email_scheduled_id')):
+                        friend_endorsements_email_scheduled_id_list.append(send_results['email_scheduled_id'])
                     if send_results['success']:
                         try:
                             activity_notice.scheduled_to_email = True
@@ -1474,6 +1522,10 @@ def schedule_activity_notices_from_seed(activity_notice_seed):
                             status += "FAILED_SAVING_ACTIVITY_NOTICE: " + str(e) + " "
                     else:
                         status += send_results['status']
+                # Send this group of up to 100 friends over one connection to the email server
+                send_list_results = email_manager.send_scheduled_email_list(friend_endorsements_email_scheduled_id_list)
+                if not send_list_results['success']:
+                    status += send_list_results['status']
             else:
                 continue_retrieving = False
         try:
@@ -1496,7 +1548,10 @@ def schedule_activity_notices_from_seed(activity_notice_seed):
             recipient_voter_we_vote_id=activity_notice_seed.recipient_voter_we_vote_id,
             friend_activity_dict_list=assemble_results['friend_activity_dict_list'],
             introduction_line=assemble_results['introduction_line'],
-            subject=assemble_results['subject'])
+            subject=assemble_results['subject'],
+            send_now=email_scheduled_id_list is None)
+        if email_scheduled_id_list is not None and positive_value_exists(send_results.get('email_scheduled_id')):
+            email_scheduled_id_list.append(send_results['email_scheduled_id'])
         if send_results['success']:
             try:
                 activity_notice_seed.activity_notices_scheduled = True
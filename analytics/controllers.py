@@ -6,7 +6,7 @@ from .models import AnalyticsAction, AnalyticsCountManager, AnalyticsManager, \
     ACTIONS_THAT_REQUIRE_ORGANIZATION_IDS
 from candidate.models import CandidateManager
 from config.base import get_environment_variable
-from datetime import date, datetime, timedelta
+from datetime import datetime, timedelta
 from django.db.models import Q
 from django.utils.timezone import localtime, now
 from exception.models import print_to_log
@@ -269,31 +269,23 @@ def process_one_analytics_batch_process_augment_with_first_visit(batch_process,
         except Exception as e:
             status += "NUMBER_OF_ROWS_BEING_REVIEWED_NOT_SAVED-FIRST_VISIT " + str(e) + " "
 
-    for voter_we_vote_id in voter_analytics_list:
-        analysis_success = True
-        try:
-            first_visit_query = AnalyticsAction.objects.using('analytics').all()
-            first_visit_query = first_visit_query.order_by("id")  # order by oldest first
-            first_visit_query = first_visit_query.filter(date_as_integer=batch_process.analytics_date_as_integer)
-            first_visit_query = first_visit_query.filter(voter_we_vote_id__iexact=voter_we_vote_id)
-            analytics_action = first_visit_query.first()
-
-            analytics_action.first_visit_today = True
-            analytics_action.save()
-            first_visit_today_count += 1
-        except Exception as e:
-            status += "FAILED_SAVING_ANALYTICS_ACTION " + str(e) + " "
-            analysis_success = False
-        if analysis_success:
-            defaults = {
-                'analytics_date_as_integer': batch_process.analytics_date_as_integer,
-                'voter_we_vote_id': voter_we_vote_id,
-                'kind_of_process': AUGMENT_ANALYTICS_ACTION_WITH_FIRST_VISIT,
-            }
-            results = analytics_manager.save_analytics_processed(
+    voter_analytics_list = list(voter_analytics_list)
+    if len(voter_analytics_list):
+        # One UPDATE marks the first action of the day for every voter in this chunk
+        first_visit_results = analytics_manager.mark_first_visit_today_in_bulk(
+            batch_process.analytics_date_as_integer, voter_we_vote_id_list=voter_analytics_list)
+        status += first_visit_results['status']
+        if first_visit_results['success']:
+            # Count every voter whose first visit is now marked, including ones marked by an earlier try,
+            #  not just the rows this UPDATE changed
+            first_visit_today_count = len(set(voter_we_vote_id.lower() for voter_we_vote_id in voter_analytics_list
+                                              if positive_value_exists(voter_we_vote_id)))
+            results = analytics_manager.save_analytics_processed_list(
                 analytics_date_as_integer=batch_process.analytics_date_as_integer,
-                voter_we_vote_id=voter_we_vote_id,
-                defaults=defaults)
+                voter_we_vote_id_list=voter_analytics_list,
+                kind_of_process=AUGMENT_ANALYTICS_ACTION_WITH_FIRST_VISIT)
+            if not results['success']:
+                status += "FAILED_SAVING_ANALYTICS_PROCESSED-FIRST_VISIT " + results['status']
 
     try:
         batch_process_analytics_chunk.number_of_rows_successfully_reviewed = first_visit_today_count
@@ -359,7 +351,7 @@ def augment_analytics_action_with_election_id_one_voter(
         voter_history_query = AnalyticsAction.objects.using('analytics').all()
         voter_history_query = voter_history_query.filter(voter_we_vote_id__iexact=voter_we_vote_id)
         voter_history_query = voter_history_query.filter(date_as_integer=analytics_date_as_integer)
-        voter_history_query = voter_history_query.order_by("id")  # order by oldest first
+        voter_history_query = voter_history_query.order_by("exact_time", "id")  # order by oldest first
         voter_history_list = list(voter_history_query)
     except Exception as e:
         status += "COULD_NOT_RETRIEVE_ANALYTICS_FOR_VOTER-ONE_VOTER: " + str(e) + " "
@@ -977,26 +969,38 @@ def calculate_organization_election_metrics(google_civic_election_id, organizati
     return results
 
 
-def calculate_organization_daily_metrics(organization_we_vote_id, limit_to_one_date_as_integer):
+def calculate_organization_daily_metrics(organization_we_vote_id, limit_to_one_date_as_integer,
+                                         daily_metrics_rollup=None):
+    """
+    :param organization_we_vote_id:
+    :param limit_to_one_date_as_integer:
+    :param daily_metrics_rollup: results of AnalyticsCountManager.retrieve_daily_metrics_rollup for this day,
+      when calculating every organization at once (see save_organization_daily_metrics_for_all_organizations)
+    :return:
+    """
     status = ""
     success = False
     google_civic_election_id_zero = 0
     limit_to_authenticated = True
 
     analytics_count_manager = AnalyticsCountManager()
-    follow_count_manager = FollowMetricsManager()
-    position_metrics_manager = PositionMetricsManager()
-    follow_organization_list = FollowOrganizationList()
 
-    date_as_integer = convert_to_int(date)
-    visitors_total = analytics_count_manager.fetch_visitors(google_civic_election_id_zero, organization_we_vote_id)
-    authenticated_visitors_total = analytics_count_manager.fetch_visitors(
-        google_civic_election_id_zero, organization_we_vote_id, 0, 0, limit_to_authenticated)
+    date_as_integer = convert_to_int(limit_to_one_date_as_integer)
+    if daily_metrics_rollup is not None:
+        organization_counts = daily_metrics_rollup['organization_counts'].get(organization_we_vote_id.lower(), {})
+        visitors_total = organization_counts.get('visitors_total', 0)
+        authenticated_visitors_total = organization_counts.get('authenticated_visitors_total', 0)
+        visitors_today = organization_counts.get('visitors_today', 0)
+        authenticated_visitors_today = organization_counts.get('authenticated_visitors_today', 0)
+    else:
+        visitors_total = analytics_count_manager.fetch_visitors(google_civic_election_id_zero, organization_we_vote_id)
+        authenticated_visitors_total = analytics_count_manager.fetch_visitors(
+            google_civic_election_id_zero, organization_we_vote_id, 0, 0, limit_to_authenticated)
 
-    visitors_today = analytics_count_manager.fetch_visitors(
-        google_civic_election_id_zero, organization_we_vote_id, limit_to_one_date_as_integer)
-    authenticated_visitors_today = analytics_count_manager.fetch_visitors(
-        google_civic_election_id_zero, organization_we_vote_id, limit_to_one_date_as_integer, 0, limit_to_authenticated)
+        visitors_today = analytics_count_manager.fetch_visitors(
+            google_civic_election_id_zero, organization_we_vote_id, date_as_integer)
+        authenticated_visitors_today = analytics_count_manager.fetch_visitors(
+            google_civic_election_id_zero, organization_we_vote_id, date_as_integer, 0, limit_to_authenticated)
 
     new_visitors_today = None
     voter_guide_entrants_today = None
@@ -1037,42 +1041,47 @@ def calculate_organization_daily_metrics(organization_we_vote_id, limit_to_one_d
     return results
 
 
-def calculate_sitewide_daily_metrics(limit_to_one_date_as_integer):
+def calculate_sitewide_daily_metrics(limit_to_one_date_as_integer, daily_metrics_rollup=None):
+    """
+    :param limit_to_one_date_as_integer:
+    :param daily_metrics_rollup: results of AnalyticsCountManager.retrieve_daily_metrics_rollup for this day,
+      so the caller can reuse it for OrganizationDailyMetrics. Retrieved here if not passed in.
+    :return:
+    """
     status = ""
     success = False
 
     analytics_count_manager = AnalyticsCountManager()
     follow_metrics_manager = FollowMetricsManager()
 
-    google_civic_election_id_zero = 0
-    organization_we_vote_id_empty = ""
     voter_we_vote_id_empty = ""
-    limit_to_authenticated = True
     date_as_integer_zero = 0
     limit_to_one_date_as_integer = convert_to_int(limit_to_one_date_as_integer)
     count_through_this_date_as_integer = limit_to_one_date_as_integer
 
-    visitors_total = analytics_count_manager.fetch_visitors(
-        google_civic_election_id_zero, organization_we_vote_id_empty, date_as_integer_zero,
-        count_through_this_date_as_integer)
-    visitors_today = analytics_count_manager.fetch_visitors(
-        google_civic_election_id_zero, organization_we_vote_id_empty, limit_to_one_date_as_integer)
+    if daily_metrics_rollup is None:
+        daily_metrics_rollup = analytics_count_manager.retrieve_daily_metrics_rollup(limit_to_one_date_as_integer)
+        status += daily_metrics_rollup['status']
+    if not daily_metrics_rollup['success']:
+        results = {
+            'status':                           status,
+            'success':                          False,
+            'sitewide_daily_metrics_values':    {},
+        }
+        return results
+    sitewide_counts = daily_metrics_rollup['sitewide_counts']
+
+    visitors_total = sitewide_counts['visitors_total']
+    visitors_today = sitewide_counts['visitors_today']
     new_visitors_today = None
     voter_guide_entrants_today = None
     welcome_page_entrants_today = None
     friend_entrants_today = None
-    authenticated_visitors_total = analytics_count_manager.fetch_visitors(
-        google_civic_election_id_zero, organization_we_vote_id_empty,
-        date_as_integer_zero, count_through_this_date_as_integer, limit_to_authenticated)
-    authenticated_visitors_today = analytics_count_manager.fetch_visitors(
-        google_civic_election_id_zero, organization_we_vote_id_empty,
-        limit_to_one_date_as_integer, date_as_integer_zero, limit_to_authenticated)
-    ballot_views_today = analytics_count_manager.fetch_ballot_views(
-        google_civic_election_id_zero, limit_to_one_date_as_integer)
-    voter_guides_viewed_total = analytics_count_manager.fetch_voter_guides_viewed(
-        google_civic_election_id_zero, date_as_integer_zero, count_through_this_date_as_integer)
-    voter_guides_viewed_today = analytics_count_manager.fetch_voter_guides_viewed(
-        google_civic_election_id_zero, limit_to_one_date_as_integer)
+    authenticated_visitors_total = sitewide_counts['authenticated_visitors_total']
+    authenticated_visitors_today = sitewide_counts['authenticated_visitors_today']
+    ballot_views_today = sitewide_counts['ballot_views_today']
+    voter_guides_viewed_total = sitewide_counts['voter_guides_viewed_total']
+    voter_guides_viewed_today = sitewide_counts['voter_guides_viewed_today']
 
     issues_followed_total = follow_metrics_manager.fetch_issues_followed(
         voter_we_vote_id_empty, date_as_integer_zero, count_through_this_date_as_integer)
@@ -1517,6 +1526,47 @@ def save_organization_daily_metrics(organization_we_vote_id, date):
     return results
 
 
+def save_organization_daily_metrics_for_all_organizations(date_as_integer, daily_metrics_rollup=None):
+    """
+    OrganizationDailyMetrics for every organization with voter guide visits through this day, calculated from one
+    pass over AnalyticsAction and saved in bulk.
+    :param date_as_integer:
+    :param daily_metrics_rollup: results of AnalyticsCountManager.retrieve_daily_metrics_rollup, if already retrieved
+    :return:
+    """
+    status = ""
+    success = False
+    metrics_saved_count = 0
+    date_as_integer = convert_to_int(date_as_integer)
+
+    if daily_metrics_rollup is None:
+        analytics_count_manager = AnalyticsCountManager()
+        daily_metrics_rollup = analytics_count_manager.retrieve_daily_metrics_rollup(date_as_integer)
+        status += daily_metrics_rollup['status']
+    if daily_metrics_rollup['success']:
+        organization_daily_metrics_list = []
+        for organization_counts in daily_metrics_rollup['organization_counts'].values():
+            results = calculate_organization_daily_metrics(
+                organization_counts['organization_we_vote_id'], date_as_integer,
+                daily_metrics_rollup=daily_metrics_rollup)
+            if results['success']:
+                organization_daily_metrics_list.append(results['organization_daily_metrics_values'])
+
+        analytics_manager = AnalyticsManager()
+        update_results = analytics_manager.save_organization_daily_metrics_values_for_one_date(
+            date_as_integer, organization_daily_metrics_list)
+        status += update_results['status']
+        success = update_results['success']
+        metrics_saved_count = update_results['metrics_created_count'] + update_results['metrics_updated_count']
+
+    results = {
+        'status':               status,
+        'success':              success,
+        'metrics_saved_count':  metrics_saved_count,
+    }
+    return results
+
+
 def save_organization_election_metrics(google_civic_election_id, organization_we_vote_id):
     status = "SAVE_ORGANIZATION_ELECTION_METRICS, " \
              "google_civic_election_id: " + str(google_civic_election_id) + \
@@ -0,0 +1,66 @@
+import time
+
+from analytics.controllers import calculate_organization_daily_metrics
+from analytics.models import ACTION_BALLOT_VISIT, ACTION_VOTER_GUIDE_VISIT, AnalyticsAction, AnalyticsCountManager
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+
+BENCHMARK_DATE_AS_INTEGER = 20000101  # Far from any real analytics data
+
+
+class Command(BaseCommand):
+    help = 'Compares counting daily metrics for every organization one fetch_visitors query at a time with ' \
+           'retrieve_daily_metrics_rollup, on synthetic AnalyticsAction rows. Everything written is rolled back.'
+
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voters', type=int, default=2000, help='Number of voters with actions')
+        parser.add_argument('--organizations', type=int, default=200, help='Number of organizations visited')
+        parser.add_argument('--actions', type=int, default=5, help='Number of actions per voter')
+
+    def handle(self, *args, **options):
+        number_of_voters = options['voters']
+        number_of_organizations = options['organizations']
+        organization_we_vote_id_list = ['wvbenchorg' + str(index) for index in range(number_of_organizations)]
+        analytics_count_manager = AnalyticsCountManager()
+
+        def one_query_at_a_time():
+            for organization_we_vote_id in organization_we_vote_id_list:
+                calculate_organization_daily_metrics(organization_we_vote_id, BENCHMARK_DATE_AS_INTEGER)
+
+        def rollup():
+            daily_metrics_rollup = analytics_count_manager.retrieve_daily_metrics_rollup(BENCHMARK_DATE_AS_INTEGER)
+            for organization_we_vote_id in organization_we_vote_id_list:
+                calculate_organization_daily_metrics(
+                    organization_we_vote_id, BENCHMARK_DATE_AS_INTEGER, daily_metrics_rollup=daily_metrics_rollup)
+
+        self.stdout.write('{voters} voters x {actions} actions, {organizations} organizations'.format(
+            voters=number_of_voters, actions=options['actions'], organizations=number_of_organizations))
+        for name, count_metrics in [('one at a time', one_query_at_a_time), ('rollup', rollup)]:
+            try:
+                with transaction.atomic(using='analytics'):
+                    AnalyticsAction.objects.using('analytics').bulk_create([
+                        AnalyticsAction(
+                            action_constant=ACTION_VOTER_GUIDE_VISIT if action_index % 2 else ACTION_BALLOT_VISIT,
+                            date_as_integer=BENCHMARK_DATE_AS_INTEGER,
+                            is_signed_in=voter_index % 3 == 0,
+                            organization_we_vote_id=organization_we_vote_id_list[
+                                (voter_index + action_index) % number_of_organizations],
+                            voter_we_vote_id='wvbenchvoter' + str(voter_index))
+                        for action_index in range(options['actions'])
+                        for voter_index in range(number_of_voters)], batch_size=5000)
+                    with CaptureQueriesContext(connections['analytics']) as captured_queries:
+                        start = time.perf_counter()
+                        count_metrics()
+                        seconds = time.perf_counter() - start
+                    self.stdout.write('{name:>13}: {seconds:8.3f} seconds, {queries:7d} queries'.format(
+                        name=name, seconds=seconds, queries=len(captured_queries)))
+                    raise RollbackBenchmark()
+            except RollbackBenchmark:
+                pass
+
+
+class RollbackBenchmark(Exception):
+    pass
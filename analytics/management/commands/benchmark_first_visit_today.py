@@ -0,0 +1,72 @@
+import time
+
+from analytics.models import AnalyticsAction, AnalyticsManager
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+
+BENCHMARK_DATE_AS_INTEGER = 20000101  # Far from any real analytics data
+
+
+class Command(BaseCommand):
+    help = 'Compares marking first_visit_today one voter and day at a time with mark_first_visit_today_in_bulk, ' \
+           'on synthetic AnalyticsAction rows. Everything written is rolled back.'
+
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voters', type=int, default=2000, help='Number of voters with actions each day')
+        parser.add_argument('--actions', type=int, default=5, help='Number of actions per voter per day')
+        parser.add_argument('--days', type=int, default=3, help='Number of days')
+
+    def handle(self, *args, **options):
+        number_of_voters = options['voters']
+        number_of_days = options['days']
+        through_date_as_integer = BENCHMARK_DATE_AS_INTEGER + number_of_days - 1
+        analytics_manager = AnalyticsManager()
+
+        def one_at_a_time():
+            # The loop mark_first_visit_today_in_bulk replaced
+            day_list = AnalyticsAction.objects.using('analytics') \
+                .filter(date_as_integer__gte=BENCHMARK_DATE_AS_INTEGER,
+                        date_as_integer__lte=through_date_as_integer) \
+                .values_list('date_as_integer', flat=True).distinct()
+            for one_date_as_integer in list(day_list):
+                voter_list = AnalyticsAction.objects.using('analytics') \
+                    .filter(date_as_integer=one_date_as_integer) \
+                    .values_list('voter_we_vote_id', flat=True).distinct()
+                for voter_we_vote_id in list(voter_list):
+                    analytics_action = AnalyticsAction.objects.using('analytics').order_by('id') \
+                        .filter(date_as_integer=one_date_as_integer, voter_we_vote_id__iexact=voter_we_vote_id) \
+                        .first()
+                    if not analytics_action.first_visit_today:
+                        analytics_action.first_visit_today = True
+                        analytics_action.save()
+
+        def set_based():
+            analytics_manager.mark_first_visit_today_in_bulk(BENCHMARK_DATE_AS_INTEGER, through_date_as_integer)
+
+        self.stdout.write('{voters} voters x {actions} actions x {days} days'.format(
+            voters=number_of_voters, actions=options['actions'], days=number_of_days))
+        for name, mark_first_visits in [('one at a time', one_at_a_time), ('set based', set_based)]:
+            try:
+                with transaction.atomic(using='analytics'):
+                    AnalyticsAction.objects.using('analytics').bulk_create([
+                        AnalyticsAction(action_constant=1, date_as_integer=BENCHMARK_DATE_AS_INTEGER + day,
+                                        voter_we_vote_id='wvbenchvoter' + str(voter_index))
+                        for day in range(number_of_days)
+                        for action_index in range(options['actions'])
+                        for voter_index in range(number_of_voters)], batch_size=5000)
+                    with CaptureQueriesContext(connections['analytics']) as captured_queries:
+                        start = time.perf_counter()
+                        mark_first_visits()
+                        seconds = time.perf_counter() - start
+                    self.stdout.write('{name:>13}: {seconds:8.3f} seconds, {queries:7d} queries'.format(
+                        name=name, seconds=seconds, queries=len(captured_queries)))
+                    raise RollbackBenchmark()
+            except RollbackBenchmark:
+                pass
+
+
+class RollbackBenchmark(Exception):
+    pass
@@ -2,14 +2,24 @@
 # Brought to you by We Vote. Be good.
 # -*- coding: UTF-8 -*-
 
-from django.db import models
-from django.db.models import Q
+import atexit
+from django.db import close_old_connections, connections, models, transaction
+from django.db.models import Count, Max, Min, Q
+from django.db.models.functions import Lower
 from django.utils.timezone import localtime, now
-from datetime import timedelta
+from datetime import datetime, timedelta
 from election.models import Election
 from exception.models import print_to_log
 from follow.models import FollowOrganizationList
+import json
 from organization.models import Organization
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from config.base import get_environment_variable_default
 import wevote_functions.admin
 from wevote_functions.functions import convert_date_as_integer_to_date, convert_date_to_date_as_integer, \
     convert_to_int, positive_value_exists
@@ -102,6 +112,21 @@ ACTIONS_THAT_REQUIRE_ORGANIZATION_IDS = \
 
 logger = wevote_functions.admin.get_logger(__name__)
 
+# AnalyticsAction rows are buffered in each worker and written with bulk_create by a background thread, instead of
+#  one INSERT inside the voter's request. Under test they are written right away.
+ANALYTICS_ACTION_BUFFERING_ON = 'test' not in sys.argv and \
+    positive_value_exists(get_environment_variable_default('ANALYTICS_ACTION_BUFFERING_ON', '1'))
+ANALYTICS_ACTION_BUFFER_FLUSH_SIZE = 500  # Wake the flusher when this many rows are waiting
+ANALYTICS_ACTION_BUFFER_FLUSH_SECONDS = 5  # ...or after this long, whichever comes first
+ANALYTICS_ACTION_BUFFER_MAX_SIZE = 20000  # Past this, the request adding a row waits for a flush (back-pressure)
+# Rows are also appended to a spool file, so rows a worker never flushed (killed, or analytics db down) are replayed
+#  by another worker. Set to an empty string to buffer in memory only.
+ANALYTICS_ACTION_SPOOL_DIRECTORY = get_environment_variable_default(
+    'ANALYTICS_ACTION_SPOOL_DIRECTORY', os.path.join(tempfile.gettempdir(), 'wevote_analytics_action_spool'))
+ANALYTICS_ACTION_SPOOL_FILE_PREFIX = 'analytics_action_spool_'
+ANALYTICS_ACTION_SPOOL_REPLAY_SECONDS = 300
+ANALYTICS_DAILY_METRICS_ROLLUP_CHUNK_SIZE = 10000  # Rows fetched per round trip when streaming one day's actions
+
 
 class AnalyticsAction(models.Model):
     """
@@ -110,7 +135,14 @@ class AnalyticsAction(models.Model):
     action_constant = models.PositiveSmallIntegerField(
         verbose_name="constant representing action", null=True, unique=False, db_index=True)
 
-    exact_time = models.DateTimeField(verbose_name='date and time of action', null=False, auto_now_add=True)
+    # Set when the action happens (not auto_now_add), since buffered actions are saved a few seconds later. Buffered
+    #  actions get their id when they are saved, so order by exact_time (then id) to put actions in the order they
+    #  happened.
+    exact_time = models.DateTimeField(verbose_name='date and time of action', null=False, default=now, editable=False)
+    # Generated when the action happens, so a buffered action saved twice (ex/ replayed after a worker died
+    #  mid-flush) is only stored once
+    action_key = models.CharField(
+        verbose_name="unique key for this action", max_length=32, null=True, blank=True, unique=True)
     # We store YYYYMMDD as an integer for very fast lookup (ex/ "20170901" for September, 1, 2017)
     date_as_integer = models.PositiveIntegerField(
         verbose_name="YYYYMMDD of the action", null=True, unique=False, db_index=True)
@@ -166,9 +198,9 @@ class AnalyticsAction(models.Model):
     def display_action_constant_human_readable(self):
         return display_action_constant_human_readable(self.action_constant)
 
-    def generate_date_as_integer(self):
+    def generate_date_as_integer(self, exact_time=None):
         # We want to store the day as an integer for extremely quick database indexing and lookup
-        datetime_now = localtime(now()).date()  # We Vote uses Pacific Time for TIME_ZONE
+        datetime_now = localtime(exact_time if exact_time else now()).date()  # We Vote uses Pacific Time for TIME_ZONE
         day_as_string = "{:d}{:02d}{:02d}".format(
             datetime_now.year,
             datetime_now.month,
@@ -203,6 +235,218 @@ class AnalyticsAction(models.Model):
         return organization
 
 
+def analytics_action_spool_file_pid(file_name):
+    # analytics_action_spool_<pid>_<milliseconds>_<sequence>.<jsonl|pending|replaying>
+    try:
+        return int(file_name[len(ANALYTICS_ACTION_SPOOL_FILE_PREFIX):].split('.')[0].split('_')[0])
+    except ValueError:
+        return 0
+
+
+def process_is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AnalyticsActionBuffer(object):
+    """
+    Collects AnalyticsAction field values in memory, and writes them to the analytics database with bulk_create from
+    a background thread. Every row is first appended to this worker's spool file. A spool file is deleted once its
+    rows are saved; if the save fails, the file is kept as ".pending", and files left by workers that died are picked
+    up too, by replay_spool_files. A file can be replayed after its rows were saved (the worker died between the save
+    and the delete), so rows are matched on action_key and only inserted once.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._action_values_list = []
+        self._spool_file = None
+        self._spool_file_path = ''
+        self._spool_sequence = 0
+        self._wake_event = threading.Event()
+        self._pid = 0
+        self._atexit_registered = False
+
+    def enqueue(self, action_values):
+        self._start_if_needed()
+        with self._lock:
+            self._write_to_spool(action_values)
+            self._action_values_list.append(action_values)
+            number_waiting = len(self._action_values_list)
+        if number_waiting >= ANALYTICS_ACTION_BUFFER_MAX_SIZE:
+            self.flush()
+        elif number_waiting >= ANALYTICS_ACTION_BUFFER_FLUSH_SIZE:
+            self._wake_event.set()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                action_values_list = self._action_values_list
+                self._action_values_list = []
+                spool_file_path = self._close_spool_file()
+            if not action_values_list:
+                self._remove_spool_file(spool_file_path)
+                return 0
+            try:
+                save_analytics_action_values_list(action_values_list)
+            except Exception as e:
+                logger.error("ANALYTICS_ACTION_BUFFER_FLUSH_FAILED, kept for replay: " + str(e))
+                self._rename_spool_file(spool_file_path, '.pending')
+                return 0
+            self._remove_spool_file(spool_file_path)
+            return len(action_values_list)
+
+    def replay_spool_files(self):
+        """
+        Save the rows from ".pending" spool files, and from spool files whose worker is no longer running.
+        A file is claimed by renaming it, so two workers never replay the same file.
+        """
+        if not positive_value_exists(ANALYTICS_ACTION_SPOOL_DIRECTORY):
+            return 0
+        number_replayed = 0
+        try:
+            file_name_list = sorted(os.listdir(ANALYTICS_ACTION_SPOOL_DIRECTORY))
+        except OSError as e:
+            logger.error("ANALYTICS_ACTION_SPOOL_LIST_FAILED: " + str(e))
+            return 0
+        for file_name in file_name_list:
+            if not file_name.startswith(ANALYTICS_ACTION_SPOOL_FILE_PREFIX):
+                continue
+            if not file_name.endswith('.pending'):
+                pid = analytics_action_spool_file_pid(file_name)
+                if not pid or pid == os.getpid() or process_is_running(pid):
+                    continue
+            claimed_file_path = self._generate_spool_file_path('.replaying')
+            try:
+                os.rename(os.path.join(ANALYTICS_ACTION_SPOOL_DIRECTORY, file_name), claimed_file_path)
+            except OSError:
+                # Another worker claimed it first
+                continue
+            action_values_list = []
+            with open(claimed_file_path, 'r') as spool_file:
+                for one_line in spool_file:
+                    try:
+                        action_values_list.append(json.loads(one_line))
+                    except ValueError:
+                        # The last line of a file from a worker that was killed mid-write
+                        continue
+            try:
+                save_analytics_action_values_list(action_values_list)
+                number_replayed += len(action_values_list)
+                self._remove_spool_file(claimed_file_path)
+            except Exception as e:
+                logger.error("ANALYTICS_ACTION_SPOOL_REPLAY_FAILED: " + str(e))
+                self._rename_spool_file(claimed_file_path, '.pending')
+        return number_replayed
+
+    def _start_if_needed(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # First use in this (possibly just forked) worker
+            self._pid = os.getpid()
+            self._action_values_list = []
+            self._spool_file = None
+            self._spool_file_path = ''
+            if positive_value_exists(ANALYTICS_ACTION_SPOOL_DIRECTORY):
+                try:
+                    os.makedirs(ANALYTICS_ACTION_SPOOL_DIRECTORY, exist_ok=True)
+                except OSError as e:
+                    logger.error("ANALYTICS_ACTION_SPOOL_DIRECTORY_NOT_AVAILABLE: " + str(e))
+            if not self._atexit_registered:
+                atexit.register(self.flush)
+                self._atexit_registered = True
+            flusher_thread = threading.Thread(
+                target=self._run_flusher, name='analytics_action_buffer_flusher', daemon=True)
+            flusher_thread.start()
+
+    def _run_flusher(self):
+        last_replay_time = 0
+        while True:
+            self._wake_event.wait(ANALYTICS_ACTION_BUFFER_FLUSH_SECONDS)
+            self._wake_event.clear()
+            try:
+                self.flush()
+                if time.monotonic() - last_replay_time > ANALYTICS_ACTION_SPOOL_REPLAY_SECONDS:
+                    last_replay_time = time.monotonic()
+                    self.replay_spool_files()
+            except Exception as e:
+                logger.error("ANALYTICS_ACTION_BUFFER_FLUSHER_ERROR: " + str(e))
+            finally:
+                close_old_connections()
+
+    def _generate_spool_file_path(self, extension):
+        self._spool_sequence += 1
+        file_name = "{prefix}{pid}_{milliseconds}_{sequence}{extension}".format(
+            prefix=ANALYTICS_ACTION_SPOOL_FILE_PREFIX,
+            pid=os.getpid(),
+            milliseconds=int(time.time() * 1000),
+            sequence=self._spool_sequence,
+            extension=extension)
+        return os.path.join(ANALYTICS_ACTION_SPOOL_DIRECTORY, file_name)
+
+    def _write_to_spool(self, action_values):
+        # Called with self._lock held
+        if not positive_value_exists(ANALYTICS_ACTION_SPOOL_DIRECTORY):
+            return
+        try:
+            if self._spool_file is None:
+                self._spool_file_path = self._generate_spool_file_path('.jsonl')
+                # Line buffered, so every row reaches the operating system as soon as it is written
+                self._spool_file = open(self._spool_file_path, 'a', buffering=1)
+            self._spool_file.write(json.dumps(action_values) + "\n")
+        except (OSError, ValueError) as e:
+            logger.error("ANALYTICS_ACTION_SPOOL_WRITE_FAILED: " + str(e))
+
+    def _close_spool_file(self):
+        # Called with self._lock held. Returns the path of the file that was just closed.
+        spool_file_path = self._spool_file_path
+        if self._spool_file is not None:
+            try:
+                self._spool_file.close()
+            except OSError:
+                pass
+        self._spool_file = None
+        self._spool_file_path = ''
+        return spool_file_path
+
+    def _remove_spool_file(self, spool_file_path):
+        if positive_value_exists(spool_file_path):
+            try:
+                os.remove(spool_file_path)
+            except OSError:
+                pass
+
+    def _rename_spool_file(self, spool_file_path, extension):
+        if positive_value_exists(spool_file_path):
+            try:
+                os.rename(spool_file_path, self._generate_spool_file_path(extension))
+            except OSError as e:
+                logger.error("ANALYTICS_ACTION_SPOOL_RENAME_FAILED: " + str(e))
+
+
+def save_analytics_action_values_list(action_values_list):
+    analytics_action_list = []
+    for action_values in action_values_list:
+        action_values = dict(action_values)
+        if isinstance(action_values.get('exact_time'), str):
+            action_values['exact_time'] = datetime.fromisoformat(action_values['exact_time'])
+        analytics_action_list.append(AnalyticsAction(**action_values))
+    # Rows with an action_key that was already saved are skipped
+    AnalyticsAction.objects.using('analytics').bulk_create(
+        analytics_action_list, batch_size=ANALYTICS_ACTION_BUFFER_FLUSH_SIZE, ignore_conflicts=True)
+
+
+analytics_action_buffer = AnalyticsActionBuffer()
+
+
 class AnalyticsCountManager(models.Manager):
 
     def fetch_ballot_views(self, google_civic_election_id=0, limit_to_one_date_as_integer=0):
@@ -483,7 +727,7 @@ class AnalyticsCountManager(models.Manager):
         try:
             fetch_query = AnalyticsAction.objects.using('analytics').all()
             fetch_query = fetch_query.filter(voter_we_vote_id__iexact=voter_we_vote_id)
-            fetch_query = fetch_query.order_by('-id')
+            fetch_query = fetch_query.order_by('-exact_time', '-id')
             fetch_query = fetch_query[:1]
             fetch_result = list(fetch_query)
             analytics_action = fetch_result.pop()
@@ -522,9 +766,153 @@ class AnalyticsCountManager(models.Manager):
             pass
         return count_result
 
+    def retrieve_daily_metrics_rollup(self, date_as_integer):
+        """
+        Everything calculate_sitewide_daily_metrics and calculate_organization_daily_metrics count from
+        AnalyticsAction, for one day and for every organization, in three queries: the day's actions are streamed
+        once over a server-side cursor, and the totals come from two aggregate queries.
+        The counts match the fetch_visitors, fetch_ballot_views and fetch_voter_guides_viewed queries they replace:
+        an empty voter_we_vote_id (or organization_we_vote_id) is one more distinct value, the sitewide totals run
+        through this day, and an organization's totals cover every day. Organizations are included once they have a
+        voter guide visit on or before this day. Organization keys are lower case, since organization_we_vote_id is
+        compared with iexact elsewhere.
+        :param date_as_integer:
+        :return:
+        """
+        status = ""
+        success = True
+        date_as_integer = convert_to_int(date_as_integer)
+        sitewide_counts = {}
+        organization_counts = {}
+
+        voters_today = set()
+        authenticated_voters_today = set()
+        ballot_voters_today = set()
+        voter_guides_viewed_today = set()
+        organization_visitors_today = {}
+        organization_authenticated_visitors_today = {}
+        organization_we_vote_id_spelling = {}
+        try:
+            action_query = AnalyticsAction.objects.using('analytics') \
+                .filter(date_as_integer=date_as_integer) \
+                .values_list('voter_we_vote_id', 'organization_we_vote_id', 'action_constant', 'is_signed_in')
+            for voter_we_vote_id, organization_we_vote_id, action_constant, is_signed_in in \
+                    action_query.iterator(chunk_size=ANALYTICS_DAILY_METRICS_ROLLUP_CHUNK_SIZE):
+                voters_today.add(voter_we_vote_id)
+                if is_signed_in:
+                    authenticated_voters_today.add(voter_we_vote_id)
+                if action_constant == ACTION_BALLOT_VISIT:
+                    ballot_voters_today.add(voter_we_vote_id)
+                elif action_constant == ACTION_VOTER_GUIDE_VISIT:
+                    voter_guides_viewed_today.add(organization_we_vote_id)
+                    if not organization_we_vote_id:
+                        continue
+                    organization_key = organization_we_vote_id.lower()
+                    if organization_key not in organization_visitors_today:
+                        organization_visitors_today[organization_key] = set()
+                        organization_authenticated_visitors_today[organization_key] = set()
+                        organization_we_vote_id_spelling[organization_key] = organization_we_vote_id
+                    organization_visitors_today[organization_key].add(voter_we_vote_id)
+                    if is_signed_in:
+                        organization_authenticated_visitors_today[organization_key].add(voter_we_vote_id)
+
+            through_date_query = AnalyticsAction.objects.using('analytics') \
+                .filter(date_as_integer__lte=date_as_integer)
+            through_date_counts = through_date_query.aggregate(
+                visitors_total=Count('voter_we_vote_id', distinct=True),
+                visitors_null=Count('id', filter=Q(voter_we_vote_id__isnull=True)),
+                authenticated_visitors_total=Count(
+                    'voter_we_vote_id', distinct=True, filter=Q(is_signed_in=True)),
+                authenticated_visitors_null=Count(
+                    'id', filter=Q(is_signed_in=True, voter_we_vote_id__isnull=True)),
+                voter_guides_viewed_total=Count(
+                    'organization_we_vote_id', distinct=True, filter=Q(action_constant=ACTION_VOTER_GUIDE_VISIT)),
+                voter_guides_viewed_null=Count(
+                    'id', filter=Q(action_constant=ACTION_VOTER_GUIDE_VISIT, organization_we_vote_id__isnull=True)),
+            )
+            # COUNT(DISTINCT ...) leaves out NULL, which the SELECT DISTINCT counts it replaces include
+            sitewide_counts = {}
+            for count_name in ['visitors', 'authenticated_visitors', 'voter_guides_viewed']:
+                sitewide_counts[count_name + '_total'] = \
+                    through_date_counts[count_name + '_total'] + min(through_date_counts[count_name + '_null'], 1)
+            sitewide_counts.update({
+                'visitors_today':               len(voters_today),
+                'authenticated_visitors_today': len(authenticated_voters_today),
+                'ballot_views_today':           len(ballot_voters_today),
+                'voter_guides_viewed_today':    len(voter_guides_viewed_today),
+            })
+
+            organization_total_query = AnalyticsAction.objects.using('analytics') \
+                .filter(action_constant=ACTION_VOTER_GUIDE_VISIT) \
+                .exclude(organization_we_vote_id__isnull=True) \
+                .exclude(organization_we_vote_id='') \
+                .annotate(organization_key=Lower('organization_we_vote_id')) \
+                .values('organization_key') \
+                .annotate(
+                    visitors_total=Count('voter_we_vote_id', distinct=True),
+                    visitors_null=Count('id', filter=Q(voter_we_vote_id__isnull=True)),
+                    authenticated_visitors_total=Count(
+                        'voter_we_vote_id', distinct=True, filter=Q(is_signed_in=True)),
+                    authenticated_visitors_null=Count(
+                        'id', filter=Q(is_signed_in=True, voter_we_vote_id__isnull=True)),
+                    first_date_as_integer=Min('date_as_integer'),
+                    organization_we_vote_id=Max('organization_we_vote_id'))
+            for organization_total in organization_total_query:
+                if not organization_total['first_date_as_integer'] or \
+                        organization_total['first_date_as_integer'] > date_as_integer:
+                    continue
+                organization_key = organization_total['organization_key']
+                visitors_today_set = organization_visitors_today.get(organization_key, set())
+                organization_counts[organization_key] = {
+                    'organization_we_vote_id':      organization_we_vote_id_spelling.get(
+                        organization_key, organization_total['organization_we_vote_id']),
+                    'visitors_total':               (organization_total['visitors_total'] +
+                                                     min(organization_total['visitors_null'], 1)),
+                    'authenticated_visitors_total': (organization_total['authenticated_visitors_total'] +
+                                                     min(organization_total['authenticated_visitors_null'], 1)),
+                    'visitors_today':               len(visitors_today_set),
+                    'authenticated_visitors_today': len(
+                        organization_authenticated_visitors_today.get(organization_key, set())),
+                }
+            status += "DAILY_METRICS_ROLLUP_RETRIEVED "
+        except Exception as e:
+            success = False
+            status += "DAILY_METRICS_ROLLUP_FAILED: " + str(e) + " "
+
+        results = {
+            'success':              success,
+            'status':               status,
+            'date_as_integer':      date_as_integer,
+            'sitewide_counts':      sitewide_counts,
+            'organization_counts':  organization_counts,
+        }
+        return results
+
 
 class AnalyticsManager(models.Manager):
 
+    def create_analytics_action(self, action_values):
+        """
+        Buffer one AnalyticsAction (see AnalyticsActionBuffer), or save it right away if buffering is off.
+        exact_time, date_as_integer and action_key are set here, when the action happens, not when the row is flushed.
+        :param action_values: dict of AnalyticsAction field values
+        :return: AnalyticsAction (not yet saved when buffered)
+        """
+        action = AnalyticsAction(**action_values)
+        action.exact_time = now()
+        action.generate_date_as_integer(action.exact_time)
+        action.action_key = uuid.uuid4().hex
+        if not ANALYTICS_ACTION_BUFFERING_ON:
+            action.save(using='analytics')
+            return action
+        action_values['exact_time'] = action.exact_time
+        action_values['date_as_integer'] = action.date_as_integer
+        action_values['action_key'] = action.action_key
+        spool_values = dict(action_values)
+        spool_values['exact_time'] = action.exact_time.isoformat()
+        analytics_action_buffer.enqueue(spool_values)
+        return action
+
     def create_action_type1(
             self, action_constant, voter_we_vote_id, voter_id, is_signed_in, state_code,
             organization_we_vote_id, organization_id, google_civic_election_id,
@@ -559,25 +947,25 @@ class AnalyticsManager(models.Manager):
             return results
 
         try:
-            action = AnalyticsAction.objects.using('analytics').create(
-                action_constant=action_constant,
-                voter_we_vote_id=voter_we_vote_id,
-                voter_id=voter_id,
-                is_signed_in=is_signed_in,
-                state_code=state_code,
-                organization_we_vote_id=organization_we_vote_id,
-                organization_id=organization_id,
-                google_civic_election_id=google_civic_election_id,
-                ballot_item_we_vote_id=ballot_item_we_vote_id,
-                user_agent=user_agent_string,
-                is_bot=is_bot,
-                is_mobile=is_mobile,
-                is_desktop=is_desktop,
-                is_tablet=is_tablet
-            )
+            action = self.create_analytics_action({
+                'action_constant':          action_constant,
+                'voter_we_vote_id':         voter_we_vote_id,
+                'voter_id':                 voter_id,
+                'is_signed_in':             is_signed_in,
+                'state_code':               state_code,
+                'organization_we_vote_id':  organization_we_vote_id,
+                'organization_id':          organization_id,
+                'google_civic_election_id': google_civic_election_id,
+                'ballot_item_we_vote_id':   ballot_item_we_vote_id,
+                'user_agent':               user_agent_string,
+                'is_bot':                   is_bot,
+                'is_mobile':                is_mobile,
+                'is_desktop':               is_desktop,
+                'is_tablet':                is_tablet,
+            })
             success = True
             action_saved = True
-            status += 'ACTION_TYPE1_SAVED '
+            status += 'ACTION_TYPE1_SAVED ' if not ANALYTICS_ACTION_BUFFERING_ON else 'ACTION_TYPE1_BUFFERED '
         except Exception as e:
             success = False
             status += 'COULD_NOT_SAVE_ACTION_TYPE1 ' + str(e) + ' '
@@ -621,24 +1009,24 @@ class AnalyticsManager(models.Manager):
             return results
 
         try:
-            action = AnalyticsAction.objects.using('analytics').create(
-                action_constant=action_constant,
-                voter_we_vote_id=voter_we_vote_id,
-                voter_id=voter_id,
-                is_signed_in=is_signed_in,
-                state_code=state_code,
-                organization_we_vote_id=organization_we_vote_id,
-                google_civic_election_id=google_civic_election_id,
-                ballot_item_we_vote_id=ballot_item_we_vote_id,
-                user_agent=user_agent_string,
-                is_bot=is_bot,
-                is_mobile=is_mobile,
-                is_desktop=is_desktop,
-                is_tablet=is_tablet
-            )
+            action = self.create_analytics_action({
+                'action_constant':          action_constant,
+                'voter_we_vote_id':         voter_we_vote_id,
+                'voter_id':                 voter_id,
+                'is_signed_in':             is_signed_in,
+                'state_code':               state_code,
+                'organization_we_vote_id':  organization_we_vote_id,
+                'google_civic_election_id': google_civic_election_id,
+                'ballot_item_we_vote_id':   ballot_item_we_vote_id,
+                'user_agent':               user_agent_string,
+                'is_bot':                   is_bot,
+                'is_mobile':                is_mobile,
+                'is_desktop':               is_desktop,
+                'is_tablet':                is_tablet,
+            })
             success = True
             action_saved = True
-            status += 'ACTION_TYPE2_SAVED '
+            status += 'ACTION_TYPE2_SAVED ' if not ANALYTICS_ACTION_BUFFERING_ON else 'ACTION_TYPE2_BUFFERED '
         except Exception as e:
             success = False
             status += 'COULD_NOT_SAVE_ACTION_TYPE2 ' + str(e) + ' '
@@ -806,6 +1194,47 @@ class AnalyticsManager(models.Manager):
         }
         return results
 
+    def save_analytics_processed_list(self, analytics_date_as_integer, voter_we_vote_id_list, kind_of_process):
+        """
+        Like save_analytics_processed for many voters at once: one query for the voters already recorded, and one
+        bulk INSERT for the rest, so running the same chunk again doesn't add rows.
+        :param analytics_date_as_integer:
+        :param voter_we_vote_id_list:
+        :param kind_of_process:
+        :return:
+        """
+        success = True
+        status = ""
+        analytics_processed_saved_count = 0
+
+        try:
+            existing_voter_we_vote_id_set = set(AnalyticsProcessed.objects.using('analytics').filter(
+                analytics_date_as_integer=analytics_date_as_integer,
+                kind_of_process=kind_of_process,
+                voter_we_vote_id__in=voter_we_vote_id_list).values_list('voter_we_vote_id', flat=True))
+            new_voter_we_vote_id_list = []
+            for voter_we_vote_id in voter_we_vote_id_list:
+                if voter_we_vote_id not in existing_voter_we_vote_id_set:
+                    existing_voter_we_vote_id_set.add(voter_we_vote_id)
+                    new_voter_we_vote_id_list.append(voter_we_vote_id)
+            AnalyticsProcessed.objects.using('analytics').bulk_create([
+                AnalyticsProcessed(
+                    analytics_date_as_integer=analytics_date_as_integer,
+                    voter_we_vote_id=voter_we_vote_id,
+                    kind_of_process=kind_of_process,
+                ) for voter_we_vote_id in new_voter_we_vote_id_list])
+            analytics_processed_saved_count = len(new_voter_we_vote_id_list)
+        except Exception as e:
+            success = False
+            status += 'SAVE_ANALYTICS_PROCESSED_LIST_PROBLEM: ' + str(e) + ' '
+
+        results = {
+            'success':                          success,
+            'status':                           status,
+            'analytics_processed_saved_count':  analytics_processed_saved_count,
+        }
+        return results
+
     def save_analytics_processing_status(self, analytics_date_as_integer, defaults):
         success = True
         status = ""
@@ -1293,6 +1722,80 @@ class AnalyticsManager(models.Manager):
         }
         return results
 
+    def save_organization_daily_metrics_values_for_one_date(self, date_as_integer, organization_daily_metrics_list):
+        """
+        Save OrganizationDailyMetrics for many organizations on one day: the day's existing rows are read in one
+        query, then updated with bulk_update, and the rest are created with bulk_create.
+        :param date_as_integer:
+        :param organization_daily_metrics_list: list of organization_daily_metrics_values dicts
+        :return:
+        """
+        success = True
+        status = ""
+        metrics_created_count = 0
+        metrics_updated_count = 0
+        if not positive_value_exists(date_as_integer):
+            results = {
+                'success':                  False,
+                'status':                   'MISSING_DATE_AS_INTEGER ',
+                'metrics_created_count':    metrics_created_count,
+                'metrics_updated_count':    metrics_updated_count,
+            }
+            return results
+
+        field_name_list = []
+        for field in OrganizationDailyMetrics._meta.concrete_fields:
+            if field.name not in ('id', 'date_as_integer', 'organization_we_vote_id'):
+                field_name_list.append(field.name)
+        try:
+            with transaction.atomic(using='analytics'):
+                existing_metrics_by_organization = {}
+                existing_query = OrganizationDailyMetrics.objects.using('analytics') \
+                    .select_for_update().filter(date_as_integer=date_as_integer)
+                for existing_metrics in existing_query:
+                    if positive_value_exists(existing_metrics.organization_we_vote_id):
+                        existing_metrics_by_organization[existing_metrics.organization_we_vote_id.lower()] = \
+                            existing_metrics
+
+                metrics_to_create = []
+                metrics_to_update = []
+                for organization_daily_metrics_values in organization_daily_metrics_list:
+                    organization_we_vote_id = organization_daily_metrics_values['organization_we_vote_id']
+                    if not positive_value_exists(organization_we_vote_id):
+                        continue
+                    metrics = existing_metrics_by_organization.get(organization_we_vote_id.lower())
+                    if metrics is None:
+                        metrics = OrganizationDailyMetrics(
+                            date_as_integer=date_as_integer, organization_we_vote_id=organization_we_vote_id)
+                        metrics_to_create.append(metrics)
+                    else:
+                        metrics_to_update.append(metrics)
+                    for field_name in field_name_list:
+                        if field_name in organization_daily_metrics_values:
+                            setattr(metrics, field_name, organization_daily_metrics_values[field_name])
+
+                if len(metrics_to_update):
+                    OrganizationDailyMetrics.objects.using('analytics').bulk_update(
+                        metrics_to_update, field_name_list, batch_size=1000)
+                if len(metrics_to_create):
+                    OrganizationDailyMetrics.objects.using('analytics').bulk_create(
+                        metrics_to_create, batch_size=1000)
+                metrics_created_count = len(metrics_to_create)
+                metrics_updated_count = len(metrics_to_update)
+            status += 'ORGANIZATION_DAILY_METRICS_SAVED_FOR_ONE_DATE ' \
+                      'created: ' + str(metrics_created_count) + ', updated: ' + str(metrics_updated_count) + ' '
+        except Exception as e:
+            success = False
+            status += 'ORGANIZATION_DAILY_METRICS_BULK_SAVE_FAILED ' + str(e) + ' '
+
+        results = {
+            'success':                  success,
+            'status':                   status,
+            'metrics_created_count':    metrics_created_count,
+            'metrics_updated_count':    metrics_updated_count,
+        }
+        return results
+
     def save_organization_election_metrics_values(self, organization_election_metrics_values):
         success = False
         status = ""
@@ -1427,81 +1930,66 @@ class AnalyticsManager(models.Manager):
         )
         return positive_value_exists(updated_on_date_query.count())
 
-    def update_first_visit_today_for_all_voters_since_date(self, date_as_integer, through_date_as_integer):
-        success = True
+    def mark_first_visit_today_in_bulk(self, date_as_integer, through_date_as_integer=0, voter_we_vote_id_list=None):
+        """
+        Set first_visit_today on the oldest AnalyticsAction (lowest id) of every voter on every day in the range, with
+        one UPDATE driven by ROW_NUMBER() OVER (PARTITION BY day, voter). Only rows not already marked are written.
+        :param date_as_integer:
+        :param through_date_as_integer: Defaults to date_as_integer (one day)
+        :param voter_we_vote_id_list: Optionally limit to these voters (for processing one chunk at a time)
+        :return:
+        """
         status = ""
-        distinct_days_list = []
         first_visit_today_count = 0
+        if not positive_value_exists(through_date_as_integer):
+            through_date_as_integer = date_as_integer
+        if not positive_value_exists(date_as_integer):
+            results = {
+                'success':                  False,
+                'status':                   "MARK_FIRST_VISIT_TODAY-MISSING_DATE_AS_INTEGER ",
+                'first_visit_today_count':  first_visit_today_count,
+            }
+            return results
 
-        # Get distinct days
+        parameters = [convert_to_int(date_as_integer), convert_to_int(through_date_as_integer)]
+        voter_filter = ""
+        if voter_we_vote_id_list is not None:
+            voter_we_vote_id_list = [voter_we_vote_id.lower() for voter_we_vote_id in voter_we_vote_id_list
+                                     if positive_value_exists(voter_we_vote_id)]
+            if not voter_we_vote_id_list:
+                results = {
+                    'success':                  True,
+                    'status':                   "MARK_FIRST_VISIT_TODAY-NO_VOTERS ",
+                    'first_visit_today_count':  first_visit_today_count,
+                }
+                return results
+            voter_filter = "AND LOWER(voter_we_vote_id) = ANY(%s) "
+            parameters.append(voter_we_vote_id_list)
+
+        # Voter ids are compared case-insensitively, like the voter_we_vote_id__iexact lookups this replaces.
+        #  Buffered actions get their id when they are flushed, so the first visit is the earliest exact_time.
+        sql = "UPDATE {table} SET first_visit_today = TRUE WHERE id IN (" \
+              "SELECT id FROM (" \
+              "SELECT id, first_visit_today, ROW_NUMBER() OVER (" \
+              "PARTITION BY date_as_integer, LOWER(voter_we_vote_id) ORDER BY exact_time, id) AS visit_number " \
+              "FROM {table} " \
+              "WHERE date_as_integer BETWEEN %s AND %s " \
+              "AND voter_we_vote_id IS NOT NULL AND voter_we_vote_id <> '' " \
+              "{voter_filter}" \
+              ") AS numbered_action " \
+              "WHERE visit_number = 1 AND NOT first_visit_today)".format(
+                table=AnalyticsAction._meta.db_table, voter_filter=voter_filter)
         try:
-            distinct_days_query = AnalyticsAction.objects.using('analytics').all()
-            distinct_days_query = distinct_days_query.filter(date_as_integer__gte=date_as_integer)
-            distinct_days_query = distinct_days_query.filter(date_as_integer__lte=through_date_as_integer)
-            distinct_days_query = distinct_days_query.values('date_as_integer').distinct()
-            # distinct_days_query = distinct_days_query[:5]  # TEMP limit to 5
-            distinct_days_list = list(distinct_days_query)
-            distinct_days_found = True
+            with transaction.atomic(using='analytics'):
+                with connections['analytics'].cursor() as cursor:
+                    cursor.execute(sql, parameters)
+                    first_visit_today_count = cursor.rowcount
+            success = True
+            status += "MARK_FIRST_VISIT_TODAY_UPDATED: " + str(first_visit_today_count) + " "
         except Exception as e:
             success = False
-            status += "UPDATE_FIRST_VISIT_TODAY-DISTINCT_DAY_QUERY_ERROR " + str(e) + ' '
-            distinct_days_found = False
-
-        simple_distinct_days_list = []
-        for day_dict in distinct_days_list:
-            if positive_value_exists(day_dict['date_as_integer']):
-                simple_distinct_days_list.append(day_dict['date_as_integer'])
-
-        # Loop through each day
-        for one_date_as_integer in simple_distinct_days_list:
-            # Get distinct voters on that day
-            if not positive_value_exists(one_date_as_integer):
-                continue
-
-            voter_list = []
-            try:
-                voter_list_query = AnalyticsAction.objects.using('analytics').all()
-                voter_list_query = voter_list_query.filter(date_as_integer=one_date_as_integer)
-                voter_list_query = voter_list_query.values('voter_we_vote_id').distinct()
-                # voter_list_query = voter_list_query[:5]  # TEMP limit to 5
-                voter_list = list(voter_list_query)
-                voter_list_found = True
-            except Exception as e:
-                success = False
-                status += "UPDATE_FIRST_VISIT_TODAY-DISTINCT_VOTER_QUERY_ERROR " + str(e) + ' '
-                voter_list_found = False
-
-            simple_voter_list = []
-            for voter_dict in voter_list:
-                if positive_value_exists(voter_dict['voter_we_vote_id']) and \
-                        voter_dict['voter_we_vote_id'] not in simple_voter_list:
-                    simple_voter_list.append(voter_dict['voter_we_vote_id'])
-
-            if not voter_list_found:
-                continue
-
-            # Loop through each voter per day, and update the first entry for that day with "first_visit_today=True"
-            for voter_we_vote_id in simple_voter_list:
-                if not positive_value_exists(voter_we_vote_id):
-                    continue
-
-                try:
-                    first_visit_query = AnalyticsAction.objects.using('analytics').all()
-                    first_visit_query = first_visit_query.order_by("id")  # order by oldest first
-                    first_visit_query = first_visit_query.filter(date_as_integer=one_date_as_integer)
-                    first_visit_query = first_visit_query.filter(voter_we_vote_id__iexact=voter_we_vote_id)
-                    analytics_action = first_visit_query.first()
-
-                    if not analytics_action.first_visit_today:
-                        analytics_action.first_visit_today = True
-                        analytics_action.save()
-                        first_visit_saved = True
-                        first_visit_today_count += 1
-                except Exception as e:
-                    success = False
-                    status += "UPDATE_FIRST_VISIT_TODAY-VOTER_ON_DATE_QUERY_ERROR " + str(e) + ' '
-                    print_to_log(logger=logger, exception_message_optional=status)
-                    first_visit_found = False
+            status += "MARK_FIRST_VISIT_TODAY_ERROR: " + str(e) + " "
+            print_to_log(logger=logger, exception_message_optional=status)
 
         results = {
             'success':                  success,
@@ -1510,6 +1998,9 @@ class AnalyticsManager(models.Manager):
         }
         return results
 
+    def update_first_visit_today_for_all_voters_since_date(self, date_as_integer, through_date_as_integer):
+        return self.mark_first_visit_today_in_bulk(date_as_integer, through_date_as_integer)
+
     def update_first_visit_today_for_one_voter(self, voter_we_vote_id):
         success = False
         status = ""
@@ -1534,7 +2025,7 @@ class AnalyticsManager(models.Manager):
         for one_date_as_integer in simple_distinct_days_list:
             try:
                 first_visit_query = AnalyticsAction.objects.using('analytics').all()
-                first_visit_query = first_visit_query.order_by("id")  # order by oldest first
+                first_visit_query = first_visit_query.order_by("exact_time", "id")  # order by oldest first
                 first_visit_query = first_visit_query.filter(date_as_integer=one_date_as_integer)
                 first_visit_query = first_visit_query.filter(voter_we_vote_id__iexact=voter_we_vote_id)
                 analytics_action = first_visit_query.first()
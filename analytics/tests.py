@@ -0,0 +1,161 @@
+from datetime import timedelta
+from unittest import mock
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.utils.timezone import now
+
+from analytics.models import ACTION_BALLOT_VISIT, ACTION_VOTER_GUIDE_VISIT, ANALYTICS_ACTION_SPOOL_FILE_PREFIX, \
+    AnalyticsAction, AnalyticsActionBuffer, AnalyticsCountManager, AnalyticsManager, AnalyticsProcessed
+from import_export_batches.models import AUGMENT_ANALYTICS_ACTION_WITH_FIRST_VISIT
+
+
+@mock.patch.object(AnalyticsActionBuffer, '_start_if_needed')
+class AnalyticsActionBufferTestCase(TestCase):
+    """ Buffering is off under test, so these tests turn it on with a buffer that has no flusher thread. """
+    databases = ["default", "readonly", "analytics"]
+
+    def setUp(self):
+        self.spool_directory = tempfile.mkdtemp()
+        self.analytics_action_buffer = AnalyticsActionBuffer()
+        patch_list = [
+            mock.patch('analytics.models.ANALYTICS_ACTION_BUFFERING_ON', True),
+            mock.patch('analytics.models.ANALYTICS_ACTION_SPOOL_DIRECTORY', self.spool_directory),
+            mock.patch('analytics.models.analytics_action_buffer', self.analytics_action_buffer),
+        ]
+        for one_patch in patch_list:
+            one_patch.start()
+            self.addCleanup(one_patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_directory, ignore_errors=True)
+
+    def create_ballot_visit(self, voter_we_vote_id):
+        return AnalyticsManager().create_analytics_action({
+            'action_constant':          ACTION_BALLOT_VISIT,
+            'voter_we_vote_id':         voter_we_vote_id,
+            'google_civic_election_id': 4184,
+        })
+
+    def test_action_is_saved_at_flush_with_the_time_it_happened(self, start_if_needed):
+        action = self.create_ballot_visit('wv01voter1')
+        self.assertIsNone(action.id)
+        self.assertTrue(action.date_as_integer)
+        self.assertEqual(len(action.action_key), 32)
+        self.assertEqual(AnalyticsAction.objects.using('analytics').count(), 0)
+        self.assertEqual(len(os.listdir(self.spool_directory)), 1)
+
+        self.assertEqual(self.analytics_action_buffer.flush(), 1)
+        saved_action = AnalyticsAction.objects.using('analytics').get()
+        self.assertEqual(saved_action.action_key, action.action_key)
+        self.assertEqual(saved_action.exact_time, action.exact_time)
+        self.assertEqual(saved_action.date_as_integer, action.date_as_integer)
+        self.assertEqual(os.listdir(self.spool_directory), [], 'The spool file is deleted once its rows are saved')
+
+    def test_spool_file_replayed_after_its_rows_were_saved_adds_no_rows(self, start_if_needed):
+        self.create_ballot_visit('wv01voter1')
+        self.create_ballot_visit('wv01voter2')
+        with open(self.analytics_action_buffer._spool_file_path) as spool_file:
+            spool_file_lines = spool_file.read()
+        self.analytics_action_buffer.flush()
+
+        # The worker died after the save, before deleting its spool file
+        spool_file_path = os.path.join(self.spool_directory, ANALYTICS_ACTION_SPOOL_FILE_PREFIX + '1_0_0.pending')
+        with open(spool_file_path, 'w') as spool_file:
+            spool_file.write(spool_file_lines)
+        self.assertEqual(self.analytics_action_buffer.replay_spool_files(), 2)
+        self.assertEqual(AnalyticsAction.objects.using('analytics').count(), 2)
+        self.assertEqual(os.listdir(self.spool_directory), [])
+
+    def test_failed_flush_is_kept_for_replay(self, start_if_needed):
+        self.create_ballot_visit('wv01voter1')
+        with mock.patch('analytics.models.save_analytics_action_values_list', side_effect=Exception('down')):
+            self.assertEqual(self.analytics_action_buffer.flush(), 0)
+        self.assertTrue(os.listdir(self.spool_directory)[0].endswith('.pending'))
+
+        self.assertEqual(self.analytics_action_buffer.replay_spool_files(), 1)
+        self.assertEqual(AnalyticsAction.objects.using('analytics').count(), 1)
+
+
+class MarkFirstVisitTodayTestCase(TestCase):
+    databases = ["default", "readonly", "analytics"]
+
+    def setUp(self):
+        self.analytics_manager = AnalyticsManager()
+        self.exact_time = now()
+
+    def create_action(self, voter_we_vote_id, minutes_later, date_as_integer=20201103):
+        return AnalyticsAction.objects.using('analytics').create(
+            action_constant=ACTION_BALLOT_VISIT, voter_we_vote_id=voter_we_vote_id, date_as_integer=date_as_integer,
+            exact_time=self.exact_time + timedelta(minutes=minutes_later))
+
+    def test_earliest_action_of_each_voter_and_day_is_marked(self):
+        # Saved out of order, the way buffered actions from two workers can be
+        second_visit = self.create_action('wv01voter1', 10)
+        first_visit = self.create_action('WV01VOTER1', 0)
+        next_day_visit = self.create_action('wv01voter1', 5, date_as_integer=20201104)
+        other_voter_visit = self.create_action('wv01voter2', 20)
+        self.create_action('', 0)
+
+        results = self.analytics_manager.mark_first_visit_today_in_bulk(20201103, 20201104)
+        self.assertTrue(results['success'], results['status'])
+        self.assertEqual(results['first_visit_today_count'], 3)
+        marked_id_list = list(AnalyticsAction.objects.using('analytics').filter(first_visit_today=True)
+                              .order_by('id').values_list('id', flat=True))
+        self.assertEqual(marked_id_list, [first_visit.id, next_day_visit.id, other_voter_visit.id])
+        self.assertNotIn(second_visit.id, marked_id_list)
+
+        results = self.analytics_manager.mark_first_visit_today_in_bulk(20201103, 20201104)
+        self.assertEqual(results['first_visit_today_count'], 0, 'Rows already marked are not written again')
+
+    def test_voter_list_limits_the_update(self):
+        self.create_action('wv01voter1', 0)
+        self.create_action('wv01voter2', 0)
+        results = self.analytics_manager.mark_first_visit_today_in_bulk(
+            20201103, voter_we_vote_id_list=['WV01VOTER2'])
+        self.assertEqual(results['first_visit_today_count'], 1)
+        self.assertEqual(list(AnalyticsAction.objects.using('analytics').filter(first_visit_today=True)
+                              .values_list('voter_we_vote_id', flat=True)), ['wv01voter2'])
+
+    def test_saving_the_same_processed_voters_twice_adds_no_rows(self):
+        for i in range(2):
+            results = self.analytics_manager.save_analytics_processed_list(
+                20201103, ['wv01voter1', 'wv01voter2'], AUGMENT_ANALYTICS_ACTION_WITH_FIRST_VISIT)
+            self.assertTrue(results['success'], results['status'])
+        self.assertEqual(results['analytics_processed_saved_count'], 0)
+        self.assertEqual(AnalyticsProcessed.objects.using('analytics').count(), 2)
+
+
+class DailyMetricsRollupTestCase(TestCase):
+    databases = ["default", "readonly", "analytics"]
+
+    def create_action(self, date_as_integer, voter_we_vote_id, action_constant=ACTION_VOTER_GUIDE_VISIT,
+                      organization_we_vote_id='wv01org1', is_signed_in=False):
+        AnalyticsAction.objects.using('analytics').create(
+            action_constant=action_constant, voter_we_vote_id=voter_we_vote_id, date_as_integer=date_as_integer,
+            organization_we_vote_id=organization_we_vote_id, is_signed_in=is_signed_in)
+
+    def test_rollup_matches_the_distinct_counts_it_replaces(self):
+        self.create_action(20201102, 'wv01voter1', is_signed_in=True)
+        self.create_action(20201103, 'wv01voter2')
+        self.create_action(20201103, None, organization_we_vote_id='WV01ORG1')
+        self.create_action(20201103, 'wv01voter2', action_constant=ACTION_BALLOT_VISIT, organization_we_vote_id=None)
+        self.create_action(20201104, 'wv01voter3')
+        self.create_action(20201104, 'wv01voter4', organization_we_vote_id='wv01org2')
+
+        results = AnalyticsCountManager().retrieve_daily_metrics_rollup(20201103)
+        self.assertTrue(results['success'], results['status'])
+        sitewide_counts = results['sitewide_counts']
+        self.assertEqual(sitewide_counts['visitors_total'], 3, 'wv01voter1, wv01voter2 and the empty voter')
+        self.assertEqual(sitewide_counts['visitors_today'], 2)
+        self.assertEqual(sitewide_counts['authenticated_visitors_total'], 1)
+        self.assertEqual(sitewide_counts['ballot_views_today'], 1)
+        self.assertEqual(sitewide_counts['voter_guides_viewed_total'], 2, 'Organization ids compared exactly')
+
+        self.assertEqual(list(results['organization_counts'].keys()), ['wv01org1'])
+        organization_counts = results['organization_counts']['wv01org1']
+        self.assertEqual(organization_counts['visitors_total'], 4, 'Every day, as fetch_visitors counted it')
+        self.assertEqual(organization_counts['visitors_today'], 2)
+        self.assertEqual(organization_counts['authenticated_visitors_total'], 1)
@@ -4,7 +4,8 @@
 
 from .controllers import augment_one_voter_analytics_action_entries_without_election_id, \
     augment_voter_analytics_action_entries_without_election_id, \
-    save_organization_daily_metrics, save_organization_election_metrics, \
+    save_organization_daily_metrics, save_organization_daily_metrics_for_all_organizations, \
+    save_organization_election_metrics, \
     save_sitewide_daily_metrics, save_sitewide_election_metrics, save_sitewide_voter_metrics
 from .models import ACTION_WELCOME_VISIT, AnalyticsAction, AnalyticsManager, display_action_constant_human_readable, \
     fetch_action_constant_number_from_constant_string, OrganizationDailyMetrics, OrganizationElectionMetrics, \
@@ -790,7 +791,10 @@ def organization_daily_metrics_process_view(request):
                                     "?google_civic_election_id=" + str(google_civic_election_id) +
                                     "&state_code=" + str(state_code))
 
-    results = save_organization_daily_metrics(organization_we_vote_id, changes_since_this_date_as_integer)
+    if positive_value_exists(organization_we_vote_id):
+        results = save_organization_daily_metrics(organization_we_vote_id, changes_since_this_date_as_integer)
+    else:
+        results = save_organization_daily_metrics_for_all_organizations(changes_since_this_date_as_integer)
 
     return HttpResponseRedirect(reverse('analytics:organization_daily_metrics', args=()) +
                                 "?google_civic_election_id=" + str(google_civic_election_id) +
@@ -2,12 +2,43 @@
 # Brought to you by We Vote. Be good.
 # -*- coding: UTF-8 -*-
 
+from django.core.cache import caches
 from django.db import models
 from django.utils.timezone import now
 from django.db.models import Q
 from datetime import timedelta
 import json
-from wevote_functions.functions import positive_value_exists
+from config.base import get_environment_variable_default
+from wevote_functions.functions import is_cache_shared_between_processes, LocalLruCache, positive_value_exists
+
+# Tier 1: Each worker keeps the already-serialized response bytes, stamped with the ApiInternalCache id they came from
+API_INTERNAL_CACHE_LOCAL_TTL_SECONDS = 60
+API_INTERNAL_CACHE_LOCAL_MAX_ENTRIES = 200
+# Tier 2: A Django cache backend shared by the workers (see CACHES in config/base.py). It has to be shared by every
+#  process (memcached, or the file backend on a single server). With a per-process backend like the default
+#  LocMemCache, a refresh could only invalidate the worker that did it, so tier 2 is skipped, and the other workers
+#  keep serving their tier 1 copy until API_INTERNAL_CACHE_LOCAL_TTL_SECONDS runs out. Configure a shared backend
+#  where a refresh has to reach every worker right away.
+API_INTERNAL_CACHE_SHARED_CACHE_ALIAS = \
+    get_environment_variable_default('API_INTERNAL_CACHE_SHARED_CACHE_ALIAS', 'default')
+API_INTERNAL_CACHE_SHARED_TTL_SECONDS = 300
+# How often a single worker is allowed to run schedule_refresh_of_api_internal_cache for one api_name/election list
+API_INTERNAL_CACHE_SCHEDULE_REFRESH_TTL_SECONDS = 300
+
+api_internal_cache_local_tier = LocalLruCache(
+    max_size=API_INTERNAL_CACHE_LOCAL_MAX_ENTRIES, ttl_seconds=API_INTERNAL_CACHE_LOCAL_TTL_SECONDS)
+api_refresh_scheduled_local_tier = LocalLruCache(
+    max_size=API_INTERNAL_CACHE_LOCAL_MAX_ENTRIES, ttl_seconds=API_INTERNAL_CACHE_SCHEDULE_REFRESH_TTL_SECONDS)
+
+
+def get_api_internal_cache_shared_tier():
+    shared_tier = caches[API_INTERNAL_CACHE_SHARED_CACHE_ALIAS]
+    return shared_tier if is_cache_shared_between_processes(shared_tier) else None
+
+
+def generate_api_internal_cache_key(api_name='', election_id_list_serialized=''):
+    # Lower case to match the "iexact" database lookups
+    return str(api_name).lower() + ':' + str(election_id_list_serialized).lower()
 
 
 class ApiInternalCacheManager(models.Manager):
@@ -139,6 +170,28 @@ class ApiInternalCacheManager(models.Manager):
         }
         return results
 
+    def invalidate_api_internal_cache_tiers(
+            self,
+            api_name='',
+            election_id_list_serialized='',
+            new_version=0):
+        """
+        Stamp the shared tier with the id of the newest ApiInternalCache entry. Every worker compares its local copy
+        against this version stamp, so a refresh invalidates all tiers.
+        """
+        status = ''
+        cache_key = generate_api_internal_cache_key(api_name, election_id_list_serialized)
+        api_internal_cache_local_tier.delete(cache_key)
+        try:
+            shared_tier = get_api_internal_cache_shared_tier()
+            if shared_tier is not None:
+                shared_tier.set('version:' + cache_key, new_version, API_INTERNAL_CACHE_SHARED_TTL_SECONDS)
+                shared_tier.delete('payload:' + cache_key)
+            status += "API_INTERNAL_CACHE_TIERS_INVALIDATED "
+        except Exception as e:
+            status += 'API_INTERNAL_CACHE_TIERS_INVALIDATE_ERROR ' + str(e) + ' '
+        return status
+
     def mark_prior_api_internal_cache_entries_as_replaced(
             self,
             api_name="",
@@ -161,6 +214,10 @@ class ApiInternalCacheManager(models.Manager):
             except Exception as e:
                 success = False
                 status += 'API_INTERNAL_CACHE_MARK_REPLACED_ERROR ' + str(e) + ' '
+            status += self.invalidate_api_internal_cache_tiers(
+                api_name=api_name,
+                election_id_list_serialized=election_id_list_serialized,
+                new_version=excluded_api_internal_cache_id)
         else:
             status += 'MUST_SPECIFY_REPLACEMENT_CACHE '
             success = False
@@ -285,11 +342,138 @@ class ApiInternalCacheManager(models.Manager):
         }
         return results
 
+    def retrieve_latest_api_internal_cache_serialized(
+            self,
+            api_name='',
+            election_id_list_serialized=''):
+        """
+        Tiered version of retrieve_latest_api_internal_cache for the API hot path. Returns the serialized response
+        without json decoding it, checking this worker's local tier, then the shared tier, and only then Postgres.
+        Without a shared tier, the local tier is served for its TTL without asking Postgres, so a refresh made by
+        another worker shows up here within API_INTERNAL_CACHE_LOCAL_TTL_SECONDS.
+        :param api_name:
+        :param election_id_list_serialized:
+        :return:
+        """
+        status = ''
+        if not positive_value_exists(api_name):
+            status += "RETRIEVE_LATEST_CACHE_SERIALIZED-MISSING_API_NAME "
+            results = {
+                'success':                          False,
+                'status':                           status,
+                'api_internal_cache_found':         False,
+                'api_internal_cache_id':            0,
+                'cached_api_response_serialized':   '',
+                'date_cached':                      None,
+            }
+            return results
+
+        cache_key = generate_api_internal_cache_key(api_name, election_id_list_serialized)
+        shared_tier = None
+        current_version = None
+        try:
+            shared_tier = get_api_internal_cache_shared_tier()
+            if shared_tier is not None:
+                current_version = shared_tier.get('version:' + cache_key)
+        except Exception as e:
+            status += 'API_INTERNAL_CACHE_SHARED_TIER_ERROR ' + str(e) + ' '
+
+        # Tier 1: This worker's memory
+        cached_entry = api_internal_cache_local_tier.get(cache_key)
+        if cached_entry and (current_version is None or cached_entry['api_internal_cache_id'] == current_version):
+            status += "API_INTERNAL_CACHE_LOCAL_TIER_HIT "
+            return dict(cached_entry, success=True, status=status, api_internal_cache_found=True)
+
+        # Tier 2: Shared between workers
+        if shared_tier is not None:
+            try:
+                cached_entry = shared_tier.get('payload:' + cache_key)
+            except Exception as e:
+                cached_entry = None
+                status += 'API_INTERNAL_CACHE_SHARED_TIER_ERROR ' + str(e) + ' '
+            if cached_entry and (current_version is None or cached_entry['api_internal_cache_id'] == current_version):
+                status += "API_INTERNAL_CACHE_SHARED_TIER_HIT "
+                api_internal_cache_local_tier.set(cache_key, cached_entry)
+                return dict(cached_entry, success=True, status=status, api_internal_cache_found=True)
+
+        # Tier 3: Postgres
+        cached_entry = None
+        try:
+            query = self.retrieve_latest_api_internal_cache_query(api_name, election_id_list_serialized)
+            cached_entry = query.values('id', 'cached_api_response_serialized', 'date_cached').first()
+            success = True
+        except Exception as e:
+            success = False
+            status += 'RETRIEVE_LATEST_CACHE_SERIALIZED_ERROR ' + str(e) + ' '
+
+        if not cached_entry:
+            status += "RETRIEVE_LATEST_CACHE_SERIALIZED_NOT_FOUND "
+            results = {
+                'success':                          success,
+                'status':                           status,
+                'api_internal_cache_found':         False,
+                'api_internal_cache_id':            0,
+                'cached_api_response_serialized':   '',
+                'date_cached':                      None,
+            }
+            return results
+
+        cached_entry = {
+            'api_internal_cache_id':            cached_entry['id'],
+            'cached_api_response_serialized':   cached_entry['cached_api_response_serialized'],
+            'date_cached':                      cached_entry['date_cached'],
+        }
+        api_internal_cache_local_tier.set(cache_key, cached_entry)
+        if shared_tier is not None:
+            try:
+                shared_tier.set('payload:' + cache_key, cached_entry, API_INTERNAL_CACHE_SHARED_TTL_SECONDS)
+                if current_version is None:
+                    shared_tier.add(
+                        'version:' + cache_key, cached_entry['api_internal_cache_id'],
+                        API_INTERNAL_CACHE_SHARED_TTL_SECONDS)
+            except Exception as e:
+                status += 'API_INTERNAL_CACHE_SHARED_TIER_ERROR ' + str(e) + ' '
+        status += "API_INTERNAL_CACHE_DATABASE_HIT "
+        return dict(cached_entry, success=True, status=status, api_internal_cache_found=True)
+
+    def retrieve_latest_api_internal_cache_query(self, api_name='', election_id_list_serialized=''):
+        query = ApiInternalCache.objects.filter(
+            api_name__iexact=api_name,
+            election_id_list_serialized__iexact=election_id_list_serialized,
+            replaced=False)
+        query = query.exclude(cached_api_response_serialized='')
+        return query.order_by('-date_cached')
+
+    def schedule_refresh_of_api_internal_cache_if_due(
+            self,
+            api_name='',
+            election_id_list_serialized='',
+            date_cached=None):
+        """
+        Call schedule_refresh_of_api_internal_cache at most once per API_INTERNAL_CACHE_SCHEDULE_REFRESH_TTL_SECONDS
+        per worker, instead of on every request.
+        """
+        cache_key = generate_api_internal_cache_key(api_name, election_id_list_serialized)
+        if cache_key in api_refresh_scheduled_local_tier:
+            results = {
+                'success':  True,
+                'status':   "API_REFRESH_RECENTLY_SCHEDULED_BY_THIS_WORKER ",
+            }
+            return results
+        results = self.schedule_refresh_of_api_internal_cache(
+            api_name=api_name,
+            election_id_list_serialized=election_id_list_serialized,
+            date_cached=date_cached)
+        if results['success']:
+            api_refresh_scheduled_local_tier.set(cache_key, True)
+        return results
+
     def schedule_refresh_of_api_internal_cache(
             self,
             api_name='',
             election_id_list_serialized='',
-            api_internal_cache=None):
+            api_internal_cache=None,
+            date_cached=None):
         api_internal_cache_found = False
         status = ''
         success = True
@@ -298,6 +482,10 @@ class ApiInternalCacheManager(models.Manager):
             # Work with this existing object
             api_internal_cache_found = True
             status += "API_INTERNAL_CACHE_PASSED_IN "
+        elif date_cached is not None:
+            # We only need to know when the latest cache entry was created
+            api_internal_cache_found = True
+            status += "API_INTERNAL_CACHE_DATE_CACHED_PASSED_IN "
         else:
             status += "API_INTERNAL_CACHE_NOT_PASSED_IN "
             results = self.retrieve_latest_api_internal_cache(
@@ -313,9 +501,11 @@ class ApiInternalCacheManager(models.Manager):
         create_entry_immediately = False
         if not api_internal_cache_found:
             create_entry_immediately = True
-        elif api_internal_cache and hasattr(api_internal_cache, 'date_cached'):
+        else:
+            if api_internal_cache and hasattr(api_internal_cache, 'date_cached'):
+                date_cached = api_internal_cache.date_cached
             sixty_minutes_ago = now() - timedelta(hours=1)
-            if api_internal_cache.date_cached < sixty_minutes_ago:
+            if date_cached is not None and date_cached < sixty_minutes_ago:
                 create_entry_immediately = True
         if create_entry_immediately:
             # We don't pass in date_refresh_is_needed, so it assumes value is "immediately"
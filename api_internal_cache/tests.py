@@ -0,0 +1,38 @@
+from django.test import TestCase
+
+from api_internal_cache.models import api_internal_cache_local_tier, ApiInternalCacheManager
+
+
+class ApiInternalCacheTiersTestCase(TestCase):
+    databases = ["default", "readonly"]
+
+    def setUp(self):
+        api_internal_cache_local_tier.clear()
+        self.api_internal_cache_manager = ApiInternalCacheManager()
+
+    def test_local_tier_is_served_without_asking_postgres(self):
+        results = self.api_internal_cache_manager.create_api_internal_cache(
+            api_name='voterGuidesUpcoming', election_id_list_serialized='[4184]',
+            cached_api_response_serialized='{"voter_guides": []}')
+        self.assertTrue(results['api_internal_cache_saved'])
+
+        results = self.api_internal_cache_manager.retrieve_latest_api_internal_cache_serialized(
+            api_name='voterGuidesUpcoming', election_id_list_serialized='[4184]')
+        self.assertIn("API_INTERNAL_CACHE_DATABASE_HIT", results['status'])
+        with self.assertNumQueries(0):
+            results = self.api_internal_cache_manager.retrieve_latest_api_internal_cache_serialized(
+                api_name='VoterGuidesUpcoming', election_id_list_serialized='[4184]')
+        self.assertIn("API_INTERNAL_CACHE_LOCAL_TIER_HIT", results['status'])
+        self.assertEqual(results['cached_api_response_serialized'], '{"voter_guides": []}')
+
+    def test_refresh_by_this_worker_replaces_its_local_tier(self):
+        for cached_api_response_serialized in ['{"version": 1}', '{"version": 2}']:
+            results = self.api_internal_cache_manager.create_api_internal_cache(
+                api_name='voterGuidesUpcoming', election_id_list_serialized='[4184]',
+                cached_api_response_serialized=cached_api_response_serialized)
+            self.api_internal_cache_manager.mark_prior_api_internal_cache_entries_as_replaced(
+                api_name='voterGuidesUpcoming', election_id_list_serialized='[4184]',
+                excluded_api_internal_cache_id=results['api_internal_cache_id'])
+            results = self.api_internal_cache_manager.retrieve_latest_api_internal_cache_serialized(
+                api_name='voterGuidesUpcoming', election_id_list_serialized='[4184]')
+            self.assertEqual(results['cached_api_response_serialized'], cached_api_response_serialized)
@@ -25,6 +25,22 @@ def search_all_doc_template_values(url_root):
         },
     ]
     optional_query_parameter_list = [
+        {
+            'name':         'search_scope_list[]',
+            'value':        'string',  # boolean, integer, long, string
+            'description':  'Limit the search to: CN (candidates), MN (measures), ON (organizations), '
+                            'PN (politicians). Search everything if not passed in.',
+        },
+        {
+            'name':         'start_retrieve_at_this_number',
+            'value':        'integer',  # boolean, integer, long, string
+            'description':  'Skip this many of the best results. Defaults to 0.',
+        },
+        {
+            'name':         'maximum_number_to_retrieve',
+            'value':        'integer',  # boolean, integer, long, string
+            'description':  'Return at most this many results, best first. Defaults to 50.',
+        },
     ]
 
     potential_status_codes_list = [
@@ -48,6 +64,7 @@ def search_all_doc_template_values(url_root):
                    '  "voter_device_id": string (88 characters long),\n' \
                    '  "text_from_search_field": string,\n' \
                    '  "search_results_found": boolean,\n' \
+                   '  "search_results_total": integer,\n' \
                    '  "search_results": list\n' \
                    '   [{\n' \
                    '     "result_title": string,\n' \
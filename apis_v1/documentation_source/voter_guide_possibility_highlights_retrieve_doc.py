@@ -35,6 +35,13 @@ def voter_guide_possibility_highlights_retrieve_doc_template_values(url_root):
             'value':        'integer',  # boolean, integer, long, string
             'description':  'The Google civic election ID. Provide a value, only if you want data for a prior election.',
         },
+        {
+            'name':         'text_to_scan',
+            'value':        'string',  # boolean, integer, long, string
+            'description':  'The text of the page (or PDF), which can be sent with POST. If provided, the names are '
+                            'found on the server: highlight_list only has the names found, and match_list says '
+                            'where each one is.',
+        },
     ]
 
     potential_status_codes_list = [
@@ -77,6 +84,14 @@ def voter_guide_possibility_highlights_retrieve_doc_template_values(url_root):
                    '      "prior": integer, (\'1\' if from a prior election)\n'\
                    '    }\n' \
                    '  ],\n' \
+                   '  "match_list": list [ (only when text_to_scan is provided)\n' \
+                   '    {\n' \
+                   '      "name": string,\n' \
+                   '      "we_vote_id": string,\n' \
+                   '      "start": integer, (offset in text_to_scan of the first character)\n' \
+                   '      "end": integer, (offset in text_to_scan just past the last character)\n' \
+                   '    }\n' \
+                   '  ],\n' \
                    '  "never_highlight_on": list [\n' \
                    '     "*.wevote.us",\n' \
                    '     "api.wevoteusa.org",\n' \
@@ -4,9 +4,15 @@
 
 from future.standard_library import install_aliases
 from django.urls import reverse
+from django.core.cache import caches
 from django.test import TestCase
 from django.test import Client
+from django.test import override_settings
 import json
+import tempfile
+from voter.controllers import voter_sign_out_for_api
+from voter.models import fetch_voter_we_vote_id_from_voter_device_link, generate_voter_identity_cache_key, \
+    VoterDeviceLink
 install_aliases()
 
 
@@ -80,3 +86,59 @@ class WeVoteAPIsV1TestsVoterRetrieve(TestCase):
                          "last_name expected in the voterRetrieveView json response but not found")
         self.assertEqual('email' in json_data3, True,
                          "email expected in the voterRetrieveView json response but not found")
+
+    def test_sign_out_clears_cached_voter_identity(self):
+        response = self.client2.get(self.generate_voter_device_id_url)
+        voter_device_id = json.loads(response.content.decode())['voter_device_id']
+        response2 = self.client2.get(self.voter_create_url, {'voter_device_id': voter_device_id})
+        json_data2 = json.loads(response2.content.decode())
+
+        # The first lookup fills the identity cache
+        self.assertEqual(fetch_voter_we_vote_id_from_voter_device_link(voter_device_id), json_data2['voter_we_vote_id'])
+
+        voter_sign_out_for_api(voter_device_id)
+        self.assertEqual(fetch_voter_we_vote_id_from_voter_device_link(voter_device_id), None,
+                         "voter_device_id should no longer resolve to a voter after voterSignOut")
+
+    def create_voter_and_fill_identity_cache(self):
+        response = self.client2.get(self.generate_voter_device_id_url)
+        voter_device_id = json.loads(response.content.decode())['voter_device_id']
+        response2 = self.client2.get(self.voter_create_url, {'voter_device_id': voter_device_id})
+        voter_we_vote_id = json.loads(response2.content.decode())['voter_we_vote_id']
+        self.assertEqual(fetch_voter_we_vote_id_from_voter_device_link(voter_device_id), voter_we_vote_id)
+        return voter_device_id, voter_we_vote_id
+
+    def test_per_process_cache_is_not_used_for_voter_identity(self):
+        voter_device_id, voter_we_vote_id = self.create_voter_and_fill_identity_cache()
+        self.assertIsNone(caches['default'].get(generate_voter_identity_cache_key(voter_device_id)),
+                          "A LocMemCache entry could not be cleared on the other workers at voterSignOut")
+        with self.assertNumQueries(1):
+            self.assertEqual(fetch_voter_we_vote_id_from_voter_device_link(voter_device_id), voter_we_vote_id)
+        with self.assertNumQueries(1):
+            self.assertEqual(fetch_voter_we_vote_id_from_voter_device_link('unknown_device'), None)
+
+    def test_sign_out_clears_shared_voter_identity_cache(self):
+        with tempfile.TemporaryDirectory() as cache_directory:
+            shared_caches = {'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_directory}}
+            with override_settings(CACHES=shared_caches):
+                voter_device_id, voter_we_vote_id = self.create_voter_and_fill_identity_cache()
+                self.assertIsNotNone(caches['default'].get(generate_voter_identity_cache_key(voter_device_id)))
+
+                voter_sign_out_for_api(voter_device_id)
+                self.assertIsNone(caches['default'].get(generate_voter_identity_cache_key(voter_device_id)))
+                self.assertEqual(fetch_voter_we_vote_id_from_voter_device_link(voter_device_id), None)
+
+    def test_sign_out_all_devices_clears_every_device_in_shared_voter_identity_cache(self):
+        with tempfile.TemporaryDirectory() as cache_directory:
+            shared_caches = {'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_directory}}
+            with override_settings(CACHES=shared_caches):
+                voter_device_id, voter_we_vote_id = self.create_voter_and_fill_identity_cache()
+                voter_device_link = VoterDeviceLink.objects.get(voter_device_id=voter_device_id)
+                VoterDeviceLink.objects.create(voter_device_id='second_device', voter_id=voter_device_link.voter_id)
+                self.assertEqual(fetch_voter_we_vote_id_from_voter_device_link('second_device'), voter_we_vote_id)
+
+                voter_sign_out_for_api(voter_device_id, sign_out_all_devices=True)
+                self.assertEqual(fetch_voter_we_vote_id_from_voter_device_link(voter_device_id), None)
+                self.assertEqual(fetch_voter_we_vote_id_from_voter_device_link('second_device'), None)
@@ -2,10 +2,11 @@
 # Brought to you by We Vote. Be good.
 # -*- coding: UTF-8 -*-
 from ballot.controllers import all_ballot_items_retrieve_for_api, ballot_item_highlights_retrieve_for_api, \
-    ballot_item_options_retrieve_for_api, ballot_items_search_retrieve_for_api
+    ballot_item_options_retrieve_for_api, ballot_items_search_retrieve_for_api, retrieve_ballot_snapshot_for_api
 from candidate.controllers import candidate_retrieve_for_api
 from config.base import get_environment_variable
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified
+import gzip
 import json
 from measure.controllers import measure_retrieve_for_api
 from office.controllers import office_retrieve_for_api
@@ -33,11 +34,39 @@ def all_ballot_items_retrieve_view(request):  # allBallotItemsRetrieve
     if use_test_election:
         google_civic_election_id = 2000  # The Google Civic test election
 
+    if positive_value_exists(google_civic_election_id):
+        results = retrieve_ballot_snapshot_for_api(google_civic_election_id, state_code)
+        if results['ballot_snapshot_found']:
+            return ballot_snapshot_http_response(request, results['snapshot_json_gzip'], results['snapshot_etag'])
+
     json_data = all_ballot_items_retrieve_for_api(google_civic_election_id, state_code)
 
     return HttpResponse(json.dumps(json_data), content_type='application/json')
 
 
+def ballot_snapshot_http_response(request, snapshot_json_gzip, snapshot_etag):
+    """
+    Serve a stored snapshot: 304 when the client already has this ETag, and the stored gzip bytes as-is when the
+    client accepts gzip
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if positive_value_exists(if_none_match) and positive_value_exists(snapshot_etag):
+        etag_list = [one_etag.strip().replace('W/', '', 1) for one_etag in if_none_match.split(',')]
+        if snapshot_etag in etag_list or '*' in etag_list:
+            response = HttpResponseNotModified()
+            response['ETag'] = snapshot_etag
+            return response
+
+    if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(snapshot_json_gzip, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(gzip.decompress(snapshot_json_gzip), content_type='application/json')
+    response['ETag'] = snapshot_etag
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
 def ballot_item_highlights_retrieve_view(request):  # ballotItemHighlightsRetrieve
     json_data = ballot_item_highlights_retrieve_for_api()
     response = HttpResponse(json.dumps(json_data), content_type='application/json')
@@ -7,10 +7,11 @@ import json
 import sys
 from office.controllers import office_retrieve_for_api
 from quick_info.controllers import quick_info_retrieve_for_api
-from search.controllers import search_all_for_api
+from search.controllers import search_all_for_api, SEARCH_ALL_DEFAULT_PAGE_SIZE
 import wevote_functions.admin
 from voter.models import VoterDeviceLinkManager
-from wevote_functions.functions import generate_voter_device_id, get_voter_device_id, positive_value_exists
+from wevote_functions.functions import convert_to_int, generate_voter_device_id, get_voter_device_id, \
+    positive_value_exists
 
 logger = wevote_functions.admin.get_logger(__name__)
 
@@ -120,7 +121,10 @@ def search_all_view(request):  # searchAll
     search_scope_list = request.GET.getlist('search_scope_list[]')
     search_scope_list = list(filter(None, search_scope_list))
     # search_scope_list options
-    # PN = POLITICIAN_NAME
+    # CN = CANDIDATE_NAME, MN = MEASURE_NAME, ON = ORGANIZATION_NAME, PN = POLITICIAN_NAME
+    start_retrieve_at_this_number = convert_to_int(request.GET.get('start_retrieve_at_this_number', 0))
+    maximum_number_to_retrieve = convert_to_int(
+        request.GET.get('maximum_number_to_retrieve', SEARCH_ALL_DEFAULT_PAGE_SIZE))
 
     if not positive_value_exists(text_from_search_field):
         status = 'MISSING_TEXT_FROM_SEARCH_FIELD'
@@ -136,7 +140,9 @@ def search_all_view(request):  # searchAll
     results = search_all_for_api(
         text_from_search_field=text_from_search_field,
         voter_device_id=voter_device_id,
-        search_scope_list=search_scope_list)
+        search_scope_list=search_scope_list,
+        start_retrieve_at_this_number=start_retrieve_at_this_number,
+        maximum_number_to_retrieve=maximum_number_to_retrieve)
     # results = search_all_elastic_for_api(text_from_search_field, voter_device_id)  #
     status = "UNABLE_TO_FIND_ANY_SEARCH_RESULTS "
     search_results = []
@@ -151,6 +157,7 @@ def search_all_view(request):  # searchAll
         'success':                  True,
         'text_from_search_field':   text_from_search_field,
         'voter_device_id':          voter_device_id,
+        'search_results_total':     results.get('search_results_total', 0),
         'search_results':           search_results,
     }
     return HttpResponse(json.dumps(json_data), content_type='application/json')
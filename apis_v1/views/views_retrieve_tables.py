@@ -2,9 +2,10 @@
 # Brought to you by We Vote. Be good.
 # -*- coding: UTF-8 -*-
 from config.base import get_environment_variable
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 import json
-from retrieve_tables.controllers import retrieve_sql_tables_as_csv
+from retrieve_tables.controllers import allowable_tables, retrieve_sql_table_as_csv_stream, \
+    retrieve_sql_tables_as_csv, zstandard
 import wevote_functions.admin
 
 logger = wevote_functions.admin.get_logger(__name__)
@@ -19,6 +20,27 @@ def retrieve_sql_tables(request):  # retrieveSQLTables
     :return:
     """
     table = request.GET.get('table', '')
+    if 'last_id' in request.GET:
+        # Stream the table as compressed CSV, starting after last_id, so the client can resume where it left off
+        last_id = request.GET.get('last_id', 0)
+        compression = request.GET.get('compression', 'gzip')
+        if compression == 'zstd' and zstandard is None:
+            compression = 'gzip'
+        if table not in allowable_tables:
+            json_data = {
+                'success': False,
+                'status': "the table_name '" + table + "' is not in the table list, therefore no table was returned",
+            }
+            return HttpResponse(json.dumps(json_data), content_type='application/json', status=400)
+        content_type = 'text/csv'
+        if compression == 'gzip':
+            content_type = 'application/gzip'
+        elif compression == 'zstd':
+            content_type = 'application/zstd'
+        return StreamingHttpResponse(
+            retrieve_sql_table_as_csv_stream(table, last_id=last_id, compression=compression),
+            content_type=content_type)
+
     start = request.GET.get('start', '')
     end = request.GET.get('end', '')
     json_data = retrieve_sql_tables_as_csv(table, start, end)
@@ -4,6 +4,7 @@
 
 from ballot.controllers import choose_election_from_existing_data
 from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
 import json
 from api_internal_cache.models import ApiInternalCacheManager
 from position.models import FRIENDS_AND_PUBLIC, FRIENDS_ONLY, PUBLIC_ONLY
@@ -92,23 +93,28 @@ def voter_guide_possibility_position_save_view(request):  # voterGuidePossibilit
     return HttpResponse(json.dumps(json_data), content_type='application/json')
 
 
+@csrf_exempt
 def voter_guide_possibility_highlights_retrieve_view(request):  # voterGuidePossibilityHighlightsRetrieve
     """
     Retrieve the possible highlights from one organization on one page.
+    The page text can be large, so text_to_scan (and the other variables) can also be sent with POST.
     :param request:
     :return:
     """
+    request_variables = request.POST if request.method == 'POST' else request.GET
     voter_device_id = get_voter_device_id(request)  # We standardize how we take in the voter_device_id
-    limit_to_existing = request.GET.get('limit_to_existing', '')
-    url_to_scan = request.GET.get('url_to_scan', '')
-    pdf_url = request.GET.get('pdf_url', '')
-    google_civic_election_id = request.GET.get('google_civic_election_id', 0)
+    limit_to_existing = request_variables.get('limit_to_existing', '')
+    url_to_scan = request_variables.get('url_to_scan', '')
+    pdf_url = request_variables.get('pdf_url', '')
+    google_civic_election_id = request_variables.get('google_civic_election_id', 0)
+    text_to_scan = request_variables.get('text_to_scan', '')
     json_data = voter_guide_possibility_highlights_retrieve_for_api(
         voter_device_id=voter_device_id,
         url_to_scan=url_to_scan,
         limit_to_existing=limit_to_existing,
         pdf_url=pdf_url,
-        google_civic_election_id=google_civic_election_id)
+        google_civic_election_id=google_civic_election_id,
+        text_to_scan=text_to_scan)
     return HttpResponse(json.dumps(json_data), content_type='application/json')
 
 
@@ -336,9 +342,8 @@ def voter_guides_upcoming_retrieve_view(request):  # voterGuidesUpcomingRetrieve
     :return:
     """
     status = ""
-    api_internal_cache = None
-    api_internal_cache_found = False
-    json_data = {}
+    cached_api_response_serialized = ''
+    date_cached = None
 
     google_civic_election_id_list = request.GET.getlist('google_civic_election_id_list[]')
 
@@ -348,29 +353,29 @@ def voter_guides_upcoming_retrieve_view(request):  # voterGuidesUpcomingRetrieve
     else:
         google_civic_election_id_list = []
 
-    # Since this API assembles a lot of data, we pre-cache it. Get the data cached most recently.
+    # Since this API assembles a lot of data, we pre-cache it. Get the data cached most recently, already serialized,
+    #  from the fastest cache tier that has it.
     api_internal_cache_manager = ApiInternalCacheManager()
     election_id_list_serialized = json.dumps(google_civic_election_id_list)
-    results = api_internal_cache_manager.retrieve_latest_api_internal_cache(
+    results = api_internal_cache_manager.retrieve_latest_api_internal_cache_serialized(
         api_name='voterGuidesUpcoming',
         election_id_list_serialized=election_id_list_serialized)
     if results['api_internal_cache_found']:
-        api_internal_cache_found = True
-        api_internal_cache = results['api_internal_cache']
-        json_data = results['cached_api_response_json_data']
+        cached_api_response_serialized = results['cached_api_response_serialized']
+        date_cached = results['date_cached']
 
     # Schedule the next retrieve. It is possible for the first retrieve
     # of the day (above) to be using data from a few days ago.
-    results = api_internal_cache_manager.schedule_refresh_of_api_internal_cache(
+    results = api_internal_cache_manager.schedule_refresh_of_api_internal_cache_if_due(
         api_name='voterGuidesUpcoming',
         election_id_list_serialized=election_id_list_serialized,
-        api_internal_cache=api_internal_cache,
+        date_cached=date_cached,
     )
     # Add a log entry here
 
-    if not api_internal_cache_found:
+    if not positive_value_exists(cached_api_response_serialized):
         results = voter_guides_upcoming_retrieve_for_api(google_civic_election_id_list=google_civic_election_id_list)
         status += results['status']
-        json_data = results['json_data']
+        cached_api_response_serialized = json.dumps(results['json_data'])
 
-    return HttpResponse(json.dumps(json_data), content_type='application/json')
+    return HttpResponse(cached_api_response_serialized, content_type='application/json')
@@ -3,7 +3,8 @@
 # -*- coding: UTF-8 -*-
 
 from .models import BallotItemListManager, BallotItemManager, BallotReturnedListManager, BallotReturnedManager, \
-    CANDIDATE, find_best_previously_stored_ballot_returned, OFFICE, MEASURE, \
+    BALLOT_SNAPSHOT_NATIONAL_STATE_CODE, BallotSnapshotManager, CANDIDATE, \
+    find_best_previously_stored_ballot_returned, normalize_ballot_snapshot_state_code, OFFICE, MEASURE, \
     VoterBallotSaved, VoterBallotSavedManager
 from candidate.models import CandidateListManager
 from config.base import get_environment_variable
@@ -12,18 +13,22 @@ import datetime as the_other_datetime
 from election.controllers import retrieve_upcoming_election_id_list
 from election.models import ElectionManager
 from exception.models import handle_exception
+import gzip
+import hashlib
 from import_export_google_civic.controllers import \
     refresh_voter_ballot_items_from_google_civic_from_voter_ballot_saved, \
     voter_ballot_items_retrieve_from_google_civic_for_api
 from measure.models import ContestMeasureListManager, ContestMeasureManager
-from office.models import ContestOfficeManager, ContestOfficeListManager
+from office.models import ContestOfficeListManager
 from polling_location.models import PollingLocationManager
 import pytz
+import threading
 from voter.models import BALLOT_ADDRESS, VoterAddress, VoterAddressManager, VoterDeviceLinkManager, VoterManager
 import wevote_functions.admin
 from wevote_functions.functions import convert_to_int, extract_state_code_from_address_string, positive_value_exists, \
     process_request_from_master, strip_html_tags
 from geopy.geocoders import get_geocoder_for_service
+import json
 
 logger = wevote_functions.admin.get_logger(__name__)
 
@@ -34,6 +39,10 @@ WE_VOTE_API_KEY = get_environment_variable("WE_VOTE_API_KEY")
 BALLOT_ITEMS_SYNC_URL = get_environment_variable("BALLOT_ITEMS_SYNC_URL")  # ballotItemsSyncOut
 BALLOT_RETURNED_SYNC_URL = get_environment_variable("BALLOT_RETURNED_SYNC_URL")  # ballotReturnedSyncOut
 
+# One lock per (google_civic_election_id, normalized state_code) snapshot, see fetch_ballot_snapshot_refresh_lock
+ballot_snapshot_refresh_lock_dict = {}
+ballot_snapshot_refresh_lock_dict_lock = threading.Lock()
+
 
 def ballot_items_import_from_master_server(request, google_civic_election_id, state_code):
     """
@@ -141,44 +150,21 @@ def filter_ballot_items_structured_json_for_local_duplicates(structured_json):
     duplicates_removed = 0
     filtered_structured_json = []
     ballot_item_list_manager = BallotItemListManager()
-    for one_ballot_item in structured_json:
-        ballot_item_display_name = one_ballot_item['ballot_item_display_name'] \
-            if 'ballot_item_display_name' in one_ballot_item else ''
-        google_civic_election_id = one_ballot_item['google_civic_election_id'] \
-            if 'google_civic_election_id' in one_ballot_item else ''
-        state_code = one_ballot_item['state_code'] \
-            if 'state_code' in one_ballot_item else ''
-        polling_location_we_vote_id = one_ballot_item['polling_location_we_vote_id'] \
-            if 'polling_location_we_vote_id' in one_ballot_item else ''
-        contest_office_we_vote_id = None
-        contest_measure_we_vote_id = None
-        # Check to see if there is an entry that matches in all critical ways, minus the
-        # contest_office_we_vote_id or contest_measure_we_vote_id. That is, an entry for a
-        # google_civic_election_id + polling_location_we_vote_id that has the same ballot_item_display_name,
-        # but different contest_office_we_vote_id or contest_measure_we_vote_id
-        # contest_office_we_vote_id = one_ballot_item['contest_office_we_vote_id'] \
-        #     if 'contest_office_we_vote_id' in one_ballot_item else ''
-        # contest_measure_we_vote_id = one_ballot_item['contest_measure_we_vote_id'] \
-        #     if 'contest_measure_we_vote_id' in one_ballot_item else ''
-        voter_id = 0
-        results = ballot_item_list_manager.retrieve_possible_duplicate_ballot_items(
-            ballot_item_display_name, google_civic_election_id,
-            polling_location_we_vote_id, voter_id,
-            contest_office_we_vote_id, contest_measure_we_vote_id, state_code)
-
-        if results['ballot_item_list_found']:
+    # Check to see if there is an entry that matches in all critical ways, minus the
+    # contest_office_we_vote_id or contest_measure_we_vote_id. That is, an entry for a
+    # google_civic_election_id + polling_location_we_vote_id that has the same ballot_item_display_name,
+    # but different contest_office_we_vote_id or contest_measure_we_vote_id
+    results = ballot_item_list_manager.retrieve_possible_duplicate_ballot_items_in_bulk(structured_json)
+    for one_ballot_item, possible_duplicate_found in zip(structured_json, results['possible_duplicate_found_list']):
+        if possible_duplicate_found:
             # There seems to be a duplicate already in this database using a different we_vote_id
             duplicates_removed += 1
         else:
             filtered_structured_json.append(one_ballot_item)
 
-        count = duplicates_removed + len(filtered_structured_json)
-        if not count % 10000:
-            print("... ballot items checked for duplicates: " + str(count) + " of " + str(len(structured_json)))
-
     ballot_items_results = {
         'success':              True,
-        'status':               "FILTER_BALLOT_ITEMS_FOR_DUPLICATES_PROCESS_COMPLETE",
+        'status':               "FILTER_BALLOT_ITEMS_FOR_DUPLICATES_PROCESS_COMPLETE " + results['status'],
         'duplicates_removed':   duplicates_removed,
         'structured_json':      filtered_structured_json,
     }
@@ -196,35 +182,19 @@ def filter_ballot_returned_structured_json_for_local_duplicates(structured_json)
     duplicates_removed = 0
     filtered_structured_json = []
     ballot_returned_list_manager = BallotReturnedListManager()
-    for one_ballot_returned in structured_json:
-        polling_location_we_vote_id = one_ballot_returned['polling_location_we_vote_id'] \
-            if 'polling_location_we_vote_id' in one_ballot_returned else ''
-        google_civic_election_id = \
-            one_ballot_returned['google_civic_election_id'] if 'google_civic_election_id' in one_ballot_returned else ''
-        normalized_line1 = one_ballot_returned['normalized_line1'] if 'normalized_line1' in one_ballot_returned else ''
-        normalized_zip = one_ballot_returned['normalized_zip'] if 'normalized_zip' in one_ballot_returned else ''
-
-        # Check to see if there is an entry that matches in all critical ways, minus the polling_location_we_vote_id
-        results = ballot_returned_list_manager.retrieve_possible_duplicate_ballot_returned(
-            google_civic_election_id, normalized_line1, normalized_zip, polling_location_we_vote_id)
-
-        if results['ballot_returned_list_found']:
+    # Check to see if there is an entry that matches in all critical ways, minus the polling_location_we_vote_id
+    results = ballot_returned_list_manager.retrieve_possible_duplicate_ballot_returned_in_bulk(structured_json)
+    for one_ballot_returned, possible_duplicate_found in \
+            zip(structured_json, results['possible_duplicate_found_list']):
+        if possible_duplicate_found:
             # There seems to be a duplicate already in this database using a different we_vote_id
             duplicates_removed += 1
         else:
             filtered_structured_json.append(one_ballot_returned)
-        processed = duplicates_removed + len(filtered_structured_json)
-        if processed % 5000 == 0:
-            print("... pre-processed " + str(processed) + " ballot returned imports")
-
-        processed = duplicates_removed + len(filtered_structured_json)
-        if not processed % 10000:
-            print("... ballots returned, checked for duplicates: " + str(processed) + " of " +
-                  str(len(structured_json)))
 
     ballot_returned_results = {
         'success':              True,
-        'status':               "FILTER_BALLOT_RETURNED_ITEMS_FOR_DUPLICATES_PROCESS_COMPLETE",
+        'status':               "FILTER_BALLOT_RETURNED_ITEMS_FOR_DUPLICATES_PROCESS_COMPLETE " + results['status'],
         'duplicates_removed':   duplicates_removed,
         'structured_json':      filtered_structured_json,
     }
@@ -960,6 +930,240 @@ def all_ballot_items_retrieve_for_api(google_civic_election_id, state_code=''):
     return json_data
 
 
+def render_ballot_snapshot(json_data):
+    """
+    :return: (snapshot_json_gzip, snapshot_etag). The ETag comes from the uncompressed JSON.
+    """
+    snapshot_json = json.dumps(json_data).encode('utf-8')
+    snapshot_etag = '"' + hashlib.sha1(snapshot_json).hexdigest() + '"'
+    return gzip.compress(snapshot_json), snapshot_etag
+
+
+def refresh_ballot_snapshot(google_civic_election_id, state_code=''):
+    """
+    Render allBallotItemsRetrieve for one (election, state) and store it as a BallotSnapshot, along with the ballot
+    items belonging to that state. Called on the first request after invalidate_ballot_snapshots cleared it.
+    A render with no ballot items is returned, but not stored.
+    :param google_civic_election_id:
+    :param state_code: As spelled in the request, which is what the response echoes back
+    :return:
+    """
+    status = ""
+    ballot_snapshot_manager = BallotSnapshotManager()
+    normalized_state_code = normalize_ballot_snapshot_state_code(state_code)
+
+    json_data = all_ballot_items_retrieve_for_api(google_civic_election_id, state_code)
+    if not positive_value_exists(json_data['success']):
+        status += "REFRESH_BALLOT_SNAPSHOT-NOT_SAVED " + json_data['status']
+        results = {
+            'success':              False,
+            'status':               status,
+            'snapshot_json_gzip':   None,
+            'snapshot_etag':        '',
+        }
+        return results
+
+    snapshot_json_gzip, snapshot_etag = render_ballot_snapshot(json_data)
+    ballot_item_list_by_state = {}
+    for one_ballot_item in json_data['ballot_item_list']:
+        item_state_code = one_ballot_item.get('state_code') or BALLOT_SNAPSHOT_NATIONAL_STATE_CODE
+        ballot_item_list_by_state.setdefault(item_state_code, []).append(one_ballot_item)
+    ballot_item_list_json_by_state = ballot_snapshot_manager.retrieve_ballot_item_list_json_by_state(
+        google_civic_election_id)
+
+    if positive_value_exists(normalized_state_code):
+        if len(json_data['ballot_item_list']):
+            results = ballot_snapshot_manager.save_ballot_snapshot(
+                google_civic_election_id, normalized_state_code,
+                ballot_item_list_json=json.dumps(ballot_item_list_by_state.get(normalized_state_code, [])),
+                snapshot_json_gzip=snapshot_json_gzip,
+                snapshot_etag=snapshot_etag,
+                rendered_state_code=state_code)
+        else:
+            results = ballot_snapshot_manager.delete_ballot_snapshot(google_civic_election_id, normalized_state_code)
+        status += results['status']
+
+        # A state's ballot includes the offices not tied to any state, so keep those current too. Measures are only
+        #  retrieved for the state itself, so the national measures come from the last nationwide render, and if
+        #  we don't have those, the national ballot items are left for the next nationwide render.
+        national_ballot_item_list_json = ballot_item_list_json_by_state.get(BALLOT_SNAPSHOT_NATIONAL_STATE_CODE)
+        if national_ballot_item_list_json is not None:
+            national_ballot_item_list = [
+                one_ballot_item for one_ballot_item in
+                ballot_item_list_by_state.get(BALLOT_SNAPSHOT_NATIONAL_STATE_CODE, [])
+                if one_ballot_item['kind_of_ballot_item'] == OFFICE]
+            national_ballot_item_list += [
+                one_ballot_item for one_ballot_item in json.loads(national_ballot_item_list_json)
+                if one_ballot_item['kind_of_ballot_item'] == MEASURE]
+            new_national_ballot_item_list_json = json.dumps(national_ballot_item_list)
+            if new_national_ballot_item_list_json != national_ballot_item_list_json:
+                results = ballot_snapshot_manager.save_ballot_snapshot(
+                    google_civic_election_id, BALLOT_SNAPSHOT_NATIONAL_STATE_CODE,
+                    ballot_item_list_json=new_national_ballot_item_list_json)
+                status += results['status']
+    else:
+        # A nationwide render also gives us every state's ballot items
+        ballot_item_list_by_state.setdefault(BALLOT_SNAPSHOT_NATIONAL_STATE_CODE, [])
+        for item_state_code, ballot_item_list in ballot_item_list_by_state.items():
+            results = ballot_snapshot_manager.save_ballot_snapshot(
+                google_civic_election_id, item_state_code, ballot_item_list_json=json.dumps(ballot_item_list))
+            status += results['status']
+        for item_state_code in ballot_item_list_json_by_state:
+            if item_state_code not in ballot_item_list_by_state:
+                # No ballot items left in this state
+                results = ballot_snapshot_manager.delete_ballot_snapshot(google_civic_election_id, item_state_code)
+                status += results['status']
+        if len(json_data['ballot_item_list']):
+            results = ballot_snapshot_manager.save_ballot_snapshot(
+                google_civic_election_id, '',
+                snapshot_json_gzip=snapshot_json_gzip,
+                snapshot_etag=snapshot_etag)
+            status += results['status']
+
+    results = {
+        'success':              True,
+        'status':               status,
+        'snapshot_json_gzip':   snapshot_json_gzip,
+        'snapshot_etag':        snapshot_etag,
+    }
+    return results
+
+
+def refresh_nationwide_ballot_snapshot(google_civic_election_id):
+    """
+    Assemble the nationwide allBallotItemsRetrieve snapshot from the stored per-state ballot items, rendering only
+    the states that were invalidated since. Without the national ballot items, everything is rendered again.
+    :param google_civic_election_id:
+    :return:
+    """
+    status = ""
+    ballot_snapshot_manager = BallotSnapshotManager()
+    ballot_item_list_json_by_state = ballot_snapshot_manager.retrieve_ballot_item_list_json_by_state(
+        google_civic_election_id)
+    if ballot_item_list_json_by_state.get(BALLOT_SNAPSHOT_NATIONAL_STATE_CODE) is None:
+        return refresh_ballot_snapshot(google_civic_election_id, '')
+
+    invalidated_state_code_list = [state_code for state_code, ballot_item_list_json in
+                                   ballot_item_list_json_by_state.items() if ballot_item_list_json is None]
+    for state_code in invalidated_state_code_list:
+        results = refresh_ballot_snapshot(google_civic_election_id, state_code)
+        if not results['success']:
+            status += results['status']
+            return {
+                'success':              False,
+                'status':               status,
+                'snapshot_json_gzip':   None,
+                'snapshot_etag':        '',
+            }
+    if len(invalidated_state_code_list):
+        ballot_item_list_json_by_state = ballot_snapshot_manager.retrieve_ballot_item_list_json_by_state(
+            google_civic_election_id)
+        status += "BALLOT_SNAPSHOT_STATES_RENDERED: " + ','.join(invalidated_state_code_list) + " "
+
+    json_data = assemble_nationwide_ballot_items(google_civic_election_id, ballot_item_list_json_by_state)
+    snapshot_json_gzip, snapshot_etag = render_ballot_snapshot(json_data)
+    if len(json_data['ballot_item_list']):
+        results = ballot_snapshot_manager.save_ballot_snapshot(
+            google_civic_election_id, '', snapshot_json_gzip=snapshot_json_gzip, snapshot_etag=snapshot_etag)
+        status += results['status']
+    results = {
+        'success':              True,
+        'status':               status,
+        'snapshot_json_gzip':   snapshot_json_gzip,
+        'snapshot_etag':        snapshot_etag,
+    }
+    return results
+
+
+def assemble_nationwide_ballot_items(google_civic_election_id, ballot_item_list_json_by_state):
+    """
+    Build the nationwide allBallotItemsRetrieve response from the stored per-state ballot items, in the same order
+    all_ballot_items_retrieve_for_one_election_for_api uses: offices by name, then measures by title.
+    :param google_civic_election_id:
+    :param ballot_item_list_json_by_state:
+    :return:
+    """
+    office_list = []
+    measure_list = []
+    for ballot_item_list_json in ballot_item_list_json_by_state.values():
+        for one_ballot_item in json.loads(ballot_item_list_json or '[]'):
+            if one_ballot_item['kind_of_ballot_item'] == OFFICE:
+                office_list.append(one_ballot_item)
+            else:
+                measure_list.append(one_ballot_item)
+    office_list.sort(key=lambda one_ballot_item: one_ballot_item['ballot_item_display_name'] or '')
+    measure_list.sort(key=lambda one_ballot_item: one_ballot_item['ballot_item_display_name'] or '')
+    ballot_item_list = office_list + measure_list
+
+    election_description_text = ""
+    election_day_text = ""
+    election_manager = ElectionManager()
+    election_results = election_manager.retrieve_election(google_civic_election_id)
+    if election_results['election_found']:
+        election = election_results['election']
+        election_description_text = election.election_name
+        if positive_value_exists(election.election_day_text):
+            election_day_text = election.election_day_text
+
+    json_data = {
+        'status':                       "ALL_BALLOT_ITEMS_ASSEMBLED_FROM_STATE_SNAPSHOTS ",
+        'success':                      True,
+        'ballot_found':                 len(ballot_item_list),
+        'ballot_item_list':             ballot_item_list,
+        'election_name':                election_description_text,
+        'election_day_text':            election_day_text,
+        'google_civic_election_id':     google_civic_election_id,
+        'state_code':                   '',
+    }
+    return json_data
+
+
+def fetch_ballot_snapshot_refresh_lock(google_civic_election_id, state_code=''):
+    """
+    The lock held while rendering one allBallotItemsRetrieve snapshot in this worker, so requests arriving after
+    an invalidation wait for one render instead of each rendering the same snapshot.
+    """
+    refresh_key = (convert_to_int(google_civic_election_id), normalize_ballot_snapshot_state_code(state_code))
+    with ballot_snapshot_refresh_lock_dict_lock:
+        return ballot_snapshot_refresh_lock_dict.setdefault(refresh_key, threading.Lock())
+
+
+def retrieve_ballot_snapshot_for_api(google_civic_election_id, state_code=''):  # allBallotItemsRetrieve
+    """
+    The stored allBallotItemsRetrieve snapshot, rendering it first if we don't have it yet. Snapshots are stored
+    per state without regard to case, and the state_code in the response is spelled the way this request spelled it.
+    :param google_civic_election_id:
+    :param state_code:
+    :return:
+    """
+    ballot_snapshot_manager = BallotSnapshotManager()
+    results = ballot_snapshot_manager.retrieve_ballot_snapshot(google_civic_election_id, state_code)
+    if not results['ballot_snapshot_found']:
+        with fetch_ballot_snapshot_refresh_lock(google_civic_election_id, state_code):
+            # Another request may have rendered it while we waited for the lock
+            results = ballot_snapshot_manager.retrieve_ballot_snapshot(google_civic_election_id, state_code)
+            if not results['ballot_snapshot_found']:
+                status = results['status']
+                if positive_value_exists(normalize_ballot_snapshot_state_code(state_code)):
+                    results = refresh_ballot_snapshot(google_civic_election_id, state_code)
+                else:
+                    results = refresh_nationwide_ballot_snapshot(google_civic_election_id)
+                results = {
+                    'success':              results['success'],
+                    'status':               status + results['status'],
+                    'ballot_snapshot_found': results['snapshot_json_gzip'] is not None,
+                    'snapshot_json_gzip':   results['snapshot_json_gzip'],
+                    'snapshot_etag':        results['snapshot_etag'],
+                    'rendered_state_code':  state_code,
+                }
+    if results['ballot_snapshot_found'] and results['rendered_state_code'] != state_code:
+        json_data = json.loads(gzip.decompress(results['snapshot_json_gzip']))
+        json_data['state_code'] = state_code
+        results['snapshot_json_gzip'], results['snapshot_etag'] = render_ballot_snapshot(json_data)
+        results['rendered_state_code'] = state_code
+    return results
+
+
 def voter_ballot_items_retrieve_for_api(  # voterBallotItemsRetrieve
         voter_device_id, google_civic_election_id,
         ballot_returned_we_vote_id='', ballot_location_shortcut=''):
@@ -2022,6 +2226,82 @@ def choose_election_from_existing_data(voter_device_link, google_civic_election_
     return error_results
 
 
+def retrieve_ballot_objects_for_one_election(
+        google_civic_election_id=0,
+        state_code='',
+        office_we_vote_id_list=[],
+        include_measures=True,
+        read_only=True):
+    """
+    Bulk loader for assembling ballots. Instead of querying candidates once per office, this retrieves the offices,
+    the CandidateToOfficeLink entries, the candidates and the measures in a fixed handful of queries, and groups the
+    candidates by office in memory. Used by allBallotItemsRetrieve and voterBallotItemsRetrieve.
+    :param google_civic_election_id:
+    :param state_code: Limit offices and measures to this state (plus national offices)
+    :param office_we_vote_id_list: When passed in, retrieve exactly these offices instead of all in the election
+    :param include_measures:
+    :param read_only:
+    :return:
+    """
+    status = ""
+    office_list = []
+    office_success = True
+    measure_list = []
+    measure_success = True
+    candidate_list_by_office_we_vote_id = {}
+
+    contest_office_list_manager = ContestOfficeListManager()
+    if positive_value_exists(len(office_we_vote_id_list)):
+        office_results = contest_office_list_manager.retrieve_offices(
+            retrieve_from_this_office_we_vote_id_list=office_we_vote_id_list,
+            return_list_of_objects=True,
+            read_only=read_only)
+    else:
+        office_results = contest_office_list_manager.retrieve_all_offices_for_upcoming_election(
+            google_civic_election_id=google_civic_election_id,
+            state_code=state_code,
+            return_list_of_objects=True,
+            read_only=read_only)
+    office_success = office_results['success']
+    status += office_results['status']
+    if office_results['office_list_found']:
+        office_list = list(office_results['office_list_objects'])
+
+    if positive_value_exists(len(office_list)):
+        candidate_list_object = CandidateListManager()
+        candidate_results = candidate_list_object.retrieve_candidate_list_by_office_we_vote_id(
+            office_we_vote_id_list=[contest_office.we_vote_id for contest_office in office_list],
+            read_only=read_only)
+        status += candidate_results['status']
+        if not candidate_results['success']:
+            office_success = False
+        candidate_list_by_office_we_vote_id = candidate_results['candidate_list_by_office_we_vote_id']
+
+    if positive_value_exists(include_measures):
+        contest_measure_list_manager = ContestMeasureListManager()
+        measure_results = contest_measure_list_manager.retrieve_all_measures_for_upcoming_election(
+            google_civic_election_id_list=[google_civic_election_id],
+            state_code=state_code,
+            return_list_of_objects=True,
+            limit=0,
+            read_only=read_only)
+        measure_success = measure_results['success']
+        status += measure_results['status']
+        if measure_results['measure_list_found']:
+            measure_list = measure_results['measure_list_objects']
+
+    results = {
+        'status':                               status,
+        'success':                              office_success and measure_success,
+        'office_success':                       office_success,
+        'office_list':                          office_list,
+        'candidate_list_by_office_we_vote_id':  candidate_list_by_office_we_vote_id,
+        'measure_success':                      measure_success,
+        'measure_list':                         measure_list,
+    }
+    return results
+
+
 def all_ballot_items_retrieve_for_one_election_for_api(google_civic_election_id, state_code_to_find):
     """
     allBallotItemsRetrieve
@@ -2032,24 +2312,18 @@ def all_ballot_items_retrieve_for_one_election_for_api(google_civic_election_id,
     """
     status = ""
     success = True
-    contest_office_list_manager = ContestOfficeListManager()
-    candidate_list_object = CandidateListManager()
-    contest_measure_list_manager = ContestMeasureListManager()
 
-    ballot_item_list = []
     ballot_items_to_display = []
-    office_list = []
     results = {}
 
-    # Retrieve all offices in this election
-    read_only = True
-    return_list_of_objects = True
-    office_results = contest_office_list_manager.retrieve_all_offices_for_upcoming_election(
-        google_civic_election_id, state_code_to_find, return_list_of_objects, read_only)
-    office_success = office_results['success']
-    status += office_results['status']
-    if office_results['office_list_found']:
-        office_list = office_results['office_list_objects']
+    # Retrieve all offices, candidates and measures in this election in a fixed number of queries
+    ballot_objects_results = retrieve_ballot_objects_for_one_election(
+        google_civic_election_id=google_civic_election_id,
+        state_code=state_code_to_find)
+    status += ballot_objects_results['status']
+    office_success = ballot_objects_results['office_success']
+    office_list = ballot_objects_results['office_list']
+    candidate_list_by_office_we_vote_id = ballot_objects_results['candidate_list_by_office_we_vote_id']
 
     if not office_success:
         success = False
@@ -2070,12 +2344,9 @@ def all_ballot_items_retrieve_for_one_election_for_api(google_civic_election_id,
                 else:
                     state_code_lower_case = ""
                 try:
-                    read_only = True
-                    results = candidate_list_object.retrieve_all_candidates_for_office(
-                        office_we_vote_id=office_we_vote_id, read_only=read_only)
                     candidates_to_display = []
-                    if results['candidate_list_found']:
-                        candidate_list = results['candidate_list']
+                    candidate_list = candidate_list_by_office_we_vote_id.get(office_we_vote_id, [])
+                    if len(candidate_list):
                         for candidate in candidate_list:
                             # This should match values returned in candidates_retrieve_for_api (candidatesRetrieve)
                             candidate_state_code = candidate.state_code
@@ -2129,10 +2400,8 @@ def all_ballot_items_retrieve_for_one_election_for_api(google_civic_election_id,
                             }
                             candidates_to_display.append(one_candidate.copy())
                 except Exception as e:
-                    status = "FAILED retrieve_all_candidates_for_office: " + str(e) + " "
+                    status += "FAILED all_ballot_items_retrieve candidate_list: " + str(e) + " "
                     candidates_to_display = []
-                    if hasattr(results, 'status'):
-                        status += results['status'] + " "
 
                 if len(candidates_to_display):
                     one_ballot_item = {
@@ -2152,22 +2421,8 @@ def all_ballot_items_retrieve_for_one_election_for_api(google_civic_election_id,
                         first_no_candidates_warning = False
                     status += str(office_we_vote_id) + " "
 
-    # Retrieve all measures in this election
-    read_only = True
-    return_list_of_objects = True
-    measure_limit = 0
-    measure_list = []
-    google_civic_election_id_list = [google_civic_election_id]
-    measure_results = contest_measure_list_manager.retrieve_all_measures_for_upcoming_election(
-        google_civic_election_id_list=google_civic_election_id_list,
-        state_code=state_code_to_find,
-        return_list_of_objects=return_list_of_objects,
-        limit=measure_limit,
-        read_only=read_only)
-    measure_success = measure_results['success']
-    status += measure_results['status']
-    if measure_results['measure_list_found']:
-        measure_list = measure_results['measure_list_objects']
+    measure_success = ballot_objects_results['measure_success']
+    measure_list = ballot_objects_results['measure_list']
 
     if not measure_success:
         success = False
@@ -2524,8 +2779,6 @@ def voter_ballot_items_retrieve_for_one_election_for_api(
     """
     status = ""
     ballot_item_list_manager = BallotItemListManager()
-    contest_office_manager = ContestOfficeManager()
-    candidate_list_object = CandidateListManager()
     ballot_returned_manager = BallotReturnedManager()
     polling_location_we_vote_id = ''
 
@@ -2565,6 +2818,17 @@ def voter_ballot_items_retrieve_for_one_election_for_api(
 
     if success:
         status += "BALLOT_ITEM_LIST_FOUND "
+        office_we_vote_id_list = [ballot_item.contest_office_we_vote_id for ballot_item in ballot_item_list
+                                  if positive_value_exists(ballot_item.contest_office_we_vote_id)]
+        ballot_objects_results = retrieve_ballot_objects_for_one_election(
+            google_civic_election_id=google_civic_election_id,
+            office_we_vote_id_list=office_we_vote_id_list,
+            include_measures=False)
+        status += ballot_objects_results['status']
+        contest_office_by_we_vote_id = {}
+        for contest_office in ballot_objects_results['office_list']:
+            contest_office_by_we_vote_id[contest_office.we_vote_id] = contest_office
+        candidate_list_by_office_we_vote_id = ballot_objects_results['candidate_list_by_office_we_vote_id']
         for ballot_item in ballot_item_list:
             if ballot_item.contest_office_we_vote_id:
                 office_name = ""
@@ -2572,21 +2836,15 @@ def voter_ballot_items_retrieve_for_one_election_for_api(
                 office_id = ballot_item.contest_office_id
                 office_we_vote_id = ballot_item.contest_office_we_vote_id
                 race_office_level = ""
-                if positive_value_exists(office_we_vote_id):
-                    office_results = contest_office_manager.retrieve_contest_office_from_we_vote_id(
-                        office_we_vote_id, read_only=True)
-                    if office_results['contest_office_found']:
-                        contest_office = office_results['contest_office']
-                        office_id = contest_office.id
-                        office_name = contest_office.office_name
-                        race_office_level = contest_office.ballotpedia_race_office_level
+                if positive_value_exists(office_we_vote_id) and office_we_vote_id in contest_office_by_we_vote_id:
+                    contest_office = contest_office_by_we_vote_id[office_we_vote_id]
+                    office_id = contest_office.id
+                    office_name = contest_office.office_name
+                    race_office_level = contest_office.ballotpedia_race_office_level
                 try:
-                    results = candidate_list_object.retrieve_all_candidates_for_office(
-                        office_we_vote_id=office_we_vote_id, read_only=True)
-
                     candidates_to_display = []
-                    if results['candidate_list_found']:
-                        candidate_list = results['candidate_list']
+                    candidate_list = candidate_list_by_office_we_vote_id.get(office_we_vote_id, [])
+                    if len(candidate_list):
                         for candidate in candidate_list:
                             withdrawal_date = ''
                             if isinstance(candidate.withdrawal_date, the_other_datetime.date):
@@ -2635,10 +2893,8 @@ def voter_ballot_items_retrieve_for_one_election_for_api(
                             }
                             candidates_to_display.append(one_candidate.copy())
                 except Exception as e:
-                    status = 'FAILED retrieve_all_candidates_for_office. ' + str(e) + " "
+                    status += 'FAILED voter_ballot_items_retrieve candidate_list. ' + str(e) + " "
                     candidates_to_display = []
-                    if hasattr(results, 'status'):
-                        status += results['status'] + " "
 
                 if len(candidates_to_display):
                     one_ballot_item = {
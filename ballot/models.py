@@ -2,22 +2,30 @@
 # Brought to you by We Vote. Be good.
 # -*- coding: UTF-8 -*-
 
-from candidate.models import CandidateCampaign
+from candidate.models import CandidateCampaign, CandidateToOfficeLink
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from config.base import get_environment_variable
 from datetime import date, datetime
 from django.db import models
 from django.db.models import F, Q, Count
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
 from election.models import ElectionManager
 from exception.models import handle_exception, handle_record_found_more_than_one_exception
 from geopy.geocoders import get_geocoder_for_service
 from geopy.exc import GeocoderQuotaExceeded
-from measure.models import ContestMeasureManager
-from office.models import ContestOfficeManager
+from measure.models import ContestMeasure, ContestMeasureManager
+from office.models import ContestOffice, ContestOfficeManager
 from polling_location.models import PollingLocationManager
+import heapq
+import re
 import sys
+import threading
 import wevote_functions.admin
-from wevote_functions.functions import convert_date_to_date_as_integer, convert_to_int, \
-    extract_state_code_from_address_string, positive_value_exists, STATE_CODE_MAP
+from wevote_functions.functions import convert_date_to_date_as_integer, convert_to_int, DuplicateKeyIndex, \
+    extract_state_code_from_address_string, LocalLruCache, positive_value_exists, STATE_CODE_MAP, \
+    TokenBucketRateLimiter
 from wevote_settings.models import fetch_next_we_vote_id_ballot_returned_integer, fetch_site_unique_id_prefix
 
 OFFICE = 'OFFICE'
@@ -34,6 +42,44 @@ KIND_OF_BALLOT_ITEM_CHOICES = (
 GOOGLE_MAPS_API_KEY = get_environment_variable("GOOGLE_MAPS_API_KEY")
 GEOCODE_TIMEOUT = 10
 
+# Nearest map point lookups use one in-memory index per (google_civic_election_id, normalized_state), per worker
+MAP_POINT_INDEX_TTL_SECONDS = 600
+MAP_POINT_INDEX_MAX_INDEXES = 100
+# After this many incremental updates, an index is rebuilt instead of scanning the pending points
+MAP_POINT_INDEX_MAX_PENDING_POINTS = 500
+
+# Geocoder results are cached in the GeocodedAddress table, with an in-process LRU in front of it
+GEOCODED_ADDRESS_LOCAL_CACHE_MAX_ENTRIES = 10000
+GEOCODED_ADDRESS_LOCAL_CACHE_TTL_SECONDS = 86400
+# Google allows us 10 geocoder requests per second
+GEOCODER_BATCH_REQUESTS_PER_SECOND = 10
+GEOCODER_BATCH_NUMBER_OF_THREADS = 4
+# Rendered allBallotItemsRetrieve snapshots kept in each worker's memory, in front of the BallotSnapshot table. Each
+#  hit is checked against the stored ETag, so only the snapshot itself is saved from being read again.
+BALLOT_SNAPSHOT_LOCAL_CACHE_MAX_ENTRIES = 200
+BALLOT_SNAPSHOT_LOCAL_CACHE_TTL_SECONDS = 60
+# The BallotSnapshot row holding ballot items for offices and measures which are not tied to one state
+BALLOT_SNAPSHOT_NATIONAL_STATE_CODE = 'na'
+# The fields allBallotItemsRetrieve selects, orders or renders by. Saving anything else leaves the snapshots alone.
+BALLOT_SNAPSHOT_FIELD_NAMES_BY_MODEL = {
+    'CandidateCampaign': (
+        'we_vote_id', 'google_civic_election_id', 'state_code', 'candidate_name', 'ballotpedia_candidate_summary',
+        'ballotpedia_candidate_url', 'we_vote_hosted_profile_image_url_medium', 'we_vote_hosted_profile_image_url_tiny',
+        'party', 'candidate_twitter_handle', 'twitter_url', 'twitter_description', 'twitter_followers_count',
+        'withdrawn_from_election', 'withdrawal_date', 'do_not_display_on_ballot'),
+    'CandidateToOfficeLink': (
+        'candidate_we_vote_id', 'contest_office_we_vote_id', 'google_civic_election_id', 'state_code'),
+    'ContestMeasure': (
+        'we_vote_id', 'google_civic_election_id', 'state_code', 'measure_title', 'measure_subtitle', 'measure_text',
+        'measure_url', 'google_ballot_placement', 'ballotpedia_no_vote_description',
+        'ballotpedia_yes_vote_description'),
+    'ContestOffice': (
+        'we_vote_id', 'google_civic_election_id', 'state_code', 'office_name', 'ballotpedia_race_office_level'),
+}
+
+# What we need from a geocoder result. "address" is the formatted address returned by the geocoder.
+GeocodedLocation = namedtuple('GeocodedLocation', ['address', 'latitude', 'longitude', 'state_code'])
+
 logger = wevote_functions.admin.get_logger(__name__)
 
 
@@ -1605,6 +1651,68 @@ class BallotItemListManager(models.Manager):
         }
         return results
 
+    def retrieve_possible_duplicate_ballot_items_in_bulk(self, structured_json):
+        """
+        The same matching as retrieve_possible_duplicate_ballot_items (for map point ballot items, without office or
+        measure we_vote_ids), for a whole batch of ballot items coming in from the master server. We load the map
+        point ballot items for the incoming elections once, instead of querying once per ballot item.
+        :param structured_json: list of dicts with ballot_item_display_name, google_civic_election_id, state_code
+          and polling_location_we_vote_id
+        :return: possible_duplicate_found_list, one True/False for each incoming ballot item
+        """
+        possible_duplicate_found_list = []
+        google_civic_election_id_list = list(set(
+            str(one_ballot_item.get('google_civic_election_id', '')) for one_ballot_item in structured_json))
+        ballot_item_index = DuplicateKeyIndex()
+        normalize = DuplicateKeyIndex.normalize
+
+        try:
+            ballot_item_queryset = BallotItem.objects \
+                .filter(google_civic_election_id__in=google_civic_election_id_list) \
+                .exclude(Q(polling_location_we_vote_id__isnull=True) | Q(polling_location_we_vote_id='')) \
+                .values_list('google_civic_election_id', 'polling_location_we_vote_id', 'state_code',
+                             'ballot_item_display_name')
+            for google_civic_election_id, polling_location_we_vote_id, state_code, ballot_item_display_name \
+                    in ballot_item_queryset.iterator():
+                ballot_item_index.add((google_civic_election_id, normalize(polling_location_we_vote_id),
+                                       normalize(ballot_item_display_name)))
+                ballot_item_index.add((google_civic_election_id, normalize(polling_location_we_vote_id),
+                                       normalize(ballot_item_display_name), normalize(state_code)))
+        except Exception as e:
+            handle_exception(e, logger=logger)
+            status = 'FAILED retrieve_possible_duplicate_ballot_items_in_bulk ' \
+                     '{error} [type: {error_type}] '.format(error=e, error_type=type(e))
+            # Like retrieve_possible_duplicate_ballot_items, a ballot item we can't check is not treated as a duplicate
+            results = {
+                'success':                          False,
+                'status':                           status,
+                'possible_duplicate_found_list':    [False] * len(structured_json),
+            }
+            return results
+
+        for one_ballot_item in structured_json:
+            ballot_item_display_name = one_ballot_item.get('ballot_item_display_name', '')
+            google_civic_election_id = one_ballot_item.get('google_civic_election_id', '')
+            polling_location_we_vote_id = one_ballot_item.get('polling_location_we_vote_id', '')
+            state_code = one_ballot_item.get('state_code', '')
+            if not positive_value_exists(google_civic_election_id) \
+                    or not positive_value_exists(polling_location_we_vote_id) \
+                    or not positive_value_exists(ballot_item_display_name):
+                possible_duplicate_found_list.append(False)
+                continue
+            key = (str(google_civic_election_id), normalize(polling_location_we_vote_id),
+                   normalize(ballot_item_display_name))
+            if positive_value_exists(state_code):
+                key += (normalize(state_code),)
+            possible_duplicate_found_list.append(ballot_item_index.has_match(key))
+
+        results = {
+            'success':                          True,
+            'status':                           'POSSIBLE_DUPLICATE_BALLOT_ITEMS_CHECKED_IN_BULK ',
+            'possible_duplicate_found_list':    possible_duplicate_found_list,
+        }
+        return results
+
 
 class BallotReturned(models.Model):
     """
@@ -1693,6 +1801,197 @@ class BallotReturned(models.Model):
             return ""
 
 
+class BallotReturnedMapPointIndex(object):
+    """
+    An in-memory 2-d tree of BallotReturned map points (latitude, longitude, ballot_returned_id) for one election and
+    state. Distances are the same (latitude - x)^2 + (longitude - y)^2 we used to sort by in Postgres, and ties are
+    broken by the lower ballot_returned id. Points added, moved or removed after the tree was built are kept aside
+    until MAP_POINT_INDEX_MAX_PENDING_POINTS of them pile up, and then the tree is rebuilt.
+    Queries never wait on a rebuild: the new tree is built on the side and swapped in under the lock, and
+    pending_points / removed_ids are replaced rather than changed in place, so a query can keep the ones it started
+    with.
+    """
+    def __init__(self, map_point_list):
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._changes_during_rebuild = None  # List of changes to replay while a rebuild is running
+        self.latitudes = []
+        self.longitudes = []
+        self.ids = []
+        self.tree_id_set = set()
+        self.pending_points = {}
+        self.removed_ids = frozenset()
+        self.build(map_point_list)
+
+    def build(self, map_point_list):
+        map_point_list = [point for point in map_point_list if point[0] is not None and point[1] is not None]
+        self._build_range(map_point_list, 0, len(map_point_list), 0)
+        latitudes = [point[0] for point in map_point_list]
+        longitudes = [point[1] for point in map_point_list]
+        ids = [point[2] for point in map_point_list]
+        with self._lock:
+            self.latitudes, self.longitudes, self.ids = latitudes, longitudes, ids
+            self.tree_id_set = set(ids)
+            self.pending_points = {}
+            self.removed_ids = frozenset()
+            change_list = self._changes_during_rebuild or []
+            self._changes_during_rebuild = None
+            for ballot_returned_id, latitude, longitude in change_list:
+                self._apply_change(ballot_returned_id, latitude, longitude)
+
+    def rebuild(self):
+        if not self._rebuild_lock.acquire(blocking=False):
+            # Another thread is already rebuilding, and will pick up our change
+            return
+        try:
+            with self._lock:
+                map_point_list = self._all_map_points()
+                self._changes_during_rebuild = []
+            self.build(map_point_list)
+        finally:
+            self._rebuild_lock.release()
+
+    def _build_range(self, map_point_list, start, end, axis):
+        # Sort this range on the split axis, so the median is at the middle and each half is a subtree
+        if end - start <= 1:
+            return
+        map_point_list[start:end] = sorted(map_point_list[start:end], key=lambda point: point[axis])
+        middle = (start + end) // 2
+        self._build_range(map_point_list, start, middle, 1 - axis)
+        self._build_range(map_point_list, middle + 1, end, 1 - axis)
+
+    def all_map_points(self):
+        with self._lock:
+            return self._all_map_points()
+
+    def _all_map_points(self):
+        map_point_list = [(self.latitudes[index], self.longitudes[index], self.ids[index])
+                          for index in range(len(self.ids)) if self.ids[index] not in self.removed_ids]
+        map_point_list += [(latitude, longitude, ballot_returned_id)
+                           for ballot_returned_id, (latitude, longitude) in self.pending_points.items()]
+        return map_point_list
+
+    def _apply_change(self, ballot_returned_id, latitude, longitude):
+        # Called with self._lock held. latitude None means the map point was removed.
+        if ballot_returned_id in self.tree_id_set and ballot_returned_id not in self.removed_ids:
+            self.removed_ids = self.removed_ids | {ballot_returned_id}
+        pending_points = dict(self.pending_points)
+        pending_points.pop(ballot_returned_id, None)
+        if latitude is not None and longitude is not None:
+            pending_points[ballot_returned_id] = (latitude, longitude)
+        self.pending_points = pending_points
+        if self._changes_during_rebuild is not None:
+            self._changes_during_rebuild.append((ballot_returned_id, latitude, longitude))
+        return len(self.removed_ids) + len(self.pending_points) > MAP_POINT_INDEX_MAX_PENDING_POINTS
+
+    def remove_map_point(self, ballot_returned_id):
+        self.update_map_point(ballot_returned_id, None, None)
+
+    def update_map_point(self, ballot_returned_id, latitude, longitude):
+        with self._lock:
+            rebuild_needed = self._apply_change(ballot_returned_id, latitude, longitude)
+        if rebuild_needed:
+            self.rebuild()
+
+    def __len__(self):
+        with self._lock:
+            return len(self.ids) - len(self.removed_ids) + len(self.pending_points)
+
+    def nearest(self, latitude, longitude, number_to_return=1):
+        """
+        :return: list of (distance, ballot_returned_id), closest first
+        """
+        with self._lock:
+            latitudes, longitudes, ids = self.latitudes, self.longitudes, self.ids
+            pending_points, removed_ids = self.pending_points, self.removed_ids
+        # Max-heap (negated) of the best (distance, id) found so far
+        best = []
+
+        def consider(distance, ballot_returned_id):
+            candidate = (-distance, -ballot_returned_id)
+            if len(best) < number_to_return:
+                heapq.heappush(best, candidate)
+            elif candidate > best[0]:
+                heapq.heapreplace(best, candidate)
+
+        def search(start, end, axis):
+            if start >= end:
+                return
+            middle = (start + end) // 2
+            ballot_returned_id = ids[middle]
+            if ballot_returned_id not in removed_ids:
+                consider((latitudes[middle] - latitude) ** 2 + (longitudes[middle] - longitude) ** 2,
+                         ballot_returned_id)
+            split_difference = (latitude - latitudes[middle]) if axis == 0 \
+                else (longitude - longitudes[middle])
+            if split_difference < 0:
+                near_start, near_end, far_start, far_end = start, middle, middle + 1, end
+            else:
+                near_start, near_end, far_start, far_end = middle + 1, end, start, middle
+            search(near_start, near_end, 1 - axis)
+            # Only visit the far side if it could hold a point as close as (or tied with) our worst match
+            if len(best) < number_to_return or split_difference ** 2 <= -best[0][0]:
+                search(far_start, far_end, 1 - axis)
+
+        search(0, len(ids), 0)
+        for ballot_returned_id, (point_latitude, point_longitude) in pending_points.items():
+            consider((point_latitude - latitude) ** 2 + (point_longitude - longitude) ** 2, ballot_returned_id)
+        return sorted((-negative_distance, -negative_id) for negative_distance, negative_id in best)
+
+
+ballot_returned_map_point_indexes = LocalLruCache(
+    max_size=MAP_POINT_INDEX_MAX_INDEXES, ttl_seconds=MAP_POINT_INDEX_TTL_SECONDS)
+
+
+def generate_map_point_index_key(google_civic_election_id, state_code=''):
+    return str(convert_to_int(google_civic_election_id)) + ':' + str(state_code if state_code else '').upper()
+
+
+def retrieve_ballot_returned_map_point_index(google_civic_election_id, state_code='', read_only=True):
+    """
+    Return the cached map point index for this election (and state, when provided), building it if needed.
+    Uses the same filters as our nearest-ballot queries: only entries stored for map points.
+    """
+    index_key = generate_map_point_index_key(google_civic_election_id, state_code)
+    map_point_index = ballot_returned_map_point_indexes.get(index_key)
+    if map_point_index is not None:
+        return map_point_index
+
+    if 'test' in sys.argv:
+        ballot_returned_query = BallotReturned.objects.all()
+    elif positive_value_exists(read_only):
+        ballot_returned_query = BallotReturned.objects.using('readonly').all()
+    else:
+        ballot_returned_query = BallotReturned.objects.all()
+    ballot_returned_query = ballot_returned_query.filter(google_civic_election_id=google_civic_election_id)
+    ballot_returned_query = ballot_returned_query.exclude(
+        Q(polling_location_we_vote_id__isnull=True) | Q(polling_location_we_vote_id=""))
+    if positive_value_exists(state_code):
+        ballot_returned_query = ballot_returned_query.filter(normalized_state__iexact=state_code)
+    ballot_returned_query = ballot_returned_query.filter(latitude__isnull=False, longitude__isnull=False)
+    map_point_index = BallotReturnedMapPointIndex(
+        list(ballot_returned_query.values_list('latitude', 'longitude', 'id')))
+    ballot_returned_map_point_indexes.set(index_key, map_point_index)
+    return map_point_index
+
+
+def update_ballot_returned_map_point_indexes(ballot_returned):
+    """
+    Keep this worker's cached map point indexes current when a ballot_returned entry is written
+    """
+    if not ballot_returned or not positive_value_exists(ballot_returned.id):
+        return
+    for state_code in [ballot_returned.normalized_state, '']:
+        map_point_index = ballot_returned_map_point_indexes.get(
+            generate_map_point_index_key(ballot_returned.google_civic_election_id, state_code))
+        if map_point_index is None:
+            continue
+        if positive_value_exists(ballot_returned.polling_location_we_vote_id):
+            map_point_index.update_map_point(ballot_returned.id, ballot_returned.latitude, ballot_returned.longitude)
+        else:
+            map_point_index.remove_map_point(ballot_returned.id)
+
+
 class BallotReturnedManager(models.Manager):
     """
     Scenario where we get an incomplete address and Google Civic can't find it:
@@ -2354,16 +2653,23 @@ class BallotReturnedManager(models.Manager):
         if not hasattr(self, 'google_client') or not self.google_client:
             self.google_client = get_geocoder_for_service('google')(GOOGLE_MAPS_API_KEY)
 
-        try:
-            location = self.google_client.geocode(text_for_map_search, sensor=False, timeout=GEOCODE_TIMEOUT)
-        except GeocoderQuotaExceeded:
-            try_without_maps_key = True
-            status += "GEOCODER_QUOTA_EXCEEDED "
-        except Exception as e:
-            try_without_maps_key = True
-            status += 'GEOCODER_ERROR {error} [type: {error_type}] '.format(error=e, error_type=type(e))
-            # logger.info(status + " @ " + text_for_map_search + "  google_civic_election_id=" +
-            #             str(google_civic_election_id))
+        # A repeated address is answered from our geocoder cache, without a network round trip
+        geocoded_address_manager = GeocodedAddressManager()
+        location = geocoded_address_manager.retrieve_geocoded_location(text_for_map_search)
+        geocoded_address_cache_hit = location is not None
+        if geocoded_address_cache_hit:
+            status += "GEOCODED_ADDRESS_CACHE_HIT "
+        else:
+            try:
+                location = self.google_client.geocode(text_for_map_search, sensor=False, timeout=GEOCODE_TIMEOUT)
+            except GeocoderQuotaExceeded:
+                try_without_maps_key = True
+                status += "GEOCODER_QUOTA_EXCEEDED "
+            except Exception as e:
+                try_without_maps_key = True
+                status += 'GEOCODER_ERROR {error} [type: {error_type}] '.format(error=e, error_type=type(e))
+                # logger.info(status + " @ " + text_for_map_search + "  google_civic_election_id=" +
+                #             str(google_civic_election_id))
 
         if try_without_maps_key:
             # If we have exceeded our account, try without a maps key
@@ -2383,6 +2689,9 @@ class BallotReturnedManager(models.Manager):
                 status += "GEOCODER_ERROR: " + str(e) + ' '
                 location = None
 
+        if location is not None and not geocoded_address_cache_hit:
+            location = geocoded_address_manager.save_geocoded_location(text_for_map_search, location)
+
         ballot = None
         if location is None:
             status += 'Geocoder could not find location matching "{}". Trying City, State. '.format(text_for_map_search)
@@ -2460,17 +2769,15 @@ class BallotReturnedManager(models.Manager):
                 # This search for normalized_state is NOT redundant because some elections are in many states
                 ballot_returned_query = ballot_returned_query.filter(normalized_state__iexact=state_code)
 
-            # TODO: Update to a more modern approach? I think this will be deprecated in > Django 1.9
-            ballot_returned_query = ballot_returned_query.annotate(
-                distance=(F('latitude') - location.latitude) ** 2 +
-                         (F('longitude') - location.longitude) ** 2)
-            ballot_returned_query = ballot_returned_query.order_by('distance')
-
+            # The closest map point is found with the in-memory map point index for the election and state
+            #  (see retrieve_closest_map_point_ballot_returned), instead of sorting the whole table by distance
             if positive_value_exists(google_civic_election_id):
                 status += "SEARCHING_BY_GOOGLE_CIVIC_ID "
                 ballot_returned_query = ballot_returned_query.filter(google_civic_election_id=google_civic_election_id)
                 try:
-                    ballot = ballot_returned_query.first()
+                    ballot = self.retrieve_closest_map_point_ballot_returned(
+                        ballot_returned_query, location.latitude, location.longitude,
+                        google_civic_election_id=google_civic_election_id, state_code=state_code, read_only=read_only)
                 except Exception as e:
                     ballot = None
                     status += "BALLOT_RETURNED_QUERY_FIRST_FAILED: " + str(e) + ' '
@@ -2487,7 +2794,10 @@ class BallotReturnedManager(models.Manager):
                     ballot_returned_query = ballot_returned_query.filter(
                         google_civic_election_id=upcoming_google_civic_election_id)
                     try:
-                        ballot = ballot_returned_query.first()
+                        ballot = self.retrieve_closest_map_point_ballot_returned(
+                            ballot_returned_query, location.latitude, location.longitude,
+                            google_civic_election_id=upcoming_google_civic_election_id, state_code=state_code,
+                            read_only=read_only)
                     except Exception as e:
                         ballot = None
                         status += "BALLOT_RETURNED_QUERY_FIRST_FAILED: " + str(e) + ' '
@@ -2512,7 +2822,10 @@ class BallotReturnedManager(models.Manager):
                                 ballot_returned_query = ballot_returned_query.filter(
                                     google_civic_election_id=upcoming_google_civic_election_id)
                                 try:
-                                    ballot = ballot_returned_query.first()
+                                    ballot = self.retrieve_closest_map_point_ballot_returned(
+                                        ballot_returned_query, location.latitude, location.longitude,
+                                        google_civic_election_id=upcoming_google_civic_election_id,
+                                        state_code=state_code, read_only=read_only)
                                 except Exception as e:
                                     ballot = None
                                     status += "BALLOT_RETURNED_QUERY_FIRST_FAILED: " + str(e) + ' '
@@ -2525,12 +2838,19 @@ class BallotReturnedManager(models.Manager):
                                 more_elections_exist = False
                 else:
                     past_google_civic_election_id = self.fetch_last_election_in_this_state(state_code)
-                    if positive_value_exists(past_google_civic_election_id):
-                        # Limit the search to the most recent election with ballot items
-                        ballot_returned_query = ballot_returned_query.filter(
-                            google_civic_election_id=past_google_civic_election_id)
                     try:
-                        ballot = ballot_returned_query.first()
+                        if positive_value_exists(past_google_civic_election_id):
+                            # Limit the search to the most recent election with ballot items
+                            ballot_returned_query = ballot_returned_query.filter(
+                                google_civic_election_id=past_google_civic_election_id)
+                            ballot = self.retrieve_closest_map_point_ballot_returned(
+                                ballot_returned_query, location.latitude, location.longitude,
+                                google_civic_election_id=past_google_civic_election_id, state_code=state_code,
+                                read_only=read_only)
+                        else:
+                            # No election to build a map point index for, so sort this state by distance
+                            ballot = self.order_ballot_returned_query_by_distance(
+                                ballot_returned_query, location.latitude, location.longitude).first()
                     except Exception as e:
                         ballot = None
                         status += "BALLOT_RETURNED_QUERY_FIRST_FAILED: " + str(e) + ' '
@@ -2561,17 +2881,13 @@ class BallotReturnedManager(models.Manager):
                 ballot_returned_query = ballot_returned_query.exclude(
                     Q(polling_location_we_vote_id__isnull=True) | Q(polling_location_we_vote_id=""))
 
-                # TODO: Update to a more modern approach? I think this will be deprecated in > Django 1.9
-                ballot_returned_query = ballot_returned_query.annotate(
-                    distance=(F('latitude') - location.latitude) ** 2 +
-                             (F('longitude') - location.longitude) ** 2)
-                ballot_returned_query = ballot_returned_query.order_by('distance')
-
                 status += "SEARCHING_BY_GOOGLE_CIVIC_ID-ATTEMPT2 "
                 ballot_returned_query = ballot_returned_query.filter(
                     google_civic_election_id=google_civic_election_id)
                 try:
-                    ballot_returned = ballot_returned_query.first()
+                    ballot_returned = self.retrieve_closest_map_point_ballot_returned(
+                        ballot_returned_query, location.latitude, location.longitude,
+                        google_civic_election_id=google_civic_election_id, read_only=read_only)
                 except Exception as e:
                     ballot_returned = None
                     status += "BALLOT_RETURNED_QUERY_FIRST_FAILED: " + str(e) + ' '
@@ -2591,6 +2907,32 @@ class BallotReturnedManager(models.Manager):
             'ballot_returned':          ballot_returned,
         }
 
+    def order_ballot_returned_query_by_distance(self, ballot_returned_query, latitude, longitude):
+        # TODO: Update to a more modern approach? I think this will be deprecated in > Django 1.9
+        ballot_returned_query = ballot_returned_query.annotate(
+            distance=(F('latitude') - latitude) ** 2 +
+                     (F('longitude') - longitude) ** 2)
+        return ballot_returned_query.order_by('distance', 'id')
+
+    def retrieve_closest_map_point_ballot_returned(
+            self, ballot_returned_query, latitude, longitude, google_civic_election_id, state_code='', read_only=True):
+        """
+        Find the BallotReturned map point closest to (latitude, longitude) with this worker's in-memory map point index
+        for the election (and state). ballot_returned_query must already be limited to map points in this
+        election (and state), and is only used to fetch the winning entry, or to fall back to sorting by distance in
+        Postgres when the index has no match (for example, map points without a latitude or longitude).
+        :return: BallotReturned or None
+        """
+        map_point_index = retrieve_ballot_returned_map_point_index(
+            google_civic_election_id, state_code=state_code, read_only=read_only)
+        for distance, ballot_returned_id in map_point_index.nearest(latitude, longitude, number_to_return=1):
+            ballot_returned = ballot_returned_query.filter(id=ballot_returned_id).first()
+            if ballot_returned is not None:
+                return ballot_returned
+            # The entry was deleted since the index was built, so rebuild it on the next lookup
+            ballot_returned_map_point_indexes.delete(generate_map_point_index_key(google_civic_election_id, state_code))
+        return self.order_ballot_returned_query_by_distance(ballot_returned_query, latitude, longitude).first()
+
     def should_election_search_data_be_saved(self, google_civic_election_id):
         if not positive_value_exists(google_civic_election_id):
             return False
@@ -2705,6 +3047,7 @@ class BallotReturnedManager(models.Manager):
 
                     # We always save so date_last_updated resets to current date
                     ballot_returned.save()
+                    update_ballot_returned_map_point_indexes(ballot_returned)
 
                     if new_ballot_returned_created:
                         success = True
@@ -2764,24 +3107,17 @@ class BallotReturnedManager(models.Manager):
             ballot_returned_object.normalized_city,
             ballot_returned_object.normalized_state,
             ballot_returned_object.normalized_zip)
-        try:
-            location = self.google_client.geocode(full_ballot_address, sensor=False, timeout=GEOCODE_TIMEOUT)
-        except GeocoderQuotaExceeded:
-            status += "GeocoderQuotaExceeded "
+        geocoded_address_manager = GeocodedAddressManager()
+        results = geocoded_address_manager.geocode_address(full_ballot_address, google_client=self.google_client)
+        status += results['status']
+        if not results['success']:
             results = {
                 'status':                   status,
-                'geocoder_quota_exceeded':  True,
-                'success':                  False,
-            }
-            return results
-        except Exception as e:
-            status += "Geocoder-Exception: " + str(e) + " "
-            results = {
-                'status':                   status,
-                'geocoder_quota_exceeded':  False,
+                'geocoder_quota_exceeded':  results['geocoder_quota_exceeded'],
                 'success':                  False,
             }
             return results
+        location = results['location']
 
         if location is None:
             results = {
@@ -2794,6 +3130,7 @@ class BallotReturnedManager(models.Manager):
         try:
             ballot_returned_object.latitude, ballot_returned_object.longitude = location.latitude, location.longitude
             ballot_returned_object.save()
+            update_ballot_returned_map_point_indexes(ballot_returned_object)
             status += "BALLOT_RETURNED_SAVED_WITH_LATITUDE_AND_LONGITUDE "
             success = True
         except Exception as e:
@@ -3206,6 +3543,93 @@ class BallotReturnedListManager(models.Manager):
 
         return 0
 
+    def populate_latitude_and_longitude_for_election(
+            self, google_civic_election_id, state_code='', limit=0, google_client=None,
+            number_of_threads=GEOCODER_BATCH_NUMBER_OF_THREADS,
+            requests_per_second=GEOCODER_BATCH_REQUESTS_PER_SECOND):
+        """
+        Batch version of populate_latitude_and_longitude_for_ballot_returned, for the map point entries counted by
+        fetch_ballot_returned_entries_needed_lat_long_for_election (all elections if google_civic_election_id is 0).
+        Addresses shared by several entries are geocoded once, cached addresses are not sent to the geocoder at all,
+        and the rest are geocoded concurrently under requests_per_second.
+        :return:
+        """
+        status = ''
+        ballot_returned_updated_count = 0
+        ballot_returned_not_updated_count = 0
+        try:
+            ballot_returned_queryset = BallotReturned.objects.order_by('id')
+            ballot_returned_queryset = ballot_returned_queryset.exclude(
+                Q(polling_location_we_vote_id=None) |
+                Q(polling_location_we_vote_id=""))
+            ballot_returned_queryset = ballot_returned_queryset.filter(Q(latitude=None) | Q(latitude=0))
+            if positive_value_exists(google_civic_election_id):
+                ballot_returned_queryset = ballot_returned_queryset.filter(
+                    google_civic_election_id=convert_to_int(google_civic_election_id))
+            if positive_value_exists(state_code):
+                ballot_returned_queryset = ballot_returned_queryset.filter(normalized_state__iexact=state_code)
+            if positive_value_exists(limit):
+                ballot_returned_queryset = ballot_returned_queryset[:limit]
+            ballot_returned_list = list(ballot_returned_queryset)
+        except Exception as e:
+            status += "POPULATE_LATITUDE_AND_LONGITUDE_FOR_ELECTION-QUERY_FAILED " + str(e) + " "
+            results = {
+                'success':                              False,
+                'status':                               status,
+                'geocoder_quota_exceeded':              False,
+                'ballot_returned_updated_count':        0,
+                'ballot_returned_not_updated_count':    0,
+            }
+            return results
+
+        full_address_by_ballot_returned_id = {}
+        for ballot_returned in ballot_returned_list:
+            if not positive_value_exists(ballot_returned.normalized_line1) or not \
+                    positive_value_exists(ballot_returned.normalized_city) or not \
+                    positive_value_exists(ballot_returned.normalized_state) or not \
+                    positive_value_exists(ballot_returned.normalized_zip):
+                # We require all four values
+                ballot_returned_not_updated_count += 1
+                continue
+            full_address_by_ballot_returned_id[ballot_returned.id] = '{}, {}, {} {}'.format(
+                ballot_returned.normalized_line1,
+                ballot_returned.normalized_city,
+                ballot_returned.normalized_state,
+                ballot_returned.normalized_zip)
+
+        geocoded_address_manager = GeocodedAddressManager()
+        geocoder_results = geocoded_address_manager.batch_geocode_addresses(
+            list(full_address_by_ballot_returned_id.values()), google_client=google_client,
+            number_of_threads=number_of_threads, requests_per_second=requests_per_second)
+        status += geocoder_results['status']
+        locations_by_address = geocoder_results['locations_by_address']
+
+        for ballot_returned in ballot_returned_list:
+            if ballot_returned.id not in full_address_by_ballot_returned_id:
+                continue
+            location = locations_by_address.get(
+                normalize_address_for_geocoder(full_address_by_ballot_returned_id[ballot_returned.id]))
+            if location is None:
+                ballot_returned_not_updated_count += 1
+                continue
+            try:
+                ballot_returned.latitude, ballot_returned.longitude = location.latitude, location.longitude
+                ballot_returned.save()
+                update_ballot_returned_map_point_indexes(ballot_returned)
+                ballot_returned_updated_count += 1
+            except Exception as e:
+                ballot_returned_not_updated_count += 1
+                status += "BALLOT_RETURNED_NOT_SAVED_WITH_LATITUDE_AND_LONGITUDE " + str(e) + " "
+
+        results = {
+            'success':                              geocoder_results['success'],
+            'status':                               status,
+            'geocoder_quota_exceeded':              geocoder_results['geocoder_quota_exceeded'],
+            'ballot_returned_updated_count':        ballot_returned_updated_count,
+            'ballot_returned_not_updated_count':    ballot_returned_not_updated_count,
+        }
+        return results
+
     def merge_ballot_returned_duplicates(self, google_civic_election_id=0, state_code=''):
         status = ''
         success = True
@@ -3333,6 +3757,64 @@ class BallotReturnedListManager(models.Manager):
         }
         return results
 
+    def retrieve_possible_duplicate_ballot_returned_in_bulk(self, structured_json):
+        """
+        The same matching as retrieve_possible_duplicate_ballot_returned, for a whole batch of ballot returned
+        entries coming in from the master server. We load the addresses for the incoming elections once, instead
+        of querying once per entry.
+        :param structured_json: list of dicts with google_civic_election_id, normalized_line1, normalized_zip and
+          polling_location_we_vote_id
+        :return: possible_duplicate_found_list, one True/False for each incoming ballot returned entry
+        """
+        possible_duplicate_found_list = []
+        google_civic_election_id_list = list(set(
+            convert_to_int(one_ballot_returned.get('google_civic_election_id', ''))
+            for one_ballot_returned in structured_json))
+        ballot_returned_index = DuplicateKeyIndex()
+        normalize = DuplicateKeyIndex.normalize
+
+        try:
+            ballot_returned_queryset = BallotReturned.objects \
+                .filter(google_civic_election_id__in=google_civic_election_id_list) \
+                .values_list('polling_location_we_vote_id', 'google_civic_election_id', 'normalized_line1',
+                             'normalized_zip')
+            for polling_location_we_vote_id, google_civic_election_id, normalized_line1, normalized_zip \
+                    in ballot_returned_queryset.iterator():
+                ballot_returned_index.add(
+                    (google_civic_election_id, normalize(normalized_line1), normalize(normalized_zip)),
+                    polling_location_we_vote_id)
+        except Exception as e:
+            handle_exception(e, logger=logger)
+            status = 'FAILED retrieve_possible_duplicate_ballot_returned_in_bulk ' \
+                     '{error} [type: {error_type}]'.format(error=e, error_type=type(e))
+            # Like retrieve_possible_duplicate_ballot_returned, an entry we can't check is not treated as a duplicate
+            results = {
+                'success':                          False,
+                'status':                           status,
+                'possible_duplicate_found_list':    [False] * len(structured_json),
+            }
+            return results
+
+        for one_ballot_returned in structured_json:
+            normalized_line1 = one_ballot_returned.get('normalized_line1', '')
+            normalized_zip = one_ballot_returned.get('normalized_zip', '')
+            if not positive_value_exists(normalized_line1) and not positive_value_exists(normalized_zip):
+                possible_duplicate_found_list.append(False)
+                continue
+            google_civic_election_id = convert_to_int(one_ballot_returned.get('google_civic_election_id', ''))
+            # Ignore entries with polling_location_we_vote_id coming in from master server
+            polling_location_we_vote_id = one_ballot_returned.get('polling_location_we_vote_id', '') or ''
+            possible_duplicate_found_list.append(ballot_returned_index.has_match(
+                (google_civic_election_id, normalize(normalized_line1), normalize(normalized_zip)),
+                polling_location_we_vote_id))
+
+        results = {
+            'success':                          True,
+            'status':                           'POSSIBLE_DUPLICATE_BALLOT_RETURNED_CHECKED_IN_BULK ',
+            'possible_duplicate_found_list':    possible_duplicate_found_list,
+        }
+        return results
+
 
 class VoterBallotSaved(models.Model):
     """
@@ -4199,3 +4681,527 @@ def retrieve_address_fields_from_geocoder(text_for_map_search):
         'zip_long':     zip_long,
     }
     return results
+
+
+class GeocodedAddress(models.Model):
+    """
+    Cache of geocoder results, so a repeated address doesn't cost another geocoder request (or more quota)
+    """
+    normalized_address = models.CharField(max_length=255, null=False, unique=True, db_index=True)
+    formatted_address = models.CharField(max_length=255, null=True, blank=True)
+    latitude = models.FloatField(null=True)
+    longitude = models.FloatField(null=True)
+    state_code = models.CharField(max_length=2, null=True, blank=True)
+    date_last_updated = models.DateTimeField(auto_now=True)
+
+
+geocoded_address_local_cache = LocalLruCache(
+    max_size=GEOCODED_ADDRESS_LOCAL_CACHE_MAX_ENTRIES, ttl_seconds=GEOCODED_ADDRESS_LOCAL_CACHE_TTL_SECONDS)
+
+
+def normalize_address_for_geocoder(text_for_map_search):
+    """
+    "  1200 Broadway Ave ,Oakland,  CA " and "1200 broadway ave, oakland, ca" should share one cache entry
+    """
+    if not positive_value_exists(text_for_map_search):
+        return ''
+    normalized_address = re.sub(r'\s+', ' ', str(text_for_map_search).strip().lower())
+    normalized_address = re.sub(r'\s*,\s*', ', ', normalized_address)
+    return normalized_address.strip(' ,.')[:255]
+
+
+def convert_geocoder_location_to_geocoded_location(location):
+    state_code = ''
+    if hasattr(location, 'raw') and isinstance(location.raw, dict) and 'address_components' in location.raw:
+        for one_address_component in location.raw['address_components']:
+            if 'administrative_area_level_1' in one_address_component['types'] \
+                    and positive_value_exists(one_address_component['short_name']):
+                state_code = one_address_component['short_name']
+    address = location.address if hasattr(location, 'address') else ''
+    if not positive_value_exists(state_code) and positive_value_exists(address) and "," in address:
+        # address has format "line_1, state zip, USA"
+        state_code = address.split(', ')[-2][:2]
+    return GeocodedLocation(address=address, latitude=location.latitude, longitude=location.longitude,
+                            state_code=state_code.upper())
+
+
+class GeocodedAddressManager(models.Manager):
+
+    def __unicode__(self):
+        return "GeocodedAddressManager"
+
+    def retrieve_geocoded_location(self, text_for_map_search):
+        """
+        Look for a previously geocoded address, first in this worker's memory and then in the GeocodedAddress table
+        :return: GeocodedLocation or None
+        """
+        normalized_address = normalize_address_for_geocoder(text_for_map_search)
+        if not positive_value_exists(normalized_address):
+            return None
+        geocoded_location = geocoded_address_local_cache.get(normalized_address)
+        if geocoded_location is not None:
+            return geocoded_location
+        locations_by_address = self.retrieve_geocoded_locations([normalized_address])
+        return locations_by_address.get(normalized_address)
+
+    def retrieve_geocoded_locations(self, normalized_address_list):
+        """
+        :return: dict of normalized_address -> GeocodedLocation, for the addresses we have cached
+        """
+        locations_by_address = {}
+        addresses_to_look_up = []
+        for normalized_address in normalized_address_list:
+            geocoded_location = geocoded_address_local_cache.get(normalized_address)
+            if geocoded_location is not None:
+                locations_by_address[normalized_address] = geocoded_location
+            else:
+                addresses_to_look_up.append(normalized_address)
+        try:
+            for start in range(0, len(addresses_to_look_up), 1000):
+                query = GeocodedAddress.objects.filter(normalized_address__in=addresses_to_look_up[start:start + 1000])
+                for geocoded_address in query:
+                    geocoded_location = GeocodedLocation(
+                        address=geocoded_address.formatted_address,
+                        latitude=geocoded_address.latitude,
+                        longitude=geocoded_address.longitude,
+                        state_code=geocoded_address.state_code)
+                    geocoded_address_local_cache.set(geocoded_address.normalized_address, geocoded_location)
+                    locations_by_address[geocoded_address.normalized_address] = geocoded_location
+        except Exception as e:
+            logger.error("RETRIEVE_GEOCODED_LOCATIONS_FAILED " + str(e))
+        return locations_by_address
+
+    def save_geocoded_location(self, text_for_map_search, location):
+        """
+        :param text_for_map_search:
+        :param location: a geopy Location, or a GeocodedLocation
+        :return: GeocodedLocation or None
+        """
+        normalized_address = normalize_address_for_geocoder(text_for_map_search)
+        if not positive_value_exists(normalized_address) or location is None:
+            return None
+        if not isinstance(location, GeocodedLocation):
+            location = convert_geocoder_location_to_geocoded_location(location)
+        geocoded_address_local_cache.set(normalized_address, location)
+        try:
+            GeocodedAddress.objects.update_or_create(
+                normalized_address=normalized_address,
+                defaults={
+                    'formatted_address':    location.address[:255] if location.address else '',
+                    'latitude':             location.latitude,
+                    'longitude':            location.longitude,
+                    'state_code':           location.state_code,
+                })
+        except Exception as e:
+            logger.error("SAVE_GEOCODED_LOCATION_FAILED " + str(e))
+        return location
+
+    def geocode_address(self, text_for_map_search, google_client=None):
+        """
+        Geocode one address, using our cache when we can
+        :param text_for_map_search:
+        :param google_client: Any geopy-style geocoder (an object with geocode(query, ...)). Tests pass in a stub.
+        :return:
+        """
+        status = ''
+        geocoder_quota_exceeded = False
+        geocoded_location = self.retrieve_geocoded_location(text_for_map_search)
+        if geocoded_location is not None:
+            status += "GEOCODED_ADDRESS_CACHE_HIT "
+            results = {
+                'success':                      True,
+                'status':                       status,
+                'geocoded_address_cache_hit':   True,
+                'geocoder_quota_exceeded':      geocoder_quota_exceeded,
+                'location_found':               True,
+                'location':                     geocoded_location,
+            }
+            return results
+
+        if google_client is None:
+            google_client = get_geocoder_for_service('google')(GOOGLE_MAPS_API_KEY)
+        success = True
+        location = None
+        try:
+            location = google_client.geocode(text_for_map_search, sensor=False, timeout=GEOCODE_TIMEOUT)
+        except GeocoderQuotaExceeded:
+            geocoder_quota_exceeded = True
+            success = False
+            status += "GeocoderQuotaExceeded "
+        except Exception as e:
+            success = False
+            status += "Geocoder-Exception: " + str(e) + " "
+
+        if location is not None:
+            geocoded_location = self.save_geocoded_location(text_for_map_search, location)
+        results = {
+            'success':                      success,
+            'status':                       status,
+            'geocoded_address_cache_hit':   False,
+            'geocoder_quota_exceeded':      geocoder_quota_exceeded,
+            'location_found':               geocoded_location is not None,
+            'location':                     geocoded_location,
+        }
+        return results
+
+    def batch_geocode_addresses(self, address_list, google_client=None,
+                                number_of_threads=GEOCODER_BATCH_NUMBER_OF_THREADS,
+                                requests_per_second=GEOCODER_BATCH_REQUESTS_PER_SECOND):
+        """
+        Geocode many addresses at once. Addresses are deduplicated after normalizing, cached results are loaded in bulk,
+        and only the remaining addresses are sent to the geocoder, from several threads sharing one rate limit.
+        :param address_list:
+        :param google_client: Any geopy-style geocoder. It must be safe to call from several threads.
+        :param number_of_threads:
+        :param requests_per_second:
+        :return: results with 'locations_by_address', a dict of normalized_address -> GeocodedLocation
+        """
+        status = ''
+        address_by_normalized_address = {}
+        for text_for_map_search in address_list:
+            normalized_address = normalize_address_for_geocoder(text_for_map_search)
+            if positive_value_exists(normalized_address) and normalized_address not in address_by_normalized_address:
+                address_by_normalized_address[normalized_address] = text_for_map_search
+
+        locations_by_address = self.retrieve_geocoded_locations(list(address_by_normalized_address.keys()))
+        cache_hit_count = len(locations_by_address)
+        addresses_to_geocode = [normalized_address for normalized_address in address_by_normalized_address
+                                if normalized_address not in locations_by_address]
+
+        if google_client is None and len(addresses_to_geocode):
+            google_client = get_geocoder_for_service('google')(GOOGLE_MAPS_API_KEY)
+        rate_limiter = TokenBucketRateLimiter(requests_per_second=requests_per_second)
+        quota_exceeded_flags = []
+
+        def geocode_one_address(normalized_address):
+            if len(quota_exceeded_flags):
+                return normalized_address, None
+            rate_limiter.acquire()
+            try:
+                return normalized_address, google_client.geocode(
+                    address_by_normalized_address[normalized_address], sensor=False, timeout=GEOCODE_TIMEOUT)
+            except GeocoderQuotaExceeded:
+                quota_exceeded_flags.append(True)
+            except Exception as e:
+                logger.error("BATCH_GEOCODE_ADDRESSES-Geocoder-Exception: " + str(e))
+            return normalized_address, None
+
+        geocoder_call_count = 0
+        not_found_count = 0
+        if len(addresses_to_geocode):
+            with ThreadPoolExecutor(max_workers=max(1, number_of_threads)) as executor:
+                geocoder_results = list(executor.map(geocode_one_address, addresses_to_geocode))
+            # Database writes stay on this thread
+            for normalized_address, location in geocoder_results:
+                geocoder_call_count += 1
+                if location is None:
+                    not_found_count += 1
+                    continue
+                locations_by_address[normalized_address] = self.save_geocoded_location(normalized_address, location)
+
+        geocoder_quota_exceeded = len(quota_exceeded_flags) > 0
+        if geocoder_quota_exceeded:
+            status += "GeocoderQuotaExceeded "
+        status += "BATCH_GEOCODE_ADDRESSES unique: " + str(len(address_by_normalized_address)) + \
+                  ", cache_hits: " + str(cache_hit_count) + ", geocoded: " + str(geocoder_call_count) + \
+                  ", not_found: " + str(not_found_count) + " "
+        results = {
+            'success':                  not geocoder_quota_exceeded,
+            'status':                   status,
+            'geocoder_quota_exceeded':  geocoder_quota_exceeded,
+            'locations_by_address':     locations_by_address,
+            'cache_hit_count':          cache_hit_count,
+            'geocoder_call_count':      geocoder_call_count,
+        }
+        return results
+
+
+class BallotSnapshot(models.Model):
+    """
+    The rendered allBallotItemsRetrieve response for one (election, state), stored gzip compressed with its ETag.
+    ballot_item_list_json holds only the ballot items belonging to this state, so the nationwide snapshot
+    (state_code '') can be assembled from the state snapshots without re-rendering every state. When offices,
+    candidates or measures change, invalidate_ballot_snapshots clears what they appear in, and those pieces are
+    rendered again on the next request.
+    """
+    google_civic_election_id = models.PositiveIntegerField(db_index=True, default=0, null=False)
+    state_code = models.CharField(max_length=2, default='', null=False, blank=True, db_index=True)
+    # The state_code in the stored response, as it was spelled in the request that rendered it
+    rendered_state_code = models.CharField(max_length=2, default='', null=False, blank=True)
+    ballot_item_list_json = models.TextField(null=True, blank=True)
+    snapshot_json_gzip = models.BinaryField(null=True)
+    snapshot_etag = models.CharField(max_length=64, null=True, blank=True)
+    date_last_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('google_civic_election_id', 'state_code')
+
+
+ballot_snapshot_local_cache = LocalLruCache(
+    max_size=BALLOT_SNAPSHOT_LOCAL_CACHE_MAX_ENTRIES, ttl_seconds=BALLOT_SNAPSHOT_LOCAL_CACHE_TTL_SECONDS)
+
+
+def normalize_ballot_snapshot_state_code(state_code):
+    return state_code.strip().lower() if positive_value_exists(state_code) else ''
+
+
+class BallotSnapshotManager(models.Manager):
+
+    def __unicode__(self):
+        return "BallotSnapshotManager"
+
+    def retrieve_ballot_snapshot(self, google_civic_election_id, state_code=''):
+        """
+        :return: results with 'snapshot_json_gzip', 'snapshot_etag' and 'rendered_state_code', from this worker's
+          memory when its ETag still matches the stored one, so a snapshot invalidated by another worker isn't served
+        """
+        google_civic_election_id = convert_to_int(google_civic_election_id)
+        state_code = normalize_ballot_snapshot_state_code(state_code)
+        cache_key = (google_civic_election_id, state_code)
+        status = ''
+        success = True
+        ballot_snapshot_found = False
+        snapshot_json_gzip = None
+        snapshot_etag = ''
+        rendered_state_code = ''
+        try:
+            cached_snapshot = ballot_snapshot_local_cache.get(cache_key)
+            if cached_snapshot is not None:
+                stored_snapshot_etag = BallotSnapshot.objects.using('readonly')\
+                    .filter(google_civic_election_id=google_civic_election_id, state_code=state_code)\
+                    .values_list('snapshot_etag', flat=True)\
+                    .first()
+                if stored_snapshot_etag == cached_snapshot[1]:
+                    results = {
+                        'success':              True,
+                        'status':               "BALLOT_SNAPSHOT_LOCAL_CACHE_HIT ",
+                        'ballot_snapshot_found': True,
+                        'snapshot_json_gzip':   cached_snapshot[0],
+                        'snapshot_etag':        cached_snapshot[1],
+                        'rendered_state_code':  cached_snapshot[2],
+                    }
+                    return results
+                ballot_snapshot_local_cache.delete(cache_key)
+                status += "BALLOT_SNAPSHOT_LOCAL_CACHE_OUT_OF_DATE "
+                if not positive_value_exists(stored_snapshot_etag):
+                    status += "BALLOT_SNAPSHOT_NOT_FOUND "
+                    results = {
+                        'success':              success,
+                        'status':               status,
+                        'ballot_snapshot_found': False,
+                        'snapshot_json_gzip':   None,
+                        'snapshot_etag':        '',
+                        'rendered_state_code':  '',
+                    }
+                    return results
+
+            ballot_snapshot = BallotSnapshot.objects.using('readonly')\
+                .filter(google_civic_election_id=google_civic_election_id, state_code=state_code)\
+                .exclude(snapshot_json_gzip__isnull=True)\
+                .values('snapshot_json_gzip', 'snapshot_etag', 'rendered_state_code')\
+                .first()
+            if ballot_snapshot is not None:
+                snapshot_json_gzip = bytes(ballot_snapshot['snapshot_json_gzip'])
+                snapshot_etag = ballot_snapshot['snapshot_etag']
+                rendered_state_code = ballot_snapshot['rendered_state_code']
+                ballot_snapshot_found = True
+                ballot_snapshot_local_cache.set(cache_key, (snapshot_json_gzip, snapshot_etag, rendered_state_code))
+                status += "BALLOT_SNAPSHOT_FOUND "
+            else:
+                status += "BALLOT_SNAPSHOT_NOT_FOUND "
+        except Exception as e:
+            success = False
+            status += "RETRIEVE_BALLOT_SNAPSHOT_FAILED " + str(e) + " "
+        results = {
+            'success':              success,
+            'status':               status,
+            'ballot_snapshot_found': ballot_snapshot_found,
+            'snapshot_json_gzip':   snapshot_json_gzip,
+            'snapshot_etag':        snapshot_etag,
+            'rendered_state_code':  rendered_state_code,
+        }
+        return results
+
+    def retrieve_ballot_item_list_json_by_state(self, google_civic_election_id):
+        """
+        :return: dict of state_code -> ballot_item_list_json, for every state (and the national ballot items) we
+          have a snapshot entry for in this election. The value is None when that state has to be rendered again.
+        """
+        ballot_item_list_json_by_state = {}
+        try:
+            query = BallotSnapshot.objects\
+                .filter(google_civic_election_id=convert_to_int(google_civic_election_id))\
+                .exclude(state_code='')\
+                .values_list('state_code', 'ballot_item_list_json')
+            for state_code, ballot_item_list_json in query:
+                ballot_item_list_json_by_state[state_code] = ballot_item_list_json
+        except Exception as e:
+            logger.error("RETRIEVE_BALLOT_ITEM_LIST_JSON_BY_STATE_FAILED " + str(e))
+        return ballot_item_list_json_by_state
+
+    def save_ballot_snapshot(self, google_civic_election_id, state_code='', ballot_item_list_json=None,
+                             snapshot_json_gzip=None, snapshot_etag=None, rendered_state_code=None):
+        """
+        Values left as None are not changed
+        """
+        google_civic_election_id = convert_to_int(google_civic_election_id)
+        state_code = normalize_ballot_snapshot_state_code(state_code)
+        defaults = {}
+        if ballot_item_list_json is not None:
+            defaults['ballot_item_list_json'] = ballot_item_list_json
+        if snapshot_json_gzip is not None:
+            defaults['snapshot_json_gzip'] = snapshot_json_gzip
+            defaults['snapshot_etag'] = snapshot_etag
+            defaults['rendered_state_code'] = rendered_state_code if rendered_state_code else ''
+        status = ''
+        success = True
+        try:
+            BallotSnapshot.objects.update_or_create(
+                google_civic_election_id=google_civic_election_id,
+                state_code=state_code,
+                defaults=defaults)
+            if snapshot_json_gzip is not None:
+                ballot_snapshot_local_cache.set((google_civic_election_id, state_code),
+                                                (snapshot_json_gzip, snapshot_etag, defaults['rendered_state_code']))
+            status += "BALLOT_SNAPSHOT_SAVED "
+        except Exception as e:
+            success = False
+            status += "SAVE_BALLOT_SNAPSHOT_FAILED " + str(e) + " "
+        results = {
+            'success':  success,
+            'status':   status,
+        }
+        return results
+
+    def delete_ballot_snapshot(self, google_civic_election_id, state_code=''):
+        google_civic_election_id = convert_to_int(google_civic_election_id)
+        state_code = normalize_ballot_snapshot_state_code(state_code)
+        status = ''
+        success = True
+        try:
+            BallotSnapshot.objects.filter(
+                google_civic_election_id=google_civic_election_id, state_code=state_code).delete()
+            ballot_snapshot_local_cache.delete((google_civic_election_id, state_code))
+            status += "BALLOT_SNAPSHOT_DELETED "
+        except Exception as e:
+            success = False
+            status += "DELETE_BALLOT_SNAPSHOT_FAILED " + str(e) + " "
+        results = {
+            'success':  success,
+            'status':   status,
+        }
+        return results
+
+    def invalidate_ballot_snapshots(self, google_civic_election_id, state_code=''):
+        """
+        Called when offices, candidates or measures in one state change: that state's ballot items and snapshot,
+        and the nationwide snapshot, are rendered again the next time they are requested. A change not tied to a
+        state clears the national ballot items and every snapshot in the election, but keeps each state's own
+        ballot items. Other workers notice the ETag change and drop their copy in memory.
+        """
+        google_civic_election_id = convert_to_int(google_civic_election_id)
+        state_code = normalize_ballot_snapshot_state_code(state_code)
+        status = ''
+        success = True
+        if not positive_value_exists(google_civic_election_id):
+            status += "INVALIDATE_BALLOT_SNAPSHOTS-MISSING_ELECTION_ID "
+            return {
+                'success':  False,
+                'status':   status,
+            }
+        try:
+            query = BallotSnapshot.objects.filter(google_civic_election_id=google_civic_election_id)
+            not_invalidated_yet = Q(ballot_item_list_json__isnull=False) | Q(snapshot_json_gzip__isnull=False)
+            if positive_value_exists(state_code) and state_code != BALLOT_SNAPSHOT_NATIONAL_STATE_CODE:
+                changed_count = query.filter(not_invalidated_yet, state_code=state_code).update(
+                    ballot_item_list_json=None, snapshot_json_gzip=None, snapshot_etag='')
+                if not changed_count and query.exists() and not query.filter(state_code=state_code).exists():
+                    # A state with no ballot items the last time we rendered. Leave an entry, so the nationwide
+                    #  snapshot knows to render it.
+                    BallotSnapshot.objects.get_or_create(
+                        google_civic_election_id=google_civic_election_id, state_code=state_code)
+                query.filter(state_code='', snapshot_json_gzip__isnull=False).update(
+                    snapshot_json_gzip=None, snapshot_etag='')
+                ballot_snapshot_local_cache.delete((google_civic_election_id, state_code))
+                ballot_snapshot_local_cache.delete((google_civic_election_id, ''))
+            else:
+                query.filter(state_code=BALLOT_SNAPSHOT_NATIONAL_STATE_CODE, ballot_item_list_json__isnull=False)\
+                    .update(ballot_item_list_json=None)
+                query.filter(snapshot_json_gzip__isnull=False).update(snapshot_json_gzip=None, snapshot_etag='')
+                ballot_snapshot_local_cache.clear()
+            status += "BALLOT_SNAPSHOTS_INVALIDATED "
+        except Exception as e:
+            success = False
+            status += "INVALIDATE_BALLOT_SNAPSHOTS_FAILED " + str(e) + " "
+            logger.error(status)
+        results = {
+            'success':  success,
+            'status':   status,
+        }
+        return results
+
+
+def fetch_ballot_snapshot_field_values(instance):
+    """
+    The ballot fields as they are on this instance. Deferred fields are left out, rather than loaded.
+    """
+    return {field_name: instance.__dict__[field_name]
+            for field_name in BALLOT_SNAPSHOT_FIELD_NAMES_BY_MODEL[type(instance).__name__]
+            if field_name in instance.__dict__}
+
+
+@receiver(post_init, sender=CandidateCampaign)
+@receiver(post_init, sender=CandidateToOfficeLink)
+@receiver(post_init, sender=ContestMeasure)
+@receiver(post_init, sender=ContestOffice)
+def remember_ballot_snapshot_field_values_signal(sender, instance, **kwargs):
+    """
+    Remember the ballot fields as loaded, so invalidate_ballot_snapshots_signal can tell whether a save changed them
+    """
+    instance._ballot_snapshot_field_values = fetch_ballot_snapshot_field_values(instance)
+
+
+@receiver(post_save, sender=CandidateCampaign)
+@receiver(post_delete, sender=CandidateCampaign)
+@receiver(post_save, sender=CandidateToOfficeLink)
+@receiver(post_delete, sender=CandidateToOfficeLink)
+@receiver(post_save, sender=ContestMeasure)
+@receiver(post_delete, sender=ContestMeasure)
+@receiver(post_save, sender=ContestOffice)
+@receiver(post_delete, sender=ContestOffice)
+def invalidate_ballot_snapshots_signal(sender, instance, **kwargs):
+    """
+    Keep allBallotItemsRetrieve snapshots current when the offices, candidates and measures in them are written.
+    Saves which don't change a field the ballot uses (like the Twitter and photo refreshes) are skipped.
+    """
+    loaded_field_values = getattr(instance, '_ballot_snapshot_field_values', {})
+    if 'created' in kwargs:
+        # post_save
+        field_values = fetch_ballot_snapshot_field_values(instance)
+        instance._ballot_snapshot_field_values = field_values
+        if not kwargs['created']:
+            update_fields = kwargs.get('update_fields')
+            if update_fields and not set(update_fields) & set(BALLOT_SNAPSHOT_FIELD_NAMES_BY_MODEL[sender.__name__]):
+                return
+            if loaded_field_values == field_values:
+                return
+
+    ballot_snapshot_manager = BallotSnapshotManager()
+    election_and_state_list = []
+    if positive_value_exists(instance.google_civic_election_id):
+        election_and_state_list.append((instance.google_civic_election_id, instance.state_code))
+    elif sender is CandidateCampaign and positive_value_exists(instance.we_vote_id):
+        # Candidates are tied to elections through their CandidateToOfficeLink entries
+        election_and_state_list = list(CandidateToOfficeLink.objects
+                                       .filter(candidate_we_vote_id=instance.we_vote_id)
+                                       .values_list('google_civic_election_id', 'state_code').distinct())
+    if positive_value_exists(loaded_field_values.get('google_civic_election_id')):
+        # Moved to another election or state, so it comes off the ballot it was on too
+        election_and_state_list.append((loaded_field_values['google_civic_election_id'],
+                                        loaded_field_values.get('state_code', instance.state_code)))
+    invalidated_set = set()
+    for google_civic_election_id, state_code in election_and_state_list:
+        invalidated_key = (convert_to_int(google_civic_election_id), normalize_ballot_snapshot_state_code(state_code))
+        if invalidated_key not in invalidated_set:
+            invalidated_set.add(invalidated_key)
+            ballot_snapshot_manager.invalidate_ballot_snapshots(google_civic_election_id, state_code)
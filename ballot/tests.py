@@ -1,14 +1,33 @@
 from unittest import mock
 from collections import namedtuple
+import gzip
+import json
 
 from django.test import TestCase
 
-from ballot.models import BallotReturned, BallotReturnedManager
+from ballot.controllers import all_ballot_items_retrieve_for_api, retrieve_ballot_objects_for_one_election, \
+    retrieve_ballot_snapshot_for_api
+from ballot.models import BallotReturned, BallotReturnedListManager, BallotReturnedManager, \
+    BallotReturnedMapPointIndex, ballot_snapshot_local_cache, BallotSnapshot, BallotSnapshotManager, \
+    geocoded_address_local_cache, GeocodedAddress
+from candidate.models import CandidateCampaign, CandidateToOfficeLink
+from office.models import ContestOffice
 
 
 Location = namedtuple('Location', ['address', 'latitude', 'longitude'])
 
 
+class StubGeocoder(object):
+    """ Local stand-in for the Google geocoder, which counts the addresses it is asked about. """
+    def __init__(self, locations):
+        self.locations = locations
+        self.queries = []
+
+    def geocode(self, query, sensor=False, timeout=None):
+        self.queries.append(query)
+        return self.locations.get(query)
+
+
 class BallotTestCase(TestCase):
     databases = ["default", "readonly"]
 
@@ -100,3 +119,190 @@ class BallotTestCase(TestCase):
             self.assertFalse(result['geocoder_quota_exceeded'])
             self.assertTrue(result['ballot_returned_found'])
             self.assertEqual(result['ballot_returned'], ballot_in_jackson)
+
+    def test_map_point_index_matches_distance_sort(self):
+        """ The in-memory map point index returns the same order as sorting by distance, with ties broken by id. """
+        map_point_index = BallotReturnedMapPointIndex([(32.0, -89.5, 7), (32.0, -90.5, 3), (31.0, -90.0, 5),
+                                                       (None, None, 1)])
+        self.assertEqual([ballot_returned_id for distance, ballot_returned_id in
+                          map_point_index.nearest(32.0, -90.0, number_to_return=3)], [3, 7, 5])
+        map_point_index.update_map_point(9, 32.0, -90.0)
+        map_point_index.remove_map_point(3)
+        self.assertEqual([ballot_returned_id for distance, ballot_returned_id in
+                          map_point_index.nearest(32.0, -90.0, number_to_return=2)], [9, 7])
+
+    def test_map_point_index_counts_and_rebuilds_after_changes(self):
+        """ Removed and moved points are counted once, and enough changes rebuild the tree. """
+        map_point_index = BallotReturnedMapPointIndex([(32.0, -89.5, 7), (32.0, -90.5, 3), (31.0, -90.0, 5)])
+        map_point_index.update_map_point(3, 32.0, -90.1)
+        map_point_index.update_map_point(3, 32.0, -90.2)
+        map_point_index.remove_map_point(11)
+        self.assertEqual(len(map_point_index), 3)
+        map_point_index.remove_map_point(3)
+        self.assertEqual(len(map_point_index), 2)
+        with mock.patch('ballot.models.MAP_POINT_INDEX_MAX_PENDING_POINTS', 2):
+            map_point_index.remove_map_point(5)
+            map_point_index.update_map_point(9, 32.0, -90.0)
+        self.assertEqual(sorted(map_point_index.ids), [7, 9])
+        self.assertEqual((map_point_index.pending_points, map_point_index.removed_ids), ({}, frozenset()))
+        self.assertEqual(len(map_point_index), 2)
+        self.assertEqual([ballot_returned_id for distance, ballot_returned_id in
+                          map_point_index.nearest(32.0, -90.0, number_to_return=3)], [9, 7])
+
+    def test_batch_geocoding_dedupes_and_caches_addresses(self):
+        """ Map points sharing an address are geocoded once, and a second pass is answered from the cache. """
+        geocoded_address_local_cache.clear()
+        for polling_location_we_vote_id in ['wv01ploc1', 'wv01ploc2']:
+            BallotReturned.objects.create(**{'google_civic_election_id': 4184,
+                                             'normalized_city': 'jackson',
+                                             'normalized_line1': '1020 w mcdowell rd',
+                                             'normalized_state': 'MS',
+                                             'normalized_zip': '39204',
+                                             'polling_location_we_vote_id': polling_location_we_vote_id,
+                                             })
+        stub_geocoder = StubGeocoder({
+            '1020 w mcdowell rd, jackson, MS 39204':
+                Location(address='1020 W McDowell Rd, Jackson, MS 39204, USA',
+                         latitude=32.269163, longitude=-90.234566),
+        })
+        ballot_returned_list_manager = BallotReturnedListManager()
+        results = ballot_returned_list_manager.populate_latitude_and_longitude_for_election(
+            4184, state_code='MS', google_client=stub_geocoder, requests_per_second=100)
+        self.assertEqual(len(stub_geocoder.queries), 1)
+        self.assertEqual(results['ballot_returned_updated_count'], 2)
+        self.assertEqual(GeocodedAddress.objects.get().state_code, 'MS')
+        self.assertEqual(BallotReturned.objects.filter(latitude=32.269163).count(), 2)
+
+        geocoded_address_local_cache.clear()
+        BallotReturned.objects.filter(polling_location_we_vote_id='wv01ploc2').update(latitude=None, longitude=None)
+        results = ballot_returned_list_manager.populate_latitude_and_longitude_for_election(
+            4184, state_code='MS', google_client=stub_geocoder, requests_per_second=100)
+        self.assertEqual(len(stub_geocoder.queries), 1)
+        self.assertEqual(results['ballot_returned_updated_count'], 1)
+
+    def test_bulk_ballot_loader_groups_candidates_by_office(self):
+        """ allBallotItemsRetrieve loads candidates for every office at once, grouped and ordered per office. """
+        ContestOffice.objects.create(we_vote_id='wv01off1', office_name='Governor', google_civic_election_id=4184,
+                                     state_code='MS')
+        ContestOffice.objects.create(we_vote_id='wv01off2', office_name='Mayor', google_civic_election_id=4184,
+                                     state_code='MS')
+        for candidate_we_vote_id, twitter_followers_count, do_not_display_on_ballot in \
+                [('wv01cand1', 10, False), ('wv01cand2', 500, False), ('wv01cand3', 50, True)]:
+            CandidateCampaign.objects.create(we_vote_id=candidate_we_vote_id, candidate_name=candidate_we_vote_id,
+                                             google_civic_election_id=4184, state_code='MS',
+                                             twitter_followers_count=twitter_followers_count,
+                                             do_not_display_on_ballot=do_not_display_on_ballot)
+        for candidate_we_vote_id, contest_office_we_vote_id in \
+                [('wv01cand1', 'wv01off1'), ('wv01cand2', 'wv01off1'), ('wv01cand3', 'wv01off1'),
+                 ('wv01cand1', 'wv01off2')]:
+            CandidateToOfficeLink.objects.create(candidate_we_vote_id=candidate_we_vote_id,
+                                                 contest_office_we_vote_id=contest_office_we_vote_id,
+                                                 google_civic_election_id=4184, state_code='MS')
+
+        results = retrieve_ballot_objects_for_one_election(google_civic_election_id=4184, state_code='MS',
+                                                           include_measures=False)
+        self.assertTrue(results['success'])
+        candidate_list_by_office_we_vote_id = results['candidate_list_by_office_we_vote_id']
+        self.assertEqual([candidate.we_vote_id for candidate in candidate_list_by_office_we_vote_id['wv01off1']],
+                         ['wv01cand2', 'wv01cand1'])
+        self.assertEqual([candidate.we_vote_id for candidate in candidate_list_by_office_we_vote_id['wv01off2']],
+                         ['wv01cand1'])
+
+    def create_office_with_candidate(self, office_we_vote_id, office_name, state_code, candidate_we_vote_id):
+        ContestOffice.objects.create(we_vote_id=office_we_vote_id, office_name=office_name,
+                                     google_civic_election_id=4184, state_code=state_code)
+        CandidateCampaign.objects.create(we_vote_id=candidate_we_vote_id, candidate_name=candidate_we_vote_id,
+                                         google_civic_election_id=4184, state_code=state_code)
+        CandidateToOfficeLink.objects.create(candidate_we_vote_id=candidate_we_vote_id,
+                                             contest_office_we_vote_id=office_we_vote_id,
+                                             google_civic_election_id=4184, state_code=state_code)
+
+    def test_nationwide_snapshot_renders_only_invalidated_states(self):
+        """ A write invalidates its state and the nationwide snapshot; only that state is rendered again. """
+        ballot_snapshot_local_cache.clear()
+        self.create_office_with_candidate('wv01off1', 'Governor', 'MS', 'wv01cand1')
+        self.create_office_with_candidate('wv01off2', 'Mayor', 'CA', 'wv01cand2')
+        nationwide_results = retrieve_ballot_snapshot_for_api(4184)
+        self.assertTrue(nationwide_results['ballot_snapshot_found'], nationwide_results['status'])
+        self.assertEqual(BallotSnapshotManager().retrieve_ballot_snapshot(4184)['snapshot_etag'],
+                         nationwide_results['snapshot_etag'])
+
+        self.create_office_with_candidate('wv01off3', 'Attorney General', 'MS', 'wv01cand3')
+        self.assertFalse(BallotSnapshotManager().retrieve_ballot_snapshot(4184)['ballot_snapshot_found'])
+        with mock.patch('ballot.controllers.all_ballot_items_retrieve_for_api',
+                        wraps=all_ballot_items_retrieve_for_api) as rendered:
+            results = retrieve_ballot_snapshot_for_api(4184)
+            self.assertEqual([call_args[0] for call_args in rendered.call_args_list], [(4184, 'ms')])
+        self.assertNotEqual(results['snapshot_etag'], nationwide_results['snapshot_etag'])
+        json_data = json.loads(gzip.decompress(results['snapshot_json_gzip']))
+        self.assertEqual([ballot_item['we_vote_id'] for ballot_item in json_data['ballot_item_list']],
+                         ['wv01off3', 'wv01off1', 'wv01off2'])
+
+    def test_state_snapshot_keeps_request_state_code_and_skips_empty_renders(self):
+        """ 'MS' and 'ms' share one snapshot, each answered as spelled; empty ballots are not stored. """
+        ballot_snapshot_local_cache.clear()
+        self.create_office_with_candidate('wv01off1', 'Governor', 'MS', 'wv01cand1')
+        for state_code in ['MS', 'ms']:
+            results = retrieve_ballot_snapshot_for_api(4184, state_code)
+            self.assertEqual(json.loads(gzip.decompress(results['snapshot_json_gzip']))['state_code'], state_code)
+        self.assertEqual(BallotSnapshot.objects.filter(google_civic_election_id=4184, state_code='ms').count(), 1)
+
+        results = retrieve_ballot_snapshot_for_api(4184, 'WY')
+        self.assertEqual(json.loads(gzip.decompress(results['snapshot_json_gzip']))['ballot_item_list'], [])
+        self.assertFalse(BallotSnapshot.objects.filter(google_civic_election_id=4184, state_code='wy').exists())
+
+    def test_national_office_invalidates_every_state_snapshot(self):
+        """ Offices not tied to a state appear on every state's ballot, so writing one clears every snapshot. """
+        ballot_snapshot_local_cache.clear()
+        self.create_office_with_candidate('wv01off1', 'Governor', 'MS', 'wv01cand1')
+        self.create_office_with_candidate('wv01off2', 'Mayor', 'CA', 'wv01cand2')
+        retrieve_ballot_snapshot_for_api(4184)
+        for state_code in ['MS', 'CA']:
+            retrieve_ballot_snapshot_for_api(4184, state_code)
+        self.create_office_with_candidate('wv01off9', 'President', '', 'wv01cand9')
+        self.assertFalse(BallotSnapshot.objects.filter(
+            google_civic_election_id=4184, snapshot_json_gzip__isnull=False).exists())
+        results = retrieve_ballot_snapshot_for_api(4184, 'CA')
+        json_data = json.loads(gzip.decompress(results['snapshot_json_gzip']))
+        self.assertIn('wv01off9', [ballot_item['we_vote_id'] for ballot_item in json_data['ballot_item_list']])
+
+    def test_saves_that_leave_the_ballot_alone_keep_the_snapshots(self):
+        """ Twitter and photo refreshes, and saves that change nothing, don't invalidate the snapshots. """
+        ballot_snapshot_local_cache.clear()
+        self.create_office_with_candidate('wv01off1', 'Governor', 'MS', 'wv01cand1')
+        retrieve_ballot_snapshot_for_api(4184, 'MS')
+        candidate = CandidateCampaign.objects.get(we_vote_id='wv01cand1')
+        candidate.twitter_profile_image_url_https = 'https://pbs.twimg.com/wv01cand1_normal.jpg'
+        candidate.save(update_fields=['twitter_profile_image_url_https'])
+        candidate.save()
+        CandidateCampaign.objects.get(we_vote_id='wv01cand1').save()
+        self.assertTrue(BallotSnapshotManager().retrieve_ballot_snapshot(4184, 'MS')['ballot_snapshot_found'])
+
+        candidate.twitter_followers_count = 1000
+        candidate.save(update_fields=['twitter_followers_count'])
+        self.assertFalse(BallotSnapshotManager().retrieve_ballot_snapshot(4184, 'MS')['ballot_snapshot_found'])
+
+    def test_snapshot_invalidated_by_another_worker_is_not_served_from_memory(self):
+        ballot_snapshot_local_cache.clear()
+        self.create_office_with_candidate('wv01off1', 'Governor', 'MS', 'wv01cand1')
+        retrieve_ballot_snapshot_for_api(4184, 'MS')
+        self.assertIn("BALLOT_SNAPSHOT_LOCAL_CACHE_HIT",
+                      BallotSnapshotManager().retrieve_ballot_snapshot(4184, 'MS')['status'])
+
+        # Another worker's invalidation doesn't reach this worker's memory, but it does change the stored ETag
+        BallotSnapshot.objects.filter(google_civic_election_id=4184, state_code='ms').update(
+            ballot_item_list_json=None, snapshot_json_gzip=None, snapshot_etag='')
+        results = BallotSnapshotManager().retrieve_ballot_snapshot(4184, 'MS')
+        self.assertFalse(results['ballot_snapshot_found'])
+        self.assertIn("BALLOT_SNAPSHOT_LOCAL_CACHE_OUT_OF_DATE", results['status'])
+
+    def test_request_waiting_for_a_render_uses_the_snapshot_it_waited_for(self):
+        not_found = {'success': True, 'status': "BALLOT_SNAPSHOT_NOT_FOUND ", 'ballot_snapshot_found': False,
+                     'snapshot_json_gzip': None, 'snapshot_etag': '', 'rendered_state_code': ''}
+        found = {'success': True, 'status': "BALLOT_SNAPSHOT_FOUND ", 'ballot_snapshot_found': True,
+                 'snapshot_json_gzip': gzip.compress(b'{}'), 'snapshot_etag': '"1"', 'rendered_state_code': 'MS'}
+        with mock.patch.object(BallotSnapshotManager, 'retrieve_ballot_snapshot', side_effect=[not_found, found]), \
+                mock.patch('ballot.controllers.refresh_ballot_snapshot') as refreshed:
+            results = retrieve_ballot_snapshot_for_api(4184, 'MS')
+        refreshed.assert_not_called()
+        self.assertEqual(results['snapshot_etag'], '"1"')
@@ -4,7 +4,8 @@
 
 from .controllers import ballot_items_import_from_master_server, ballot_returned_import_from_master_server, \
     repair_ballot_items_for_election
-from .models import BallotItem, BallotItemListManager, BallotItemManager, BallotReturned, BallotReturnedManager
+from .models import BallotItem, BallotItemListManager, BallotItemManager, BallotReturned, BallotReturnedListManager, \
+    BallotReturnedManager
 from admin_tools.views import redirect_to_sign_in_page
 from candidate.models import CandidateListManager
 from config.base import get_environment_variable
@@ -22,7 +23,6 @@ import json
 from measure.models import ContestMeasure, ContestMeasureManager
 from office.models import ContestOffice, ContestOfficeManager
 from polling_location.models import PollingLocation, PollingLocationManager
-import time
 from voter.models import voter_has_authority
 import wevote_functions.admin
 from wevote_functions.functions import convert_to_int, positive_value_exists
@@ -882,38 +882,16 @@ def update_ballot_returned_with_latitude_and_longitude_view(request):
             except Exception as e:
                 pass
     else:
-        # Gather the list of ballot_returned entries that need to be updated
-        ballot_returned_query = BallotReturned.objects.order_by('id')
-        ballot_returned_query = ballot_returned_query.filter(Q(latitude=None) | Q(latitude=0))
-        # Don't retrieve entries for voters
-        ballot_returned_query = ballot_returned_query.exclude(Q(polling_location_we_vote_id=None) |
-                                                              Q(polling_location_we_vote_id=""))
-        if positive_value_exists(google_civic_election_id):
-            ballot_returned_query = ballot_returned_query.filter(google_civic_election_id=google_civic_election_id)
-        if positive_value_exists(state_code):
-            ballot_returned_query = ballot_returned_query.filter(normalized_state__iexact=state_code)
-        # Limit to 200 because that is all that seems to store anyways with each call
-        ballot_returned_query = ballot_returned_query[:100]
-
-        rate_limit_count = 0
-        for ballot_returned in ballot_returned_query:
-            rate_limit_count += 1
-            ballot_returned_results = ballot_returned_manager.populate_latitude_and_longitude_for_ballot_returned(
-                 ballot_returned)
-            if ballot_returned_results['success']:
-                # Keep track of the number we have processed since last break, since we can only request 10 per second
-                latitude_and_longitude_updated_count += 1
-            else:
-                latitude_and_longitude_not_updated_count += 1
-                errors_status += ballot_returned_results['status']
-
-            if rate_limit_count >= 10:
-                time.sleep(1)
-                # After pause, reset the limit count
-                rate_limit_count = 0
-
-            if ballot_returned_results['geocoder_quota_exceeded']:
-                break
+        # Geocode the ballot_returned entries that need to be updated in one batch. Addresses are deduplicated,
+        #  cached addresses skip the geocoder, and the rest are geocoded concurrently within our rate limit.
+        # Limit to 100 per call, as before
+        ballot_returned_list_manager = BallotReturnedListManager()
+        ballot_returned_results = ballot_returned_list_manager.populate_latitude_and_longitude_for_election(
+            google_civic_election_id, state_code=state_code, limit=100)
+        latitude_and_longitude_updated_count += ballot_returned_results['ballot_returned_updated_count']
+        latitude_and_longitude_not_updated_count += ballot_returned_results['ballot_returned_not_updated_count']
+        if not ballot_returned_results['success']:
+            errors_status += ballot_returned_results['status']
 
         # Write the lat/long data that we have back to the map point table
         ballot_returned_query = BallotReturned.objects.order_by('id')
@@ -632,59 +632,21 @@ def filter_candidates_structured_json_for_local_duplicates(structured_json):
     :param structured_json:
     :return:
     """
-    processed = 0
     duplicates_removed = 0
     filtered_structured_json = []
     candidate_list_manager = CandidateListManager()
-    for one_candidate in structured_json:
-        candidate_name = one_candidate['candidate_name'] if 'candidate_name' in one_candidate else ''
-        google_civic_candidate_name = one_candidate['google_civic_candidate_name'] \
-            if 'google_civic_candidate_name' in one_candidate else ''
-        google_civic_candidate_name2 = one_candidate['google_civic_candidate_name2'] \
-            if 'google_civic_candidate_name2' in one_candidate else ''
-        google_civic_candidate_name3 = one_candidate['google_civic_candidate_name3'] \
-            if 'google_civic_candidate_name3' in one_candidate else ''
-        we_vote_id = one_candidate['we_vote_id'] if 'we_vote_id' in one_candidate else ''
-        google_civic_election_id = \
-            one_candidate['google_civic_election_id'] if 'google_civic_election_id' in one_candidate else ''
-        contest_office_we_vote_id = \
-            one_candidate['contest_office_we_vote_id'] if 'contest_office_we_vote_id' in one_candidate else ''
-        politician_we_vote_id = one_candidate['politician_we_vote_id'] \
-            if 'politician_we_vote_id' in one_candidate else ''
-        candidate_twitter_handle = one_candidate['candidate_twitter_handle'] \
-            if 'candidate_twitter_handle' in one_candidate else ''
-        ballotpedia_candidate_id = one_candidate['ballotpedia_candidate_id'] \
-            if 'ballotpedia_candidate_id' in one_candidate else ''
-        # Not needed here: ballotpedia_person_id
-        vote_smart_id = one_candidate['vote_smart_id'] if 'vote_smart_id' in one_candidate else ''
-        maplight_id = one_candidate['maplight_id'] if 'maplight_id' in one_candidate else ''
-
-        # Check to see if there is an entry that matches in all critical ways, minus the we_vote_id
-        we_vote_id_from_master = we_vote_id
-
-        results = candidate_list_manager.retrieve_possible_duplicate_candidates(
-            candidate_name, google_civic_candidate_name, google_civic_candidate_name2, google_civic_candidate_name3,
-            google_civic_election_id, contest_office_we_vote_id,
-            politician_we_vote_id, candidate_twitter_handle, ballotpedia_candidate_id, vote_smart_id, maplight_id,
-            we_vote_id_from_master)
-
-        if results['candidate_list_found']:
-            # print("Skipping candidate " + str(candidate_name) + ",  " + str(google_civic_candidate_name) + ",  " +
-            #       str(google_civic_election_id) + ",  " + str(contest_office_we_vote_id) + ",  " +
-            #       str(politician_we_vote_id) + ",  " + str(candidate_twitter_handle) + ",  " +
-            #       str(vote_smart_id) + ",  " + str(maplight_id) + ",  " + str(we_vote_id_from_master))
+    # Check to see if there is an entry that matches in all critical ways, minus the we_vote_id
+    results = candidate_list_manager.retrieve_possible_duplicate_candidates_in_bulk(structured_json)
+    for one_candidate, possible_duplicate_found in zip(structured_json, results['possible_duplicate_found_list']):
+        if possible_duplicate_found:
             # Obsolete note?: There seems to be a duplicate already in this database using a different we_vote_id
             duplicates_removed += 1
         else:
             filtered_structured_json.append(one_candidate)
 
-        processed += 1
-        if not processed % 10000:
-            print("... candidates checked for duplicates: " + str(processed) + " of " + str(len(structured_json)))
-
     candidates_results = {
         'success':              True,
-        'status':               "FILTER_CANDIDATES_FOR_DUPLICATES_PROCESS_COMPLETE",
+        'status':               "FILTER_CANDIDATES_FOR_DUPLICATES_PROCESS_COMPLETE " + results['status'],
         'duplicates_removed':   duplicates_removed,
         'structured_json':      filtered_structured_json,
     }
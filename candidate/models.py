@@ -12,7 +12,7 @@ from wevote_settings.models import fetch_next_we_vote_id_candidate_campaign_inte
 import wevote_functions.admin
 from wevote_functions.functions import add_period_to_middle_name_initial, add_period_to_name_prefix_and_suffix, \
     convert_to_int, \
-    display_full_name_with_correct_capitalization, \
+    display_full_name_with_correct_capitalization, DuplicateKeyIndex, \
     extract_title_from_full_name, extract_first_name_from_full_name, extract_middle_name_from_full_name, \
     extract_last_name_from_full_name, extract_suffix_from_full_name, extract_nickname_from_full_name, \
     extract_state_from_ocd_division_id, extract_twitter_handle_from_text_string, \
@@ -176,6 +176,78 @@ class CandidateListManager(models.Manager):
         }
         return results
 
+    def retrieve_candidate_list_by_office_we_vote_id(self, office_we_vote_id_list=[], read_only=True):
+        """
+        The bulk version of retrieve_all_candidates_for_office: two queries (links, then candidates) for any number
+        of offices, instead of two queries per office. Each office's candidate list keeps the
+        retrieve_all_candidates_for_office order (most twitter followers first), and skips do_not_display_on_ballot.
+        :param office_we_vote_id_list:
+        :param read_only:
+        :return:
+        """
+        candidate_list_by_office_we_vote_id = {}
+        status = ""
+        success = True
+
+        office_we_vote_id_list = [one_we_vote_id for one_we_vote_id in office_we_vote_id_list
+                                  if positive_value_exists(one_we_vote_id)]
+        if not len(office_we_vote_id_list):
+            status += 'RETRIEVE_CANDIDATE_LIST_BY_OFFICE-NO_OFFICES '
+            results = {
+                'success':                              success,
+                'status':                               status,
+                'candidate_list_by_office_we_vote_id':  candidate_list_by_office_we_vote_id,
+            }
+            return results
+
+        link_results = self.retrieve_candidate_to_office_link_list(
+            contest_office_we_vote_id_list=office_we_vote_id_list,
+            read_only=read_only)
+        if not positive_value_exists(link_results['success']):
+            status += link_results['status']
+            results = {
+                'success':                              False,
+                'status':                               status,
+                'candidate_list_by_office_we_vote_id':  candidate_list_by_office_we_vote_id,
+            }
+            return results
+
+        office_we_vote_id_list_by_candidate_we_vote_id = {}
+        for one_link in link_results['candidate_to_office_link_list']:
+            if positive_value_exists(one_link.candidate_we_vote_id):
+                office_we_vote_id_list_by_candidate_we_vote_id.setdefault(one_link.candidate_we_vote_id, [])
+                if one_link.contest_office_we_vote_id not in \
+                        office_we_vote_id_list_by_candidate_we_vote_id[one_link.candidate_we_vote_id]:
+                    office_we_vote_id_list_by_candidate_we_vote_id[one_link.candidate_we_vote_id].append(
+                        one_link.contest_office_we_vote_id)
+
+        try:
+            if positive_value_exists(len(office_we_vote_id_list_by_candidate_we_vote_id)):
+                if read_only:
+                    candidate_query = CandidateCampaign.objects.using('readonly').all()
+                else:
+                    candidate_query = CandidateCampaign.objects.all()
+                candidate_query = candidate_query.filter(
+                    we_vote_id__in=list(office_we_vote_id_list_by_candidate_we_vote_id.keys()))
+                candidate_query = candidate_query.exclude(do_not_display_on_ballot=True)
+                candidate_query = candidate_query.order_by('-twitter_followers_count')
+                for candidate in candidate_query:
+                    for office_we_vote_id in office_we_vote_id_list_by_candidate_we_vote_id[candidate.we_vote_id]:
+                        candidate_list_by_office_we_vote_id.setdefault(office_we_vote_id, [])
+                        candidate_list_by_office_we_vote_id[office_we_vote_id].append(candidate)
+            status += 'RETRIEVE_CANDIDATE_LIST_BY_OFFICE-CANDIDATES_RETRIEVED '
+        except Exception as e:
+            handle_exception(e, logger=logger)
+            status += 'FAILED retrieve_candidate_list_by_office_we_vote_id ' + str(e) + ' '
+            success = False
+
+        results = {
+            'success':                              success,
+            'status':                               status,
+            'candidate_list_by_office_we_vote_id':  candidate_list_by_office_we_vote_id,
+        }
+        return results
+
     def retrieve_all_candidates_for_upcoming_election(
             self,
             google_civic_election_id_list=[],
@@ -832,6 +904,149 @@ class CandidateListManager(models.Manager):
         }
         return results
 
+    def retrieve_possible_duplicate_candidates_in_bulk(self, structured_json):
+        """
+        The same matching as retrieve_possible_duplicate_candidates, for a whole batch of candidates coming in from
+        the master server. We load the candidates linked to the incoming elections once, and index their names and
+        ids by election, instead of running several queries per candidate.
+        :param structured_json: list of dicts with the candidate fields retrieve_possible_duplicate_candidates uses
+        :return: possible_duplicate_found_list, one True/False for each incoming candidate
+        """
+        possible_duplicate_found_list = []
+        status = ''
+        candidate_index = DuplicateKeyIndex()
+        normalize = DuplicateKeyIndex.normalize
+        google_civic_election_id_list = list(set(
+            convert_to_int(one_candidate.get('google_civic_election_id', ''))
+            for one_candidate in structured_json))
+
+        def modified_name(name, add_period_function, remove_period_function):
+            # Since Google Civic doesn't provide a unique identifier, and sometimes returns initials (or prefixes
+            # and suffixes) with a period and sometimes without, we also try the name the other way
+            add_results = add_period_function(name)
+            if add_results['name_changed']:
+                return add_results['modified_name']
+            remove_results = remove_period_function(name)
+            if remove_results['name_changed']:
+                return remove_results['modified_name']
+            return ''
+
+        try:
+            results = self.retrieve_candidate_to_office_link_list(
+                google_civic_election_id_list=google_civic_election_id_list)
+            if not positive_value_exists(results['success']):
+                status += results['status']
+            election_id_list_by_candidate_we_vote_id = {}
+            for candidate_to_office_link in results['candidate_to_office_link_list']:
+                election_id_list_by_candidate_we_vote_id.setdefault(
+                    candidate_to_office_link.candidate_we_vote_id, set()).add(
+                    candidate_to_office_link.google_civic_election_id)
+
+            candidate_queryset = CandidateCampaign.objects \
+                .filter(we_vote_id__in=list(election_id_list_by_candidate_we_vote_id.keys())) \
+                .values_list('we_vote_id', 'candidate_name', 'google_civic_candidate_name',
+                             'google_civic_candidate_name2', 'google_civic_candidate_name3', 'politician_we_vote_id',
+                             'candidate_twitter_handle', 'ballotpedia_candidate_id', 'vote_smart_id', 'maplight_id')
+            for we_vote_id, candidate_name, google_civic_candidate_name, google_civic_candidate_name2, \
+                    google_civic_candidate_name3, politician_we_vote_id, candidate_twitter_handle, \
+                    ballotpedia_candidate_id, vote_smart_id, maplight_id in candidate_queryset.iterator():
+                for google_civic_election_id in election_id_list_by_candidate_we_vote_id[we_vote_id]:
+                    key_list = [
+                        (google_civic_election_id,),
+                        (google_civic_election_id, 'candidate_name', candidate_name),
+                        (google_civic_election_id, 'candidate_name_iexact', normalize(candidate_name)),
+                        (google_civic_election_id, 'politician_we_vote_id', normalize(politician_we_vote_id)),
+                        (google_civic_election_id, 'candidate_twitter_handle', normalize(candidate_twitter_handle)),
+                        (google_civic_election_id, 'ballotpedia_candidate_id', ballotpedia_candidate_id),
+                        (google_civic_election_id, 'vote_smart_id', vote_smart_id),
+                        (google_civic_election_id, 'maplight_id', maplight_id),
+                    ]
+                    for one_name in [google_civic_candidate_name, google_civic_candidate_name2,
+                                     google_civic_candidate_name3]:
+                        key_list.append((google_civic_election_id, 'google_civic_candidate_name', one_name))
+                        key_list.append(
+                            (google_civic_election_id, 'google_civic_candidate_name_iexact', normalize(one_name)))
+                    for key in key_list:
+                        candidate_index.add(key, we_vote_id)
+        except Exception as e:
+            handle_exception(e, logger=logger)
+            status += 'FAILED-retrieve_possible_duplicate_candidates_in_bulk ' + str(e) + ' '
+            # Like retrieve_possible_duplicate_candidates, a candidate we can't check is not treated as a duplicate
+            results = {
+                'success':                          False,
+                'status':                           status,
+                'possible_duplicate_found_list':    [False] * len(structured_json),
+            }
+            return results
+
+        for one_candidate in structured_json:
+            google_civic_election_id = convert_to_int(one_candidate.get('google_civic_election_id', ''))
+            we_vote_id_from_master = one_candidate.get('we_vote_id', '')
+            excluded_we_vote_id = we_vote_id_from_master if positive_value_exists(we_vote_id_from_master) else None
+
+            # We want to find candidates with *any* of these values
+            key_list = []
+            for field_name in ['google_civic_candidate_name', 'google_civic_candidate_name2',
+                               'google_civic_candidate_name3']:
+                one_name = one_candidate.get(field_name, '')
+                if not positive_value_exists(one_name):
+                    continue
+                if field_name == 'google_civic_candidate_name':
+                    # We intentionally use case sensitive matching here
+                    key_list.append((google_civic_election_id, 'google_civic_candidate_name', one_name))
+                else:
+                    key_list.append((google_civic_election_id, 'google_civic_candidate_name_iexact',
+                                     normalize(one_name)))
+                for one_modified_name in [
+                        modified_name(one_name, add_period_to_middle_name_initial,
+                                      remove_period_from_middle_name_initial),
+                        modified_name(one_name, add_period_to_name_prefix_and_suffix,
+                                      remove_period_from_name_prefix_and_suffix)]:
+                    if positive_value_exists(one_modified_name):
+                        key_list.append((google_civic_election_id, 'google_civic_candidate_name_iexact',
+                                         normalize(one_modified_name)))
+
+            candidate_name = one_candidate.get('candidate_name', '')
+            if positive_value_exists(candidate_name):
+                key_list.append((google_civic_election_id, 'candidate_name_iexact', normalize(candidate_name)))
+                candidate_name_modified = modified_name(
+                    candidate_name, add_period_to_middle_name_initial, remove_period_from_middle_name_initial)
+                if positive_value_exists(candidate_name_modified):
+                    # We intentionally use case sensitive matching here
+                    key_list.append((google_civic_election_id, 'candidate_name', candidate_name_modified))
+
+            politician_we_vote_id = one_candidate.get('politician_we_vote_id', '')
+            if positive_value_exists(politician_we_vote_id):
+                key_list.append((google_civic_election_id, 'politician_we_vote_id', normalize(politician_we_vote_id)))
+            candidate_twitter_handle = one_candidate.get('candidate_twitter_handle', '')
+            if positive_value_exists(candidate_twitter_handle):
+                key_list.append(
+                    (google_civic_election_id, 'candidate_twitter_handle', normalize(candidate_twitter_handle)))
+            ballotpedia_candidate_id = convert_to_int(one_candidate.get('ballotpedia_candidate_id', ''))
+            if positive_value_exists(ballotpedia_candidate_id):
+                key_list.append((google_civic_election_id, 'ballotpedia_candidate_id', ballotpedia_candidate_id))
+            vote_smart_id = one_candidate.get('vote_smart_id', '')
+            if positive_value_exists(vote_smart_id):
+                key_list.append((google_civic_election_id, 'vote_smart_id', str(vote_smart_id)))
+            maplight_id = one_candidate.get('maplight_id', '')
+            if positive_value_exists(maplight_id):
+                key_list.append((google_civic_election_id, 'maplight_id', str(maplight_id)))
+
+            if not len(key_list):
+                # With none of these values, any other candidate in the election is a possible duplicate
+                key_list.append((google_civic_election_id,))
+
+            possible_duplicate_found_list.append(
+                any(candidate_index.has_match(key, excluded_we_vote_id) for key in key_list))
+
+        status += 'POSSIBLE_DUPLICATE_CANDIDATES_CHECKED_IN_BULK '
+        results = {
+            'success':                          True,
+            'status':                           status,
+            'possible_duplicate_found_list':    possible_duplicate_found_list,
+        }
+        return results
+
     def retrieve_candidates_from_non_unique_identifiers(
             self,
             google_civic_election_id_list,
@@ -209,6 +209,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'wevote_social.middleware.SocialMiddleware',
+    'voter.middleware.VoterIdentityCacheMiddleware',
 ]
 
 AUTHENTICATION_BACKENDS = (
@@ -348,6 +349,20 @@ CORS_REPLACE_HTTPS_REFERER = True
 CSRF_TRUSTED_ORIGINS = ['api.wevoteusa.org']
 DATA_UPLOAD_MAX_MEMORY_SIZE = 6000000
 
+# The "shared" cache tier sits between each worker's in-process caches and Postgres. Local memory is the default,
+# but it is private to each process, so code that invalidates entries for every worker (see
+# is_cache_shared_between_processes) skips it and goes to Postgres instead. To share entries, point CACHE_BACKEND
+# at django.core.cache.backends.memcached.PyMemcacheCache (CACHE_LOCATION host:port) when there is more than one
+# server, or at django.core.cache.backends.filebased.FileBasedCache (CACHE_LOCATION a directory) on a single server.
+CACHES = {
+    'default': {
+        'BACKEND': get_environment_variable_default(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': get_environment_variable_default('CACHE_LOCATION', 'wevote-default-cache'),
+        'TIMEOUT': 3600,
+    },
+}
+
 # CORS_ORIGIN_WHITELIST = (
 #     'google.com',
 #     'hostname.example.com'
@@ -17,4 +17,12 @@ from dj_static import Cling  # For Heroku
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 # application = get_wsgi_application() # Without Heroku
-application = Cling(get_wsgi_application())  # For Heroku
\ No newline at end of file
+application = Cling(get_wsgi_application())  # For Heroku
+
+# Open the memory-mapped GeoLite2 database once here, so that when gunicorn preloads the app every forked worker
+# shares the same mapped pages instead of opening the file itself
+try:
+    from geoip.controllers import retrieve_geoip_reader
+    retrieve_geoip_reader()
+except Exception:
+    pass
@@ -2,11 +2,16 @@
 # Brought to you by We Vote. Be good.
 # -*- coding: UTF-8 -*-
 
-from django.core.mail import EmailMultiAlternatives
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from config.base import get_environment_variable_default
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.apps import apps
-from django.db import models
-from wevote_functions.functions import extract_email_addresses_from_string, generate_random_string, \
-    positive_value_exists
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+from datetime import timedelta
+from wevote_functions.functions import convert_to_int, extract_email_addresses_from_string, \
+    generate_random_string, positive_value_exists, TokenBucketRateLimiter
 from wevote_settings.models import fetch_next_we_vote_id_email_integer, fetch_site_unique_id_prefix
 
 FRIEND_ACCEPTED_INVITATION_TEMPLATE = 'FRIEND_ACCEPTED_INVITATION_TEMPLATE'
@@ -42,14 +47,28 @@ ASSEMBLY_STATUS_CHOICES = (
 )
 WAITING_FOR_VERIFICATION = 'WAITING_FOR_VERIFICATION'
 
+WAITING_FOR_BULK_SEND = 'WAITING_FOR_BULK_SEND'
 BEING_SENT = 'BEING_SENT'
 SENT = 'SENT'
+SEND_FAILED = 'SEND_FAILED'
 SEND_STATUS_CHOICES = (
     (TO_BE_PROCESSED,  'Message to be processed'),
+    (WAITING_FOR_BULK_SEND, 'Message waiting to be sent with others'),
     (BEING_SENT, 'Message being sent'),
     (SENT, 'Message sent'),
+    (SEND_FAILED, 'Message could not be sent'),
 )
 
+# send_scheduled_emails_in_bulk sends each chunk of EmailScheduled rows over one email backend connection, with
+#  several chunks in flight at once, and all threads together held under EMAIL_BULK_SEND_MESSAGES_PER_SECOND
+EMAIL_BULK_SEND_CHUNK_SIZE = 100
+EMAIL_BULK_SEND_THREADS = convert_to_int(get_environment_variable_default('EMAIL_BULK_SEND_THREADS', 4))
+EMAIL_BULK_SEND_MESSAGES_PER_SECOND = \
+    convert_to_int(get_environment_variable_default('EMAIL_BULK_SEND_MESSAGES_PER_SECOND', 50))
+# Entries still BEING_SENT this long after they were claimed belong to a process that stopped mid-send, and are
+#  claimed again (so an email can go out twice if the process stopped after sending but before marking it SENT)
+EMAIL_BEING_SENT_RECLAIM_SECONDS = 900
+
 
 class EmailAddress(models.Model):
     """
@@ -858,18 +877,9 @@ class EmailManager(models.Manager):
         #     status += "MISSING_SENDER_VOTER_EMAIL"
         #     success = False
 
-        if not positive_value_exists(email_scheduled.recipient_voter_email):
-            status += "MISSING_RECIPIENT_VOTER_EMAIL"
-            success = False
-
-        if not positive_value_exists(email_scheduled.subject):
-            status += "MISSING_EMAIL_SUBJECT "
-            success = False
-
-        # We need either plain text or HTML message
-        if not positive_value_exists(email_scheduled.message_text) and \
-                not positive_value_exists(email_scheduled.message_html):
-            status += "MISSING_EMAIL_MESSAGE "
+        missing_values_status = fetch_email_scheduled_missing_values_status(email_scheduled)
+        if positive_value_exists(missing_values_status):
+            status += missing_values_status
             success = False
 
         if success:
@@ -901,23 +911,7 @@ class EmailManager(models.Manager):
             }
             return results
 
-        if positive_value_exists(email_scheduled.sender_voter_name):
-            # TODO DALE Make system variable
-            system_sender_email_address = "{sender_voter_name} via We Vote <info@WeVote.US>" \
-                                          "".format(sender_voter_name=email_scheduled.sender_voter_name)
-        else:
-            system_sender_email_address = "We Vote <info@WeVote.US>"  # TODO DALE Make system variable
-
-        mail = EmailMultiAlternatives(
-            subject=email_scheduled.subject,
-            body=email_scheduled.message_text,
-            from_email=system_sender_email_address,
-            to=[email_scheduled.recipient_voter_email],
-            # headers={"Reply-To": email_scheduled.sender_voter_email}
-        )
-        # 2020-01-19 Dale commented out Reply-To header because with it, Gmail gives phishing warning
-        if positive_value_exists(email_scheduled.message_html):
-            mail.attach_alternative(email_scheduled.message_html, "text/html")
+        mail = generate_email_message_from_email_scheduled(email_scheduled)
 
         try:
             mail.send()
@@ -936,17 +930,198 @@ class EmailManager(models.Manager):
 
     def send_scheduled_email_list(self, messages_to_send):
         """
-        Take in a list of scheduled_email_id's, and send them
+        Take in a list of scheduled_email_id's (scheduled as WAITING_FOR_BULK_SEND), and send them. Any left
+        unsent are picked up by send_scheduled_emails_waiting_for_bulk_send.
         :param messages_to_send:
         :return:
         """
-        success = False
+        if not len(messages_to_send):
+            results = {
+                'success':                  True,
+                'status':                   "NO_SCHEDULED_EMAIL_IDS_TO_SEND ",
+                'at_least_one_email_found': False,
+            }
+            return results
+
+        send_results = self.send_scheduled_emails_in_bulk(
+            send_status=WAITING_FOR_BULK_SEND, email_scheduled_id_list=messages_to_send)
+        results = {
+            'success':                  send_results['success'],
+            'status':                   send_results['status'],
+            'at_least_one_email_found': send_results['email_scheduled_found_count'] > 0,
+        }
+        return results
+
+    def send_scheduled_emails_waiting_for_bulk_send(self):
+        """
+        Called periodically, to send the WAITING_FOR_BULK_SEND entries a caller scheduled but never sent (the process
+        stopped before send_scheduled_email_list, or the email server could not be reached), and entries left
+        BEING_SENT by a process that stopped mid-send.
+        :return:
+        """
+        return self.send_scheduled_emails_in_bulk(send_status=WAITING_FOR_BULK_SEND)
+
+    def send_scheduled_emails_in_bulk(self, send_status=TO_BE_PROCESSED, email_scheduled_id_list=None,
+                                      sender_voter_we_vote_id='', chunk_size=EMAIL_BULK_SEND_CHUNK_SIZE,
+                                      number_of_threads=EMAIL_BULK_SEND_THREADS,
+                                      messages_per_second=EMAIL_BULK_SEND_MESSAGES_PER_SECOND):
+        """
+        Drain the EmailScheduled entries with this send_status. Each chunk is claimed (marked BEING_SENT with
+        SKIP LOCKED, so two processes never send the same email), sent one message at a time over a single email
+        backend connection, and then marked SENT or SEND_FAILED with one update per outcome. A message the backend
+        reports as not sent is SEND_FAILED.
+        Chunks are sent from number_of_threads threads at once. Entries that could not be sent because the
+        connection failed go back to send_status, to be picked up by the next run.
+        :param send_status:
+        :param email_scheduled_id_list: Only send these entries
+        :param sender_voter_we_vote_id: Only send entries from this voter
+        :param chunk_size:
+        :param number_of_threads:
+        :param messages_per_second:
+        :return:
+        """
+        status = ""
+        success = True
+        email_scheduled_found_count = 0
+        email_scheduled_sent_count = 0
+        email_scheduled_failed_count = 0
+        rate_limiter = TokenBucketRateLimiter(requests_per_second=messages_per_second)
+
+        def send_one_chunk(email_scheduled_list):
+            # Only talks to the email backend. The database is updated from the calling thread.
+            sent_id_list = []
+            failed_id_list = []
+            retry_id_list = []
+            message_list = []
+            message_id_list = []
+            for email_scheduled in email_scheduled_list:
+                if positive_value_exists(fetch_email_scheduled_missing_values_status(email_scheduled)):
+                    failed_id_list.append(email_scheduled.id)
+                else:
+                    message_list.append(generate_email_message_from_email_scheduled(email_scheduled))
+                    message_id_list.append(email_scheduled.id)
+            chunk_status = ""
+            if len(message_list):
+                try:
+                    connection = get_connection()
+                    connection.open()
+                except Exception as e:
+                    retry_id_list = message_id_list
+                    return sent_id_list, failed_id_list, retry_id_list, \
+                        "COULD_NOT_CONNECT_VIA_SENDGRID " + str(e) + " "
+                try:
+                    for message_index, message in enumerate(message_list):
+                        rate_limiter.acquire()
+                        try:
+                            number_sent = connection.send_messages([message])
+                        except Exception as e:
+                            # The connection failed, so this message and the rest are tried again next run
+                            retry_id_list = message_id_list[message_index:]
+                            chunk_status += "COULD_NOT_SEND_CHUNK_VIA_SENDGRID " + str(e) + " "
+                            break
+                        if number_sent:
+                            sent_id_list.append(message_id_list[message_index])
+                        else:
+                            failed_id_list.append(message_id_list[message_index])
+                finally:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+            return sent_id_list, failed_id_list, retry_id_list, chunk_status
+
+        in_flight_futures = set()
+        with ThreadPoolExecutor(max_workers=max(1, number_of_threads)) as executor:
+            continue_claiming = True
+            while continue_claiming or len(in_flight_futures):
+                if continue_claiming and len(in_flight_futures) < max(1, number_of_threads):
+                    claim_results = self.claim_scheduled_email_chunk(
+                        send_status=send_status,
+                        email_scheduled_id_list=email_scheduled_id_list,
+                        sender_voter_we_vote_id=sender_voter_we_vote_id,
+                        chunk_size=chunk_size)
+                    if not claim_results['success']:
+                        status += claim_results['status']
+                        success = False
+                        continue_claiming = False
+                    elif len(claim_results['email_scheduled_list']):
+                        email_scheduled_found_count += len(claim_results['email_scheduled_list'])
+                        in_flight_futures.add(executor.submit(send_one_chunk, claim_results['email_scheduled_list']))
+                    else:
+                        continue_claiming = False
+                    continue
+
+                done_futures, in_flight_futures = wait(in_flight_futures, return_when=FIRST_COMPLETED)
+                for future in done_futures:
+                    sent_id_list, failed_id_list, retry_id_list, chunk_status = future.result()
+                    status += chunk_status
+                    try:
+                        if len(sent_id_list):
+                            EmailScheduled.objects.filter(id__in=sent_id_list).update(send_status=SENT)
+                        if len(failed_id_list):
+                            EmailScheduled.objects.filter(id__in=failed_id_list).update(send_status=SEND_FAILED)
+                        if len(retry_id_list):
+                            EmailScheduled.objects.filter(id__in=retry_id_list).update(send_status=send_status)
+                    except Exception as e:
+                        status += "FAILED_TO_UPDATE_SEND_STATUS: " + str(e) + " "
+                        success = False
+                    email_scheduled_sent_count += len(sent_id_list)
+                    email_scheduled_failed_count += len(failed_id_list)
+                    if len(retry_id_list):
+                        # Don't claim the same entries again in this run
+                        continue_claiming = False
+
+        status += "SCHEDULED_EMAILS_SENT_IN_BULK sent: " + str(email_scheduled_sent_count) + \
+                  ", failed: " + str(email_scheduled_failed_count) + " "
+        results = {
+            'success':                      success,
+            'status':                       status,
+            'email_scheduled_found_count':  email_scheduled_found_count,
+            'email_scheduled_sent_count':   email_scheduled_sent_count,
+            'email_scheduled_failed_count': email_scheduled_failed_count,
+        }
+        return results
+
+    def claim_scheduled_email_chunk(self, send_status=TO_BE_PROCESSED, email_scheduled_id_list=None,
+                                    sender_voter_we_vote_id='', chunk_size=EMAIL_BULK_SEND_CHUNK_SIZE):
+        """
+        Mark up to chunk_size EmailScheduled entries with this send_status as BEING_SENT, skipping entries another
+        process has locked, and return them. Entries claimed more than EMAIL_BEING_SENT_RECLAIM_SECONDS ago and still
+        BEING_SENT are claimed again.
+        :param send_status:
+        :param email_scheduled_id_list:
+        :param sender_voter_we_vote_id:
+        :param chunk_size:
+        :return:
+        """
         status = ""
+        email_scheduled_list = []
+        try:
+            with transaction.atomic():
+                reclaim_before_time = now() - timedelta(seconds=EMAIL_BEING_SENT_RECLAIM_SECONDS)
+                claim_query = EmailScheduled.objects.select_for_update(skip_locked=True) \
+                    .filter(Q(send_status=send_status) |
+                            Q(send_status=BEING_SENT, date_last_changed__lt=reclaim_before_time))
+                if email_scheduled_id_list is not None:
+                    claim_query = claim_query.filter(id__in=email_scheduled_id_list)
+                if positive_value_exists(sender_voter_we_vote_id):
+                    claim_query = claim_query.filter(sender_voter_we_vote_id=sender_voter_we_vote_id)
+                email_scheduled_list = list(claim_query.order_by('id')[:chunk_size])
+                if len(email_scheduled_list):
+                    claimed_id_list = [email_scheduled.id for email_scheduled in email_scheduled_list]
+                    # update() doesn't set auto_now fields, and date_last_changed is when the entries were claimed
+                    EmailScheduled.objects.filter(id__in=claimed_id_list).update(
+                        send_status=BEING_SENT, date_last_changed=now())
+            success = True
+        except Exception as e:
+            email_scheduled_list = []
+            success = False
+            status += "FAILED_TO_CLAIM_SCHEDULED_EMAIL_CHUNK: " + str(e) + " "
 
         results = {
-            'success':                  success,
-            'status':                   status,
-            'at_least_one_email_found': True,
+            'success':              success,
+            'status':               status,
+            'email_scheduled_list': email_scheduled_list,
         }
         return results
 
@@ -992,17 +1167,10 @@ class EmailManager(models.Manager):
                             status += "SCHEDULED_EMAIL_SAVED "
                         except Exception as e:
                             status += "COULD_NOT_SAVE_SCHEDULED_EMAIL " + str(e) + " "
-                send_results = self.send_scheduled_email(scheduled_email)
-                email_scheduled_sent = send_results['email_scheduled_sent']
-                status += send_results['status']
-                if email_scheduled_sent:
-                    # If scheduled email sent successfully change their status from WAITING_FOR_VERIFICATION to SENT
-                    send_status = SENT
-                    try:
-                        scheduled_email.send_status = send_status
-                        scheduled_email.save()
-                    except Exception as e:
-                        status += "FAILED_TO_UPDATE_SEND_STATUS: " + str(e) + ' '
+            # Send them all over one connection, changing their status from WAITING_FOR_VERIFICATION to SENT
+            send_results = self.send_scheduled_emails_in_bulk(
+                send_status=send_status, sender_voter_we_vote_id=sender_we_vote_id)
+            status += send_results['status']
         results = {
             'success':                  success,
             'status':                   status,
@@ -1045,6 +1213,46 @@ class EmailManager(models.Manager):
             return email_address_object
 
 
+def fetch_email_scheduled_missing_values_status(email_scheduled):
+    """
+    :param email_scheduled:
+    :return: Empty string if email_scheduled can be sent
+    """
+    status = ""
+    if not positive_value_exists(email_scheduled.recipient_voter_email):
+        status += "MISSING_RECIPIENT_VOTER_EMAIL"
+
+    if not positive_value_exists(email_scheduled.subject):
+        status += "MISSING_EMAIL_SUBJECT "
+
+    # We need either plain text or HTML message
+    if not positive_value_exists(email_scheduled.message_text) and \
+            not positive_value_exists(email_scheduled.message_html):
+        status += "MISSING_EMAIL_MESSAGE "
+    return status
+
+
+def generate_email_message_from_email_scheduled(email_scheduled):
+    if positive_value_exists(email_scheduled.sender_voter_name):
+        # TODO DALE Make system variable
+        system_sender_email_address = "{sender_voter_name} via We Vote <info@WeVote.US>" \
+                                      "".format(sender_voter_name=email_scheduled.sender_voter_name)
+    else:
+        system_sender_email_address = "We Vote <info@WeVote.US>"  # TODO DALE Make system variable
+
+    mail = EmailMultiAlternatives(
+        subject=email_scheduled.subject,
+        body=email_scheduled.message_text,
+        from_email=system_sender_email_address,
+        to=[email_scheduled.recipient_voter_email],
+        # headers={"Reply-To": email_scheduled.sender_voter_email}
+    )
+    # 2020-01-19 Dale commented out Reply-To header because with it, Gmail gives phishing warning
+    if positive_value_exists(email_scheduled.message_html):
+        mail.attach_alternative(email_scheduled.message_html, "text/html")
+    return mail
+
+
 def update_friend_invitation_email_link_with_new_email(deleted_email_we_vote_id, updated_email_we_vote_id):
     success = True
     status = ""
@@ -0,0 +1,89 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils.timezone import now
+
+from email_outbound.models import BEING_SENT, EMAIL_BEING_SENT_RECLAIM_SECONDS, EmailManager, EmailScheduled, \
+    SEND_FAILED, SENT, TO_BE_PROCESSED, WAITING_FOR_BULK_SEND, WAITING_FOR_VERIFICATION
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class EmailBulkSendTestCase(TestCase):
+
+    def setUp(self):
+        for index in range(5):
+            EmailScheduled.objects.create(
+                subject='Subject ' + str(index),
+                message_text='Message ' + str(index),
+                recipient_voter_email='friend' + str(index) + '@example.com',
+                sender_voter_we_vote_id='wv01voter1',
+                send_status=TO_BE_PROCESSED,
+            )
+        # Missing the recipient, so it can never be sent
+        EmailScheduled.objects.create(
+            subject='No recipient', message_text='Message', sender_voter_we_vote_id='wv01voter1',
+            send_status=TO_BE_PROCESSED)
+        EmailScheduled.objects.create(
+            subject='Not yet', message_text='Message', recipient_voter_email='later@example.com',
+            sender_voter_we_vote_id='wv01voter1', send_status=WAITING_FOR_VERIFICATION)
+        self.email_manager = EmailManager()
+
+    def test_send_scheduled_emails_in_bulk_drains_send_status(self):
+        results = self.email_manager.send_scheduled_emails_in_bulk(
+            send_status=TO_BE_PROCESSED, chunk_size=2, number_of_threads=2, messages_per_second=1000)
+        self.assertTrue(results['success'], results['status'])
+        self.assertEqual(results['email_scheduled_sent_count'], 5)
+        self.assertEqual(results['email_scheduled_failed_count'], 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['friend' + str(index) + '@example.com' for index in range(5)])
+        self.assertEqual(EmailScheduled.objects.filter(send_status=SENT).count(), 5)
+        self.assertEqual(EmailScheduled.objects.filter(send_status=SEND_FAILED).count(), 1)
+        self.assertEqual(EmailScheduled.objects.filter(send_status=WAITING_FOR_VERIFICATION).count(), 1)
+
+    def test_send_scheduled_email_list_only_sends_listed_emails(self):
+        email_scheduled_id_list = list(EmailScheduled.objects.filter(send_status=TO_BE_PROCESSED)
+                                       .exclude(recipient_voter_email__isnull=True)
+                                       .order_by('id').values_list('id', flat=True)[:3])
+        EmailScheduled.objects.filter(id__in=email_scheduled_id_list).update(send_status=WAITING_FOR_BULK_SEND)
+        email_scheduled_id_list = email_scheduled_id_list[:2]
+        results = self.email_manager.send_scheduled_email_list(email_scheduled_id_list)
+        self.assertTrue(results['at_least_one_email_found'])
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(EmailScheduled.objects.filter(id__in=email_scheduled_id_list, send_status=SENT).count(), 2)
+        self.assertEqual(EmailScheduled.objects.filter(send_status=WAITING_FOR_BULK_SEND).count(), 1)
+        self.assertEqual(EmailScheduled.objects.filter(send_status=TO_BE_PROCESSED).count(), 3)
+
+        # The one left is sent by the periodic drain, which leaves TO_BE_PROCESSED entries alone
+        results = self.email_manager.send_scheduled_emails_waiting_for_bulk_send()
+        self.assertEqual(results['email_scheduled_sent_count'], 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(EmailScheduled.objects.filter(send_status=TO_BE_PROCESSED).count(), 3)
+
+    def test_entries_left_being_sent_are_claimed_again_once_stale(self):
+        EmailScheduled.objects.filter(send_status=TO_BE_PROCESSED).update(
+            send_status=BEING_SENT, date_last_changed=now())
+        stale_email_scheduled = EmailScheduled.objects.filter(recipient_voter_email='friend0@example.com').first()
+        EmailScheduled.objects.filter(id=stale_email_scheduled.id).update(
+            date_last_changed=now() - timedelta(seconds=EMAIL_BEING_SENT_RECLAIM_SECONDS + 60))
+
+        results = self.email_manager.send_scheduled_emails_waiting_for_bulk_send()
+        self.assertEqual(results['email_scheduled_sent_count'], 1)
+        self.assertEqual([message.to[0] for message in mail.outbox], ['friend0@example.com'])
+        self.assertEqual(EmailScheduled.objects.filter(send_status=BEING_SENT).count(), 5)
+
+    def test_messages_the_backend_did_not_send_are_marked_send_failed(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = [1, 0, 1, Exception('Connection dropped')]
+        with mock.patch('email_outbound.models.get_connection', return_value=connection):
+            results = self.email_manager.send_scheduled_emails_in_bulk(
+                send_status=TO_BE_PROCESSED, number_of_threads=1, messages_per_second=1000)
+        self.assertEqual(results['email_scheduled_sent_count'], 2)
+        self.assertEqual(results['email_scheduled_failed_count'], 2, 'One not sent, and one missing its recipient')
+        self.assertEqual(EmailScheduled.objects.filter(send_status=SENT).count(), 2)
+        self.assertEqual(EmailScheduled.objects.filter(send_status=SEND_FAILED).count(), 2)
+        self.assertEqual(EmailScheduled.objects.filter(send_status=TO_BE_PROCESSED).count(), 2,
+                         'Not tried, or tried when the connection dropped, so sent on the next run')
+        connection.close.assert_called_once_with()
@@ -9,7 +9,7 @@ from .models import ACCEPTED, FriendInvitationVoterLink, FriendManager, CURRENT_
 from config.base import get_environment_variable
 from email_outbound.controllers import schedule_email_with_email_outbound_description, schedule_verification_email
 from email_outbound.models import EmailAddress, EmailManager, FRIEND_ACCEPTED_INVITATION_TEMPLATE, \
-    FRIEND_INVITATION_TEMPLATE, WAITING_FOR_VERIFICATION, TO_BE_PROCESSED
+    FRIEND_INVITATION_TEMPLATE, WAITING_FOR_BULK_SEND, WAITING_FOR_VERIFICATION, TO_BE_PROCESSED
 from follow.models import FollowIssueList
 from import_export_facebook.models import FacebookManager
 import json
@@ -386,6 +386,7 @@ def friend_invitation_by_email_send_for_api(voter_device_id,  # friendInvitation
 
     sender_voter = voter_results['voter']
     email_manager = EmailManager()
+    messages_to_send = []
 
     send_now = False
     valid_new_sender_email_address = False
@@ -517,7 +518,7 @@ def friend_invitation_by_email_send_for_api(voter_device_id,  # friendInvitation
             send_results = send_to_one_friend(voter_device_id, sender_voter, send_now,
                                               sender_email_with_ownership_verified,
                                               one_normalized_raw_email, first_name, last_name, invitation_message,
-                                              web_app_root_url)
+                                              web_app_root_url, messages_to_send=messages_to_send)
             status += send_results['status']
 
     else:
@@ -543,7 +544,7 @@ def friend_invitation_by_email_send_for_api(voter_device_id,  # friendInvitation
                 send_results = send_to_one_friend(voter_device_id, sender_voter, send_now,
                                                   sender_email_with_ownership_verified,
                                                   one_normalized_raw_email, first_name, last_name, invitation_message,
-                                                  web_app_root_url)
+                                                  web_app_root_url, messages_to_send=messages_to_send)
                 status += send_results['status']
         else:
             error_message_to_show_voter = "Please enter the email address of at least one friend."
@@ -557,6 +558,11 @@ def friend_invitation_by_email_send_for_api(voter_device_id,  # friendInvitation
             }
             return error_results
 
+    # When we are done scheduling all email, send it with a single connection to the email server
+    if len(messages_to_send):
+        send_results = email_manager.send_scheduled_email_list(messages_to_send)
+        status += send_results['status']
+
     # Now send any "WAITING_FOR_VERIFICATION" emails if the voter has since verified themselves
     # Are there any waiting?
     send_status = WAITING_FOR_VERIFICATION
@@ -606,7 +612,11 @@ def friend_invitation_by_email_send_for_api(voter_device_id,  # friendInvitation
 
 def send_to_one_friend(voter_device_id, sender_voter, send_now, sender_email_with_ownership_verified,
                        one_normalized_raw_email, first_name, last_name, invitation_message,
-                       web_app_root_url=''):
+                       web_app_root_url='', messages_to_send=None):
+    """
+    :param messages_to_send: If passed in, the invitation is scheduled and its EmailScheduled id appended here, so the
+      caller can send all of them together with EmailManager.send_scheduled_email_list
+    """
     # Starting with a raw email address, find (or create) the EmailAddress entry
     # and the owner (Voter) if exists
     status = ""
@@ -754,15 +764,17 @@ def send_to_one_friend(voter_device_id, sender_voter, send_now, sender_email_wit
         status += outbound_results['status'] + " "
         email_outbound_description = outbound_results['email_outbound_description']
         if outbound_results['email_outbound_description_saved'] and send_now:
-            send_status = TO_BE_PROCESSED
+            send_status = TO_BE_PROCESSED if messages_to_send is None else WAITING_FOR_BULK_SEND
             schedule_results = schedule_email_with_email_outbound_description(email_outbound_description, send_status)
             status += schedule_results['status'] + " "
             if schedule_results['email_scheduled_saved']:
-                # messages_to_send.append(schedule_results['email_scheduled_id'])
-                email_scheduled = schedule_results['email_scheduled']
-                send_results = email_manager.send_scheduled_email(email_scheduled)
-                email_scheduled_sent = send_results['email_scheduled_sent']
-                status += send_results['status']
+                if messages_to_send is not None:
+                    messages_to_send.append(schedule_results['email_scheduled_id'])
+                else:
+                    email_scheduled = schedule_results['email_scheduled']
+                    send_results = email_manager.send_scheduled_email(email_scheduled)
+                    email_scheduled_sent = send_results['email_scheduled_sent']
+                    status += send_results['status']
         elif not send_now:
             send_status = WAITING_FOR_VERIFICATION
             schedule_results = schedule_email_with_email_outbound_description(email_outbound_description, send_status)
@@ -1895,6 +1907,8 @@ def friend_list_for_api(voter_device_id,  # friendList
         status += retrieve_current_friends_as_voters_results['status']
         if retrieve_current_friends_as_voters_results['friend_list_found']:
             current_friend_list = retrieve_current_friends_as_voters_results['friend_list']
+            mutual_friends_count_dict = friend_manager.retrieve_mutual_friends_count_dict(
+                voter.we_vote_id, [friend_voter.we_vote_id for friend_voter in current_friend_list])
             for friend_voter in current_friend_list:
                 if not positive_value_exists(friend_voter.linked_organization_we_vote_id):
                     # We need to retrieve another voter object that can be saved
@@ -1921,7 +1935,7 @@ def friend_list_for_api(voter_device_id,  # friendList
                             status += "VOTER_COULD_NOT_BE_HEALED " + heal_results['status']
                     else:
                         status += "COULD_NOT_RETRIEVE_VOTER_THAT_CAN_BE_SAVED " + voter_results['status']
-                mutual_friends = friend_manager.fetch_mutual_friends_count(voter.we_vote_id, friend_voter.we_vote_id)
+                mutual_friends = mutual_friends_count_dict.get(friend_voter.we_vote_id, 0)
                 positions_taken = position_metrics_manager.fetch_positions_count_for_this_voter(friend_voter)
                 one_friend = {
                     "voter_we_vote_id":                 friend_voter.we_vote_id,
@@ -1952,6 +1966,9 @@ def friend_list_for_api(voter_device_id,  # friendList
         status += retrieve_invitations_processed_results['status']
         if retrieve_invitations_processed_results['friend_list_found']:
             raw_friend_list = retrieve_invitations_processed_results['friend_list']
+            mutual_friends_count_dict = friend_manager.retrieve_mutual_friends_count_dict(
+                voter.we_vote_id,
+                [one_friend_invitation.sender_voter_we_vote_id for one_friend_invitation in raw_friend_list])
             for one_friend_invitation in raw_friend_list:
                 # Augment the line with voter information
                 friend_voter_results = voter_manager.retrieve_voter_by_we_vote_id(
@@ -1961,8 +1978,7 @@ def friend_list_for_api(voter_device_id,  # friendList
                     recipient_voter_email = one_friend_invitation.recipient_voter_email \
                         if hasattr(one_friend_invitation, "recipient_voter_email") \
                         else ""
-                    mutual_friends = friend_manager.fetch_mutual_friends_count(
-                        voter.we_vote_id, friend_voter.we_vote_id)
+                    mutual_friends = mutual_friends_count_dict.get(friend_voter.we_vote_id, 0)
                     positions_taken = position_metrics_manager.fetch_positions_count_for_this_voter(friend_voter)
                     one_friend = {
                         "voter_we_vote_id":                 friend_voter.we_vote_id,
@@ -1996,6 +2012,9 @@ def friend_list_for_api(voter_device_id,  # friendList
             heal_results = heal_friend_invitations_sent_to_me(voter.we_vote_id, raw_friend_list)
             verified_friend_list = heal_results['friend_list']
             status += heal_results['status']
+            mutual_friends_count_dict = friend_manager.retrieve_mutual_friends_count_dict(
+                voter.we_vote_id,
+                [one_friend_invitation.sender_voter_we_vote_id for one_friend_invitation in verified_friend_list])
             for one_friend_invitation in verified_friend_list:
                 # Augment the line with voter information
                 friend_voter_results = voter_manager.retrieve_voter_by_we_vote_id(
@@ -2005,8 +2024,7 @@ def friend_list_for_api(voter_device_id,  # friendList
                     recipient_voter_email = one_friend_invitation.recipient_voter_email \
                         if hasattr(one_friend_invitation, "recipient_voter_email") \
                         else ""
-                    mutual_friends = friend_manager.fetch_mutual_friends_count(
-                        voter.we_vote_id, friend_voter.we_vote_id)
+                    mutual_friends = mutual_friends_count_dict.get(friend_voter.we_vote_id, 0)
                     positions_taken = position_metrics_manager.fetch_positions_count_for_this_voter(friend_voter)
                     one_friend = {
                         "voter_we_vote_id":                 friend_voter.we_vote_id,
@@ -2038,6 +2056,10 @@ def friend_list_for_api(voter_device_id,  # friendList
         status += retrieve_invitations_sent_by_me_results['status']
         if retrieve_invitations_sent_by_me_results['friend_list_found']:
             raw_friend_list = retrieve_invitations_sent_by_me_results['friend_list']
+            mutual_friends_count_dict = friend_manager.retrieve_mutual_friends_count_dict(
+                voter.we_vote_id,
+                [getattr(one_friend_invitation, 'recipient_voter_we_vote_id', '')
+                 for one_friend_invitation in raw_friend_list])
             for one_friend_invitation in raw_friend_list:
                 # Two kinds of invitations come in the raw_friend_list, 1) an invitation connected to voter
                 # 2) an invitation to a previously unrecognized email address
@@ -2055,8 +2077,7 @@ def friend_list_for_api(voter_device_id,  # friendList
                     if friend_voter_results['voter_found']:
                         friend_voter = friend_voter_results['voter']
                         positions_taken = position_metrics_manager.fetch_positions_count_for_this_voter(friend_voter)
-                        mutual_friends = friend_manager.fetch_mutual_friends_count(
-                            voter.we_vote_id, friend_voter.we_vote_id)
+                        mutual_friends = mutual_friends_count_dict.get(friend_voter.we_vote_id, 0)
                         one_friend = {
                             "voter_we_vote_id":                 friend_voter.we_vote_id,
                             "voter_date_last_changed":          friend_voter.date_last_changed.strftime('%Y-%m-%d %H:%M:%S'),
@@ -2139,6 +2160,8 @@ def friend_list_for_api(voter_device_id,  # friendList
         status += retrieve_suggested_friend_list_as_voters_results['status']
         if retrieve_suggested_friend_list_as_voters_results['friend_list_found']:
             suggested_friend_list = retrieve_suggested_friend_list_as_voters_results['friend_list']
+            mutual_friends_count_dict = friend_manager.retrieve_mutual_friends_count_dict(
+                voter.we_vote_id, [suggested_friend.we_vote_id for suggested_friend in suggested_friend_list])
             for suggested_friend in suggested_friend_list:
                 if not positive_value_exists(suggested_friend.linked_organization_we_vote_id):
                     # We need to retrieve another voter object that can be saved
@@ -2157,8 +2180,7 @@ def friend_list_for_api(voter_device_id,  # friendList
                             status += "SUGGESTED_FRIEND_VOTER_COULD_NOT_BE_HEALED " + heal_results['status']
                     else:
                         status += "SUGGESTED-COULD_NOT_RETRIEVE_VOTER_THAT_CAN_BE_SAVED " + voter_results['status']
-                mutual_friends = \
-                    friend_manager.fetch_mutual_friends_count(voter.we_vote_id, suggested_friend.we_vote_id)
+                mutual_friends = mutual_friends_count_dict.get(suggested_friend.we_vote_id, 0)
                 positions_taken = position_metrics_manager.fetch_positions_count_for_this_voter(suggested_friend)
                 one_friend = {
                     "voter_we_vote_id":                 suggested_friend.we_vote_id,
@@ -6,6 +6,7 @@ import json
 import psycopg2
 from django.db import models
 from django.db.models import Q
+from django.db.models.functions import Lower
 from config.base import get_environment_variable
 from email_outbound.models import EmailManager
 from voter.models import VoterManager
@@ -46,6 +47,8 @@ FRIENDS_IN_COMMON = 'FRIENDS_IN_COMMON'
 IGNORED_FRIEND_INVITATIONS = 'IGNORED_FRIEND_INVITATIONS'
 SUGGESTED_FRIEND_LIST = 'SUGGESTED_FRIEND_LIST'
 
+SUGGESTED_FRIEND_BULK_CREATE_BATCH_SIZE = 1000
+
 
 class CurrentFriend(models.Model):
     """
@@ -768,51 +771,87 @@ class FriendManager(models.Manager):
         return current_friends_count
 
     def fetch_mutual_friends_count(self, voter_we_vote_id, friend_we_vote_id):
-        """
-        TODO: This could be converted to database only calculation for better speed
-        :param voter_we_vote_id:
-        :param friend_we_vote_id:
-        :return:
-        """
-        mutual_friends_count = 0
-
         if not positive_value_exists(voter_we_vote_id) or not positive_value_exists(friend_we_vote_id):
-            return mutual_friends_count
+            return 0
+        mutual_friends_count_dict = self.retrieve_mutual_friends_count_dict(voter_we_vote_id, [friend_we_vote_id])
+        return mutual_friends_count_dict.get(friend_we_vote_id, 0)
 
-        voter_friends_we_vote_id_list = []
-        friend_friends_we_vote_id_list = []
+    def retrieve_friends_adjacency_dict(self, voter_we_vote_id_list, limit_to_we_vote_id_list=None, read_only=True):
+        """
+        Adjacency lists for a set of voters, from one query over CurrentFriend. Since the direction of a CurrentFriend
+        entry doesn't matter, every edge is added to both ends. We Vote ids are matched case-insensitively, like the
+        iexact lookups elsewhere in this file, so they all come back in lower case.
+        :param voter_we_vote_id_list:
+        :param limit_to_we_vote_id_list: If passed in, only keep edges whose other end is on this list
+        :param read_only:
+        :return: dict of lower case voter_we_vote_id -> set of lower case friend we_vote_ids
+        """
+        voter_we_vote_id_list = list(set(one_we_vote_id.lower() for one_we_vote_id in voter_we_vote_id_list
+                                         if positive_value_exists(one_we_vote_id)))
+        friends_adjacency_dict = {voter_we_vote_id: set() for voter_we_vote_id in voter_we_vote_id_list}
+        if not voter_we_vote_id_list:
+            return friends_adjacency_dict
 
-        try:
-            voter_friends_queryset = CurrentFriend.objects.using('readonly').all()
-            voter_friends_queryset = voter_friends_queryset.filter(
-                Q(viewer_voter_we_vote_id__iexact=voter_we_vote_id) |
-                Q(viewee_voter_we_vote_id__iexact=voter_we_vote_id))
-            voter_friends_list = list(voter_friends_queryset)
-            for one_friend in voter_friends_list:
-                voter_friends_we_vote_id_list.append(one_friend.fetch_other_voter_we_vote_id(voter_we_vote_id))
-        except Exception as e:
-            mutual_friends_count = 0
-            return mutual_friends_count
+        if positive_value_exists(read_only):
+            current_friend_queryset = CurrentFriend.objects.using('readonly').all()
+        else:
+            current_friend_queryset = CurrentFriend.objects.all()
+        current_friend_queryset = current_friend_queryset.annotate(
+            viewer_voter_we_vote_id_lower=Lower('viewer_voter_we_vote_id'),
+            viewee_voter_we_vote_id_lower=Lower('viewee_voter_we_vote_id'))
+        if limit_to_we_vote_id_list is None:
+            current_friend_queryset = current_friend_queryset.filter(
+                Q(viewer_voter_we_vote_id_lower__in=voter_we_vote_id_list) |
+                Q(viewee_voter_we_vote_id_lower__in=voter_we_vote_id_list))
+        else:
+            limit_to_we_vote_id_list = list(set(one_we_vote_id.lower() for one_we_vote_id in limit_to_we_vote_id_list
+                                                if positive_value_exists(one_we_vote_id)))
+            current_friend_queryset = current_friend_queryset.filter(
+                Q(viewer_voter_we_vote_id_lower__in=voter_we_vote_id_list,
+                  viewee_voter_we_vote_id_lower__in=limit_to_we_vote_id_list) |
+                Q(viewee_voter_we_vote_id_lower__in=voter_we_vote_id_list,
+                  viewer_voter_we_vote_id_lower__in=limit_to_we_vote_id_list))
+        for viewer_voter_we_vote_id, viewee_voter_we_vote_id in current_friend_queryset.values_list(
+                'viewer_voter_we_vote_id_lower', 'viewee_voter_we_vote_id_lower'):
+            if not positive_value_exists(viewer_voter_we_vote_id) or \
+                    not positive_value_exists(viewee_voter_we_vote_id):
+                continue
+            if viewer_voter_we_vote_id in friends_adjacency_dict:
+                friends_adjacency_dict[viewer_voter_we_vote_id].add(viewee_voter_we_vote_id)
+            if viewee_voter_we_vote_id in friends_adjacency_dict:
+                friends_adjacency_dict[viewee_voter_we_vote_id].add(viewer_voter_we_vote_id)
+        return friends_adjacency_dict
+
+    def retrieve_mutual_friends_count_dict(self, voter_we_vote_id, other_voter_we_vote_id_list):
+        """
+        The number of friends voter_we_vote_id has in common with each voter on other_voter_we_vote_id_list, using two
+        queries no matter how long the list is: one for the voter's friends, and one for the edges between the
+        other voters and those friends.
+        :param voter_we_vote_id:
+        :param other_voter_we_vote_id_list:
+        :return: dict of other_voter_we_vote_id -> mutual friends count
+        """
+        mutual_friends_count_dict = {}
+        other_voter_we_vote_id_list = [one_we_vote_id for one_we_vote_id in other_voter_we_vote_id_list
+                                       if positive_value_exists(one_we_vote_id)]
+        if not positive_value_exists(voter_we_vote_id) or not other_voter_we_vote_id_list:
+            return mutual_friends_count_dict
 
         try:
-            friend_friends_queryset = CurrentFriend.objects.using('readonly').all()
-            friend_friends_queryset = friend_friends_queryset.filter(
-                Q(viewer_voter_we_vote_id__iexact=friend_we_vote_id) |
-                Q(viewee_voter_we_vote_id__iexact=friend_we_vote_id))
-            friend_friends_list = list(friend_friends_queryset)
-            for one_friend in friend_friends_list:
-                friend_friends_we_vote_id_list.append(one_friend.fetch_other_voter_we_vote_id(friend_we_vote_id))
+            voter_friends_set = self.retrieve_friends_adjacency_dict([voter_we_vote_id])[voter_we_vote_id.lower()]
+            if voter_friends_set:
+                friends_adjacency_dict = self.retrieve_friends_adjacency_dict(
+                    other_voter_we_vote_id_list, limit_to_we_vote_id_list=voter_friends_set)
+            else:
+                friends_adjacency_dict = {}
         except Exception as e:
-            mutual_friends_count = 0
-            return mutual_friends_count
-
-        voter_set = set(voter_friends_we_vote_id_list)
-        friend_set = set(friend_friends_we_vote_id_list)
-        mutual_set = voter_set & friend_set
-        if mutual_set:
-            mutual_friends_count = len(mutual_set)
+            return mutual_friends_count_dict
 
-        return mutual_friends_count
+        for other_voter_we_vote_id in other_voter_we_vote_id_list:
+            mutual_set = friends_adjacency_dict.get(other_voter_we_vote_id.lower(), set())
+            mutual_set.discard(voter_we_vote_id.lower())
+            mutual_friends_count_dict[other_voter_we_vote_id] = len(mutual_set)
+        return mutual_friends_count_dict
 
     def fetch_suggested_friends_count(self, voter_we_vote_id):
         suggested_friends_count = 0
@@ -2173,34 +2212,66 @@ class FriendManager(models.Manager):
         :param read_only:
         :return:
         """
-        all_friends_one_person_results = self.retrieve_current_friends(starting_voter_we_vote_id, read_only=read_only)
+        status = ""
+        success = True
         suggested_friend_created_count = 0
-        if all_friends_one_person_results['current_friend_list_found']:
-            current_friend_list = all_friends_one_person_results['current_friend_list']
+        if not positive_value_exists(starting_voter_we_vote_id):
+            results = {
+                'status':                           "UPDATE_SUGGESTED_FRIENDS-MISSING_VOTER_WE_VOTE_ID ",
+                'success':                          False,
+                'suggested_friend_created_count':   suggested_friend_created_count,
+            }
+            return results
+
+        try:
             # For each friend on this list, suggest every other friend as a possible friend
             # Ex/ You have the friends Jo and Pat. This routine makes sure they both see each other as suggested friends
-            for one_current_friend_to_suggest in current_friend_list:
-                first_voter_we_vote_id = one_current_friend_to_suggest.fetch_other_voter_we_vote_id(
-                    starting_voter_we_vote_id)
-                for second_current_friend_to_suggest in current_friend_list:
-                    second_voter_we_vote_id = second_current_friend_to_suggest.fetch_other_voter_we_vote_id(
-                        starting_voter_we_vote_id)
-                    if positive_value_exists(first_voter_we_vote_id) and \
-                            positive_value_exists(second_voter_we_vote_id) and \
-                            first_voter_we_vote_id != second_voter_we_vote_id:
-                        # Are they already friends?
-                        already_friend_results = self.retrieve_current_friend(first_voter_we_vote_id,
-                                                                              second_voter_we_vote_id)
-                        if not already_friend_results['current_friend_found']:
-                            suggested_friend_results = self.update_or_create_suggested_friend(first_voter_we_vote_id,
-                                                                                              second_voter_we_vote_id)
-                            if suggested_friend_results['suggested_friend_created'] or \
-                                    suggested_friend_results['suggested_friend_found']:
-                                suggested_friend_created_count += 1
+            friend_we_vote_id_list = sorted(self.retrieve_friends_adjacency_dict(
+                [starting_voter_we_vote_id], read_only=read_only)[starting_voter_we_vote_id.lower()])
+            if len(friend_we_vote_id_list) > 1:
+                # Who among these friends is already friends with each other?
+                friends_adjacency_dict = self.retrieve_friends_adjacency_dict(
+                    friend_we_vote_id_list, limit_to_we_vote_id_list=friend_we_vote_id_list, read_only=read_only)
+                # Which pairs have already been suggested (in either direction)?
+                existing_pair_set = set()
+                suggested_friend_queryset = SuggestedFriend.objects.all() if not positive_value_exists(read_only) \
+                    else SuggestedFriend.objects.using('readonly').all()
+                suggested_friend_queryset = suggested_friend_queryset.annotate(
+                    viewer_voter_we_vote_id_lower=Lower('viewer_voter_we_vote_id'),
+                    viewee_voter_we_vote_id_lower=Lower('viewee_voter_we_vote_id')).filter(
+                    viewer_voter_we_vote_id_lower__in=friend_we_vote_id_list,
+                    viewee_voter_we_vote_id_lower__in=friend_we_vote_id_list)
+                for viewer_voter_we_vote_id, viewee_voter_we_vote_id in suggested_friend_queryset.values_list(
+                        'viewer_voter_we_vote_id_lower', 'viewee_voter_we_vote_id_lower'):
+                    existing_pair_set.add(frozenset((viewer_voter_we_vote_id, viewee_voter_we_vote_id)))
+
+                suggested_friend_to_create_list = []
+                for index, first_voter_we_vote_id in enumerate(friend_we_vote_id_list):
+                    not_yet_friends_list = [
+                        second_voter_we_vote_id for second_voter_we_vote_id in friend_we_vote_id_list[index + 1:]
+                        if second_voter_we_vote_id not in friends_adjacency_dict[first_voter_we_vote_id]]
+                    for second_voter_we_vote_id in not_yet_friends_list:
+                        # Counted once from each side of the pair, whether it is new or was already suggested
+                        suggested_friend_created_count += 2
+                        if frozenset((first_voter_we_vote_id, second_voter_we_vote_id)) not in existing_pair_set:
+                            # friend_we_vote_id_list is sorted, so a pair is always stored in the same order
+                            suggested_friend_to_create_list.append(SuggestedFriend(
+                                viewer_voter_we_vote_id=first_voter_we_vote_id,
+                                viewee_voter_we_vote_id=second_voter_we_vote_id,
+                            ))
+                if suggested_friend_to_create_list:
+                    SuggestedFriend.objects.bulk_create(
+                        suggested_friend_to_create_list, batch_size=SUGGESTED_FRIEND_BULK_CREATE_BATCH_SIZE,
+                        ignore_conflicts=True)
+                    status += "SUGGESTED_FRIENDS_CREATED: " + str(len(suggested_friend_to_create_list)) + " "
+            status += "UPDATE_SUGGESTED_FRIENDS_COMPLETED "
+        except Exception as e:
+            success = False
+            status += "UPDATE_SUGGESTED_FRIENDS_FAILED: " + str(e) + " "
 
         results = {
-            'status':                           "UPDATE_SUGGESTED_FRIENDS_COMPLETED ",
-            'success':                          True,
+            'status':                           status,
+            'success':                          success,
             'suggested_friend_created_count':   suggested_friend_created_count,
         }
         return results
@@ -2273,9 +2344,9 @@ class SuggestedFriend(models.Model):
     This table stores possible friend connections.
     """
     viewer_voter_we_vote_id = models.CharField(
-        verbose_name="voter we vote id person 1", max_length=255, null=True, blank=True, unique=False)
+        verbose_name="voter we vote id person 1", max_length=255, null=True, blank=True, unique=False, db_index=True)
     viewee_voter_we_vote_id = models.CharField(
-        verbose_name="voter we vote id person 2", max_length=255, null=True, blank=True, unique=False)
+        verbose_name="voter we vote id person 2", max_length=255, null=True, blank=True, unique=False, db_index=True)
     # Each voter can choose to remove this suggested friend entry for themselves. When one voter's id
     # is in "first" that voter won't see the suggested entry. The second voter can also remove the entry.
     voter_we_vote_id_deleted_first = models.CharField(
@@ -0,0 +1,56 @@
+from django.test import TestCase
+
+from friend.models import CurrentFriend, FriendManager, SuggestedFriend
+
+
+class FriendsAdjacencyTestCase(TestCase):
+    databases = ["default", "readonly"]
+
+    def setUp(self):
+        self.friend_manager = FriendManager()
+        # wv01voter1 is friends with 2, 3 and 4. 2 and 3 are also friends, and 4 is friends with 5.
+        for viewer_voter_we_vote_id, viewee_voter_we_vote_id in [
+                ('wv01voter1', 'wv01voter2'), ('WV01VOTER3', 'wv01voter1'), ('wv01voter1', 'wv01voter4'),
+                ('wv01voter2', 'WV01VOTER3'), ('wv01voter5', 'wv01voter4'), ('wv01voter1', '')]:
+            CurrentFriend.objects.create(
+                viewer_voter_we_vote_id=viewer_voter_we_vote_id, viewee_voter_we_vote_id=viewee_voter_we_vote_id)
+
+    def test_adjacency_dict_matches_we_vote_ids_case_insensitively(self):
+        friends_adjacency_dict = self.friend_manager.retrieve_friends_adjacency_dict(['WV01VOTER1', 'wv01voter5'])
+        self.assertEqual(friends_adjacency_dict, {
+            'wv01voter1': {'wv01voter2', 'wv01voter3', 'wv01voter4'},
+            'wv01voter5': {'wv01voter4'},
+        })
+
+        friends_adjacency_dict = self.friend_manager.retrieve_friends_adjacency_dict(
+            ['wv01voter2', 'wv01voter4'], limit_to_we_vote_id_list=['wv01voter3', 'WV01VOTER5'])
+        self.assertEqual(friends_adjacency_dict, {'wv01voter2': {'wv01voter3'}, 'wv01voter4': {'wv01voter5'}})
+        self.assertEqual(self.friend_manager.retrieve_friends_adjacency_dict(['']), {})
+
+    def test_mutual_friends_counts_for_a_whole_list(self):
+        mutual_friends_count_dict = self.friend_manager.retrieve_mutual_friends_count_dict(
+            'wv01voter1', ['wv01voter2', 'WV01VOTER3', 'wv01voter4', 'wv01voter5', ''])
+        self.assertEqual(mutual_friends_count_dict,
+                         {'wv01voter2': 1, 'WV01VOTER3': 1, 'wv01voter4': 0, 'wv01voter5': 1})
+        self.assertEqual(self.friend_manager.fetch_mutual_friends_count('WV01VOTER2', 'wv01voter1'), 1)
+        self.assertEqual(self.friend_manager.fetch_mutual_friends_count('wv01voter1', ''), 0)
+
+    def test_friends_who_are_not_yet_friends_are_suggested_to_each_other_once(self):
+        SuggestedFriend.objects.create(viewer_voter_we_vote_id='WV01VOTER4', viewee_voter_we_vote_id='wv01voter2')
+
+        results = self.friend_manager.update_suggested_friends_starting_with_one_voter('WV01VOTER1')
+        self.assertTrue(results['success'], results['status'])
+        self.assertEqual(results['suggested_friend_created_count'], 4, 'Both sides of 2-4 and of 3-4')
+        self.assertEqual(
+            sorted(SuggestedFriend.objects.values_list('viewer_voter_we_vote_id', 'viewee_voter_we_vote_id')),
+            [('WV01VOTER4', 'wv01voter2'), ('wv01voter3', 'wv01voter4')])
+
+        results = self.friend_manager.update_suggested_friends_starting_with_one_voter('wv01voter1')
+        self.assertEqual(results['suggested_friend_created_count'], 4)
+        self.assertEqual(SuggestedFriend.objects.count(), 2)
+
+    def test_voter_with_one_friend_gets_no_suggestions(self):
+        results = self.friend_manager.update_suggested_friends_starting_with_one_voter('wv01voter5')
+        self.assertTrue(results['success'], results['status'])
+        self.assertEqual(results['suggested_friend_created_count'], 0)
+        self.assertFalse(self.friend_manager.update_suggested_friends_starting_with_one_voter('')['success'])
@@ -2,14 +2,89 @@
 # Brought to you by We Vote. Be good.
 # -*- coding: UTF-8 -*-
 
+import os
 import sys
+import threading
+import time
 import geoip2.database
 import wevote_functions.admin
 from config.base import get_environment_variable_default
-from wevote_functions.functions import get_ip_from_headers, positive_value_exists
+from wevote_functions.functions import get_ip_from_headers, LocalLruCache, positive_value_exists
 
 logger = wevote_functions.admin.get_logger(__name__)
 
+GEOLITE2_DATABASE_LOCATION = get_environment_variable_default('GEOLITE2_DATABASE_LOCATION',
+                                                              'geoip2/city-db/GeoLite2-City.mmdb')
+# How often (at most) each process checks whether update_geoip_data has dropped in a new .mmdb
+GEOIP_READER_RELOAD_CHECK_SECONDS = 60
+GEOIP_LOCATION_CACHE_MAX_ENTRIES = 10000
+GEOIP_LOCATION_CACHE_TTL_SECONDS = 3600
+
+# One memory-mapped reader per process. When it is opened in the gunicorn master (see config/wsgi.py) the mapped
+# pages are shared with every forked worker through copy-on-write, so a lookup never opens the file.
+geoip_reader = None
+geoip_reader_file_signature = None
+geoip_reader_last_checked = 0
+geoip_reader_lock = threading.Lock()
+# ip_address -> location fields, for the hot IP ranges that load the first page over and over
+geoip_location_cache = LocalLruCache(max_size=GEOIP_LOCATION_CACHE_MAX_ENTRIES,
+                                     ttl_seconds=GEOIP_LOCATION_CACHE_TTL_SECONDS)
+
+
+def get_geoip_database_file_signature(database_location=GEOLITE2_DATABASE_LOCATION):
+    """
+    The (inode, modification time, size) of the database file. update_geoip_data replaces the file with os.replace,
+    so a new database always shows up with a new signature.
+    :param database_location:
+    :return:
+    """
+    try:
+        file_stat = os.stat(database_location)
+        return file_stat.st_ino, file_stat.st_mtime, file_stat.st_size
+    except OSError:
+        return None
+
+
+def reload_geoip_reader(database_location=GEOLITE2_DATABASE_LOCATION):
+    """
+    Open the database in memory-mapped mode and swap it in as the shared reader. Requests already using the prior
+    reader keep their reference, so we let it close when it is garbage collected instead of closing it under them.
+    :param database_location:
+    :return:
+    """
+    global geoip_reader, geoip_reader_file_signature, geoip_reader_last_checked
+    with geoip_reader_lock:
+        file_signature = get_geoip_database_file_signature(database_location)
+        new_reader = geoip2.database.Reader(database_location, mode=geoip2.database.MODE_MMAP)
+        geoip_reader = new_reader
+        geoip_reader_file_signature = file_signature
+        geoip_reader_last_checked = time.monotonic()
+        geoip_location_cache.clear()
+    return new_reader
+
+
+def retrieve_geoip_reader():
+    """
+    Return the shared reader, opening it on first use, and reopening it if the database file has been replaced
+    since it was opened. The file is only checked every GEOIP_READER_RELOAD_CHECK_SECONDS.
+    :return:
+    """
+    global geoip_reader_last_checked
+    reader = geoip_reader
+    if reader is None:
+        return reload_geoip_reader()
+    now = time.monotonic()
+    if now - geoip_reader_last_checked >= GEOIP_READER_RELOAD_CHECK_SECONDS:
+        geoip_reader_last_checked = now
+        file_signature = get_geoip_database_file_signature()
+        if file_signature is not None and file_signature != geoip_reader_file_signature:
+            try:
+                reader = reload_geoip_reader()
+            except Exception as e:
+                # Keep serving from the database we already have
+                logger.error("retrieve_geoip_reader could not reload " + GEOLITE2_DATABASE_LOCATION + ": " + str(e))
+    return reader
+
 
 def voter_location_retrieve_from_ip_for_api(request, ip_address=''):
     """
@@ -58,17 +133,44 @@ def voter_location_retrieve_from_ip_for_api(request, ip_address=''):
 
         return response_content
 
+    location = geoip_location_cache.get(ip_address)
+    if location is None:
+        location = retrieve_location_from_ip(ip_address)
+        if location['success']:
+            geoip_location_cache.set(ip_address, location)
+
+    response_content = {
+        'success':              location['success'],
+        'status':               location['status'],
+        'voter_location_found': location['voter_location_found'],
+        'voter_location':       location['voter_location'],
+        'city':                 location['city'],
+        'region':               location['region'],
+        'postal_code':          location['postal_code'],
+        'ip_address':           ip_address,
+        'x_forwarded_for':      x_forwarded_for,
+        'http_x_forwarded_for': http_x_forwarded_for,
+    }
+
+    return response_content
+
+
+def retrieve_location_from_ip(ip_address):
+    """
+    Look up one IP address in the shared GeoLite2 reader, and return only the location fields, so the result
+    can be cached by ip_address.
+    :param ip_address:
+    :return:
+    """
     try:
-        database_location = get_environment_variable_default('GEOLITE2_DATABASE_LOCATION',
-                                                             'geoip2/city-db/GeoLite2-City.mmdb')
-        reader = geoip2.database.Reader(database_location)
+        reader = retrieve_geoip_reader()
         response = reader.city(ip_address)
 
     except geoip2.errors.AddressNotFoundError as e:
         if 'test' not in sys.argv:
             logger.error("voter_location_retrieve_from_ip_for_api ip " + ip_address + " not found: " + str(e))
 
-        response_content = {
+        return {
             'success':              True,
             'status':               'LOCATION_NOT_FOUND',
             'voter_location_found': False,
@@ -76,13 +178,8 @@ def voter_location_retrieve_from_ip_for_api(request, ip_address=''):
             'city':                 '',
             'region':               '',
             'postal_code':          '',
-            'ip_address':           ip_address,
-            'x_forwarded_for':      x_forwarded_for,
-            'http_x_forwarded_for': http_x_forwarded_for,
         }
 
-        return response_content
-
     voter_location = ''
     city = ''
     region = ''  # could be state_code
@@ -115,7 +212,7 @@ def voter_location_retrieve_from_ip_for_api(request, ip_address=''):
         status = str(e)
         success = False
 
-    response_content = {
+    return {
         'success':              success,
         'status':               status,
         'voter_location_found': voter_location_found,
@@ -123,9 +220,4 @@ def voter_location_retrieve_from_ip_for_api(request, ip_address=''):
         'city':                 city,
         'region':               region,
         'postal_code':          postal_code,
-        'ip_address':           ip_address,
-        'x_forwarded_for':      x_forwarded_for,
-        'http_x_forwarded_for': http_x_forwarded_for,
     }
-
-    return response_content
@@ -1,5 +1,7 @@
 import os
 import gzip
+import shutil
+import tempfile
 import urllib
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
@@ -11,6 +13,36 @@ download_folder = settings.GEOIP_PATH
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('--source', dest='source', default='',
+                            help='A newly downloaded GeoLite2-City.mmdb (or .mmdb.gz) to install')
+
     def handle(self, *args, **options):
-        self.stdout.write('\nIf you want to get an updated free database (GeoLite2-City.mmdb) download it from https://dev.maxmind.com/geoip/geoip2/geolite2/, unzip it, and overwrite the source controlled version')
-        self.stdout.write('\nDownload the paid db from MaxMind for more precise results. Ask Dale for the credentials')
+        source = options.get('source')
+        if not source:
+            self.stdout.write('\nIf you want to get an updated free database (GeoLite2-City.mmdb) download it from https://dev.maxmind.com/geoip/geoip2/geolite2/, unzip it, and overwrite the source controlled version')
+            self.stdout.write('\nDownload the paid db from MaxMind for more precise results. Ask Dale for the credentials')
+            self.stdout.write('\nThen run: python manage.py update_geoip_data --source /path/to/GeoLite2-City.mmdb')
+            return
+
+        from geoip.controllers import GEOLITE2_DATABASE_LOCATION, reload_geoip_reader
+        if not os.path.exists(source):
+            raise CommandError('update_geoip_data: source file not found: ' + source)
+
+        # Write the new database next to the live one, then swap it in with a single rename, so a running server
+        # never sees a partially written file. Each process notices the new file and reopens its shared reader.
+        destination_folder = os.path.dirname(os.path.abspath(GEOLITE2_DATABASE_LOCATION))
+        file_descriptor, temporary_path = tempfile.mkstemp(suffix='.mmdb', dir=destination_folder)
+        try:
+            open_source = gzip.open if source.endswith('.gz') else open
+            with open_source(source, 'rb') as source_file, os.fdopen(file_descriptor, 'wb') as destination_file:
+                shutil.copyfileobj(source_file, destination_file)
+            os.replace(temporary_path, GEOLITE2_DATABASE_LOCATION)
+        except Exception as e:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise CommandError('update_geoip_data: could not install ' + source + ': ' + str(e))
+
+        # Confirms the new file opens cleanly
+        reload_geoip_reader()
+        self.stdout.write('\nInstalled ' + source + ' as ' + GEOLITE2_DATABASE_LOCATION)
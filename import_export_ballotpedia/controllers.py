@@ -6,7 +6,7 @@ from .models import BallotpediaApiCounterManager
 from ballot.models import BallotItemListManager, BallotItemManager, BallotReturned, BallotReturnedManager, \
     VoterBallotSavedManager
 from candidate.models import CandidateManager, CandidateListManager, fetch_candidate_count_for_office
-from config.base import get_environment_variable
+from config.base import get_environment_variable, get_environment_variable_default
 from electoral_district.models import ElectoralDistrict, ElectoralDistrictManager
 from election.models import BallotpediaElection, ElectionManager, Election
 from exception.models import handle_exception
@@ -18,7 +18,8 @@ from polling_location.models import PollingLocationManager
 import requests
 from voter.models import fetch_voter_id_from_voter_device_link, VoterAddressManager
 import wevote_functions.admin
-from wevote_functions.functions import convert_to_int, extract_state_code_from_address_string, positive_value_exists
+from wevote_functions.functions import convert_to_int, extract_state_code_from_address_string, PooledHttpFetcher, \
+    positive_value_exists
 
 BALLOTPEDIA_API_KEY = get_environment_variable("BALLOTPEDIA_API_KEY")
 BALLOTPEDIA_API_CANDIDATES_URL = get_environment_variable("BALLOTPEDIA_API_CANDIDATES_URL")
@@ -36,6 +37,11 @@ BALLOTPEDIA_API_FILES_TYPE = "files"
 BALLOTPEDIA_API_MEASURES_TYPE = "measures"
 BALLOTPEDIA_API_RACES_TYPE = "races"
 BALLOTPEDIA_API_SAMPLE_BALLOT_RESULTS_TYPE = "sample_ballot_results"
+# Map point ballots are fetched from Ballotpedia by BALLOTPEDIA_MAP_POINT_THREADS threads, together held under
+#  BALLOTPEDIA_MAP_POINT_REQUESTS_PER_SECOND, and then groomed and stored one at a time on the calling thread
+BALLOTPEDIA_MAP_POINT_REQUESTS_PER_SECOND = \
+    convert_to_int(get_environment_variable_default('BALLOTPEDIA_MAP_POINT_REQUESTS_PER_SECOND', 10))
+BALLOTPEDIA_MAP_POINT_THREADS = convert_to_int(get_environment_variable_default('BALLOTPEDIA_MAP_POINT_THREADS', 8))
 GEOCODE_TIMEOUT = 10
 GOOGLE_MAPS_API_KEY = get_environment_variable("GOOGLE_MAPS_API_KEY")
 
@@ -52,6 +58,10 @@ MAIL_HEADERS = {
         'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.14; rv:72.0) Gecko/20100101 Firefox/72.0',
 }
 
+ballotpedia_http_fetcher = PooledHttpFetcher(
+    requests_per_second=BALLOTPEDIA_MAP_POINT_REQUESTS_PER_SECOND, number_of_threads=BALLOTPEDIA_MAP_POINT_THREADS,
+    headers=MAIL_HEADERS)
+
 PRESIDENTIAL_CANDIDATES_JSON_LIST = [
     {
         'id': 54804,
@@ -751,6 +761,79 @@ def retrieve_ballot_items_from_polling_location(
     return results
 
 
+def generate_ballotpedia_office_district_string(ballotpedia_district_id_list):
+    office_district_string = ""
+    office_district_count = 0
+    ballotpedia_district_id_not_used_list = []
+    for one_district in ballotpedia_district_id_list:
+        # The url we send to Ballotpedia can only be so long. If too long, we stop adding districts to the
+        #  office_district_string, but capture the districts not used
+        # 3796 = 4096 - 300 (300 gives us room for all of the other url variables we need)
+        if len(office_district_string) < 3796:
+            office_district_string += str(one_district) + ","
+            office_district_count += 1
+        else:
+            # In the future we might want to set up a second query to get the races for these districts
+            ballotpedia_district_id_not_used_list.append(one_district)
+
+    # Remove last comma
+    if office_district_count > 1:
+        office_district_string = office_district_string[:-1]
+    return office_district_string
+
+
+def fetch_ballotpedia_ballot_json_from_polling_location_v4(
+        polling_location, google_civic_election_id, election_day_text="", http_fetcher=None):
+    """
+    The network half of retrieve_ballotpedia_ballot_items_from_polling_location_api_v4. It doesn't touch the database,
+    so it can run on the http_fetcher worker threads. Pass districts_json and sample_ballot_json on to
+    retrieve_ballotpedia_ballot_items_from_polling_location_api_v4 to groom and store them.
+    :param polling_location:
+    :param google_civic_election_id:
+    :param election_day_text:
+    :param http_fetcher:
+    :return:
+    """
+    status = ""
+    success = True
+    districts_json = None
+    sample_ballot_json = None
+    if http_fetcher is None:
+        http_fetcher = ballotpedia_http_fetcher
+
+    if not polling_location.latitude or not polling_location.longitude:
+        success = False
+        status += "RETRIEVE_DISTRICTS-MISSING_LATITUDE_LONGITUDE "
+    else:
+        try:
+            # Get the electoral_districts at this lat/long
+            response = http_fetcher.get(BALLOTPEDIA_API_SAMPLE_BALLOT_ELECTIONS_URL, params={
+                "lat": polling_location.latitude,
+                "long": polling_location.longitude,
+            })
+            districts_json = json.loads(response.text)
+
+            groom_results = groom_and_store_sample_ballot_elections_api_v4(districts_json, google_civic_election_id)
+            ballotpedia_district_id_list = groom_results['ballotpedia_district_id_list']
+            if ballotpedia_district_id_list and len(ballotpedia_district_id_list) > 0:
+                response = http_fetcher.get(BALLOTPEDIA_API_SAMPLE_BALLOT_RESULTS_URL, params={
+                    "districts": generate_ballotpedia_office_district_string(ballotpedia_district_id_list),
+                    "election_date": election_day_text,
+                })
+                sample_ballot_json = json.loads(response.text)
+        except Exception as e:
+            success = False
+            status += 'FETCH_BALLOTPEDIA_BALLOT_JSON_FROM_POLLING_LOCATION_V4-ERROR: ' + str(e) + ' '
+
+    results = {
+        'success':              success,
+        'status':               status,
+        'districts_json':       districts_json,
+        'sample_ballot_json':   sample_ballot_json,
+    }
+    return results
+
+
 def retrieve_ballotpedia_ballot_items_from_polling_location_api_v4(
         google_civic_election_id,
         election_day_text="",
@@ -761,10 +844,33 @@ def retrieve_ballotpedia_ballot_items_from_polling_location_api_v4(
         existing_offices_by_election_dict={},
         existing_office_objects_dict={},
         existing_candidate_objects_dict={},
+        existing_candidate_to_office_links_dict={},
         existing_measure_objects_dict={},
         new_office_we_vote_ids_list=[],
         new_candidate_we_vote_ids_list=[],
-        new_measure_we_vote_ids_list=[]):
+        new_measure_we_vote_ids_list=[],
+        districts_json=None,
+        sample_ballot_json=None):
+    """
+    :param google_civic_election_id:
+    :param election_day_text:
+    :param polling_location_we_vote_id:
+    :param polling_location:
+    :param state_code:
+    :param batch_set_id:
+    :param existing_offices_by_election_dict:
+    :param existing_office_objects_dict:
+    :param existing_candidate_objects_dict:
+    :param existing_candidate_to_office_links_dict:
+    :param existing_measure_objects_dict:
+    :param new_office_we_vote_ids_list:
+    :param new_candidate_we_vote_ids_list:
+    :param new_measure_we_vote_ids_list:
+    :param districts_json: Already retrieved with fetch_ballotpedia_ballot_json_from_polling_location_v4. If not
+      passed in, we retrieve it from Ballotpedia here.
+    :param sample_ballot_json: Already retrieved with fetch_ballotpedia_ballot_json_from_polling_location_v4
+    :return:
+    """
     success = True
     status = ""
     polling_location_found = False
@@ -778,6 +884,7 @@ def retrieve_ballotpedia_ballot_items_from_polling_location_api_v4(
             'existing_offices_by_election_dict': existing_offices_by_election_dict,
             'existing_office_objects_dict': existing_office_objects_dict,
             'existing_candidate_objects_dict': existing_candidate_objects_dict,
+            'existing_candidate_to_office_links_dict': existing_candidate_to_office_links_dict,
             'existing_measure_objects_dict': existing_measure_objects_dict,
             'new_office_we_vote_ids_list': new_office_we_vote_ids_list,
             'new_candidate_we_vote_ids_list': new_candidate_we_vote_ids_list,
@@ -793,6 +900,7 @@ def retrieve_ballotpedia_ballot_items_from_polling_location_api_v4(
             'existing_offices_by_election_dict': existing_offices_by_election_dict,
             'existing_office_objects_dict': existing_office_objects_dict,
             'existing_candidate_objects_dict': existing_candidate_objects_dict,
+            'existing_candidate_to_office_links_dict': existing_candidate_to_office_links_dict,
             'existing_measure_objects_dict': existing_measure_objects_dict,
             'new_office_we_vote_ids_list': new_office_we_vote_ids_list,
             'new_candidate_we_vote_ids_list': new_candidate_we_vote_ids_list,
@@ -821,6 +929,7 @@ def retrieve_ballotpedia_ballot_items_from_polling_location_api_v4(
                 'existing_offices_by_election_dict': existing_offices_by_election_dict,
                 'existing_office_objects_dict': existing_office_objects_dict,
                 'existing_candidate_objects_dict': existing_candidate_objects_dict,
+                'existing_candidate_to_office_links_dict': existing_candidate_to_office_links_dict,
                 'existing_measure_objects_dict': existing_measure_objects_dict,
                 'new_office_we_vote_ids_list': new_office_we_vote_ids_list,
                 'new_candidate_we_vote_ids_list': new_candidate_we_vote_ids_list,
@@ -835,15 +944,17 @@ def retrieve_ballotpedia_ballot_items_from_polling_location_api_v4(
                 state_code = "na"
 
         try:
-            # Get the electoral_districts at this lat/long
-            response = requests.get(
-                BALLOTPEDIA_API_SAMPLE_BALLOT_ELECTIONS_URL,
-                headers=MAIL_HEADERS,
-                params={
-                    "lat": polling_location.latitude,
-                    "long": polling_location.longitude,
-                })
-            structured_json = json.loads(response.text)
+            if districts_json is None:
+                # Get the electoral_districts at this lat/long
+                response = requests.get(
+                    BALLOTPEDIA_API_SAMPLE_BALLOT_ELECTIONS_URL,
+                    headers=MAIL_HEADERS,
+                    params={
+                        "lat": polling_location.latitude,
+                        "long": polling_location.longitude,
+                    })
+                districts_json = json.loads(response.text)
+            structured_json = districts_json
 
             # Use Ballotpedia API call counter to track the number of queries we are doing each day
             ballotpedia_api_counter_manager = BallotpediaApiCounterManager()
@@ -862,6 +973,7 @@ def retrieve_ballotpedia_ballot_items_from_polling_location_api_v4(
                     'existing_offices_by_election_dict': existing_offices_by_election_dict,
                     'existing_office_objects_dict': existing_office_objects_dict,
                     'existing_candidate_objects_dict': existing_candidate_objects_dict,
+                    'existing_candidate_to_office_links_dict': existing_candidate_to_office_links_dict,
                     'existing_measure_objects_dict': existing_measure_objects_dict,
                     'new_office_we_vote_ids_list': new_office_we_vote_ids_list,
                     'new_candidate_we_vote_ids_list': new_candidate_we_vote_ids_list,
@@ -869,31 +981,16 @@ def retrieve_ballotpedia_ballot_items_from_polling_location_api_v4(
                 }
                 return results
 
-            office_district_string = ""
-            office_district_count = 0
-            ballotpedia_district_id_not_used_list = []
-            for one_district in ballotpedia_district_id_list:
-                # The url we send to Ballotpedia can only be so long. If too long, we stop adding districts to the
-                #  office_district_string, but capture the districts not used
-                # 3796 = 4096 - 300 (300 gives us room for all of the other url variables we need)
-                if len(office_district_string) < 3796:
-                    office_district_string += str(one_district) + ","
-                    office_district_count += 1
-                else:
-                    # In the future we might want to set up a second query to get the races for these districts
-                    ballotpedia_district_id_not_used_list.append(one_district)
+            if sample_ballot_json is None:
+                office_district_string = generate_ballotpedia_office_district_string(ballotpedia_district_id_list)
 
-            # Remove last comma
-            if office_district_count > 1:
-                office_district_string = office_district_string[:-1]
-            # chunks_of_district_strings.append(office_district_string)
-
-            # Get the electoral_districts at this lat/long
-            response = requests.get(BALLOTPEDIA_API_SAMPLE_BALLOT_RESULTS_URL, headers=MAIL_HEADERS, params={
-                "districts": office_district_string,
-                "election_date": election_day_text,
-            })
-            structured_json = json.loads(response.text)
+                # Get the electoral_districts at this lat/long
+                response = requests.get(BALLOTPEDIA_API_SAMPLE_BALLOT_RESULTS_URL, headers=MAIL_HEADERS, params={
+                    "districts": office_district_string,
+                    "election_date": election_day_text,
+                })
+                sample_ballot_json = json.loads(response.text)
+            structured_json = sample_ballot_json
 
             # Use Ballotpedia API call counter to track the number of queries we are doing each day
             ballotpedia_api_counter_manager = BallotpediaApiCounterManager()
@@ -910,6 +1007,7 @@ def retrieve_ballotpedia_ballot_items_from_polling_location_api_v4(
                 existing_offices_by_election_dict=existing_offices_by_election_dict,
                 existing_office_objects_dict=existing_office_objects_dict,
                 existing_candidate_objects_dict=existing_candidate_objects_dict,
+                existing_candidate_to_office_links_dict=existing_candidate_to_office_links_dict,
                 existing_measure_objects_dict=existing_measure_objects_dict,
                 new_office_we_vote_ids_list=new_office_we_vote_ids_list,
                 new_candidate_we_vote_ids_list=new_candidate_we_vote_ids_list,
@@ -975,6 +1073,7 @@ def retrieve_ballotpedia_ballot_items_from_polling_location_api_v4(
         'existing_offices_by_election_dict': existing_offices_by_election_dict,
         'existing_office_objects_dict': existing_office_objects_dict,
         'existing_candidate_objects_dict': existing_candidate_objects_dict,
+        'existing_candidate_to_office_links_dict': existing_candidate_to_office_links_dict,
         'existing_measure_objects_dict': existing_measure_objects_dict,
         'new_office_we_vote_ids_list': new_office_we_vote_ids_list,
         'new_candidate_we_vote_ids_list': new_candidate_we_vote_ids_list,
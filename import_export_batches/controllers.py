@@ -12,11 +12,11 @@ from .models import BatchManager, BatchDescription, BatchHeaderMap, BatchRow, Ba
     BATCH_IMPORT_KEYS_ACCEPTED_FOR_ELECTED_OFFICES, BATCH_IMPORT_KEYS_ACCEPTED_FOR_MEASURES, \
     BATCH_IMPORT_KEYS_ACCEPTED_FOR_ORGANIZATIONS, BATCH_IMPORT_KEYS_ACCEPTED_FOR_POLITICIANS, \
     BATCH_IMPORT_KEYS_ACCEPTED_FOR_POLLING_LOCATIONS, BATCH_IMPORT_KEYS_ACCEPTED_FOR_POSITIONS, \
-    BATCH_IMPORT_KEYS_ACCEPTED_FOR_BALLOT_ITEMS
+    BATCH_IMPORT_KEYS_ACCEPTED_FOR_BALLOT_ITEMS, BATCH_ROW_BULK_CREATE_SIZE
 from ballot.models import BallotItem, BallotItemListManager, BallotItemManager, BallotReturnedManager
 from candidate.controllers import retrieve_next_or_most_recent_office_for_candidate
 from candidate.models import CandidateCampaign, CandidateListManager, CandidateManager
-# from django.db import transaction
+from django.db import transaction
 from django.db.models import Q
 from django.utils.timezone import now
 from elected_office.models import ElectedOffice, ElectedOfficeManager
@@ -38,6 +38,7 @@ from voter_guide.controllers import refresh_existing_voter_guides
 from voter_guide.models import ORGANIZATION_WORD
 import wevote_functions.admin
 from wevote_functions.functions import convert_to_int, extract_twitter_handle_from_text_string, positive_value_exists
+from wevote_settings.models import preallocate_we_vote_id_integers
 
 logger = wevote_functions.admin.get_logger(__name__)
 
@@ -51,6 +52,13 @@ IMPORT_VOTER = 'IMPORT_VOTER'
 MEASURE = 'MEASURE'
 POLITICIAN = 'POLITICIAN'
 
+# The BatchRowActionBallotItem fields create_batch_row_action_ballot_item can change on an existing entry
+BATCH_ROW_ACTION_BALLOT_ITEM_ANALYSIS_FIELDS = [
+    'ballot_item_display_name', 'batch_set_id', 'contest_measure_we_vote_id', 'contest_office_we_vote_id',
+    'google_civic_election_id', 'kind_of_action', 'local_ballot_order', 'measure_text', 'measure_url',
+    'no_vote_description', 'polling_location_we_vote_id', 'state_code', 'status', 'voter_id', 'yes_vote_description',
+]
+
 
 def create_batch_row_actions(
         batch_header_id,
@@ -60,7 +68,8 @@ def create_batch_row_actions(
         delete_analysis_only=False,
         election_objects_dict={},
         measure_objects_dict={},
-        office_objects_dict={}):
+        office_objects_dict={},
+        ballot_item_lookups_dict=None):
     """
     Cycle through all BatchRow entries for this batch_header_id and move the values we can find into
     the BatchRowActionYYY table so we can review it before importing it
@@ -72,6 +81,8 @@ def create_batch_row_actions(
     :param election_objects_dict:
     :param measure_objects_dict:
     :param office_objects_dict:
+    :param ballot_item_lookups_dict: Offices and measures preloaded by retrieve_ballot_item_lookups, by election.
+        Pass the returned dict back in when analyzing every batch in a batch set.
     :return:
     """
     success = False
@@ -83,6 +94,8 @@ def create_batch_row_actions(
     kind_of_batch = ""
     polling_location_we_vote_id = ""
     voter_id = 0
+    if ballot_item_lookups_dict is None:
+        ballot_item_lookups_dict = {}
 
     if not positive_value_exists(batch_header_id):
         status += "CREATE_BATCH_ROW_ACTIONS-BATCH_HEADER_ID_MISSING "
@@ -98,6 +111,7 @@ def create_batch_row_actions(
             'election_objects_dict':            election_objects_dict,
             'measure_objects_dict':             measure_objects_dict,
             'office_objects_dict':              office_objects_dict,
+            'ballot_item_lookups_dict':         ballot_item_lookups_dict,
             'polling_location_we_vote_id':      polling_location_we_vote_id,
             'voter_id':                         voter_id,
         }
@@ -162,6 +176,15 @@ def create_batch_row_actions(
     else:
         status += "ELSE [if batch_description_found and batch_header_map_found and not delete_analysis_only] "
 
+    # When analyzing a whole ballot item batch, match against preloaded lookups and write the results in bulk
+    ballot_item_batch_analysis_dict = None
+    if kind_of_batch == IMPORT_BALLOT_ITEM and batch_description_found and batch_header_map_found and \
+            not positive_value_exists(batch_row_id):
+        results = retrieve_ballot_item_batch_analysis_dict(batch_description, batch_header_map, batch_row_list)
+        ballot_item_batch_analysis_dict = results['ballot_item_batch_analysis_dict']
+        if not results['success']:
+            status += results['status']
+
     batch_row_action_list = []
     start_create_batch_row_action_time_tracker = []
     if batch_description_found and batch_header_map_found and batch_row_action_list_found and not delete_analysis_only:
@@ -262,6 +285,8 @@ def create_batch_row_actions(
                     election_objects_dict=election_objects_dict,
                     measure_objects_dict=measure_objects_dict,
                     office_objects_dict=office_objects_dict,
+                    ballot_item_lookups_dict=ballot_item_lookups_dict,
+                    ballot_item_batch_analysis_dict=ballot_item_batch_analysis_dict,
                 )
                 election_objects_dict = results['election_objects_dict']
                 measure_objects_dict = results['measure_objects_dict']
@@ -346,7 +371,9 @@ def create_batch_row_actions(
                 if not positive_value_exists(batch_row_action_found):
                     # If here we know that a ballot item already exists, and the current data would NOT be
                     #  creating/updating a ballot item. Create a delete action.
-                    results = create_batch_row_action_ballot_item_delete(batch_description, existing_ballot_item)
+                    results = create_batch_row_action_ballot_item_delete(
+                        batch_description, existing_ballot_item,
+                        ballot_item_batch_analysis_dict=ballot_item_batch_analysis_dict)
                     batch_row_action_delete_exists = results['batch_row_action_delete_exists']
 
                 if positive_value_exists(batch_row_action_delete_exists):
@@ -354,6 +381,12 @@ def create_batch_row_actions(
         else:
             status += "EXISTING_BALLOT_ITEM_LIST_EMPTY "
 
+        if ballot_item_batch_analysis_dict is not None:
+            results = save_ballot_item_batch_analysis_in_bulk(ballot_item_batch_analysis_dict)
+            status += results['status']
+            if not results['success']:
+                success = False
+
     # Record that this batch_description has been analyzed, and the source for the ballot_item
     if batch_description_found and success:
         try:
@@ -392,6 +425,7 @@ def create_batch_row_actions(
         'election_objects_dict':            election_objects_dict,
         'measure_objects_dict':             measure_objects_dict,
         'office_objects_dict':              office_objects_dict,
+        'ballot_item_lookups_dict':         ballot_item_lookups_dict,
         'polling_location_we_vote_id':      polling_location_we_vote_id,
         'start_create_batch_row_action_time_tracker':   start_create_batch_row_action_time_tracker,
         'voter_id':                         voter_id,
@@ -2752,20 +2786,229 @@ def create_batch_row_action_position(batch_description, batch_header_map, one_ba
     return results
 
 
+def lower_case_or_none(value):
+    # Matches the way a Django __iexact filter treats None (IS NULL) versus a string
+    return value.lower() if value is not None else None
+
+
+def retrieve_ballot_item_lookups(google_civic_election_id, ballot_item_lookups_dict,
+                                 measure_objects_dict={}, office_objects_dict={}):
+    """
+    Load every ContestOffice and ContestMeasure in one election into memory, indexed the way
+    create_batch_row_action_ballot_item matches them, so analyzing a batch set costs two queries per election
+    instead of several per BatchRow. The lookups are cached in ballot_item_lookups_dict by election.
+    :param google_civic_election_id:
+    :param ballot_item_lookups_dict:
+    :param measure_objects_dict:
+    :param office_objects_dict:
+    :return:
+    """
+    status = ""
+    google_civic_election_id = str(google_civic_election_id)
+    if google_civic_election_id in ballot_item_lookups_dict:
+        results = {
+            'success':              True,
+            'status':               status,
+            'ballot_item_lookups':  ballot_item_lookups_dict[google_civic_election_id],
+        }
+        return results
+
+    measure_list_by_title = {}
+    office_list_by_name_and_state = {}
+    try:
+        contest_office_query = ContestOffice.objects.filter(google_civic_election_id=google_civic_election_id)
+        for contest_office in contest_office_query:
+            office_objects_dict[contest_office.we_vote_id] = contest_office
+            office_name_and_state = \
+                (lower_case_or_none(contest_office.office_name), lower_case_or_none(contest_office.state_code))
+            office_list_by_name_and_state.setdefault(office_name_and_state, []).append(contest_office)
+
+        contest_measure_query = ContestMeasure.objects.filter(google_civic_election_id=google_civic_election_id)
+        for contest_measure in contest_measure_query:
+            measure_objects_dict[contest_measure.we_vote_id] = contest_measure
+            measure_title_set = set()
+            for measure_title in [contest_measure.measure_title,
+                                  contest_measure.google_civic_measure_title,
+                                  contest_measure.google_civic_measure_title2,
+                                  contest_measure.google_civic_measure_title3,
+                                  contest_measure.google_civic_measure_title4,
+                                  contest_measure.google_civic_measure_title5]:
+                if measure_title is not None:
+                    measure_title_set.add(measure_title.lower())
+            for measure_title in measure_title_set:
+                measure_list_by_title.setdefault(measure_title, []).append(contest_measure)
+    except Exception as e:
+        status += "RETRIEVE_BALLOT_ITEM_LOOKUPS_FAILED: " + str(e) + " "
+        handle_exception(e, logger=logger, exception_message=status)
+        results = {
+            'success':              False,
+            'status':               status,
+            'ballot_item_lookups':  None,
+        }
+        return results
+
+    ballot_item_lookups = {
+        'candidate_matching_results_dict':  {},
+        'measure_list_by_title':            measure_list_by_title,
+        'office_list_by_name_and_state':    office_list_by_name_and_state,
+    }
+    ballot_item_lookups_dict[google_civic_election_id] = ballot_item_lookups
+    status += "BALLOT_ITEM_LOOKUPS_RETRIEVED "
+    results = {
+        'success':              True,
+        'status':               status,
+        'ballot_item_lookups':  ballot_item_lookups,
+    }
+    return results
+
+
+def retrieve_ballot_item_batch_analysis_dict(batch_description, batch_header_map, batch_row_list):
+    """
+    Preload what create_batch_row_action_ballot_item would otherwise look up for each BatchRow in this batch:
+    the existing BatchRowActionBallotItem entries, and the live BallotItems at the map points the batch describes.
+    Rows without a map point (voter ballots) keep looking up their BallotItem one at a time. New and changed entries
+    are gathered in the same dict, and written with save_ballot_item_batch_analysis_in_bulk.
+    :param batch_description:
+    :param batch_header_map:
+    :param batch_row_list:
+    :return:
+    """
+    batch_manager = BatchManager()
+    status = ""
+    batch_row_action_by_ballot_item_id = {}
+    batch_row_action_by_batch_row_id = {}
+    existing_ballot_item_dict = {}
+    try:
+        batch_row_action_query = BatchRowActionBallotItem.objects.filter(
+            batch_header_id=batch_description.batch_header_id).order_by('id')
+        for batch_row_action_ballot_item in batch_row_action_query:
+            if positive_value_exists(batch_row_action_ballot_item.batch_row_id):
+                batch_row_action_by_batch_row_id.setdefault(
+                    batch_row_action_ballot_item.batch_row_id, batch_row_action_ballot_item)
+            if positive_value_exists(batch_row_action_ballot_item.ballot_item_id):
+                batch_row_action_by_ballot_item_id.setdefault(
+                    batch_row_action_ballot_item.ballot_item_id, batch_row_action_ballot_item)
+
+        google_civic_election_id_set = set()
+        polling_location_we_vote_id_set = set()
+        for one_batch_row in batch_row_list:
+            if positive_value_exists(one_batch_row.google_civic_election_id):
+                google_civic_election_id_set.add(str(one_batch_row.google_civic_election_id))
+            else:
+                google_civic_election_id_set.add(str(batch_description.google_civic_election_id))
+            polling_location_we_vote_id = batch_manager.retrieve_value_from_batch_row(
+                "polling_location_we_vote_id", batch_header_map, one_batch_row)
+            if positive_value_exists(polling_location_we_vote_id):
+                polling_location_we_vote_id_set.add(str(polling_location_we_vote_id).lower())
+
+        if len(google_civic_election_id_set) and len(polling_location_we_vote_id_set):
+            polling_location_filters = Q()
+            for polling_location_we_vote_id in polling_location_we_vote_id_set:
+                polling_location_filters |= Q(polling_location_we_vote_id__iexact=polling_location_we_vote_id)
+            # This used to retrieve from using('readonly') but the query gets interrupted from updates from master
+            existing_ballot_item_query = BallotItem.objects.filter(
+                google_civic_election_id__in=list(google_civic_election_id_set))
+            existing_ballot_item_query = existing_ballot_item_query.filter(polling_location_filters).order_by('id')
+            for existing_ballot_item in existing_ballot_item_query:
+                google_civic_election_id = str(existing_ballot_item.google_civic_election_id)
+                polling_location_we_vote_id = existing_ballot_item.polling_location_we_vote_id.lower()
+                if positive_value_exists(existing_ballot_item.contest_office_we_vote_id):
+                    existing_ballot_item_dict.setdefault(
+                        (google_civic_election_id, polling_location_we_vote_id, CONTEST_OFFICE,
+                         existing_ballot_item.contest_office_we_vote_id.lower()), existing_ballot_item)
+                if positive_value_exists(existing_ballot_item.contest_measure_we_vote_id):
+                    existing_ballot_item_dict.setdefault(
+                        (google_civic_election_id, polling_location_we_vote_id, MEASURE,
+                         existing_ballot_item.contest_measure_we_vote_id.lower()), existing_ballot_item)
+    except Exception as e:
+        status += "RETRIEVE_BALLOT_ITEM_BATCH_ANALYSIS_DICT_FAILED: " + str(e) + " "
+        handle_exception(e, logger=logger, exception_message=status)
+        results = {
+            'success':                          False,
+            'status':                           status,
+            'ballot_item_batch_analysis_dict':  None,
+        }
+        return results
+
+    ballot_item_batch_analysis_dict = {
+        'batch_row_action_by_ballot_item_id':   batch_row_action_by_ballot_item_id,
+        'batch_row_action_by_batch_row_id':     batch_row_action_by_batch_row_id,
+        'batch_row_action_create_list':         [],
+        'batch_row_action_update_list':         [],
+        'batch_row_update_list':                [],
+        'existing_ballot_item_dict':            existing_ballot_item_dict,
+    }
+    results = {
+        'success':                          True,
+        'status':                           status,
+        'ballot_item_batch_analysis_dict':  ballot_item_batch_analysis_dict,
+    }
+    return results
+
+
+def save_ballot_item_batch_analysis_in_bulk(ballot_item_batch_analysis_dict):
+    """
+    Write the BatchRowActionBallotItem and BatchRow changes gathered while analyzing one batch, in a few bulk
+    statements instead of one save per BatchRow
+    :param ballot_item_batch_analysis_dict:
+    :return:
+    """
+    status = ""
+    success = True
+    batch_row_action_create_list = ballot_item_batch_analysis_dict['batch_row_action_create_list']
+    batch_row_action_update_list = ballot_item_batch_analysis_dict['batch_row_action_update_list']
+    batch_row_update_list = ballot_item_batch_analysis_dict['batch_row_update_list']
+    try:
+        with transaction.atomic():
+            if len(batch_row_action_create_list):
+                BatchRowActionBallotItem.objects.bulk_create(
+                    batch_row_action_create_list, batch_size=BATCH_ROW_BULK_CREATE_SIZE)
+            if len(batch_row_action_update_list):
+                BatchRowActionBallotItem.objects.bulk_update(
+                    batch_row_action_update_list, BATCH_ROW_ACTION_BALLOT_ITEM_ANALYSIS_FIELDS,
+                    batch_size=BATCH_ROW_BULK_CREATE_SIZE)
+            if len(batch_row_update_list):
+                BatchRow.objects.bulk_update(
+                    batch_row_update_list, ['batch_row_analyzed', 'polling_location_we_vote_id', 'voter_id'],
+                    batch_size=BATCH_ROW_BULK_CREATE_SIZE)
+        status += "BATCH_ROW_ACTION_BALLOT_ITEMS_SAVED_IN_BULK: CREATED " + str(len(batch_row_action_create_list)) + \
+                  " UPDATED " + str(len(batch_row_action_update_list)) + " "
+    except Exception as e:
+        success = False
+        status += "BATCH_ROW_ACTION_BALLOT_ITEMS_NOT_SAVED_IN_BULK: " + str(e) + " "
+        handle_exception(e, logger=logger, exception_message=status)
+
+    ballot_item_batch_analysis_dict['batch_row_action_create_list'] = []
+    ballot_item_batch_analysis_dict['batch_row_action_update_list'] = []
+    ballot_item_batch_analysis_dict['batch_row_update_list'] = []
+    results = {
+        'success':  success,
+        'status':   status,
+    }
+    return results
+
+
 def create_batch_row_action_ballot_item(batch_description,
                                         batch_header_map,
                                         one_batch_row,
                                         election_objects_dict={},
                                         measure_objects_dict={},
-                                        office_objects_dict={}):
+                                        office_objects_dict={},
+                                        ballot_item_lookups_dict=None,
+                                        ballot_item_batch_analysis_dict=None):
     """
-    Handle batch_row for ballot_item type
+    Handle batch_row for ballot_item type. When ballot_item_batch_analysis_dict is passed in, offices, measures,
+    existing ballot items and BatchRowActionBallotItem entries are matched against the preloaded lookups, and the
+    BatchRowActionBallotItem and BatchRow changes are queued there for save_ballot_item_batch_analysis_in_bulk
+    instead of being saved one at a time.
     :param batch_description:
     :param batch_header_map:
     :param one_batch_row:
     :param election_objects_dict:
     :param measure_objects_dict:
     :param office_objects_dict:
+    :param ballot_item_lookups_dict:
+    :param ballot_item_batch_analysis_dict:
     :return:
     """
     batch_manager = BatchManager()
@@ -2845,6 +3088,17 @@ def create_batch_row_action_ballot_item(batch_description,
                 state_code = election.state_code
                 election_objects_dict[google_civic_election_id] = election
 
+    ballot_item_lookups = None
+    if ballot_item_batch_analysis_dict is not None and ballot_item_lookups_dict is not None and \
+            positive_value_exists(google_civic_election_id):
+        # Also fills office_objects_dict and measure_objects_dict with every office and measure in this election
+        lookups_results = retrieve_ballot_item_lookups(
+            google_civic_election_id, ballot_item_lookups_dict,
+            measure_objects_dict=measure_objects_dict, office_objects_dict=office_objects_dict)
+        ballot_item_lookups = lookups_results['ballot_item_lookups']
+        if not lookups_results['success']:
+            status += lookups_results['status']
+
     # See if we have a contest_office_we_vote_id
     contest_office_manager = ContestOfficeManager()
     if positive_value_exists(contest_office_we_vote_id):
@@ -2870,10 +3124,24 @@ def create_batch_row_action_ballot_item(batch_description,
     if keep_looking_for_duplicates and not positive_value_exists(contest_office_we_vote_id) and \
             positive_value_exists(contest_office_name):
         # See if we have an office name
-        contest_office_list_manager = ContestOfficeListManager()
-        # Needs to be read_only=False so we don't get "terminating connection due to conflict with recovery" error
-        matching_results = contest_office_list_manager.retrieve_contest_offices_from_non_unique_identifiers(
-            contest_office_name, google_civic_election_id, state_code, read_only=False)
+        contest_office_list = []
+        if ballot_item_lookups is not None:
+            # Same exact match retrieve_contest_offices_from_non_unique_identifiers tries first
+            contest_office_list = ballot_item_lookups['office_list_by_name_and_state'].get(
+                (contest_office_name.lower(), lower_case_or_none(state_code)), [])
+        if len(contest_office_list):
+            matching_results = {
+                'success':                  True,
+                'status':                   "",
+                'contest_office_found':     len(contest_office_list) == 1,
+                'contest_office':           contest_office_list[0],
+                'contest_office_list_found': True,
+            }
+        else:
+            contest_office_list_manager = ContestOfficeListManager()
+            # Needs to be read_only=False so we don't get "terminating connection due to conflict with recovery" error
+            matching_results = contest_office_list_manager.retrieve_contest_offices_from_non_unique_identifiers(
+                contest_office_name, google_civic_election_id, state_code, read_only=False)
         if matching_results['contest_office_found']:
             keep_looking_for_duplicates = False
             contest_office = matching_results['contest_office']
@@ -2890,11 +3158,18 @@ def create_batch_row_action_ballot_item(batch_description,
 
     if keep_looking_for_duplicates and \
             positive_value_exists(candidate_twitter_handle) or positive_value_exists(candidate_name):
-        candidate_list_manager = CandidateListManager()
-        google_civic_election_id_list = [google_civic_election_id]
-        # Needs to be read_only=False so we don't get "terminating connection due to conflict with recovery" error
-        matching_results = candidate_list_manager.retrieve_candidates_from_non_unique_identifiers(
-            google_civic_election_id_list, state_code, candidate_twitter_handle, candidate_name, read_only=False)
+        candidate_identifiers = (state_code, candidate_twitter_handle, candidate_name)
+        if ballot_item_lookups is not None and \
+                candidate_identifiers in ballot_item_lookups['candidate_matching_results_dict']:
+            matching_results = ballot_item_lookups['candidate_matching_results_dict'][candidate_identifiers]
+        else:
+            candidate_list_manager = CandidateListManager()
+            google_civic_election_id_list = [google_civic_election_id]
+            # Needs to be read_only=False so we don't get "terminating connection due to conflict with recovery" error
+            matching_results = candidate_list_manager.retrieve_candidates_from_non_unique_identifiers(
+                google_civic_election_id_list, state_code, candidate_twitter_handle, candidate_name, read_only=False)
+            if ballot_item_lookups is not None:
+                ballot_item_lookups['candidate_matching_results_dict'][candidate_identifiers] = matching_results
         if matching_results['candidate_found']:
             candidate = matching_results['candidate']
             keep_looking_for_duplicates = False
@@ -2926,12 +3201,29 @@ def create_batch_row_action_ballot_item(batch_description,
     if keep_looking_for_duplicates and not \
             positive_value_exists(contest_measure_we_vote_id) and positive_value_exists(contest_measure_name):
         # See if we have an measure name
-        contest_measure_list = ContestMeasureListManager()
         keep_looking_for_duplicates = True
-        google_civic_election_id_list = [google_civic_election_id]
-        # Needs to be read_only=False so we don't get "terminating connection due to conflict with recovery" error
-        matching_results = contest_measure_list.retrieve_contest_measures_from_non_unique_identifiers(
-            google_civic_election_id_list, state_code, contest_measure_name, read_only=False)
+        contest_measure_list_filtered = []
+        if ballot_item_lookups is not None:
+            # Same exact match retrieve_contest_measures_from_non_unique_identifiers tries first
+            contest_measure_list_filtered = [
+                one_contest_measure for one_contest_measure
+                in ballot_item_lookups['measure_list_by_title'].get(contest_measure_name.lower(), [])
+                if not positive_value_exists(state_code) or
+                lower_case_or_none(one_contest_measure.state_code) == state_code.lower()]
+        if len(contest_measure_list_filtered):
+            matching_results = {
+                'success':                      True,
+                'status':                       "",
+                'contest_measure_found':        len(contest_measure_list_filtered) == 1,
+                'contest_measure':              contest_measure_list_filtered[0],
+                'contest_measure_list_found':   True,
+            }
+        else:
+            contest_measure_list = ContestMeasureListManager()
+            google_civic_election_id_list = [google_civic_election_id]
+            # Needs to be read_only=False so we don't get "terminating connection due to conflict with recovery" error
+            matching_results = contest_measure_list.retrieve_contest_measures_from_non_unique_identifiers(
+                google_civic_election_id_list, state_code, contest_measure_name, read_only=False)
         if matching_results['contest_measure_found']:
             contest_measure = matching_results['contest_measure']
             contest_measure_found = True
@@ -2970,7 +3262,21 @@ def create_batch_row_action_ballot_item(batch_description,
 
     # check for duplicate entries in the live ballot_item data
     existing_ballot_item_query_completed = False
-    if positive_value_exists(contest_office_we_vote_id) or positive_value_exists(contest_measure_we_vote_id):
+    if ballot_item_batch_analysis_dict is not None and positive_value_exists(polling_location_we_vote_id) and \
+            (positive_value_exists(contest_office_we_vote_id) or positive_value_exists(contest_measure_we_vote_id)):
+        if positive_value_exists(contest_office_we_vote_id):
+            existing_ballot_item_key = (google_civic_election_id, str(polling_location_we_vote_id).lower(),
+                                        CONTEST_OFFICE, contest_office_we_vote_id.lower())
+        else:
+            existing_ballot_item_key = (google_civic_election_id, str(polling_location_we_vote_id).lower(),
+                                        MEASURE, contest_measure_we_vote_id.lower())
+        existing_ballot_item = ballot_item_batch_analysis_dict['existing_ballot_item_dict'].get(
+            existing_ballot_item_key)
+        existing_ballot_item_query_completed = True
+        if existing_ballot_item is not None:
+            existing_ballot_item_id = existing_ballot_item.id
+            existing_ballot_item_found = True
+    elif positive_value_exists(contest_office_we_vote_id) or positive_value_exists(contest_measure_we_vote_id):
         try:
             # This used to retrieve from using('readonly') but the query gets interrupted from updates from master
             existing_ballot_item_query = BallotItem.objects.all()
@@ -3029,12 +3335,47 @@ def create_batch_row_action_ballot_item(batch_description,
     # We want to start with the BatchRowAction... entry first so we can record our findings line by line while
     #  we are checking for existing duplicate data
     batch_row_action_ballot_item_change_found = False
-    existing_results = batch_manager.retrieve_batch_row_action_ballot_item(
-        batch_description.batch_header_id, one_batch_row.id)
+    if ballot_item_batch_analysis_dict is not None:
+        batch_row_action_ballot_item = \
+            ballot_item_batch_analysis_dict['batch_row_action_by_batch_row_id'].get(one_batch_row.id)
+        existing_results = {
+            'batch_row_action_found':       batch_row_action_ballot_item is not None,
+            'batch_row_action_ballot_item': batch_row_action_ballot_item,
+        }
+    else:
+        existing_results = batch_manager.retrieve_batch_row_action_ballot_item(
+            batch_description.batch_header_id, one_batch_row.id)
     if existing_results['batch_row_action_found']:
         batch_row_action_ballot_item = existing_results['batch_row_action_ballot_item']
         batch_row_action_updated = True
         status += "EXISTING_BATCH_ROW_ACTION_BALLOT_ITEM_FOUND "
+    elif ballot_item_batch_analysis_dict is not None:
+        # Saved with the rest of this batch in save_ballot_item_batch_analysis_in_bulk
+        batch_row_action_ballot_item = BatchRowActionBallotItem(
+            ballot_item_display_name=ballot_item_display_name,
+            ballot_item_id=existing_ballot_item_id,
+            batch_header_id=batch_description.batch_header_id,
+            batch_row_id=one_batch_row.id,
+            batch_set_id=batch_description.batch_set_id,
+            contest_measure_we_vote_id=contest_measure_we_vote_id,
+            contest_office_we_vote_id=contest_office_we_vote_id,
+            google_civic_election_id=google_civic_election_id,
+            kind_of_action=kind_of_action,
+            local_ballot_order=local_ballot_order,
+            measure_text=contest_measure_text,
+            measure_url=contest_measure_url,
+            no_vote_description=no_vote_description,
+            polling_location_we_vote_id=polling_location_we_vote_id,
+            state_code=state_code,
+            status=status,
+            voter_id=voter_id,
+            yes_vote_description=yes_vote_description,
+        )
+        ballot_item_batch_analysis_dict['batch_row_action_create_list'].append(batch_row_action_ballot_item)
+        ballot_item_batch_analysis_dict['batch_row_action_by_batch_row_id'][one_batch_row.id] = \
+            batch_row_action_ballot_item
+        batch_row_action_created = True
+        status += "BATCH_ROW_ACTION_BALLOT_ITEM_QUEUED "
     else:
         # If a BatchRowActionBallotItem entry does not exist, create one
         status += "[BatchRowActionBallotItem.objects.create]"
@@ -3128,8 +3469,12 @@ def create_batch_row_action_ballot_item(batch_description,
             batch_row_action_ballot_item_change_found = True
         if positive_value_exists(batch_row_action_ballot_item_change_found):
             batch_row_action_ballot_item.status = status
-            batch_row_action_ballot_item.save()
-            status += "BATCH_ROW_ACTION_BALLOT_ITEM_SAVED "
+            if ballot_item_batch_analysis_dict is None:
+                batch_row_action_ballot_item.save()
+                status += "BATCH_ROW_ACTION_BALLOT_ITEM_SAVED "
+            elif batch_row_action_ballot_item.pk:
+                ballot_item_batch_analysis_dict['batch_row_action_update_list'].append(batch_row_action_ballot_item)
+                status += "BATCH_ROW_ACTION_BALLOT_ITEM_QUEUED_FOR_UPDATE "
         else:
             status += "BATCH_ROW_ACTION_BALLOT_ITEM_NO_SAVE_NEEDED "
     except Exception as e:
@@ -3153,7 +3498,10 @@ def create_batch_row_action_ballot_item(batch_description,
                 one_batch_row.batch_row_analyzed = True
                 batch_row_changed = True
             if batch_row_changed:
-                one_batch_row.save()
+                if ballot_item_batch_analysis_dict is None:
+                    one_batch_row.save()
+                else:
+                    ballot_item_batch_analysis_dict['batch_row_update_list'].append(one_batch_row)
     except Exception as e:
         status += "COULD_NOT_SAVE_BATCH_ROW: " + str(e) + " "
         handle_exception(e, logger=logger, exception_message=status)
@@ -3172,11 +3520,14 @@ def create_batch_row_action_ballot_item(batch_description,
     return results
 
 
-def create_batch_row_action_ballot_item_delete(batch_description, existing_ballot_item):
+def create_batch_row_action_ballot_item_delete(batch_description, existing_ballot_item,
+                                               ballot_item_batch_analysis_dict=None):
     """
     Schedule the delete of existing ballot_item
     :param batch_description:
     :param existing_ballot_item:
+    :param ballot_item_batch_analysis_dict: When passed in, the new entry is queued for
+        save_ballot_item_batch_analysis_in_bulk instead of saved here
     :return:
     """
     batch_manager = BatchManager()
@@ -3192,11 +3543,33 @@ def create_batch_row_action_ballot_item_delete(batch_description, existing_ballo
     # Does a BatchRowActionBallotItem entry already exist?
     # We want to start with the BatchRowAction... entry first so we can record our findings line by line while
     #  we are checking for existing duplicate data
-    existing_results = batch_manager.retrieve_batch_row_action_ballot_item(
-        batch_description.batch_header_id, ballot_item_id=existing_ballot_item.id)
+    if ballot_item_batch_analysis_dict is not None:
+        batch_row_action_ballot_item = \
+            ballot_item_batch_analysis_dict['batch_row_action_by_ballot_item_id'].get(existing_ballot_item.id)
+        existing_results = {
+            'batch_row_action_found':       batch_row_action_ballot_item is not None,
+            'batch_row_action_ballot_item': batch_row_action_ballot_item,
+        }
+    else:
+        existing_results = batch_manager.retrieve_batch_row_action_ballot_item(
+            batch_description.batch_header_id, ballot_item_id=existing_ballot_item.id)
     if existing_results['batch_row_action_found']:
         batch_row_action_ballot_item = existing_results['batch_row_action_ballot_item']
         batch_row_action_delete_exists = True
+    elif ballot_item_batch_analysis_dict is not None:
+        batch_row_action_ballot_item = BatchRowActionBallotItem(
+            ballot_item_id=existing_ballot_item.id,
+            ballot_item_display_name=existing_ballot_item.ballot_item_display_name,
+            batch_header_id=batch_description.batch_header_id,
+            batch_set_id=batch_description.batch_set_id,
+            google_civic_election_id=google_civic_election_id,
+            kind_of_action=IMPORT_DELETE,
+        )
+        ballot_item_batch_analysis_dict['batch_row_action_create_list'].append(batch_row_action_ballot_item)
+        ballot_item_batch_analysis_dict['batch_row_action_by_ballot_item_id'][existing_ballot_item.id] = \
+            batch_row_action_ballot_item
+        batch_row_action_delete_exists = True
+        status += "BATCH_ROW_ACTION_BALLOT_ITEM_DELETE_QUEUED "
     else:
         # If a BatchRowActionBallotItem entry does not exist, create one
         try:
@@ -3345,6 +3718,9 @@ def import_elected_office_data_from_batch_row_actions(batch_header_id, batch_row
         }
         return results
 
+    if create_entry_flag:
+        # Reserve the we_vote_id integers for every row at once
+        preallocate_we_vote_id_integers('we_vote_id_last_elected_office_integer', len(batch_row_action_list))
     for one_batch_row_action in batch_row_action_list:
 
         # Find the column in the incoming batch_row with the header == elected_office_name
@@ -3716,6 +4092,9 @@ def import_contest_office_data_from_batch_row_actions(
     #     }
     #     return results
 
+    if create_entry_flag:
+        # Reserve the we_vote_id integers for every row at once
+        preallocate_we_vote_id_integers('we_vote_id_last_contest_office_integer', len(batch_row_action_list))
     for one_batch_row_action in batch_row_action_list:
 
         # Find the column in the incoming batch_row with the header == contest_office_name
@@ -3935,6 +4314,9 @@ def import_measure_data_from_batch_row_actions(batch_header_id, batch_row_id,
         }
         return results
 
+    if create_entry_flag:
+        # Reserve the we_vote_id integers for every row at once
+        preallocate_we_vote_id_integers('we_vote_id_last_contest_measure_integer', len(batch_row_action_list))
     for one_batch_row_action in batch_row_action_list:
 
         # Find the column in the incoming batch_row with the header == elected_office_name
@@ -4128,6 +4510,9 @@ def import_candidate_data_from_batch_row_actions(batch_header_id, batch_row_id,
         }
         return results
 
+    if create_entry_flag:
+        # Reserve the we_vote_id integers for every row at once
+        preallocate_we_vote_id_integers('we_vote_id_last_candidate_campaign_integer', len(batch_row_action_list))
     for one_batch_row_action in batch_row_action_list:
         candidate_ctcl_person_id = one_batch_row_action.candidate_ctcl_person_id
         if positive_value_exists(one_batch_row_action.google_civic_election_id):
@@ -4398,6 +4783,9 @@ def import_politician_data_from_batch_row_actions(batch_header_id, batch_row_id,
         }
         return results
 
+    if create_entry_flag:
+        # Reserve the we_vote_id integers for every row at once
+        preallocate_we_vote_id_integers('we_vote_id_last_politician_integer', len(batch_row_action_list))
     for one_batch_row_action in batch_row_action_list:
 
         # Find the column in the incoming batch_row with the header == politician_name
@@ -4548,6 +4936,9 @@ def import_organization_data_from_batch_row_actions(
 
     organization_manager = OrganizationManager()
     twitter_user_manager = TwitterUserManager()
+    if create_entry_flag:
+        # Reserve the we_vote_id integers for every row at once
+        preallocate_we_vote_id_integers('we_vote_id_last_org_integer', len(batch_row_action_list))
     for one_batch_row_action in batch_row_action_list:
         if create_entry_flag:
             twitter_link_to_organization_exists = False
@@ -4708,6 +5099,9 @@ def import_polling_location_data_from_batch_row_actions(
         status += "POLLING_LOCATION_UPDATE_NOT_WORKING YET "
 
     polling_location_manager = PollingLocationManager()
+    if create_entry_flag:
+        # Reserve the we_vote_id integers for every row at once
+        preallocate_we_vote_id_integers('we_vote_id_last_polling_location_integer', len(batch_row_action_list))
     for one_batch_row_action in batch_row_action_list:
         if create_entry_flag:
             results = polling_location_manager.update_or_create_polling_location(
@@ -4850,6 +5244,9 @@ def import_position_data_from_batch_row_actions(
     position_manager = PositionManager()
     google_civic_election_id = 0
     unique_organization_we_vote_id_list = []
+    if create_entry_flag:
+        # Reserve the we_vote_id integers for every row at once
+        preallocate_we_vote_id_integers('we_vote_id_last_position_integer', len(batch_row_action_list))
     for one_batch_row_action in batch_row_action_list:
         if create_entry_flag:
             position_we_vote_id = ""
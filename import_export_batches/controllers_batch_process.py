@@ -18,10 +18,11 @@ from activity.controllers import process_activity_notice_seeds_triggered_by_batc
 from analytics.controllers import calculate_sitewide_daily_metrics, \
     process_one_analytics_batch_process_augment_with_election_id, \
     process_one_analytics_batch_process_augment_with_first_visit, process_sitewide_voter_metrics, \
-    retrieve_analytics_processing_next_step
-from analytics.models import AnalyticsManager
+    retrieve_analytics_processing_next_step, save_organization_daily_metrics_for_all_organizations
+from analytics.models import AnalyticsCountManager, AnalyticsManager
 from api_internal_cache.models import ApiInternalCacheManager
-from ballot.models import BallotReturnedListManager
+from ballot.models import BallotReturnedListManager, BallotSnapshotManager
+from config.base import get_environment_variable_default
 from datetime import timedelta
 from django.utils.timezone import now
 from election.models import ElectionManager
@@ -30,9 +31,10 @@ from import_export_twitter.controllers import fetch_number_of_candidates_needing
     retrieve_possible_twitter_handles_in_bulk
 from issue.controllers import update_issue_statistics
 import json
+import threading
 from voter_guide.controllers import voter_guides_upcoming_retrieve_for_api
 import wevote_functions.admin
-from wevote_functions.functions import positive_value_exists
+from wevote_functions.functions import convert_to_int, positive_value_exists
 from wevote_settings.models import fetch_batch_process_system_on, fetch_batch_process_system_activity_notices_on, \
     fetch_batch_process_system_api_refresh_on, fetch_batch_process_system_ballot_items_on, \
     fetch_batch_process_system_calculate_analytics_on, fetch_batch_process_system_search_twitter_on
@@ -57,6 +59,60 @@ NUMBER_OF_SIMULTANEOUS_BATCH_PROCESSES = 4  # Four processes at a time
 NUMBER_OF_SIMULTANEOUS_BALLOT_ITEM_BATCH_PROCESSES = 4  # Four processes at a time
 NUMBER_OF_SIMULTANEOUS_GENERAL_MAINTENANCE_BATCH_PROCESSES = 1
 
+# Lanes for the run_batch_process_worker management command, in priority order. A worker takes its next BatchProcess
+#  from the first lane that has work waiting and fewer than number_of_simultaneous_processes checked out on all
+#  servers, so voter-facing work is never stuck behind a long ballot item import. Run the workers on servers that do
+#  not answer voter API calls, and use --lane to dedicate a server to some of the lanes.
+BATCH_PROCESS_WORKER_LANES = [
+    {
+        'lane_name':                        'activity_notices',
+        'kind_of_process_list':             [ACTIVITY_NOTICE_PROCESS],
+        'number_of_simultaneous_processes': convert_to_int(get_environment_variable_default(
+            'BATCH_PROCESS_WORKER_ACTIVITY_NOTICES_POOL_SIZE', 1)),
+        'system_on_function':               fetch_batch_process_system_activity_notices_on,
+    },
+    {
+        'lane_name':                        'api_refresh',
+        'kind_of_process_list':             [API_REFRESH_REQUEST],
+        'number_of_simultaneous_processes': convert_to_int(get_environment_variable_default(
+            'BATCH_PROCESS_WORKER_API_REFRESH_POOL_SIZE', NUMBER_OF_SIMULTANEOUS_GENERAL_MAINTENANCE_BATCH_PROCESSES)),
+        'system_on_function':               fetch_batch_process_system_api_refresh_on,
+    },
+    {
+        'lane_name':                        'ballot_items',
+        'kind_of_process_list':             [REFRESH_BALLOT_ITEMS_FROM_POLLING_LOCATIONS,
+                                             REFRESH_BALLOT_ITEMS_FROM_VOTERS,
+                                             RETRIEVE_BALLOT_ITEMS_FROM_POLLING_LOCATIONS],
+        'number_of_simultaneous_processes': convert_to_int(get_environment_variable_default(
+            'BATCH_PROCESS_WORKER_BALLOT_ITEMS_POOL_SIZE', NUMBER_OF_SIMULTANEOUS_BALLOT_ITEM_BATCH_PROCESSES)),
+        'restart_active_first':             True,
+        'for_upcoming_elections':           True,
+        'system_on_function':               fetch_batch_process_system_ballot_items_on,
+    },
+    {
+        'lane_name':                        'analytics',
+        'kind_of_process_list':             [AUGMENT_ANALYTICS_ACTION_WITH_ELECTION_ID,
+                                             AUGMENT_ANALYTICS_ACTION_WITH_FIRST_VISIT,
+                                             CALCULATE_ORGANIZATION_DAILY_METRICS,
+                                             CALCULATE_ORGANIZATION_ELECTION_METRICS,
+                                             CALCULATE_SITEWIDE_DAILY_METRICS,
+                                             CALCULATE_SITEWIDE_ELECTION_METRICS,
+                                             CALCULATE_SITEWIDE_VOTER_METRICS],
+        'number_of_simultaneous_processes': convert_to_int(get_environment_variable_default(
+            'BATCH_PROCESS_WORKER_ANALYTICS_POOL_SIZE', NUMBER_OF_SIMULTANEOUS_GENERAL_MAINTENANCE_BATCH_PROCESSES)),
+        'system_on_function':               fetch_batch_process_system_calculate_analytics_on,
+    },
+    {
+        'lane_name':                        'search_twitter',
+        'kind_of_process_list':             [SEARCH_TWITTER_FOR_CANDIDATE_TWITTER_HANDLE],
+        'number_of_simultaneous_processes': convert_to_int(get_environment_variable_default(
+            'BATCH_PROCESS_WORKER_SEARCH_TWITTER_POOL_SIZE', 1)),
+        'system_on_function':               fetch_batch_process_system_search_twitter_on,
+    },
+]
+# How often a worker renews the lease (date_checked_out) on the BatchProcess it is running
+BATCH_PROCESS_WORKER_HEARTBEAT_SECONDS = 60
+
 
 # WE HAVE DEPRECATED THIS WHOLE FUNCTION
 # def batch_process_next_steps():
@@ -1067,6 +1123,126 @@ def process_next_general_maintenance():
     return results
 
 
+def process_next_batch_process_from_worker_lanes(lane_name_list=[],
+                                                 heartbeat_seconds=BATCH_PROCESS_WORKER_HEARTBEAT_SECONDS):
+    """
+    Claim the next BatchProcess from the highest priority lane with room, and run one step of it while renewing its
+    lease in the background. Called in a loop by the run_batch_process_worker management command.
+    :param lane_name_list: Only take work from these lanes. Take work from every lane if empty.
+    :param heartbeat_seconds:
+    :return:
+    """
+    success = True
+    status = ""
+    batch_process_found = False
+    batch_process_manager = BatchProcessManager()
+
+    if not fetch_batch_process_system_on():
+        status += "BATCH_PROCESS_SYSTEM_TURNED_OFF-WORKER "
+        results = {
+            'success':              success,
+            'status':               status,
+            'batch_process_found':  batch_process_found,
+        }
+        return results
+
+    batch_process = None
+    for lane in BATCH_PROCESS_WORKER_LANES:
+        if len(lane_name_list) and lane['lane_name'] not in lane_name_list:
+            continue
+        if not lane['system_on_function']():
+            status += "BATCH_PROCESS_LANE_TURNED_OFF-" + lane['lane_name'] + " "
+            continue
+        results = batch_process_manager.claim_next_batch_process(
+            kind_of_process_list=lane['kind_of_process_list'],
+            number_of_simultaneous_processes=lane['number_of_simultaneous_processes'],
+            restart_active_first=lane.get('restart_active_first', False),
+            for_upcoming_elections=lane.get('for_upcoming_elections', False))
+        if not results['success']:
+            success = False
+            status += results['status']
+        if results['batch_process_found']:
+            batch_process = results['batch_process']
+            batch_process_found = True
+            status += "BATCH_PROCESS_CLAIMED-" + lane['lane_name'] + "(" + str(batch_process.id) + ") "
+            break
+
+    if not batch_process_found:
+        results = {
+            'success':              success,
+            'status':               status,
+            'batch_process_found':  batch_process_found,
+        }
+        return results
+
+    checked_out_lease_token = batch_process.checked_out_lease_token
+    lease_released = threading.Event()
+
+    def renew_lease_until_released():
+        from django.db import connection
+        try:
+            while not lease_released.wait(heartbeat_seconds):
+                if not batch_process_manager.renew_batch_process_lease(batch_process.id, checked_out_lease_token):
+                    break
+        finally:
+            connection.close()
+
+    heartbeat_thread = threading.Thread(target=renew_lease_until_released, daemon=True)
+    heartbeat_thread.start()
+    try:
+        if batch_process.kind_of_process in [
+                REFRESH_BALLOT_ITEMS_FROM_POLLING_LOCATIONS, REFRESH_BALLOT_ITEMS_FROM_VOTERS,
+                RETRIEVE_BALLOT_ITEMS_FROM_POLLING_LOCATIONS]:
+            if batch_process.date_started is None:
+                batch_process.date_started = now()
+                batch_process.save(update_fields=['date_started'])
+            results = process_one_ballot_item_batch_process(batch_process)
+            status += results['status']
+        elif batch_process.kind_of_process in [ACTIVITY_NOTICE_PROCESS]:
+            results = process_activity_notice_batch_process(batch_process)
+            status += results['status']
+        elif batch_process.kind_of_process in [API_REFRESH_REQUEST]:
+            results = process_one_api_refresh_request_batch_process(batch_process)
+            status += results['status']
+        elif batch_process.kind_of_process in [
+                AUGMENT_ANALYTICS_ACTION_WITH_ELECTION_ID, AUGMENT_ANALYTICS_ACTION_WITH_FIRST_VISIT,
+                CALCULATE_ORGANIZATION_DAILY_METRICS, CALCULATE_ORGANIZATION_ELECTION_METRICS,
+                CALCULATE_SITEWIDE_ELECTION_METRICS, CALCULATE_SITEWIDE_VOTER_METRICS]:
+            results = process_one_analytics_batch_process(batch_process)
+            status += results['status']
+        elif batch_process.kind_of_process in [CALCULATE_SITEWIDE_DAILY_METRICS]:
+            results = process_one_sitewide_daily_analytics_batch_process(batch_process)
+            status += results['status']
+        elif batch_process.kind_of_process in [SEARCH_TWITTER_FOR_CANDIDATE_TWITTER_HANDLE]:
+            results = process_one_search_twitter_batch_process(batch_process, status=status)
+            status = results['status']  # Not additive since we pass status into function
+        else:
+            status += "KIND_OF_PROCESS_NOT_RECOGNIZED "
+    except Exception as e:
+        success = False
+        status += "ERROR-BATCH_PROCESS_WORKER: " + str(e) + " "
+        handle_exception(e, logger=logger, exception_message=status)
+        batch_process_manager.create_batch_process_log_entry(
+            batch_process_id=batch_process.id,
+            google_civic_election_id=batch_process.google_civic_election_id,
+            kind_of_process=batch_process.kind_of_process,
+            state_code=batch_process.state_code,
+            status=status,
+        )
+    finally:
+        lease_released.set()
+        heartbeat_thread.join()
+        # Whether this step finished or failed, any worker can now claim the next step
+        batch_process_manager.release_batch_process(batch_process.id, checked_out_lease_token)
+
+    results = {
+        'success':              success,
+        'status':               status,
+        'batch_process_found':  batch_process_found,
+    }
+    return results
+
+
 def process_one_analytics_batch_process(batch_process):
     from import_export_batches.models import BatchProcessManager
     batch_process_manager = BatchProcessManager()
@@ -2165,6 +2341,12 @@ def process_one_ballot_item_batch_process(batch_process):
                 else:
                     status += results['status']
 
+            if positive_value_exists(google_civic_election_id):
+                # New ballot data is in, so the allBallotItemsRetrieve snapshot for this state is rendered again
+                #  on its next request. Bulk writes skip the signals that usually take care of this.
+                results = BallotSnapshotManager().invalidate_ballot_snapshots(google_civic_election_id, state_code)
+                status += results['status']
+
             status += "CREATE_DATE_STARTED-CREATE_DATE_COMPLETED_SAVED "
             batch_process_manager.create_batch_process_log_entry(
                 batch_process_id=batch_process.id,
@@ -2231,6 +2413,10 @@ def process_one_ballot_item_batch_process(batch_process):
                     else:
                         status += results['status']
 
+                if positive_value_exists(google_civic_election_id):
+                    results = BallotSnapshotManager().invalidate_ballot_snapshots(google_civic_election_id, state_code)
+                    status += results['status']
+
                 status += "CREATE_DATE_STARTED-CREATE_DATE_COMPLETED_SAVED "
                 batch_process_manager.create_batch_process_log_entry(
                     batch_process_id=batch_process.id,
@@ -2508,7 +2694,12 @@ def process_one_sitewide_daily_analytics_batch_process(batch_process):
     status += update_results['status']
 
     daily_metrics_calculated = False
-    results = calculate_sitewide_daily_metrics(batch_process.analytics_date_as_integer)
+    # One pass over the day's AnalyticsAction entries, shared by the sitewide and organization daily metrics
+    daily_metrics_rollup = AnalyticsCountManager().retrieve_daily_metrics_rollup(
+        batch_process.analytics_date_as_integer)
+    status += daily_metrics_rollup['status']
+    results = calculate_sitewide_daily_metrics(
+        batch_process.analytics_date_as_integer, daily_metrics_rollup=daily_metrics_rollup)
     status += results['status']
     if positive_value_exists(results['success']):
         sitewide_daily_metrics_values = results['sitewide_daily_metrics_values']
@@ -2516,6 +2707,9 @@ def process_one_sitewide_daily_analytics_batch_process(batch_process):
         status += update_results['status']
         if positive_value_exists(update_results['success']):
             daily_metrics_calculated = True
+            organization_results = save_organization_daily_metrics_for_all_organizations(
+                batch_process.analytics_date_as_integer, daily_metrics_rollup=daily_metrics_rollup)
+            status += organization_results['status']
         else:
             status += "SAVE_SITEWIDE_DAILY_METRICS-FAILED_TO_SAVE "
             success = False
@@ -2617,6 +2811,7 @@ def process_batch_set(batch_set_id=0, analyze_all=False, create_all=False, delet
     # Store static data in memory so we don't have to use the database
     election_objects_dict = {}
     office_objects_dict = {}
+    ballot_item_lookups_dict = {}
     measure_objects_dict = {}
 
     if positive_value_exists(analyze_all):
@@ -2637,6 +2832,7 @@ def process_batch_set(batch_set_id=0, analyze_all=False, create_all=False, delet
                 election_objects_dict=election_objects_dict,
                 measure_objects_dict=measure_objects_dict,
                 office_objects_dict=office_objects_dict,
+                ballot_item_lookups_dict=ballot_item_lookups_dict,
             )
             batch_description_rows_reviewed += 1
             if results['batch_actions_created']:
@@ -2647,6 +2843,7 @@ def process_batch_set(batch_set_id=0, analyze_all=False, create_all=False, delet
             election_objects_dict = results['election_objects_dict']
             measure_objects_dict = results['measure_objects_dict']
             office_objects_dict = results['office_objects_dict']
+            ballot_item_lookups_dict = results['ballot_item_lookups_dict']
             start_create_batch_row_action_time_tracker = results['start_create_batch_row_action_time_tracker']
             summary_of_create_batch_row_action_time_tracker.append(start_create_batch_row_action_time_tracker)
         status += "CREATE_BATCH_ROW_ACTIONS_BATCH_ROWS_ANALYZED: " + str(batch_rows_analyzed) + \
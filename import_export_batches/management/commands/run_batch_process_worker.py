@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from import_export_batches.controllers_batch_process import BATCH_PROCESS_WORKER_HEARTBEAT_SECONDS, \
+    BATCH_PROCESS_WORKER_LANES, process_next_batch_process_from_worker_lanes
+
+
+class Command(BaseCommand):
+    help = 'Runs BatchProcess steps (ballot items, analytics, API refresh, activity notices, Twitter search) as a ' \
+           'standalone worker, instead of in the process_next_* admin views. Start as many as you like, on as many ' \
+           'servers as you like: each BatchProcess is leased to one worker at a time.'
+
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        lane_name_list = [lane['lane_name'] for lane in BATCH_PROCESS_WORKER_LANES]
+        parser.add_argument('--lane', action='append', choices=lane_name_list, default=[],
+                            help='Only run work from this lane (repeat for more). Default: every lane, in the '
+                                 'order ' + ', '.join(lane_name_list))
+        parser.add_argument('--idle-seconds', type=float, default=10,
+                            help='How long to wait before looking again when there is nothing to run')
+        parser.add_argument('--heartbeat-seconds', type=float, default=BATCH_PROCESS_WORKER_HEARTBEAT_SECONDS,
+                            help='How often to renew the lease on the BatchProcess being run')
+        parser.add_argument('--once', action='store_true', help='Run at most one step, then exit')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            results = process_next_batch_process_from_worker_lanes(
+                lane_name_list=options['lane'], heartbeat_seconds=options['heartbeat_seconds'])
+            if results['batch_process_found'] or not results['success'] or options['verbosity'] > 1:
+                self.stdout.write(results['status'])
+            if options['once']:
+                break
+            if not results['batch_process_found']:
+                time.sleep(options['idle_seconds'])
@@ -3,9 +3,10 @@
 # -*- coding: UTF-8 -*-
 
 import codecs
+from config.base import get_environment_variable_default
 import csv
 from datetime import date, timedelta
-from django.db import models
+from django.db import connection, models, transaction
 from django.db.models import Q
 from django.utils.http import urlquote
 from django.utils.timezone import localtime, now
@@ -17,13 +18,16 @@ import magic
 from organization.models import ORGANIZATION_TYPE_CHOICES, UNKNOWN, alphanumeric
 from party.controllers import retrieve_all_party_names_and_ids_api, party_import_from_xml_data
 from politician.models import GENDER_CHOICES, UNKNOWN
+import time
 import urllib
 from urllib.request import Request, urlopen
+import uuid
 from voter_guide.models import ORGANIZATION_WORD
 import wevote_functions.admin
 from wevote_functions.functions import convert_to_int, positive_value_exists, \
     LANGUAGE_CODE_ENGLISH, LANGUAGE_CODE_SPANISH
 import xml.etree.ElementTree as ElementTree
+import zlib
 
 POSITION = 'POSITION'
 ANY_STANCE = 'ANY_STANCE'  # This is a way to indicate when we want to return any stance (support, oppose, no_stance)
@@ -540,6 +544,9 @@ REFRESH_BALLOT_ITEMS_FROM_POLLING_LOCATIONS = "REFRESH_BALLOT_ITEMS_FROM_POLLING
 REFRESH_BALLOT_ITEMS_FROM_VOTERS = "REFRESH_BALLOT_ITEMS_FROM_VOTERS"
 SEARCH_TWITTER_FOR_CANDIDATE_TWITTER_HANDLE = "SEARCH_TWITTER_FOR_CANDIDATE_TWITTER_HANDLE"
 
+# Number of BatchRow objects written by each INSERT when importing a batch
+BATCH_ROW_BULK_CREATE_SIZE = convert_to_int(get_environment_variable_default("BATCH_ROW_BULK_CREATE_SIZE", 1000))
+
 KIND_OF_PROCESS_CHOICES = (
     (ACTIVITY_NOTICE_PROCESS,  'Create, update, or schedule to send Activity Notices'),
     (API_REFRESH_REQUEST,  'Make sure we have cached a recent return from a specific API'),
@@ -595,6 +602,74 @@ def get_header_map_value_if_index_in_list(incoming_list, index, kind_of_batch=""
         return ""
 
 
+class BatchRowBulkCreator(object):
+    """
+    Collects the BatchRow objects for one import in memory and writes them with bulk_create, batch_size rows per INSERT,
+    so the time an import takes no longer grows with one database round trip per row.
+    """
+
+    def __init__(self, batch_size=BATCH_ROW_BULK_CREATE_SIZE):
+        self.batch_size = max(convert_to_int(batch_size), 1)
+        self.batch_row_list = []
+        self.number_of_batch_rows = 0
+        self.number_of_inserts = 0
+        self.start_time = time.perf_counter()
+
+    def add(self, batch_row):
+        """
+        Queue one unsaved BatchRow, writing the queue once it reaches batch_size. If that write fails the queued rows
+        are dropped and the exception is raised to the caller, just as BatchRow.objects.create would have.
+        :param batch_row:
+        :return:
+        """
+        self.batch_row_list.append(batch_row)
+        if len(self.batch_row_list) >= self.batch_size:
+            self.write_batch_row_list()
+
+    def __len__(self):
+        """
+        The number of rows added so far, saved or still queued
+        """
+        return self.number_of_batch_rows + len(self.batch_row_list)
+
+    def write_batch_row_list(self):
+        batch_row_list = self.batch_row_list
+        self.batch_row_list = []
+        if len(batch_row_list):
+            BatchRow.objects.bulk_create(batch_row_list)
+            self.number_of_batch_rows += len(batch_row_list)
+            self.number_of_inserts += 1
+
+    def save_remaining(self):
+        """
+        Write whatever is still queued, and report how many rows were saved and how quickly
+        :return:
+        """
+        success = True
+        status = ""
+        try:
+            self.write_batch_row_list()
+        except Exception as e:
+            success = False
+            status += "EXCEPTION_BATCH_ROW_BULK_CREATE " + str(e) + " "
+            handle_exception(e, logger=logger, exception_message=status)
+
+        batch_row_seconds = time.perf_counter() - self.start_time
+        batch_rows_per_second = self.number_of_batch_rows / batch_row_seconds if batch_row_seconds > 0 else 0
+        status += "BATCH_ROWS_SAVED: {rows} IN {inserts} INSERTS, {seconds:.3f} SECONDS, " \
+                  "{rows_per_second:.0f} ROWS_PER_SECOND ".format(
+                      rows=self.number_of_batch_rows, inserts=self.number_of_inserts, seconds=batch_row_seconds,
+                      rows_per_second=batch_rows_per_second)
+        results = {
+            'success':                  success,
+            'status':                   status,
+            'number_of_batch_rows':     self.number_of_batch_rows,
+            'batch_row_seconds':        batch_row_seconds,
+            'batch_rows_per_second':    batch_rows_per_second,
+        }
+        return results
+
+
 class BatchManager(models.Manager):
 
     def __unicode__(self):
@@ -761,7 +836,7 @@ class BatchManager(models.Manager):
         first_line = True
         success = False
         status = ""
-        number_of_batch_rows = 0
+        batch_row_bulk_creator = BatchRowBulkCreator()
         # limit_for_testing = 5
 
         # Retrieve from JSON
@@ -925,7 +1000,7 @@ class BatchManager(models.Manager):
                 #     break
                 if positive_value_exists(batch_header_id):
                     try:
-                        batch_row = BatchRow.objects.create(
+                        batch_row_bulk_creator.add(BatchRow(
                             batch_header_id=batch_header_id,
                             batch_row_000=get_value_if_index_in_list(line, 0),
                             batch_row_001=get_value_if_index_in_list(line, 1),
@@ -980,19 +1055,26 @@ class BatchManager(models.Manager):
                             batch_row_050=get_value_if_index_in_list(line, 50),
                             google_civic_election_id=google_civic_election_id,
                             polling_location_we_vote_id=polling_location_we_vote_id,
-                        )
-                        number_of_batch_rows += 1
+                        ))
                     except Exception as e:
                         # Stop trying to save rows -- break out of the for loop
                         status += "EXCEPTION_BATCH_ROW " + str(e) + " "
+                        success = False
                         break
 
+        batch_row_results = batch_row_bulk_creator.save_remaining()
+        status += batch_row_results['status']
+        if not batch_row_results['success']:
+            success = False
+        number_of_batch_rows = batch_row_results['number_of_batch_rows']
+
         results = {
             'success':              success,
             'status':               status,
             'batch_header_id':      batch_header_id,
             'batch_saved':          success,
             'number_of_batch_rows': number_of_batch_rows,
+            'batch_rows_per_second': batch_row_results['batch_rows_per_second'],
         }
         return results
 
@@ -1001,7 +1083,7 @@ class BatchManager(models.Manager):
                                batch_set_id=0, state_code=""):
         success = False
         status = ""
-        number_of_batch_rows = 0
+        batch_row_bulk_creator = BatchRowBulkCreator()
         # limit_for_testing = 5
 
         batch_header_id = 0
@@ -1015,7 +1097,7 @@ class BatchManager(models.Manager):
                 'status': status,
                 'batch_header_id': batch_header_id,
                 'batch_saved': success,
-                'number_of_batch_rows': number_of_batch_rows,
+                'number_of_batch_rows': 0,
             }
             return results
 
@@ -1181,7 +1263,7 @@ class BatchManager(models.Manager):
                 if not positive_value_exists(state_code):
                     local_state_code = get_value_from_dict(one_dict, 'state_code')
                 try:
-                    batch_row = BatchRow.objects.create(
+                    batch_row_bulk_creator.add(BatchRow(
                         batch_header_id=batch_header_id,
                         batch_row_000=get_value_from_dict(one_dict, get_value_if_index_in_list(remote_source_keys, 0)),
                         batch_row_001=get_value_from_dict(one_dict, get_value_if_index_in_list(remote_source_keys, 1)),
@@ -1237,21 +1319,28 @@ class BatchManager(models.Manager):
                         google_civic_election_id=local_google_civic_election_id,
                         polling_location_we_vote_id=local_polling_location_we_vote_id,
                         state_code=local_state_code,
-                    )
-                    number_of_batch_rows += 1
+                    ))
                 except Exception as e:
                     # Stop trying to save rows -- break out of the for loop
                     status += "EXCEPTION_BATCH_ROW_FOR_JSON " + str(e) + " "
+                    success = False
                     break
         else:
             status += "NO_BATCH_HEADER_ID "
 
+        batch_row_results = batch_row_bulk_creator.save_remaining()
+        status += batch_row_results['status']
+        if not batch_row_results['success']:
+            success = False
+        number_of_batch_rows = batch_row_results['number_of_batch_rows']
+
         results = {
             'success':              success,
             'status':               status,
             'batch_header_id':      batch_header_id,
             'batch_saved':          success,
             'number_of_batch_rows': number_of_batch_rows,
+            'batch_rows_per_second': batch_row_results['batch_rows_per_second'],
         }
         return results
 
@@ -2105,7 +2194,7 @@ class BatchManager(models.Manager):
         """
         # Process BallotMeasureContest data
 
-        number_of_batch_rows = 0
+        batch_row_bulk_creator = BatchRowBulkCreator()
         first_line = True
         success = True
         status = ''
@@ -2117,7 +2206,7 @@ class BatchManager(models.Manager):
         ballot_measure_xml_node = xml_root.findall('BallotMeasureContest')
         # if ballot_measure_xml_node is not None:
         for one_ballot_measure in ballot_measure_xml_node:
-            if positive_value_exists(limit_for_testing) and number_of_batch_rows >= limit_for_testing:
+            if positive_value_exists(limit_for_testing) and len(batch_row_bulk_creator) >= limit_for_testing:
                 break
 
             # look for relevant child nodes under BallotMeasureContest: id, BallotTitle, BallotSubTitle,
@@ -2215,7 +2304,7 @@ class BatchManager(models.Manager):
                          positive_value_exists(ballot_measure_name))):
 
                 try:
-                    batch_row = BatchRow.objects.create(
+                    batch_row_bulk_creator.add(BatchRow(
                         batch_header_id=batch_header_id,
                         batch_row_000=ballot_measure_id,
                         batch_row_001=ballot_measure_subtitle,
@@ -2223,18 +2312,25 @@ class BatchManager(models.Manager):
                         batch_row_003=electoral_district_id,
                         batch_row_004=ctcl_uuid,
                         batch_row_005=ballot_measure_name
-                    )
-                    number_of_batch_rows += 1
+                    ))
                 except Exception as e:
                     # Stop trying to save rows -- break out of the for loop
                     status += " EXCEPTION_BATCH_ROW " + str(e) + " "
+                    success = False
                     break
+        batch_row_results = batch_row_bulk_creator.save_remaining()
+        status += batch_row_results['status']
+        if not batch_row_results['success']:
+            success = False
+        number_of_batch_rows = batch_row_results['number_of_batch_rows']
+
         results = {
             'success': success,
             'status': status,
             'batch_header_id': batch_header_id,
             'batch_saved': success,
             'number_of_batch_rows': number_of_batch_rows,
+            'batch_rows_per_second': batch_row_results['batch_rows_per_second'],
         }
         return results
 
@@ -2250,7 +2346,7 @@ class BatchManager(models.Manager):
         :return:
         """
         # Process VIP Office data
-        number_of_batch_rows = 0
+        batch_row_bulk_creator = BatchRowBulkCreator()
         first_line = True
         success = False
         status = ''
@@ -2262,7 +2358,7 @@ class BatchManager(models.Manager):
         elected_office_xml_node = xml_root.findall('Office')
         # if ballot_measure_xml_node is not None:
         for one_elected_office in elected_office_xml_node:
-            if positive_value_exists(limit_for_testing) and number_of_batch_rows >= limit_for_testing:
+            if positive_value_exists(limit_for_testing) and len(batch_row_bulk_creator) >= limit_for_testing:
                 break
 
             # look for relevant child nodes under Office: id, Name, Description, ElectoralDistrictId,
@@ -2376,7 +2472,7 @@ class BatchManager(models.Manager):
                     (positive_value_exists(electoral_district_id) or positive_value_exists(elected_office_name)) or \
                     positive_value_exists(elected_office_name_es):
                 try:
-                    batch_row = BatchRow.objects.create(
+                    batch_row_bulk_creator.add(BatchRow(
                         batch_header_id=batch_header_id,
                         batch_row_000=elected_office_id,
                         batch_row_001=elected_office_name,
@@ -2386,19 +2482,26 @@ class BatchManager(models.Manager):
                         batch_row_005=electoral_district_id,
                         batch_row_006=elected_office_is_partisan,
                         batch_row_007=ctcl_uuid
-                    )
-                    number_of_batch_rows += 1
+                    ))
                 except Exception as e:
                     # Stop trying to save rows -- break out of the for loop
                     status += " EXCEPTION_BATCH_ROW " + str(e) + " "
                     handle_exception(e, logger=logger, exception_message=status)
+                    success = False
                     break
+        batch_row_results = batch_row_bulk_creator.save_remaining()
+        status += batch_row_results['status']
+        if not batch_row_results['success']:
+            success = False
+        number_of_batch_rows = batch_row_results['number_of_batch_rows']
+
         results = {
             'success': success,
             'status': status,
             'batch_header_id': batch_header_id,
             'batch_saved': success,
             'number_of_batch_rows': number_of_batch_rows,
+            'batch_rows_per_second': batch_row_results['batch_rows_per_second'],
         }
         return results
 
@@ -2415,7 +2518,7 @@ class BatchManager(models.Manager):
         """
         from import_export_ctcl.controllers import retrieve_candidate_from_candidate_selection
         # Process VIP CandidateContest data
-        number_of_batch_rows = 0
+        batch_row_bulk_creator = BatchRowBulkCreator()
         first_line = True
         success = True
         status = ''
@@ -2432,7 +2535,7 @@ class BatchManager(models.Manager):
         contest_office_xml_node = xml_root.findall('CandidateContest')
         # if contest_office_xml_node is not None:
         for one_contest_office in contest_office_xml_node:
-            if positive_value_exists(limit_for_testing) and number_of_batch_rows >= limit_for_testing:
+            if positive_value_exists(limit_for_testing) and len(batch_row_bulk_creator) >= limit_for_testing:
                 break
 
             # look for relevant child nodes under CandidateContest: id, Name, OfficeId, ElectoralDistrictId,
@@ -2576,7 +2679,7 @@ class BatchManager(models.Manager):
             if positive_value_exists(contest_office_id) and positive_value_exists(ctcl_uuid) and \
                     (positive_value_exists(electoral_district_id) or positive_value_exists(contest_office_name)):
                 try:
-                    batch_row = BatchRow.objects.create(
+                    batch_row_bulk_creator.add(BatchRow(
                         batch_header_id=batch_header_id,
                         batch_row_000=contest_office_id,
                         batch_row_001=contest_office_name,
@@ -2595,19 +2698,26 @@ class BatchManager(models.Manager):
                         batch_row_014=candidate_selection_ids_dict.get('candidate_selection_id_8', ''),
                         batch_row_015=candidate_selection_ids_dict.get('candidate_selection_id_9', ''),
                         batch_row_016=candidate_selection_ids_dict.get('candidate_selection_id_10', ''),
-                    )
-                    number_of_batch_rows += 1
+                    ))
                 except Exception as e:
                     # Stop trying to save rows -- break out of the for loop
                     status += " EXCEPTION_BATCH_ROW " + str(e) + " "
                     handle_exception(e, logger=logger, exception_message=status)
+                    success = False
                     break
+        batch_row_results = batch_row_bulk_creator.save_remaining()
+        status += batch_row_results['status']
+        if not batch_row_results['success']:
+            success = False
+        number_of_batch_rows = batch_row_results['number_of_batch_rows']
+
         results = {
             'success': success,
             'status': status,
             'batch_header_id': batch_header_id,
             'batch_saved': success,
             'number_of_batch_rows': number_of_batch_rows,
+            'batch_rows_per_second': batch_row_results['batch_rows_per_second'],
         }
         return results
 
@@ -2623,7 +2733,7 @@ class BatchManager(models.Manager):
         :return:
         """
         # Process VIP Person data
-        number_of_batch_rows = 0
+        batch_row_bulk_creator = BatchRowBulkCreator()
         first_line = True
         success = True
         status = ''
@@ -2637,7 +2747,7 @@ class BatchManager(models.Manager):
         # of VipObject
         person_xml_node = xml_root.findall('Person')
         for one_person in person_xml_node:
-            if positive_value_exists(limit_for_testing) and number_of_batch_rows >= limit_for_testing:
+            if positive_value_exists(limit_for_testing) and len(batch_row_bulk_creator) >= limit_for_testing:
                 break
 
             # look for relevant child nodes under Person: id, FullName, FirstName, LastName, MiddleName, PartyId, Email,
@@ -2809,7 +2919,7 @@ class BatchManager(models.Manager):
             if positive_value_exists(person_id) and positive_value_exists(ctcl_uuid) and \
                     (positive_value_exists(person_full_name) or positive_value_exists(person_first_name)):
                 try:
-                    batch_row = BatchRow.objects.create(
+                    batch_row_bulk_creator.add(BatchRow(
                         batch_header_id=batch_header_id,
                         batch_row_000=person_id,
                         batch_row_001=person_full_name,
@@ -2825,19 +2935,26 @@ class BatchManager(models.Manager):
                         batch_row_011=person_youtube_id,
                         batch_row_012=person_googleplus_id,
                         batch_row_013=ctcl_uuid,
-                    )
-                    number_of_batch_rows += 1
+                    ))
                 except Exception as e:
                     # Stop trying to save rows -- break out of the for loop
                     status += " EXCEPTION_BATCH_ROW " + str(e) + " "
                     handle_exception(e, logger=logger, exception_message=status)
+                    success = False
                     break
+        batch_row_results = batch_row_bulk_creator.save_remaining()
+        status += batch_row_results['status']
+        if not batch_row_results['success']:
+            success = False
+        number_of_batch_rows = batch_row_results['number_of_batch_rows']
+
         results = {
             'success': success,
             'status': status,
             'batch_header_id': batch_header_id,
             'batch_saved': success,
             'number_of_batch_rows': number_of_batch_rows,
+            'batch_rows_per_second': batch_row_results['batch_rows_per_second'],
         }
         return results
 
@@ -2853,7 +2970,7 @@ class BatchManager(models.Manager):
         :return:
         """
         # Process VIP Candidate data
-        number_of_batch_rows = 0
+        batch_row_bulk_creator = BatchRowBulkCreator()
         first_line = True
         success = True
         status = ''
@@ -2867,7 +2984,7 @@ class BatchManager(models.Manager):
         # of VipObject
         candidate_xml_node = xml_root.findall('Candidate')
         for one_candidate in candidate_xml_node:
-            if positive_value_exists(limit_for_testing) and number_of_batch_rows >= limit_for_testing:
+            if positive_value_exists(limit_for_testing) and len(batch_row_bulk_creator) >= limit_for_testing:
                 break
 
             candidate_name_english = None
@@ -2974,7 +3091,7 @@ class BatchManager(models.Manager):
             if positive_value_exists(candidate_id) and positive_value_exists(ctcl_uuid) and \
                     (positive_value_exists(candidate_ctcl_person_id) or positive_value_exists(candidate_name_english)):
                 try:
-                    batch_row = BatchRow.objects.create(
+                    batch_row_bulk_creator.add(BatchRow(
                         batch_header_id=batch_header_id,
                         batch_row_000=candidate_id,
                         batch_row_001=candidate_ctcl_person_id,
@@ -2983,8 +3100,7 @@ class BatchManager(models.Manager):
                         batch_row_004=candidate_is_top_ticket,
                         batch_row_005=ctcl_uuid,
                         batch_row_006=candidate_selection_id
-                    )
-                    number_of_batch_rows += 1
+                    ))
                 except Exception as e:
                     # Stop trying to save rows -- break out of the for loop
                     status += " EXCEPTION_BATCH_ROW " + str(e) + " "
@@ -2992,12 +3108,19 @@ class BatchManager(models.Manager):
                     success = False
 
                     break
+        batch_row_results = batch_row_bulk_creator.save_remaining()
+        status += batch_row_results['status']
+        if not batch_row_results['success']:
+            success = False
+        number_of_batch_rows = batch_row_results['number_of_batch_rows']
+
         results = {
             'success': success,
             'status': status,
             'batch_header_id': batch_header_id,
             'batch_saved': success,
             'number_of_batch_rows': number_of_batch_rows,
+            'batch_rows_per_second': batch_row_results['batch_rows_per_second'],
         }
         return results
 
@@ -3014,7 +3137,7 @@ class BatchManager(models.Manager):
         """
         # This state is not used right now. Parsing it for future reference
         # Process VIP State data
-        number_of_batch_rows = 0
+        batch_row_bulk_creator = BatchRowBulkCreator()
         first_line = True
         success = True
         status = ''
@@ -3026,7 +3149,7 @@ class BatchManager(models.Manager):
         state_xml_node = xml_root.findall('State')
         for one_state in state_xml_node:
             state_name = None
-            if positive_value_exists(limit_for_testing) and number_of_batch_rows >= limit_for_testing:
+            if positive_value_exists(limit_for_testing) and len(batch_row_bulk_creator) >= limit_for_testing:
                 break
 
             # look for relevant child nodes under State: id, ocd-id, Name
@@ -3092,13 +3215,12 @@ class BatchManager(models.Manager):
             # check for state_id or name AND ocd_id
             if positive_value_exists(state_id) and (positive_value_exists(state_name)):
                 try:
-                    batch_row = BatchRow.objects.create(
+                    batch_row_bulk_creator.add(BatchRow(
                         batch_header_id=batch_header_id,
                         batch_row_000=state_id,
                         batch_row_001=state_name,
                         batch_row_002=ocd_id,
-                    )
-                    number_of_batch_rows += 1
+                    ))
                 except Exception as e:
                     # Stop trying to save rows -- break out of the for loop
                     status += " EXCEPTION_BATCH_ROW " + str(e) + " "
@@ -3106,12 +3228,19 @@ class BatchManager(models.Manager):
                     success = False
 
                     break
+        batch_row_results = batch_row_bulk_creator.save_remaining()
+        status += batch_row_results['status']
+        if not batch_row_results['success']:
+            success = False
+        number_of_batch_rows = batch_row_results['number_of_batch_rows']
+
         results = {
             'success': success,
             'status': status,
             'batch_header_id': batch_header_id,
             'batch_saved': success,
             'number_of_batch_rows': number_of_batch_rows,
+            'batch_rows_per_second': batch_row_results['batch_rows_per_second'],
         }
         return results
 
@@ -4726,6 +4855,33 @@ class BatchHeaderTranslationSuggestion(models.Model):
     incoming_alternate_header_value = models.TextField(null=True, blank=True)
 
 
+def fetch_batch_process_checked_out_expiration_time(kind_of_process):
+    """
+    How many seconds a BatchProcess can stay checked out (date_checked_out) before another worker may take it over
+    :param kind_of_process:
+    :return:
+    """
+    # See also longest_activity_notice_processing_run_time_allowed
+    if kind_of_process == ACTIVITY_NOTICE_PROCESS:
+        return 270  # 4.5 minutes * 60 seconds
+    elif kind_of_process == API_REFRESH_REQUEST:
+        return 360  # 6 minutes * 60 seconds
+    elif kind_of_process in [
+            REFRESH_BALLOT_ITEMS_FROM_POLLING_LOCATIONS, REFRESH_BALLOT_ITEMS_FROM_VOTERS,
+            RETRIEVE_BALLOT_ITEMS_FROM_POLLING_LOCATIONS]:
+        return 1800  # 30 minutes * 60 seconds
+    elif kind_of_process in [
+            AUGMENT_ANALYTICS_ACTION_WITH_ELECTION_ID, AUGMENT_ANALYTICS_ACTION_WITH_FIRST_VISIT,
+            CALCULATE_ORGANIZATION_DAILY_METRICS, CALCULATE_ORGANIZATION_ELECTION_METRICS,
+            CALCULATE_SITEWIDE_ELECTION_METRICS, CALCULATE_SITEWIDE_VOTER_METRICS,
+            CALCULATE_SITEWIDE_DAILY_METRICS]:
+        return 600  # 10 minutes * 60 seconds
+    elif kind_of_process == SEARCH_TWITTER_FOR_CANDIDATE_TWITTER_HANDLE:
+        return 300  # 5 minutes * 60 seconds - See SEARCH_TWITTER_TIMED_OUT
+    else:
+        return 1800  # 30 minutes * 60 seconds
+
+
 class BatchProcessManager(models.Manager):
 
     def __unicode__(self):
@@ -4980,6 +5136,134 @@ class BatchProcessManager(models.Manager):
         }
         return results
 
+    def claim_next_batch_process(
+            self,
+            kind_of_process_list=[],
+            number_of_simultaneous_processes=1,
+            restart_active_first=False,
+            for_upcoming_elections=False):
+        """
+        Check out the next BatchProcess of these kinds that needs to be run, so that any number of workers on any
+        number of servers can share the queue. The row is locked with SELECT ... FOR UPDATE SKIP LOCKED, so two workers
+        never take the same BatchProcess, and date_checked_out serves as the lease: it must be renewed with
+        renew_batch_process_lease, or another worker takes the process over once
+        fetch_batch_process_checked_out_expiration_time has passed. Each claim sets a new checked_out_lease_token,
+        which the worker passes to renew_batch_process_lease and release_batch_process.
+        :param kind_of_process_list:
+        :param number_of_simultaneous_processes: Most BatchProcesses of these kinds checked out at once, on all servers
+        :param restart_active_first: Pick up processes that have been started before ones still waiting in the queue
+        :param for_upcoming_elections:
+        :return:
+        """
+        status = ""
+        success = True
+        batch_process = None
+        batch_process_found = False
+
+        google_civic_election_id_list = []
+        if positive_value_exists(for_upcoming_elections):
+            # Limit this search to upcoming_elections only, or no election specified
+            election_manager = ElectionManager()
+            results = election_manager.retrieve_upcoming_elections()
+            google_civic_election_id_list = [0]
+            for one_election in results['election_list']:
+                google_civic_election_id_list.append(one_election.google_civic_election_id)
+
+        lease_expired_filters = Q()
+        lease_active_filters = Q()
+        for kind_of_process in kind_of_process_list:
+            date_lease_expired = \
+                now() - timedelta(seconds=fetch_batch_process_checked_out_expiration_time(kind_of_process))
+            lease_expired_filters |= Q(kind_of_process=kind_of_process, date_checked_out__lt=date_lease_expired)
+            lease_active_filters |= Q(kind_of_process=kind_of_process, date_checked_out__gte=date_lease_expired)
+
+        try:
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    # Only one worker at a time counts and claims within these kinds, so the limit holds everywhere
+                    pool_lock_id = zlib.crc32(",".join(sorted(kind_of_process_list)).encode('utf-8'))
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [pool_lock_id])
+
+                batch_process_queryset = BatchProcess.objects.filter(kind_of_process__in=kind_of_process_list)
+                batch_process_queryset = batch_process_queryset.filter(date_completed__isnull=True)
+                batch_process_queryset = batch_process_queryset.exclude(batch_process_paused=True)
+                if positive_value_exists(for_upcoming_elections):
+                    batch_process_queryset = batch_process_queryset.filter(
+                        google_civic_election_id__in=google_civic_election_id_list)
+
+                checked_out_count = batch_process_queryset.filter(lease_active_filters).count()
+                if checked_out_count >= number_of_simultaneous_processes:
+                    status += "BATCH_PROCESSES_ALREADY_CHECKED_OUT: " + str(checked_out_count) + " "
+                else:
+                    batch_process_queryset = batch_process_queryset.filter(
+                        Q(date_checked_out__isnull=True) | lease_expired_filters)
+                    batch_process_queryset = batch_process_queryset.select_for_update(skip_locked=True)
+                    batch_process_list = []
+                    if positive_value_exists(restart_active_first):
+                        batch_process_list = \
+                            list(batch_process_queryset.filter(date_started__isnull=False).order_by('id')[:1])
+                    if not len(batch_process_list):
+                        batch_process_list = list(batch_process_queryset.order_by('id')[:1])
+                    if len(batch_process_list):
+                        batch_process = batch_process_list[0]
+                        batch_process.date_checked_out = now()
+                        batch_process.checked_out_lease_token = uuid.uuid4().hex
+                        batch_process.save(update_fields=['date_checked_out', 'checked_out_lease_token'])
+                        batch_process_found = True
+                        status += "BATCH_PROCESS_CLAIMED "
+                    else:
+                        status += "NO_BATCH_PROCESS_TO_CLAIM "
+        except Exception as e:
+            status += "FAILED_TO_CLAIM_BATCH_PROCESS: " + str(e) + " "
+            success = False
+            batch_process = None
+            batch_process_found = False
+
+        results = {
+            'success':              success,
+            'status':               status,
+            'batch_process':        batch_process,
+            'batch_process_found':  batch_process_found,
+        }
+        return results
+
+    def renew_batch_process_lease(self, batch_process_id, checked_out_lease_token):
+        """
+        Heartbeat from the worker running this BatchProcess, so it is not taken over while still being worked on
+        :param batch_process_id:
+        :param checked_out_lease_token: From the claim_next_batch_process that checked this BatchProcess out
+        :return: True if the BatchProcess is still checked out under this lease
+        """
+        if not positive_value_exists(checked_out_lease_token):
+            return False
+        try:
+            return positive_value_exists(
+                BatchProcess.objects.filter(id=batch_process_id, checked_out_lease_token=checked_out_lease_token,
+                                            date_checked_out__isnull=False,
+                                            date_completed__isnull=True).update(date_checked_out=now()))
+        except Exception as e:
+            handle_exception(e, logger=logger, exception_message="FAILED_TO_RENEW_BATCH_PROCESS_LEASE ")
+            return False
+
+    def release_batch_process(self, batch_process_id, checked_out_lease_token):
+        """
+        Check the BatchProcess back in so the next step can be claimed by any worker. Does nothing if another worker
+        has taken the BatchProcess over since this lease was claimed.
+        :param batch_process_id:
+        :param checked_out_lease_token: From the claim_next_batch_process that checked this BatchProcess out
+        :return: True if this lease was released
+        """
+        if not positive_value_exists(checked_out_lease_token):
+            return False
+        try:
+            return positive_value_exists(
+                BatchProcess.objects.filter(id=batch_process_id, checked_out_lease_token=checked_out_lease_token)
+                .update(date_checked_out=None, checked_out_lease_token=None))
+        except Exception as e:
+            handle_exception(e, logger=logger, exception_message="FAILED_TO_RELEASE_BATCH_PROCESS ")
+            return False
+
     def count_active_batch_processes(self):
         status = ""
         batch_process_count = 0
@@ -5204,25 +5488,8 @@ class BatchProcessManager(models.Manager):
                 if batch_process.date_checked_out is None:
                     filtered_batch_process_list.append(batch_process)
                 else:
-                    # See also longest_activity_notice_processing_run_time_allowed
-                    if batch_process.kind_of_process == ACTIVITY_NOTICE_PROCESS:
-                        checked_out_expiration_time = 270  # 4.5 minutes * 60 seconds
-                    elif batch_process.kind_of_process == API_REFRESH_REQUEST:
-                        checked_out_expiration_time = 360  # 6 minutes * 60 seconds
-                    elif batch_process.kind_of_process in [
-                            REFRESH_BALLOT_ITEMS_FROM_POLLING_LOCATIONS, REFRESH_BALLOT_ITEMS_FROM_VOTERS,
-                            RETRIEVE_BALLOT_ITEMS_FROM_POLLING_LOCATIONS]:
-                        checked_out_expiration_time = 1800  # 30 minutes * 60 seconds
-                    elif batch_process.kind_of_process in [
-                            AUGMENT_ANALYTICS_ACTION_WITH_ELECTION_ID, AUGMENT_ANALYTICS_ACTION_WITH_FIRST_VISIT,
-                            CALCULATE_ORGANIZATION_DAILY_METRICS, CALCULATE_ORGANIZATION_ELECTION_METRICS,
-                            CALCULATE_SITEWIDE_ELECTION_METRICS, CALCULATE_SITEWIDE_VOTER_METRICS,
-                            CALCULATE_SITEWIDE_DAILY_METRICS]:
-                        checked_out_expiration_time = 600  # 10 minutes * 60 seconds
-                    elif batch_process.kind_of_process == SEARCH_TWITTER_FOR_CANDIDATE_TWITTER_HANDLE:
-                        checked_out_expiration_time = 300  # 5 minutes * 60 seconds - See SEARCH_TWITTER_TIMED_OUT
-                    else:
-                        checked_out_expiration_time = 1800  # 30 minutes * 60 seconds
+                    checked_out_expiration_time = \
+                        fetch_batch_process_checked_out_expiration_time(batch_process.kind_of_process)
                     date_checked_out_time_out = \
                         batch_process.date_checked_out + timedelta(seconds=checked_out_expiration_time)
                     status += "CHECKED_OUT_PROCESS_FOUND "
@@ -5379,6 +5646,9 @@ class BatchProcess(models.Model):
     # When a batch_process is running, we mark when it was "taken off the shelf" to be worked on.
     #  When the process is complete, we should reset this to "NULL"
     date_checked_out = models.DateTimeField(null=True)
+    # Set to a new random value by each claim_next_batch_process, so only the worker holding the lease renews or
+    #  releases it
+    checked_out_lease_token = models.CharField(max_length=32, null=True, blank=True)
     batch_process_paused = models.BooleanField(default=False)
     completion_summary = models.TextField(null=True, blank=True)
     use_ballotpedia = models.BooleanField(default=False)
@@ -0,0 +1,222 @@
+from ballot.models import BallotItem
+from datetime import timedelta
+from django.test import TestCase
+from django.utils.timezone import now
+from unittest import mock
+from import_export_batches.controllers import create_batch_row_actions, retrieve_ballot_item_batch_analysis_dict
+from import_export_batches.models import API_REFRESH_REQUEST, BatchDescription, BatchHeaderMap, BatchManager, \
+    BatchProcess, BatchProcessManager, BatchRow, BatchRowActionBallotItem, BatchRowBulkCreator, \
+    fetch_batch_process_checked_out_expiration_time, IMPORT_ADD_TO_EXISTING, IMPORT_BALLOT_ITEM, IMPORT_CREATE, \
+    IMPORT_DELETE
+from measure.models import ContestMeasure
+from office.models import ContestOffice
+
+
+class BatchRowBulkCreateTestCase(TestCase):
+
+    def test_bulk_creator_writes_rows_in_chunks(self):
+        batch_row_bulk_creator = BatchRowBulkCreator(batch_size=2)
+        for index in range(5):
+            batch_row_bulk_creator.add(BatchRow(batch_header_id=1, batch_row_000='row ' + str(index)))
+        # Two full chunks have been written, the fifth row is still queued
+        self.assertEqual(BatchRow.objects.filter(batch_header_id=1).count(), 4)
+        results = batch_row_bulk_creator.save_remaining()
+        self.assertTrue(results['success'], results['status'])
+        self.assertEqual(results['number_of_batch_rows'], 5)
+        self.assertIn('BATCH_ROWS_SAVED: 5 IN 3 INSERTS', results['status'])
+        self.assertEqual(sorted(BatchRow.objects.filter(batch_header_id=1).values_list('batch_row_000', flat=True)),
+                         ['row ' + str(index) for index in range(5)])
+
+    def test_create_batch_from_json_saves_every_row(self):
+        structured_json_list = [
+            {'ballot_item_display_name': 'Office ' + str(index), 'state_code': 'CA'} for index in range(3)]
+        mapping_dict = {'ballot_item_display_name': 'ballot_item_display_name', 'state_code': 'state_code'}
+        results = BatchManager().create_batch_from_json(
+            'ballot_items.json', structured_json_list, mapping_dict, IMPORT_BALLOT_ITEM, google_civic_election_id=1)
+        self.assertTrue(results['batch_saved'], results['status'])
+        self.assertEqual(results['number_of_batch_rows'], 3)
+        self.assertIn('batch_rows_per_second', results)
+        batch_row_list = BatchRow.objects.filter(batch_header_id=results['batch_header_id']).order_by('id')
+        self.assertEqual([batch_row.batch_row_000 for batch_row in batch_row_list],
+                         ['Office 0', 'Office 1', 'Office 2'])
+        self.assertEqual({batch_row.state_code for batch_row in batch_row_list}, {'CA'})
+
+    def test_failed_final_write_is_reported(self):
+        structured_json_list = [{'ballot_item_display_name': 'Office 0', 'state_code': 'CA'}]
+        mapping_dict = {'ballot_item_display_name': 'ballot_item_display_name', 'state_code': 'state_code'}
+        with mock.patch.object(BatchRow.objects, 'bulk_create', side_effect=Exception('database down')):
+            results = BatchManager().create_batch_from_json(
+                'ballot_items.json', structured_json_list, mapping_dict, IMPORT_BALLOT_ITEM,
+                google_civic_election_id=1)
+        self.assertFalse(results['batch_saved'])
+        self.assertFalse(results['success'])
+        self.assertEqual(results['number_of_batch_rows'], 0)
+
+    def test_failed_write_in_the_middle_is_reported(self):
+        structured_json_list = [{'ballot_item_display_name': 'Office ' + str(index), 'state_code': 'CA'}
+                                for index in range(3)]
+        mapping_dict = {'ballot_item_display_name': 'ballot_item_display_name', 'state_code': 'state_code'}
+        with mock.patch('import_export_batches.models.BatchRowBulkCreator',
+                        lambda: BatchRowBulkCreator(batch_size=1)), \
+                mock.patch.object(BatchRow.objects, 'bulk_create', side_effect=[[], Exception('database down')]):
+            results = BatchManager().create_batch_from_json(
+                'ballot_items.json', structured_json_list, mapping_dict, IMPORT_BALLOT_ITEM,
+                google_civic_election_id=1)
+        self.assertFalse(results['batch_saved'])
+        self.assertIn("EXCEPTION_BATCH_ROW_FOR_JSON", results['status'])
+        self.assertEqual(results['number_of_batch_rows'], 1)
+
+
+class BallotItemBatchAnalysisTestCase(TestCase):
+
+    def setUp(self):
+        ContestOffice.objects.create(
+            we_vote_id='wv01off1', office_name='Mayor', google_civic_election_id='1000', state_code='ca')
+        ContestOffice.objects.create(
+            we_vote_id='wv01off2', office_name='Sheriff', google_civic_election_id='1000', state_code='ca')
+        ContestMeasure.objects.create(
+            we_vote_id='wv01meas1', measure_title='Measure A', google_civic_election_id='1000', state_code='ca')
+        self.sheriff_ballot_item = BallotItem.objects.create(
+            google_civic_election_id='1000', polling_location_we_vote_id='wv01ploc1',
+            contest_office_we_vote_id='wv01off2', ballot_item_display_name='Sheriff')
+        self.retired_ballot_item = BallotItem.objects.create(
+            google_civic_election_id='1000', polling_location_we_vote_id='wv01ploc1',
+            contest_office_we_vote_id='wv01off3', ballot_item_display_name='Dog Catcher')
+        structured_json_list = [
+            {'polling_location_we_vote_id': 'wv01ploc1', 'contest_office_name': 'mayor', 'state_code': 'CA'},
+            {'polling_location_we_vote_id': 'wv01ploc1', 'contest_office_name': 'Sheriff', 'state_code': 'CA'},
+            {'polling_location_we_vote_id': 'wv01ploc1', 'contest_measure_name': 'Measure A', 'state_code': 'CA'},
+        ]
+        mapping_dict = {key: key for key in ['polling_location_we_vote_id', 'contest_office_name',
+                                             'contest_measure_name', 'state_code']}
+        results = BatchManager().create_batch_from_json(
+            'ballot_items.json', structured_json_list, mapping_dict, IMPORT_BALLOT_ITEM, google_civic_election_id=1000)
+        self.batch_header_id = results['batch_header_id']
+
+    def test_create_batch_row_actions_for_ballot_items(self):
+        results = create_batch_row_actions(self.batch_header_id)
+        self.assertTrue(results['success'], results['status'])
+        self.assertEqual(results['number_of_batch_actions_created'], 3)
+        self.assertEqual(results['number_of_batch_action_deletes_created'], 1)
+        self.assertIn('1000', results['ballot_item_lookups_dict'])
+
+        action_query = BatchRowActionBallotItem.objects.filter(batch_header_id=self.batch_header_id)
+        self.assertEqual(
+            sorted(action_query.exclude(kind_of_action=IMPORT_DELETE).values_list(
+                'contest_office_we_vote_id', 'contest_measure_we_vote_id', 'kind_of_action', 'ballot_item_id')),
+            [('', 'wv01meas1', IMPORT_CREATE, 0),
+             ('wv01off1', '', IMPORT_CREATE, 0),
+             ('wv01off2', '', IMPORT_ADD_TO_EXISTING, self.sheriff_ballot_item.id)])
+        self.assertEqual(
+            list(action_query.filter(kind_of_action=IMPORT_DELETE).values_list('ballot_item_id', flat=True)),
+            [self.retired_ballot_item.id])
+        self.assertFalse(
+            BatchRow.objects.filter(batch_header_id=self.batch_header_id, batch_row_analyzed=False).exists())
+
+        # Analyzing again updates the existing entries rather than adding more
+        results = create_batch_row_actions(self.batch_header_id)
+        self.assertEqual(results['number_of_batch_actions_updated'], 3)
+        self.assertEqual(BatchRowActionBallotItem.objects.filter(batch_header_id=self.batch_header_id).count(), 4)
+
+    def test_voter_ballot_items_are_not_preloaded(self):
+        BallotItem.objects.create(
+            google_civic_election_id='1000', polling_location_we_vote_id='', voter_id=1,
+            contest_office_we_vote_id='wv01off1', ballot_item_display_name='Mayor')
+        structured_json_list = [{'contest_office_name': 'Mayor', 'state_code': 'CA'}]
+        mapping_dict = {key: key for key in ['contest_office_name', 'state_code']}
+        results = BatchManager().create_batch_from_json(
+            'voter_ballot_items.json', structured_json_list, mapping_dict, IMPORT_BALLOT_ITEM,
+            google_civic_election_id=1000)
+        batch_header_id = results['batch_header_id']
+
+        results = retrieve_ballot_item_batch_analysis_dict(
+            BatchDescription.objects.get(batch_header_id=batch_header_id),
+            BatchHeaderMap.objects.get(batch_header_id=batch_header_id),
+            list(BatchRow.objects.filter(batch_header_id=batch_header_id)))
+        self.assertTrue(results['success'], results['status'])
+        self.assertEqual(results['ballot_item_batch_analysis_dict']['existing_ballot_item_dict'], {})
+
+        results = retrieve_ballot_item_batch_analysis_dict(
+            BatchDescription.objects.get(batch_header_id=self.batch_header_id),
+            BatchHeaderMap.objects.get(batch_header_id=self.batch_header_id),
+            list(BatchRow.objects.filter(batch_header_id=self.batch_header_id)))
+        self.assertEqual(list(results['ballot_item_batch_analysis_dict']['existing_ballot_item_dict'].values()),
+                         [self.sheriff_ballot_item, self.retired_ballot_item])
+
+
+class BatchProcessClaimTestCase(TestCase):
+
+    def setUp(self):
+        self.batch_process_manager = BatchProcessManager()
+        self.first_batch_process = BatchProcess.objects.create(kind_of_process=API_REFRESH_REQUEST)
+        self.second_batch_process = BatchProcess.objects.create(kind_of_process=API_REFRESH_REQUEST)
+        BatchProcess.objects.create(kind_of_process=API_REFRESH_REQUEST, batch_process_paused=True)
+
+    def test_claim_respects_number_of_simultaneous_processes(self):
+        results = self.batch_process_manager.claim_next_batch_process(
+            kind_of_process_list=[API_REFRESH_REQUEST], number_of_simultaneous_processes=1)
+        self.assertTrue(results['batch_process_found'], results['status'])
+        self.assertEqual(results['batch_process'].id, self.first_batch_process.id)
+        self.assertIsNotNone(BatchProcess.objects.get(id=self.first_batch_process.id).date_checked_out)
+
+        results = self.batch_process_manager.claim_next_batch_process(
+            kind_of_process_list=[API_REFRESH_REQUEST], number_of_simultaneous_processes=1)
+        self.assertFalse(results['batch_process_found'])
+
+        results = self.batch_process_manager.claim_next_batch_process(
+            kind_of_process_list=[API_REFRESH_REQUEST], number_of_simultaneous_processes=2)
+        self.assertEqual(results['batch_process'].id, self.second_batch_process.id)
+
+        results = self.batch_process_manager.claim_next_batch_process(
+            kind_of_process_list=[API_REFRESH_REQUEST], number_of_simultaneous_processes=5)
+        self.assertFalse(results['batch_process_found'], 'Paused processes are never claimed')
+
+    def test_expired_lease_can_be_claimed_and_released_lease_is_cleared(self):
+        lease_expired = now() - timedelta(seconds=fetch_batch_process_checked_out_expiration_time(
+            API_REFRESH_REQUEST) + 1)
+        BatchProcess.objects.filter(id=self.first_batch_process.id).update(
+            date_checked_out=lease_expired, checked_out_lease_token='first')
+        BatchProcess.objects.filter(id=self.second_batch_process.id).update(
+            date_checked_out=now(), checked_out_lease_token='second')
+        self.assertTrue(self.batch_process_manager.renew_batch_process_lease(self.second_batch_process.id, 'second'))
+
+        results = self.batch_process_manager.claim_next_batch_process(
+            kind_of_process_list=[API_REFRESH_REQUEST], number_of_simultaneous_processes=2)
+        self.assertEqual(results['batch_process'].id, self.first_batch_process.id)
+        checked_out_lease_token = results['batch_process'].checked_out_lease_token
+        self.assertNotIn(checked_out_lease_token, [None, 'first'])
+
+        self.assertTrue(
+            self.batch_process_manager.release_batch_process(self.first_batch_process.id, checked_out_lease_token))
+        batch_process = BatchProcess.objects.get(id=self.first_batch_process.id)
+        self.assertIsNone(batch_process.date_checked_out)
+        self.assertIsNone(batch_process.checked_out_lease_token)
+        self.assertFalse(
+            self.batch_process_manager.renew_batch_process_lease(self.first_batch_process.id, checked_out_lease_token))
+
+    def test_worker_whose_lease_was_taken_over_cannot_renew_or_release_it(self):
+        results = self.batch_process_manager.claim_next_batch_process(
+            kind_of_process_list=[API_REFRESH_REQUEST], number_of_simultaneous_processes=1)
+        first_lease_token = results['batch_process'].checked_out_lease_token
+        lease_expired = now() - timedelta(seconds=fetch_batch_process_checked_out_expiration_time(
+            API_REFRESH_REQUEST) + 1)
+        BatchProcess.objects.filter(id=self.first_batch_process.id).update(date_checked_out=lease_expired)
+
+        results = self.batch_process_manager.claim_next_batch_process(
+            kind_of_process_list=[API_REFRESH_REQUEST], number_of_simultaneous_processes=1)
+        self.assertEqual(results['batch_process'].id, self.first_batch_process.id, 'Taken over by a second worker')
+        second_lease_token = results['batch_process'].checked_out_lease_token
+
+        self.assertFalse(
+            self.batch_process_manager.renew_batch_process_lease(self.first_batch_process.id, first_lease_token))
+        self.assertFalse(
+            self.batch_process_manager.release_batch_process(self.first_batch_process.id, first_lease_token))
+        batch_process = BatchProcess.objects.get(id=self.first_batch_process.id)
+        self.assertIsNotNone(batch_process.date_checked_out, 'The second worker still holds the lease')
+        self.assertEqual(batch_process.checked_out_lease_token, second_lease_token)
+
+        results = self.batch_process_manager.claim_next_batch_process(
+            kind_of_process_list=[API_REFRESH_REQUEST], number_of_simultaneous_processes=1)
+        self.assertFalse(results['batch_process_found'])
+        self.assertTrue(
+            self.batch_process_manager.renew_batch_process_lease(self.first_batch_process.id, second_lease_token))
@@ -24,6 +24,7 @@ from .controllers_batch_process import process_next_activity_notices, process_ne
 from .controllers_ballotpedia import store_ballotpedia_json_response_to_import_batch_system
 from admin_tools.views import redirect_to_sign_in_page
 from ballot.models import BallotReturnedListManager, BallotReturnedManager, MEASURE, CANDIDATE, POLITICIAN
+from contextlib import closing
 import csv
 from datetime import date
 from django.contrib.auth.decorators import login_required
@@ -1509,7 +1510,7 @@ def batch_process_system_toggle_view(request):
     show_paused_processes_only = request.GET.get('show_paused_processes_only', '')
     include_frequent_processes = request.GET.get('include_frequent_processes', '')
 
-    from wevote_settings.models import WeVoteSettingsManager
+    from wevote_settings.models import WeVoteSetting, WeVoteSettingsManager
     we_vote_settings_manager = WeVoteSettingsManager()
     if kind_of_process == 'ACTIVITY_NOTICE_PROCESS':
         setting_name = 'batch_process_system_activity_notices_on'
@@ -1525,9 +1526,11 @@ def batch_process_system_toggle_view(request):
         setting_name = 'batch_process_system_on'
     results = we_vote_settings_manager.fetch_setting_results(setting_name=setting_name, read_only=False)
     if results['we_vote_setting_found']:
-        we_vote_setting = results['we_vote_setting']
-        we_vote_setting.boolean_value = not we_vote_setting.boolean_value
-        we_vote_setting.save()
+        # save_setting lets every batch process worker know about the change within seconds
+        we_vote_settings_manager.save_setting(
+            setting_name=setting_name,
+            setting_value=not results['we_vote_setting'].boolean_value,
+            value_type=WeVoteSetting.BOOLEAN)
     else:
         messages.add_message(request, messages.ERROR, "CANNOT_FIND_WE_VOTE_SETTING-batch_process_system_on")
 
@@ -2259,6 +2262,7 @@ def batch_set_batch_list_view(request):
     # Store static data in memory so we don't have to use the database
     election_objects_dict = {}
     office_objects_dict = {}
+    ballot_item_lookups_dict = {}
     measure_objects_dict = {}
 
     try:
@@ -2284,6 +2288,7 @@ def batch_set_batch_list_view(request):
                     election_objects_dict=election_objects_dict,
                     measure_objects_dict=measure_objects_dict,
                     office_objects_dict=office_objects_dict,
+                    ballot_item_lookups_dict=ballot_item_lookups_dict,
                 )
                 if results['batch_actions_created']:
                     batch_actions_analyzed += 1
@@ -2300,6 +2305,7 @@ def batch_set_batch_list_view(request):
                 election_objects_dict = results['election_objects_dict']
                 measure_objects_dict = results['measure_objects_dict']
                 office_objects_dict = results['office_objects_dict']
+                ballot_item_lookups_dict = results['ballot_item_lookups_dict']
                 start_create_batch_row_action_time_tracker = results['start_create_batch_row_action_time_tracker']
                 summary_of_create_batch_row_action_time_tracker.append(start_create_batch_row_action_time_tracker)
 
@@ -2319,6 +2325,7 @@ def batch_set_batch_list_view(request):
                         election_objects_dict=election_objects_dict,
                         measure_objects_dict=measure_objects_dict,
                         office_objects_dict=office_objects_dict,
+                        ballot_item_lookups_dict=ballot_item_lookups_dict,
                     )
                     if results['batch_actions_created']:
                         batch_actions_analyzed += 1
@@ -2334,6 +2341,7 @@ def batch_set_batch_list_view(request):
                     election_objects_dict = results['election_objects_dict']
                     measure_objects_dict = results['measure_objects_dict']
                     office_objects_dict = results['office_objects_dict']
+                    ballot_item_lookups_dict = results['ballot_item_lookups_dict']
                     start_create_batch_row_action_time_tracker = results['start_create_batch_row_action_time_tracker']
                     summary_of_create_batch_row_action_time_tracker.append(start_create_batch_row_action_time_tracker)
 
@@ -2425,6 +2433,7 @@ def batch_set_batch_list_view(request):
                     election_objects_dict=election_objects_dict,
                     measure_objects_dict=measure_objects_dict,
                     office_objects_dict=office_objects_dict,
+                    ballot_item_lookups_dict=ballot_item_lookups_dict,
                 )
                 if results['batch_actions_created']:
                     batch_actions_analyzed_for_deletes += 1
@@ -2433,6 +2442,7 @@ def batch_set_batch_list_view(request):
                 election_objects_dict = results['election_objects_dict']
                 measure_objects_dict = results['measure_objects_dict']
                 office_objects_dict = results['office_objects_dict']
+                ballot_item_lookups_dict = results['ballot_item_lookups_dict']
 
             if positive_value_exists(batch_actions_analyzed_for_deletes):
                 messages.add_message(request, messages.INFO, "Analyze For Deletes: "
@@ -3463,70 +3473,93 @@ def retrieve_ballots_for_polling_locations_api_v4_internal_view(
     }
 
     if success:
+        # The provider requests for all map points go out from a pool of worker threads (see PooledHttpFetcher),
+        #  while we groom and store each ballot here, in map point order, as soon as it has been fetched
+        fetched_ballot_results_generator = (fetched_ballot_results for fetched_ballot_results in [])
         if positive_value_exists(use_ballotpedia):
-            from import_export_ballotpedia.controllers import \
+            from import_export_ballotpedia.controllers import ballotpedia_http_fetcher, \
+                fetch_ballotpedia_ballot_json_from_polling_location_v4, \
                 retrieve_ballotpedia_ballot_items_from_polling_location_api_v4
+            fetched_ballot_results_generator = ballotpedia_http_fetcher.map(
+                lambda one_polling_location: fetch_ballotpedia_ballot_json_from_polling_location_v4(
+                    one_polling_location, google_civic_election_id, election_day_text=election_day_text),
+                polling_location_list)
         elif positive_value_exists(use_ctcl):
-            from import_export_ctcl.controllers import retrieve_ctcl_ballot_items_from_polling_location_api
-        for polling_location in polling_location_list:
-            one_ballot_results = {}
-            if positive_value_exists(use_ballotpedia):
-                one_ballot_results = retrieve_ballotpedia_ballot_items_from_polling_location_api_v4(
-                    google_civic_election_id,
-                    election_day_text=election_day_text,
-                    polling_location_we_vote_id=polling_location.we_vote_id,
-                    polling_location=polling_location,
-                    state_code=state_code,
-                    batch_set_id=batch_set_id,
-                    existing_offices_by_election_dict=existing_offices_by_election_dict,
-                    existing_candidate_objects_dict=existing_candidate_objects_dict,
-                    existing_candidate_to_office_links_dict=existing_candidate_to_office_links_dict,
-                    existing_measure_objects_dict=existing_measure_objects_dict,
-                    new_office_we_vote_ids_list=new_office_we_vote_ids_list,
-                    new_candidate_we_vote_ids_list=new_candidate_we_vote_ids_list,
-                    new_measure_we_vote_ids_list=new_measure_we_vote_ids_list
-                )
-            elif positive_value_exists(use_ctcl):
-                one_ballot_results = retrieve_ctcl_ballot_items_from_polling_location_api(
-                    google_civic_election_id,
-                    ctcl_election_uuid=ctcl_election_uuid,
-                    election_day_text=election_day_text,
-                    polling_location_we_vote_id=polling_location.we_vote_id,
-                    polling_location=polling_location,
-                    state_code=state_code,
-                    batch_set_id=batch_set_id,
-                    existing_offices_by_election_dict=existing_offices_by_election_dict,
-                    existing_candidate_objects_dict=existing_candidate_objects_dict,
-                    existing_candidate_to_office_links_dict=existing_candidate_to_office_links_dict,
-                    existing_measure_objects_dict=existing_measure_objects_dict,
-                    new_office_we_vote_ids_list=new_office_we_vote_ids_list,
-                    new_candidate_we_vote_ids_list=new_candidate_we_vote_ids_list,
-                    new_measure_we_vote_ids_list=new_measure_we_vote_ids_list,
-                    update_or_create_rules=update_or_create_rules,
-                )
-            else:
-                # Should not be possible to get here
-                pass
+            from import_export_ctcl.controllers import ctcl_http_fetcher, \
+                fetch_ctcl_ballot_json_from_polling_location, retrieve_ctcl_ballot_items_from_polling_location_api
+            fetched_ballot_results_generator = ctcl_http_fetcher.map(
+                lambda one_polling_location: fetch_ctcl_ballot_json_from_polling_location(
+                    one_polling_location, ctcl_election_uuid),
+                polling_location_list)
+        # Closing the generator cancels the provider requests not yet sent, if storing a ballot raises
+        with closing(fetched_ballot_results_generator):
+            for polling_location, fetch_results in fetched_ballot_results_generator:
+                if not fetch_results['success']:
+                    ballots_not_retrieved += 1
+                    if ballots_not_retrieved < 5:
+                        status += "BALLOT_ITEMS_NOT_RETRIEVED: [[[" + fetch_results['status'] + "]]] "
+                    continue
+                one_ballot_results = {}
+                if positive_value_exists(use_ballotpedia):
+                    one_ballot_results = retrieve_ballotpedia_ballot_items_from_polling_location_api_v4(
+                        google_civic_election_id,
+                        election_day_text=election_day_text,
+                        polling_location_we_vote_id=polling_location.we_vote_id,
+                        polling_location=polling_location,
+                        state_code=state_code,
+                        batch_set_id=batch_set_id,
+                        existing_offices_by_election_dict=existing_offices_by_election_dict,
+                        existing_candidate_objects_dict=existing_candidate_objects_dict,
+                        existing_candidate_to_office_links_dict=existing_candidate_to_office_links_dict,
+                        existing_measure_objects_dict=existing_measure_objects_dict,
+                        new_office_we_vote_ids_list=new_office_we_vote_ids_list,
+                        new_candidate_we_vote_ids_list=new_candidate_we_vote_ids_list,
+                        new_measure_we_vote_ids_list=new_measure_we_vote_ids_list,
+                        districts_json=fetch_results['districts_json'],
+                        sample_ballot_json=fetch_results['sample_ballot_json'],
+                    )
+                elif positive_value_exists(use_ctcl):
+                    one_ballot_results = retrieve_ctcl_ballot_items_from_polling_location_api(
+                        google_civic_election_id,
+                        ctcl_election_uuid=ctcl_election_uuid,
+                        election_day_text=election_day_text,
+                        polling_location_we_vote_id=polling_location.we_vote_id,
+                        polling_location=polling_location,
+                        state_code=state_code,
+                        batch_set_id=batch_set_id,
+                        existing_offices_by_election_dict=existing_offices_by_election_dict,
+                        existing_candidate_objects_dict=existing_candidate_objects_dict,
+                        existing_candidate_to_office_links_dict=existing_candidate_to_office_links_dict,
+                        existing_measure_objects_dict=existing_measure_objects_dict,
+                        new_office_we_vote_ids_list=new_office_we_vote_ids_list,
+                        new_candidate_we_vote_ids_list=new_candidate_we_vote_ids_list,
+                        new_measure_we_vote_ids_list=new_measure_we_vote_ids_list,
+                        update_or_create_rules=update_or_create_rules,
+                        one_ballot_json=fetch_results['one_ballot_json'],
+                    )
+                else:
+                    # Should not be possible to get here
+                    pass
 
-            if one_ballot_results and 'success' in one_ballot_results and one_ballot_results['success']:
-                success = True
-
-            existing_offices_by_election_dict = one_ballot_results['existing_offices_by_election_dict']
-            existing_candidate_objects_dict = one_ballot_results['existing_candidate_objects_dict']
-            existing_candidate_to_office_links_dict = one_ballot_results['existing_candidate_to_office_links_dict']
-            existing_measure_objects_dict = one_ballot_results['existing_measure_objects_dict']
-            new_office_we_vote_ids_list = one_ballot_results['new_office_we_vote_ids_list']
-            new_candidate_we_vote_ids_list = one_ballot_results['new_candidate_we_vote_ids_list']
-            new_measure_we_vote_ids_list = one_ballot_results['new_measure_we_vote_ids_list']
-
-            if one_ballot_results['batch_header_id']:
-                ballots_retrieved += 1
-                if ballots_retrieved < 5:
-                    status += "BALLOT_ITEMS_RETRIEVED: [[[" + one_ballot_results['status'] + "]]] "
-            else:
-                ballots_not_retrieved += 1
-                if ballots_not_retrieved < 5:
-                    status += "BALLOT_ITEMS_NOT_RETRIEVED: [[[" + one_ballot_results['status'] + "]]] "
+                if one_ballot_results and 'success' in one_ballot_results and one_ballot_results['success']:
+                    success = True
+
+                existing_offices_by_election_dict = one_ballot_results['existing_offices_by_election_dict']
+                existing_candidate_objects_dict = one_ballot_results['existing_candidate_objects_dict']
+                existing_candidate_to_office_links_dict = one_ballot_results['existing_candidate_to_office_links_dict']
+                existing_measure_objects_dict = one_ballot_results['existing_measure_objects_dict']
+                new_office_we_vote_ids_list = one_ballot_results['new_office_we_vote_ids_list']
+                new_candidate_we_vote_ids_list = one_ballot_results['new_candidate_we_vote_ids_list']
+                new_measure_we_vote_ids_list = one_ballot_results['new_measure_we_vote_ids_list']
+
+                if one_ballot_results['batch_header_id']:
+                    ballots_retrieved += 1
+                    if ballots_retrieved < 5:
+                        status += "BALLOT_ITEMS_RETRIEVED: [[[" + one_ballot_results['status'] + "]]] "
+                else:
+                    ballots_not_retrieved += 1
+                    if ballots_not_retrieved < 5:
+                        status += "BALLOT_ITEMS_NOT_RETRIEVED: [[[" + one_ballot_results['status'] + "]]] "
     else:
         status += "CANNOT_CALL_RETRIEVE_BECAUSE_OF_ERRORS " \
                   "[retrieve_ballots_for_polling_locations_api_v4_internal_view] "
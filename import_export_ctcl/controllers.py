@@ -5,7 +5,7 @@
 import xml.etree.ElementTree as ElementTree
 from .models import CandidateSelection, CTCLApiCounterManager
 from ballot.models import BallotReturnedManager
-from config.base import get_environment_variable
+from config.base import get_environment_variable, get_environment_variable_default
 from electoral_district.controllers import electoral_district_import_from_xml_data
 from exception.models import handle_exception, handle_record_found_more_than_one_exception
 from import_export_batches.controllers_ctcl import store_ctcl_json_response_to_import_batch_system
@@ -15,7 +15,8 @@ from party.controllers import party_import_from_xml_data
 from polling_location.models import PollingLocationManager
 import requests
 import wevote_functions.admin
-from wevote_functions.functions import extract_state_code_from_address_string, positive_value_exists
+from wevote_functions.functions import convert_to_int, extract_state_code_from_address_string, \
+    PooledHttpFetcher, positive_value_exists
 
 logger = wevote_functions.admin.get_logger(__name__)
 
@@ -23,6 +24,11 @@ CTCL_API_KEY = get_environment_variable("CTCL_API_KEY")
 CTCL_SAMPLE_XML_FILE = "import_export_ctcl/import_data/GoogleCivic.Sample.xml"
 CTCL_VOTER_INFO_URL = "http://api.ballotinfo.org/voterinfo"
 CTCL_API_VOTER_INFO_QUERY_TYPE = "voterinfo"
+# Map point ballots are fetched from CTCL by CTCL_MAP_POINT_THREADS threads, together held under
+#  CTCL_MAP_POINT_REQUESTS_PER_SECOND, and then groomed and stored one at a time on the calling thread
+CTCL_MAP_POINT_REQUESTS_PER_SECOND = \
+    convert_to_int(get_environment_variable_default('CTCL_MAP_POINT_REQUESTS_PER_SECOND', 10))
+CTCL_MAP_POINT_THREADS = convert_to_int(get_environment_variable_default('CTCL_MAP_POINT_THREADS', 8))
 
 
 MAIL_HEADERS = {
@@ -36,6 +42,10 @@ MAIL_HEADERS = {
         'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.14; rv:72.0) Gecko/20100101 Firefox/72.0',
 }
 
+ctcl_http_fetcher = PooledHttpFetcher(
+    requests_per_second=CTCL_MAP_POINT_REQUESTS_PER_SECOND, number_of_threads=CTCL_MAP_POINT_THREADS,
+    headers=MAIL_HEADERS)
+
 PRESIDENTIAL_CANDIDATES_JSON_LIST = [
     {
         'id': 54804,
@@ -514,6 +524,48 @@ def retrieve_ctcl_ballot_items_for_one_voter_api(
     return results
 
 
+def fetch_ctcl_ballot_json_from_polling_location(polling_location, ctcl_election_uuid, http_fetcher=None):
+    """
+    The network half of retrieve_ctcl_ballot_items_from_polling_location_api. It doesn't touch the database, so it can
+    run on the http_fetcher worker threads. Pass one_ballot_json on to
+    retrieve_ctcl_ballot_items_from_polling_location_api to groom and store it.
+    :param polling_location:
+    :param ctcl_election_uuid:
+    :param http_fetcher:
+    :return:
+    """
+    status = ""
+    success = True
+    one_ballot_json = None
+    if http_fetcher is None:
+        http_fetcher = ctcl_http_fetcher
+
+    text_for_map_search = polling_location.get_text_for_map_search()
+    if not positive_value_exists(text_for_map_search):
+        success = False
+        status += "MISSING_TEXT_FOR_MAP_SEARCH "
+    else:
+        try:
+            response = http_fetcher.get(
+                CTCL_VOTER_INFO_URL,
+                params={
+                    "key": CTCL_API_KEY,
+                    "electionId": ctcl_election_uuid,
+                    "address": text_for_map_search,
+                })
+            one_ballot_json = json.loads(response.text)
+        except Exception as e:
+            success = False
+            status += 'FETCH_CTCL_BALLOT_JSON_FROM_POLLING_LOCATION-ERROR: ' + str(e) + ' '
+
+    results = {
+        'success':          success,
+        'status':           status,
+        'one_ballot_json':  one_ballot_json,
+    }
+    return results
+
+
 def retrieve_ctcl_ballot_items_from_polling_location_api(
         google_civic_election_id,
         ctcl_election_uuid="",
@@ -529,7 +581,28 @@ def retrieve_ctcl_ballot_items_from_polling_location_api(
         new_office_we_vote_ids_list=[],
         new_candidate_we_vote_ids_list=[],
         new_measure_we_vote_ids_list=[],
-        update_or_create_rules={}):
+        update_or_create_rules={},
+        one_ballot_json=None):
+    """
+    :param google_civic_election_id:
+    :param ctcl_election_uuid:
+    :param election_day_text:
+    :param polling_location_we_vote_id:
+    :param polling_location:
+    :param state_code:
+    :param batch_set_id:
+    :param existing_offices_by_election_dict:
+    :param existing_candidate_objects_dict:
+    :param existing_candidate_to_office_links_dict:
+    :param existing_measure_objects_dict:
+    :param new_office_we_vote_ids_list:
+    :param new_candidate_we_vote_ids_list:
+    :param new_measure_we_vote_ids_list:
+    :param update_or_create_rules:
+    :param one_ballot_json: Already retrieved with fetch_ctcl_ballot_json_from_polling_location. If not passed in,
+      we retrieve it from CTCL here.
+    :return:
+    """
     success = True
     status = ""
     polling_location_found = False
@@ -620,17 +693,18 @@ def retrieve_ctcl_ballot_items_from_polling_location_api(
                 state_code = "na"
 
         try:
-            api_key = CTCL_API_KEY
-            # Get the ballot info at this address
-            response = requests.get(
-                CTCL_VOTER_INFO_URL,
-                headers=MAIL_HEADERS,
-                params={
-                    "key": api_key,
-                    "electionId": ctcl_election_uuid,
-                    "address": text_for_map_search,
-                })
-            one_ballot_json = json.loads(response.text)
+            if one_ballot_json is None:
+                api_key = CTCL_API_KEY
+                # Get the ballot info at this address
+                response = requests.get(
+                    CTCL_VOTER_INFO_URL,
+                    headers=MAIL_HEADERS,
+                    params={
+                        "key": api_key,
+                        "electionId": ctcl_election_uuid,
+                        "address": text_for_map_search,
+                    })
+                one_ballot_json = json.loads(response.text)
 
             # Use Ballotpedia API call counter to track the number of queries we are doing each day
             api_counter_manager = CTCLApiCounterManager()
@@ -74,23 +74,10 @@ def filter_measures_structured_json_for_local_duplicates(structured_json):  # Co
     duplicates_removed = 0
     filtered_structured_json = []
     measure_list_manager = ContestMeasureListManager()
-    for one_measure in structured_json:
-        measure_title = one_measure['measure_title'] if 'measure_title' in one_measure else ''
-        we_vote_id = one_measure['we_vote_id'] if 'we_vote_id' in one_measure else ''
-        google_civic_election_id = \
-            one_measure['google_civic_election_id'] if 'google_civic_election_id' in one_measure else ''
-        measure_url = one_measure['measure_url'] if 'measure_url' in one_measure else ''
-        maplight_id = one_measure['maplight_id'] if 'maplight_id' in one_measure else ''
-        vote_smart_id = one_measure['vote_smart_id'] if 'vote_smart_id' in one_measure else ''
-
-        # Check to see if there is an entry that matches in all critical ways, minus the we_vote_id
-        we_vote_id_from_master = we_vote_id
-
-        results = measure_list_manager.retrieve_possible_duplicate_measures(
-            measure_title, google_civic_election_id, measure_url, maplight_id, vote_smart_id,
-            we_vote_id_from_master)
-
-        if results['measure_list_found']:
+    # Check to see if there is an entry that matches in all critical ways, minus the we_vote_id
+    results = measure_list_manager.retrieve_possible_duplicate_measures_in_bulk(structured_json)
+    for one_measure, possible_duplicate_found in zip(structured_json, results['possible_duplicate_found_list']):
+        if possible_duplicate_found:
             # There seems to be a duplicate already in this database using a different we_vote_id
             duplicates_removed += 1
         else:
@@ -98,7 +85,7 @@ def filter_measures_structured_json_for_local_duplicates(structured_json):  # Co
 
     candidates_results = {
         'success':              True,
-        'status':               "FILTER_MEASURES_FOR_DUPLICATES_PROCESS_COMPLETE",
+        'status':               "FILTER_MEASURES_FOR_DUPLICATES_PROCESS_COMPLETE " + results['status'],
         'duplicates_removed':   duplicates_removed,
         'structured_json':      filtered_structured_json,
     }
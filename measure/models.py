@@ -9,7 +9,7 @@ from exception.models import handle_exception, handle_record_found_more_than_one
 from wevote_settings.models import fetch_next_we_vote_id_contest_measure_integer, \
     fetch_next_we_vote_id_measure_campaign_integer, fetch_site_unique_id_prefix
 import wevote_functions.admin
-from wevote_functions.functions import convert_to_int, extract_state_from_ocd_division_id, \
+from wevote_functions.functions import convert_to_int, DuplicateKeyIndex, extract_state_from_ocd_division_id, \
     MEASURE_TITLE_COMMON_PHRASES_TO_REMOVE_FROM_SEARCHES, MEASURE_TITLE_SYNONYMS, positive_value_exists, STATE_CODE_MAP
 
 
@@ -1625,6 +1625,77 @@ class ContestMeasureListManager(models.Manager):
         }
         return results
 
+    def retrieve_possible_duplicate_measures_in_bulk(self, structured_json):
+        """
+        The same matching as retrieve_possible_duplicate_measures, for a whole batch of measures coming in from the
+        master server. We load the measures for the incoming elections once, instead of querying once per measure.
+        :param structured_json: list of dicts with measure_title, google_civic_election_id, measure_url,
+          maplight_id, vote_smart_id and we_vote_id
+        :return: possible_duplicate_found_list, one True/False for each incoming measure
+        """
+        possible_duplicate_found_list = []
+        google_civic_election_id_list = list(set(
+            str(one_measure.get('google_civic_election_id', '')) for one_measure in structured_json))
+        measure_index = DuplicateKeyIndex()
+        normalize = DuplicateKeyIndex.normalize
+
+        try:
+            measure_queryset = ContestMeasure.objects \
+                .filter(google_civic_election_id__in=google_civic_election_id_list) \
+                .values_list('we_vote_id', 'google_civic_election_id', 'measure_title', 'measure_url',
+                             'maplight_id', 'vote_smart_id')
+            for we_vote_id, google_civic_election_id, measure_title, measure_url, maplight_id, vote_smart_id \
+                    in measure_queryset.iterator():
+                measure_index.add((google_civic_election_id,), we_vote_id)
+                measure_index.add((google_civic_election_id, 'measure_title', normalize(measure_title)), we_vote_id)
+                measure_index.add((google_civic_election_id, 'measure_url', normalize(measure_url)), we_vote_id)
+                measure_index.add((google_civic_election_id, 'maplight_id', maplight_id), we_vote_id)
+                measure_index.add((google_civic_election_id, 'vote_smart_id', vote_smart_id), we_vote_id)
+        except Exception as e:
+            handle_exception(e, logger=logger)
+            status = 'FAILED retrieve_possible_duplicate_measures_in_bulk ' \
+                     '{error} [type: {error_type}]'.format(error=e, error_type=type(e))
+            # Like retrieve_possible_duplicate_measures, a measure we can't check is not treated as a duplicate
+            results = {
+                'success':                          False,
+                'status':                           status,
+                'possible_duplicate_found_list':    [False] * len(structured_json),
+            }
+            return results
+
+        for one_measure in structured_json:
+            google_civic_election_id = str(one_measure.get('google_civic_election_id', ''))
+            we_vote_id_from_master = one_measure.get('we_vote_id', '')
+            excluded_we_vote_id = we_vote_id_from_master if positive_value_exists(we_vote_id_from_master) else None
+
+            # We want to find measures with *any* of these values
+            key_list = []
+            measure_title = one_measure.get('measure_title', '')
+            if positive_value_exists(measure_title):
+                key_list.append((google_civic_election_id, 'measure_title', normalize(measure_title)))
+            measure_url = one_measure.get('measure_url', '')
+            if positive_value_exists(measure_url):
+                key_list.append((google_civic_election_id, 'measure_url', normalize(measure_url)))
+            maplight_id = one_measure.get('maplight_id', '')
+            if positive_value_exists(maplight_id):
+                key_list.append((google_civic_election_id, 'maplight_id', str(maplight_id)))
+            vote_smart_id = one_measure.get('vote_smart_id', '')
+            if positive_value_exists(vote_smart_id):
+                key_list.append((google_civic_election_id, 'vote_smart_id', str(vote_smart_id)))
+            if not len(key_list):
+                # With none of these values, any other measure in the election is a possible duplicate
+                key_list.append((google_civic_election_id,))
+
+            possible_duplicate_found_list.append(
+                any(measure_index.has_match(key, excluded_we_vote_id) for key in key_list))
+
+        results = {
+            'success':                          True,
+            'status':                           'POSSIBLE_DUPLICATE_MEASURES_CHECKED_IN_BULK ',
+            'possible_duplicate_found_list':    possible_duplicate_found_list,
+        }
+        return results
+
     def search_measures_in_specific_elections(self, google_civic_election_id_list, search_string='', state_code=''):
         """
         This function, search_measures_in_specific_elections, is meant to cast a wider net for any
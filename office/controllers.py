@@ -478,37 +478,10 @@ def filter_offices_structured_json_for_local_duplicates(structured_json):
     office_manager_list = ContestOfficeListManager()
     duplicates_removed = 0
     filtered_structured_json = []
-    for one_office in structured_json:
-        google_civic_election_id = one_office['google_civic_election_id'] \
-            if 'google_civic_election_id' in one_office else 0
-        state_code = one_office['state_code'] if 'state_code' in one_office else ''
-        we_vote_id = one_office['we_vote_id'] if 'we_vote_id' in one_office else ''
-        office_name = one_office['office_name'] if 'office_name' in one_office else ''
-
-        # district_id = one_office['district_id'] if 'district_id' in one_office else ''
-        # ocd_division_id = one_office['ocd_division_id'] if 'ocd_division_id' in one_office else ''
-        # number_voting_for = one_office['number_voting_for'] if 'number_voting_for' in one_office else ''
-        # number_elected = one_office['number_elected'] if 'number_elected' in one_office else ''
-        # contest_level0 = one_office['contest_level0'] if 'contest_level0' in one_office else ''
-        # contest_level1 = one_office['contest_level1'] if 'contest_level1' in one_office else ''
-        # contest_level2 = one_office['contest_level2'] if 'contest_level2' in one_office else ''
-        # primary_party = one_office['primary_party'] if 'primary_party' in one_office else ''
-        # district_name = one_office['district_name'] if 'district_name' in one_office else ''
-        # district_scope = one_office['district_scope'] if 'district_scope' in one_office else ''
-        # electorate_specifications = one_office['electorate_specifications'] \
-        #     if 'electorate_specifications' in one_office else ''
-        # special = one_office['special'] if 'special' in one_office else ''
-        # maplight_id = one_office['maplight_id'] if 'maplight_id' in one_office else 0
-        # ballotpedia_id = one_office['ballotpedia_id'] if 'ballotpedia_id' in one_office else ''
-        # wikipedia_id = one_office['wikipedia_id'] if 'wikipedia_id' in one_office else ''
-
-        # Check to see if there is an entry that matches in all critical ways, minus the we_vote_id
-        we_vote_id_from_master = we_vote_id
-
-        results = office_manager_list.retrieve_possible_duplicate_offices(google_civic_election_id, state_code,
-                                                                          office_name, we_vote_id_from_master)
-
-        if results['office_list_found']:
+    # Check to see if there is an entry that matches in all critical ways, minus the we_vote_id
+    results = office_manager_list.retrieve_possible_duplicate_offices_in_bulk(structured_json)
+    for one_office, possible_duplicate_found in zip(structured_json, results['possible_duplicate_found_list']):
+        if possible_duplicate_found:
             # There seems to be a duplicate already in this database using a different we_vote_id
             duplicates_removed += 1
         else:
@@ -516,7 +489,7 @@ def filter_offices_structured_json_for_local_duplicates(structured_json):
 
     offices_results = {
         'success':              True,
-        'status':               "FILTER_OFFICES_PROCESS_COMPLETE ",
+        'status':               "FILTER_OFFICES_PROCESS_COMPLETE " + results['status'],
         'duplicates_removed':   duplicates_removed,
         'structured_json':      filtered_structured_json,
     }
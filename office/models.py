@@ -7,7 +7,7 @@ from django.db.models import Q
 from exception.models import handle_exception, handle_record_found_more_than_one_exception
 from wevote_settings.models import fetch_next_we_vote_id_contest_office_integer, fetch_site_unique_id_prefix
 import wevote_functions.admin
-from wevote_functions.functions import convert_to_int, extract_state_from_ocd_division_id, \
+from wevote_functions.functions import convert_to_int, DuplicateKeyIndex, extract_state_from_ocd_division_id, \
     generate_office_equivalent_district_phrase_pairs, positive_value_exists, \
     OFFICE_NAME_COMMON_PHRASES_TO_REMOVE_FROM_SEARCHES, OFFICE_NAME_EQUIVALENT_PHRASE_PAIRS, STATE_CODE_MAP
 
@@ -1446,6 +1446,61 @@ class ContestOfficeListManager(models.Manager):
         }
         return results
 
+    def retrieve_possible_duplicate_offices_in_bulk(self, structured_json):
+        """
+        The same matching as retrieve_possible_duplicate_offices, for a whole batch of offices coming in from the
+        master server. We load the offices for the incoming elections once, instead of querying once per office.
+        :param structured_json: list of dicts with google_civic_election_id, state_code, office_name and we_vote_id
+        :return: possible_duplicate_found_list, one True/False for each incoming office
+        """
+        possible_duplicate_found_list = []
+        google_civic_election_id_list = list(set(
+            str(one_office.get('google_civic_election_id', 0)) for one_office in structured_json))
+        office_name_index = DuplicateKeyIndex()
+        office_name_and_state_index = DuplicateKeyIndex()
+        normalize = DuplicateKeyIndex.normalize
+
+        try:
+            office_queryset = ContestOffice.objects \
+                .filter(google_civic_election_id__in=google_civic_election_id_list) \
+                .values_list('we_vote_id', 'google_civic_election_id', 'office_name', 'state_code')
+            for we_vote_id, google_civic_election_id, office_name, state_code in office_queryset.iterator():
+                office_name_index.add((google_civic_election_id, normalize(office_name)), we_vote_id)
+                office_name_and_state_index.add(
+                    (google_civic_election_id, normalize(office_name), normalize(state_code)), we_vote_id)
+        except Exception as e:
+            handle_exception(e, logger=logger)
+            status = 'FAILED retrieve_possible_duplicate_offices_in_bulk ' \
+                     '{error} [type: {error_type}]'.format(error=e, error_type=type(e))
+            # Like retrieve_possible_duplicate_offices, an office we can't check is not treated as a duplicate
+            results = {
+                'success':                          False,
+                'status':                           status,
+                'possible_duplicate_found_list':    [False] * len(structured_json),
+            }
+            return results
+
+        for one_office in structured_json:
+            google_civic_election_id = str(one_office.get('google_civic_election_id', 0))
+            state_code = one_office.get('state_code', '')
+            office_name = normalize(one_office.get('office_name', ''))
+            we_vote_id_from_master = one_office.get('we_vote_id', '')
+            excluded_we_vote_id = we_vote_id_from_master if positive_value_exists(we_vote_id_from_master) else None
+            if positive_value_exists(state_code):
+                possible_duplicate_found = office_name_and_state_index.has_match(
+                    (google_civic_election_id, office_name, normalize(state_code)), excluded_we_vote_id)
+            else:
+                possible_duplicate_found = office_name_index.has_match(
+                    (google_civic_election_id, office_name), excluded_we_vote_id)
+            possible_duplicate_found_list.append(possible_duplicate_found)
+
+        results = {
+            'success':                          True,
+            'status':                           'POSSIBLE_DUPLICATE_OFFICES_CHECKED_IN_BULK ',
+            'possible_duplicate_found_list':    possible_duplicate_found_list,
+        }
+        return results
+
     def retrieve_contest_offices_from_non_unique_identifiers(
             self,
             contest_office_name='',
@@ -1523,20 +1523,11 @@ def filter_organizations_structured_json_for_local_duplicates(structured_json):
     duplicates_removed = 0
     filtered_structured_json = []
     organization_list_manager = OrganizationListManager()
-    for one_organization in structured_json:
-        organization_name = one_organization['organization_name'] if 'organization_name' in one_organization else ''
-        we_vote_id = one_organization['we_vote_id'] if 'we_vote_id' in one_organization else ''
-        organization_twitter_handle = one_organization['organization_twitter_handle'] \
-            if 'organization_twitter_handle' in one_organization else ''
-        vote_smart_id = one_organization['vote_smart_id'] if 'vote_smart_id' in one_organization else ''
-
-        # Check to see if there is an entry that matches in all critical ways, minus the we_vote_id
-        we_vote_id_from_master = we_vote_id
-
-        results = organization_list_manager.retrieve_possible_duplicate_organizations(
-            organization_name, organization_twitter_handle, vote_smart_id, we_vote_id_from_master)
-
-        if results['organization_list_found']:
+    # Check to see if there is an entry that matches in all critical ways, minus the we_vote_id
+    results = organization_list_manager.retrieve_possible_duplicate_organizations_in_bulk(structured_json)
+    for one_organization, possible_duplicate_found in \
+            zip(structured_json, results['possible_duplicate_found_list']):
+        if possible_duplicate_found:
             # There seems to be a duplicate already in this database using a different we_vote_id
             duplicates_removed += 1
         else:
@@ -1544,7 +1535,7 @@ def filter_organizations_structured_json_for_local_duplicates(structured_json):
 
     organizations_results = {
         'success':              True,
-        'status':               "FILTER_ORGANIZATIONS_FOR_DUPLICATES_PROCESS_COMPLETE",
+        'status':               "FILTER_ORGANIZATIONS_FOR_DUPLICATES_PROCESS_COMPLETE " + results['status'],
         'duplicates_removed':   duplicates_removed,
         'structured_json':      filtered_structured_json,
     }
@@ -13,7 +13,8 @@ from import_export_facebook.models import FacebookManager
 from twitter.functions import retrieve_twitter_user_info
 from twitter.models import TwitterLinkToOrganization, TwitterLinkToVoter, TwitterUserManager
 from voter.models import VoterManager
-from wevote_functions.functions import convert_to_int, extract_twitter_handle_from_text_string, positive_value_exists
+from wevote_functions.functions import convert_to_int, DuplicateKeyIndex, extract_twitter_handle_from_text_string, \
+    positive_value_exists
 from wevote_settings.models import fetch_next_we_vote_id_org_integer, fetch_site_unique_id_prefix
 
 
@@ -2700,6 +2701,71 @@ class OrganizationListManager(models.Manager):
         }
         return results
 
+    def retrieve_possible_duplicate_organizations_in_bulk(self, structured_json):
+        """
+        The same matching as retrieve_possible_duplicate_organizations, for a whole batch of organizations coming in
+        from the master server. We load the organization names, twitter handles and vote_smart_ids once, instead of
+        querying once per organization.
+        :param structured_json: list of dicts with organization_name, organization_twitter_handle, vote_smart_id
+          and we_vote_id
+        :return: possible_duplicate_found_list, one True/False for each incoming organization
+        """
+        possible_duplicate_found_list = []
+        organization_index = DuplicateKeyIndex()
+        normalize = DuplicateKeyIndex.normalize
+
+        try:
+            organization_queryset = Organization.objects \
+                .values_list('we_vote_id', 'organization_name', 'organization_twitter_handle', 'vote_smart_id')
+            for we_vote_id, organization_name, organization_twitter_handle, vote_smart_id \
+                    in organization_queryset.iterator():
+                organization_index.add((), we_vote_id)
+                organization_index.add(('organization_name', normalize(organization_name)), we_vote_id)
+                organization_index.add(
+                    ('organization_twitter_handle', normalize(organization_twitter_handle)), we_vote_id)
+                organization_index.add(('vote_smart_id', vote_smart_id), we_vote_id)
+        except Exception as e:
+            handle_exception(e, logger=logger,
+                             exception_message="exception thrown in retrieve_possible_duplicate_organizations_in_bulk")
+            status = 'FAILED retrieve_possible_duplicate_organizations_in_bulk ' \
+                     '{error} [type: {error_type}]'.format(error=e, error_type=type(e))
+            # Like retrieve_possible_duplicate_organizations, an organization we can't check is not a duplicate
+            results = {
+                'success':                          False,
+                'status':                           status,
+                'possible_duplicate_found_list':    [False] * len(structured_json),
+            }
+            return results
+
+        for one_organization in structured_json:
+            we_vote_id_from_master = one_organization.get('we_vote_id', '')
+            excluded_we_vote_id = we_vote_id_from_master if positive_value_exists(we_vote_id_from_master) else None
+
+            # We want to find organizations with *any* of these values
+            key_list = []
+            organization_name = one_organization.get('organization_name', '')
+            if positive_value_exists(organization_name):
+                key_list.append(('organization_name', normalize(organization_name)))
+            organization_twitter_handle = one_organization.get('organization_twitter_handle', '')
+            if positive_value_exists(organization_twitter_handle):
+                key_list.append(('organization_twitter_handle', normalize(organization_twitter_handle)))
+            vote_smart_id = one_organization.get('vote_smart_id', '')
+            if positive_value_exists(vote_smart_id):
+                key_list.append(('vote_smart_id', convert_to_int(vote_smart_id)))
+            if not len(key_list):
+                # With none of these values, any other organization is a possible duplicate
+                key_list.append(())
+
+            possible_duplicate_found_list.append(
+                any(organization_index.has_match(key, excluded_we_vote_id) for key in key_list))
+
+        results = {
+            'success':                          True,
+            'status':                           'POSSIBLE_DUPLICATE_ORGANIZATIONS_CHECKED_IN_BULK ',
+            'possible_duplicate_found_list':    possible_duplicate_found_list,
+        }
+        return results
+
     def retrieve_organizations_by_organization_we_vote_id_list(self, list_of_organization_we_vote_ids):
         organization_list = []
         organization_list_found = False
@@ -153,7 +153,7 @@ class Politician(models.Model):
         elif self.google_civic_candidate_name:
             return self.google_civic_candidate_name
         else:
-            return self.first_name + " " + self.last_name
+            return ((self.first_name or "") + " " + (self.last_name or "")).strip()
 
     def politician_photo_url(self):
         """
@@ -52,23 +52,11 @@ def filter_polling_locations_structured_json_for_local_duplicates(structured_jso
     duplicates_removed = 0
     filtered_structured_json = []
     polling_location_list_manager = PollingLocationListManager()
-    for one_polling_location in structured_json:
-        polling_location_id = one_polling_location['polling_location_id'] \
-            if 'polling_location_id' in one_polling_location else ''
-        we_vote_id = one_polling_location['we_vote_id'] if 'we_vote_id' in one_polling_location else ''
-        state = one_polling_location['state'] if 'state' in one_polling_location else ''
-        location_name = one_polling_location['location_name'] if 'location_name' in one_polling_location else ''
-        line1 = one_polling_location['line1'] if 'line1' in one_polling_location else ''
-        zip_long = one_polling_location['zip_long'] if 'zip_long' in one_polling_location else ''
-
-        # Check to see if there is an entry that matches in all critical ways, minus the we_vote_id
-        we_vote_id_from_master = we_vote_id
-
-        results = polling_location_list_manager.retrieve_possible_duplicate_polling_locations(
-            polling_location_id, state, location_name, line1, zip_long,
-            we_vote_id_from_master)
-
-        if results['polling_location_list_found']:
+    # Check to see if there is an entry that matches in all critical ways, minus the we_vote_id
+    results = polling_location_list_manager.retrieve_possible_duplicate_polling_locations_in_bulk(structured_json)
+    for one_polling_location, possible_duplicate_found in \
+            zip(structured_json, results['possible_duplicate_found_list']):
+        if possible_duplicate_found:
             # There seems to be a duplicate already in this database using a different we_vote_id
             duplicates_removed += 1
         else:
@@ -76,7 +64,7 @@ def filter_polling_locations_structured_json_for_local_duplicates(structured_jso
 
     polling_locations_results = {
         'success':              True,
-        'status':               "FILTER_POLLING_LOCATIONS_FOR_DUPLICATES_PROCESS_COMPLETE",
+        'status':               "FILTER_POLLING_LOCATIONS_FOR_DUPLICATES_PROCESS_COMPLETE " + results['status'],
         'duplicates_removed':   duplicates_removed,
         'structured_json':      filtered_structured_json,
     }
@@ -9,7 +9,7 @@ from exception.models import handle_record_found_more_than_one_exception
 from geopy.geocoders import get_geocoder_for_service
 from geopy.exc import GeocoderQuotaExceeded
 import wevote_functions.admin
-from wevote_functions.functions import extract_zip_formatted_from_zip9, positive_value_exists
+from wevote_functions.functions import DuplicateKeyIndex, extract_zip_formatted_from_zip9, positive_value_exists
 from wevote_settings.models import fetch_next_we_vote_id_polling_location_integer, fetch_site_unique_id_prefix
 
 GEOCODE_TIMEOUT = 10
@@ -876,3 +876,73 @@ class PollingLocationListManager(models.Manager):
             'polling_location_list':        polling_location_list_objects,
         }
         return results
+
+    def retrieve_possible_duplicate_polling_locations_in_bulk(self, structured_json):
+        """
+        The same matching as retrieve_possible_duplicate_polling_locations, for a whole batch of map points coming in
+        from the master server. We load the map points for the incoming states once and match on
+        polling_location_id + state and location_name + state in memory. The few map points without a state
+        (matched on line1 + zip_long instead) are still checked with retrieve_possible_duplicate_polling_locations.
+        :param structured_json: list of dicts with polling_location_id, state, location_name, line1, zip_long
+          and we_vote_id
+        :return: possible_duplicate_found_list, one True/False for each incoming map point
+        """
+        possible_duplicate_found_list = []
+        status = ''
+        polling_location_index = DuplicateKeyIndex()
+        normalize = DuplicateKeyIndex.normalize
+        state_list = list(set(normalize(one_polling_location.get('state', ''))
+                              for one_polling_location in structured_json
+                              if positive_value_exists(one_polling_location.get('state', ''))))
+
+        try:
+            if len(state_list):
+                state_filter = Q(state__iexact=state_list[0])
+                for state in state_list[1:]:
+                    state_filter |= Q(state__iexact=state)
+                polling_location_queryset = PollingLocation.objects.filter(state_filter) \
+                    .values_list('we_vote_id', 'polling_location_id', 'location_name', 'state')
+                for we_vote_id, polling_location_id, location_name, state in polling_location_queryset.iterator():
+                    polling_location_index.add(
+                        ('polling_location_id', normalize(polling_location_id), normalize(state)), we_vote_id)
+                    polling_location_index.add(
+                        ('location_name', normalize(location_name), normalize(state)), we_vote_id)
+        except Exception as e:
+            status += 'FAILED retrieve_possible_duplicate_polling_locations_in_bulk ' + str(e) + ' '
+            # Like retrieve_possible_duplicate_polling_locations, a map point we can't check is not a duplicate
+            results = {
+                'success':                          False,
+                'status':                           status,
+                'possible_duplicate_found_list':    [False] * len(structured_json),
+            }
+            return results
+
+        for one_polling_location in structured_json:
+            polling_location_id = one_polling_location.get('polling_location_id', '')
+            state = one_polling_location.get('state', '')
+            location_name = one_polling_location.get('location_name', '')
+            we_vote_id_from_master = one_polling_location.get('we_vote_id', '')
+            excluded_we_vote_id = we_vote_id_from_master if positive_value_exists(we_vote_id_from_master) else None
+
+            key_list = []
+            if positive_value_exists(polling_location_id) and positive_value_exists(state):
+                key_list.append(('polling_location_id', normalize(polling_location_id), normalize(state)))
+            if positive_value_exists(location_name) and positive_value_exists(state):
+                key_list.append(('location_name', normalize(location_name), normalize(state)))
+            if len(key_list):
+                possible_duplicate_found_list.append(
+                    any(polling_location_index.has_match(key, excluded_we_vote_id) for key in key_list))
+            else:
+                results = self.retrieve_possible_duplicate_polling_locations(
+                    polling_location_id, state, location_name,
+                    one_polling_location.get('line1', ''), one_polling_location.get('zip_long', ''),
+                    we_vote_id_from_master)
+                possible_duplicate_found_list.append(results['polling_location_list_found'])
+
+        status += 'POSSIBLE_DUPLICATE_POLLING_LOCATIONS_CHECKED_IN_BULK '
+        results = {
+            'success':                          True,
+            'status':                           status,
+            'possible_duplicate_found_list':    possible_duplicate_found_list,
+        }
+        return results
@@ -540,20 +540,17 @@ def count_for_all_ballot_items_from_position_network_score_for_api(  # positions
     # The list where we capture results
     position_counts_list_results = []
 
-    # Get all of the individual scores for this entire election
-    position_network_score_list = position_list_manager.fetch_position_network_score_list(
+    # Get the support/oppose counts for every ballot item in this election, grouped in the database
+    counts_by_ballot_item_we_vote_id = position_list_manager.retrieve_position_network_score_counts_by_ballot_item(
         voter_id, google_civic_election_id)
-
-    # Now organize the scores by ballot item
-    raw_entries_by_ballot_item = {}
-    for position_network_score in position_network_score_list:
-        ballot_item_we_vote_id = position_network_score.get_ballot_item_we_vote_id()
-        if ballot_item_we_vote_id not in raw_entries_by_ballot_item:
-            temp_list = []
-        else:
-            temp_list = raw_entries_by_ballot_item[ballot_item_we_vote_id]
-        temp_list.append(position_network_score)
-        raw_entries_by_ballot_item[ballot_item_we_vote_id] = temp_list
+    no_counts = {
+        'support_count':            0,
+        'oppose_count':             0,
+        'support_we_vote_id_list':  [],
+        'support_name_list':        [],
+        'oppose_we_vote_id_list':   [],
+        'oppose_name_list':         [],
+    }
 
     # Get a list of all candidates and measures from this election (in the active election)
     ballot_item_list_manager = BallotItemListManager()
@@ -568,83 +565,39 @@ def count_for_all_ballot_items_from_position_network_score_for_api(  # positions
         status += results['status']
         ballot_item_list = results['ballot_item_list']
 
+    # Retrieve the candidates for all offices on this ballot at once
+    office_we_vote_id_list = [one_ballot_item.contest_office_we_vote_id for one_ballot_item in ballot_item_list
+                              if one_ballot_item.is_contest_office()]
+    results = candidate_list_manager.retrieve_candidate_list_by_office_we_vote_id(
+        office_we_vote_id_list=office_we_vote_id_list, read_only=True)
+    status += results['status']
+    candidate_list_by_office_we_vote_id = results['candidate_list_by_office_we_vote_id']
+
     # ballot_item_list is populated with contest_office and contest_measure entries
-    support_or_oppose_exists = False
+    ballot_item_we_vote_id_list = []
     for one_ballot_item in ballot_item_list:
-        # Retrieve all positions for each ballot item
         if one_ballot_item.is_contest_office():
-            results = candidate_list_manager.retrieve_all_candidates_for_office(
-                office_we_vote_id=one_ballot_item.contest_office_we_vote_id, read_only=True)
-            success = results['success']
-            candidate_list = results['candidate_list']
-
-            if success:
-                # Loop through all candidates under this office
-                for candidate in candidate_list:
-                    support_count_for_one_ballot_item = 0
-                    oppose_count_for_one_ballot_item = 0
-                    support_we_vote_id_list = []
-                    oppose_we_vote_id_list = []
-                    support_name_list = []
-                    oppose_name_list = []
-
-                    if candidate.we_vote_id in raw_entries_by_ballot_item:
-                        for position_network_score in raw_entries_by_ballot_item[candidate.we_vote_id]:
-                            if position_network_score.is_support:
-                                support_or_oppose_exists = True
-                                support_count_for_one_ballot_item += 1
-                                support_we_vote_id_list.append(position_network_score.get_speaker_we_vote_id())
-                                support_name_list.append(position_network_score.speaker_display_name)
-                            elif position_network_score.is_oppose:
-                                support_or_oppose_exists = True
-                                oppose_count_for_one_ballot_item += 1
-                                oppose_we_vote_id_list.append(position_network_score.get_speaker_we_vote_id())
-                                oppose_name_list.append(position_network_score.speaker_display_name)
-
-                    one_ballot_item_results = {
-                        'ballot_item_we_vote_id':   candidate.we_vote_id,
-                        'support_count':            support_count_for_one_ballot_item,
-                        'oppose_count':             oppose_count_for_one_ballot_item,
-                        'support_we_vote_id_list':  support_we_vote_id_list,
-                        'support_name_list':        support_name_list,
-                        'oppose_we_vote_id_list':   oppose_we_vote_id_list,
-                        'oppose_name_list':         oppose_name_list,
-                    }
-                    position_counts_list_results.append(one_ballot_item_results)
+            # Loop through all candidates under this office
+            for candidate in candidate_list_by_office_we_vote_id.get(one_ballot_item.contest_office_we_vote_id, []):
+                ballot_item_we_vote_id_list.append(candidate.we_vote_id)
         elif one_ballot_item.is_contest_measure():
-            support_count_for_one_ballot_item = 0
-            oppose_count_for_one_ballot_item = 0
-            support_we_vote_id_list = []
-            oppose_we_vote_id_list = []
-            support_name_list = []
-            oppose_name_list = []
-
-            if one_ballot_item.contest_measure_we_vote_id in raw_entries_by_ballot_item:
-                for position_network_score in raw_entries_by_ballot_item[one_ballot_item.contest_measure_we_vote_id]:
-                    if position_network_score.is_support:
-                        support_or_oppose_exists = True
-                        support_count_for_one_ballot_item += 1
-                        support_we_vote_id_list.append(position_network_score.get_speaker_we_vote_id())
-                        support_name_list.append(position_network_score.speaker_display_name)
-                    elif position_network_score.is_oppose:
-                        support_or_oppose_exists = True
-                        oppose_count_for_one_ballot_item += 1
-                        oppose_we_vote_id_list.append(position_network_score.get_speaker_we_vote_id())
-                        oppose_name_list.append(position_network_score.speaker_display_name)
-
-            one_ballot_item_results = {
-                'ballot_item_we_vote_id':   one_ballot_item.contest_measure_we_vote_id,
-                'support_count':            support_count_for_one_ballot_item,
-                'oppose_count':             oppose_count_for_one_ballot_item,
-                'support_we_vote_id_list':  support_we_vote_id_list,
-                'support_name_list':        support_name_list,
-                'oppose_we_vote_id_list':   oppose_we_vote_id_list,
-                'oppose_name_list':         oppose_name_list,
-            }
-            position_counts_list_results.append(one_ballot_item_results)
-        else:
-            # Skip the rest of this loop
-            continue
+            ballot_item_we_vote_id_list.append(one_ballot_item.contest_measure_we_vote_id)
+
+    support_or_oppose_exists = False
+    for ballot_item_we_vote_id in ballot_item_we_vote_id_list:
+        counts = counts_by_ballot_item_we_vote_id.get(ballot_item_we_vote_id, no_counts)
+        if counts['support_count'] or counts['oppose_count']:
+            support_or_oppose_exists = True
+        one_ballot_item_results = {
+            'ballot_item_we_vote_id':   ballot_item_we_vote_id,
+            'support_count':            counts['support_count'],
+            'oppose_count':             counts['oppose_count'],
+            'support_we_vote_id_list':  list(counts['support_we_vote_id_list']),
+            'support_name_list':        list(counts['support_name_list']),
+            'oppose_we_vote_id_list':   list(counts['oppose_we_vote_id_list']),
+            'oppose_name_list':         list(counts['oppose_name_list']),
+        }
+        position_counts_list_results.append(one_ballot_item_results)
 
     json_data = {
         'success':                  True,
@@ -4154,26 +4107,10 @@ def filter_positions_structured_json_for_local_duplicates(structured_json):
     duplicates_removed = 0
     filtered_structured_json = []
     position_list_manager = PositionListManager()
-    for one_position in structured_json:
-        we_vote_id = one_position['we_vote_id'] if 'we_vote_id' in one_position else ''
-        google_civic_election_id = \
-            one_position['google_civic_election_id'] if 'google_civic_election_id' in one_position else ''
-        organization_we_vote_id = \
-            one_position['organization_we_vote_id'] if 'organization_we_vote_id' in one_position else ''
-        candidate_we_vote_id = one_position['candidate_campaign_we_vote_id'] \
-            if 'candidate_campaign_we_vote_id' in one_position else ''
-        contest_measure_we_vote_id = one_position['contest_measure_we_vote_id'] \
-            if 'contest_measure_we_vote_id' in one_position else ''
-
-        # Check to see if there is an entry that matches in all critical ways, minus the we_vote_id
-        we_vote_id_from_master = we_vote_id
-
-        results = position_list_manager.retrieve_possible_duplicate_positions(
-            google_civic_election_id, organization_we_vote_id,
-            candidate_we_vote_id, contest_measure_we_vote_id,
-            we_vote_id_from_master)
-
-        if results['position_list_found']:
+    # Check to see if there is an entry that matches in all critical ways, minus the we_vote_id
+    results = position_list_manager.retrieve_possible_duplicate_positions_in_bulk(structured_json)
+    for one_position, possible_duplicate_found in zip(structured_json, results['possible_duplicate_found_list']):
+        if possible_duplicate_found:
             # There seems to be a duplicate already in this database using a different we_vote_id
             duplicates_removed += 1
         else:
@@ -4181,7 +4118,7 @@ def filter_positions_structured_json_for_local_duplicates(structured_json):
 
     positions_results = {
         'success':              True,
-        'status':               "FILTER_POSITIONS_FOR_DUPLICATES_PROCESS_COMPLETE",
+        'status':               "FILTER_POSITIONS_FOR_DUPLICATES_PROCESS_COMPLETE " + results['status'],
         'duplicates_removed':   duplicates_removed,
         'structured_json':      filtered_structured_json,
     }
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from position.models import PositionListManager, PositionManager
+
+
+class Command(BaseCommand):
+    help = 'Compares the cost of fanning one organization position out to its followers\' PositionNetworkScore ' \
+           'entries one row at a time and with update_position_network_scores_in_bulk. ' \
+           'Everything written is rolled back.'
+
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--followers', type=int, default=10000, help='Number of voters following the organization')
+
+    def handle(self, *args, **options):
+        number_of_followers = options['followers']
+        # Synthetic viewers: PositionNetworkScore only stores the viewer's ids, so no Voter rows are needed
+        viewing_voter_list = [(900000000 + index, 'wvbenchvoter' + str(index)) for index in range(number_of_followers)]
+        position_manager = PositionManager()
+        position_list_manager = PositionListManager()
+
+        def row_by_row(support_or_oppose, candidate_we_vote_id):
+            for voter_id, voter_we_vote_id in viewing_voter_list:
+                position_manager.update_or_create_position_network_score(
+                    voter_id, voter_we_vote_id, 1000000, 'wvbenchorg1', None, 'Benchmark Organization',
+                    candidate_we_vote_id, None, support_or_oppose)
+
+        def set_based(support_or_oppose, candidate_we_vote_id):
+            position_list_manager.update_position_network_scores_in_bulk(
+                viewing_voter_list, 1000000, organization_we_vote_id='wvbenchorg1',
+                speaker_display_name='Benchmark Organization', candidate_we_vote_id=candidate_we_vote_id,
+                support_or_oppose=support_or_oppose)
+
+        self.stdout.write('Fanning one position out to ' + str(number_of_followers) + ' followers')
+        for name, fan_out, candidate_we_vote_id in [('row by row', row_by_row, 'wvbenchcand1'),
+                                                    ('set based', set_based, 'wvbenchcand2')]:
+            for step, support_or_oppose in [('new endorsement', True), ('edited endorsement', False)]:
+                try:
+                    with transaction.atomic():
+                        if step == 'edited endorsement':
+                            # Start from existing entries
+                            set_based(True, candidate_we_vote_id)
+                        with CaptureQueriesContext(connection) as captured_queries:
+                            start = time.perf_counter()
+                            fan_out(support_or_oppose, candidate_we_vote_id)
+                            seconds = time.perf_counter() - start
+                        self.stdout.write('{name:>11}, {step:<19}: {seconds:8.3f} seconds, {queries:7d} queries'.format(
+                            name=name, step=step, seconds=seconds, queries=len(captured_queries)))
+                        raise RollbackBenchmark()
+                except RollbackBenchmark:
+                    pass
+
+
+class RollbackBenchmark(Exception):
+    pass
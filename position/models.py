@@ -8,26 +8,32 @@ from analytics.models import ACTION_POSITION_TAKEN, AnalyticsManager
 from candidate.models import CandidateCampaign, CandidateListManager, CandidateManager
 from ballot.controllers import figure_out_google_civic_election_id_voter_is_watching, \
     figure_out_google_civic_election_id_voter_is_watching_by_voter_we_vote_id
+from config.base import get_environment_variable_default
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
-from django.db import models
-from django.db.models import Q
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import close_old_connections, models
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, NullIf
 from django.utils.timezone import now
 from election.models import Election
 from exception.models import handle_exception, handle_record_found_more_than_one_exception,\
     handle_record_not_found_exception, handle_record_not_saved_exception, print_to_log
-from follow.models import FollowOrganizationManager, FollowOrganizationList
+from follow.models import FOLLOWING, FollowOrganization, FollowOrganizationManager
 from friend.models import FriendManager
 from measure.models import ContestMeasure, ContestMeasureManager
 from office.models import ContestOffice, ContestOfficeManager
 from organization.models import Organization, OrganizationManager, \
     INDIVIDUAL, PUBLIC_FIGURE, UNKNOWN, ORGANIZATION_TYPE_CHOICES
+import atexit
+import queue
 import robot_detection
 from share.models import ShareManager
+import threading
 from twitter.models import TwitterUser
 from voter.models import fetch_voter_id_from_voter_we_vote_id, fetch_voter_we_vote_id_from_voter_id, Voter, VoterManager
 from voter_guide.models import VoterGuideManager
 import wevote_functions.admin
-from wevote_functions.functions import convert_to_int, positive_value_exists
+from wevote_functions.functions import convert_to_int, DuplicateKeyIndex, positive_value_exists
 from wevote_settings.models import fetch_next_we_vote_id_position_integer, fetch_site_unique_id_prefix
 
 
@@ -61,6 +67,12 @@ ALL_ELECTIONS = 'ALL_ELECTIONS'
 
 POSITION = 'POSITION'
 
+# Voters per UPDATE / bulk INSERT when fanning one position out to its followers' PositionNetworkScore entries
+POSITION_NETWORK_SCORE_BULK_CHUNK_SIZE = 1000
+# Set to 1 to update PositionNetworkScore entries on a queue thread instead of the request thread
+POSITION_NETWORK_SCORES_UPDATED_IN_BACKGROUND = positive_value_exists(
+    get_environment_variable_default('POSITION_NETWORK_SCORES_UPDATED_IN_BACKGROUND', ''))
+
 logger = wevote_functions.admin.get_logger(__name__)
 
 
@@ -4304,6 +4316,81 @@ class PositionListManager(models.Manager):
         }
         return results
 
+    def retrieve_possible_duplicate_positions_in_bulk(self, structured_json):
+        """
+        The same matching as retrieve_possible_duplicate_positions, for a whole batch of positions coming in from the
+        master server. We load the positions for the incoming elections once, instead of querying once per position.
+        :param structured_json: list of dicts with google_civic_election_id, organization_we_vote_id,
+          candidate_campaign_we_vote_id, contest_measure_we_vote_id and we_vote_id
+        :return: possible_duplicate_found_list, one True/False for each incoming position
+        """
+        possible_duplicate_found_list = []
+        google_civic_election_id_list = list(set(
+            str(one_position.get('google_civic_election_id', '')) for one_position in structured_json))
+        position_index = DuplicateKeyIndex()
+        normalize = DuplicateKeyIndex.normalize
+
+        try:
+            position_queryset = PositionEntered.objects \
+                .filter(google_civic_election_id__in=google_civic_election_id_list) \
+                .exclude(stance__iexact=PERCENT_RATING) \
+                .values_list('we_vote_id', 'google_civic_election_id', 'organization_we_vote_id',
+                             'contest_measure_we_vote_id')
+            for we_vote_id, google_civic_election_id, organization_we_vote_id, contest_measure_we_vote_id \
+                    in position_queryset.iterator():
+                position_index.add((google_civic_election_id,), we_vote_id)
+                position_index.add(
+                    (google_civic_election_id, 'organization', normalize(organization_we_vote_id)), we_vote_id)
+                position_index.add(
+                    (google_civic_election_id, 'organization_and_measure', normalize(organization_we_vote_id),
+                     normalize(contest_measure_we_vote_id)), we_vote_id)
+        except Exception as e:
+            handle_exception(e, logger=logger)
+            status = 'FAILED retrieve_possible_duplicate_positions_in_bulk ' \
+                     '{error} [type: {error_type}] '.format(error=e, error_type=type(e))
+            # Like retrieve_possible_duplicate_positions, a position we can't check is not treated as a duplicate
+            results = {
+                'success':                          False,
+                'status':                           status,
+                'possible_duplicate_found_list':    [False] * len(structured_json),
+            }
+            return results
+
+        for one_position in structured_json:
+            google_civic_election_id = str(one_position.get('google_civic_election_id', ''))
+            organization_we_vote_id = one_position.get('organization_we_vote_id', '')
+            candidate_we_vote_id = one_position.get('candidate_campaign_we_vote_id', '')
+            measure_we_vote_id = one_position.get('contest_measure_we_vote_id', '')
+            we_vote_id_from_master = one_position.get('we_vote_id', '')
+            excluded_we_vote_id = we_vote_id_from_master if positive_value_exists(we_vote_id_from_master) else None
+
+            key_list = []
+            filter_used = False
+            # Situation 1 organization_we_vote_id + candidate_we_vote_id. retrieve_possible_duplicate_positions
+            #  compares the position's organization_we_vote_id with both values, so we do the same here
+            if positive_value_exists(organization_we_vote_id) and positive_value_exists(candidate_we_vote_id):
+                filter_used = True
+                if normalize(organization_we_vote_id) == normalize(candidate_we_vote_id):
+                    key_list.append((google_civic_election_id, 'organization', normalize(organization_we_vote_id)))
+            # Situation 2 organization_we_vote_id + measure_we_vote_id
+            if positive_value_exists(organization_we_vote_id) and positive_value_exists(measure_we_vote_id):
+                filter_used = True
+                key_list.append((google_civic_election_id, 'organization_and_measure',
+                                 normalize(organization_we_vote_id), normalize(measure_we_vote_id)))
+            if not filter_used:
+                # With neither situation, any other position in the election is a possible duplicate
+                key_list.append((google_civic_election_id,))
+
+            possible_duplicate_found_list.append(
+                any(position_index.has_match(key, excluded_we_vote_id) for key in key_list))
+
+        results = {
+            'success':                          True,
+            'status':                           'POSSIBLE_DUPLICATE_POSITIONS_CHECKED_IN_BULK ',
+            'possible_duplicate_found_list':    possible_duplicate_found_list,
+        }
+        return results
+
     def fetch_position_network_score_list(self, viewing_voter_id, google_civic_election_id):
         position_network_score_list_found = False
         position_network_score_list = {}
@@ -4324,6 +4411,51 @@ class PositionListManager(models.Manager):
             position_network_score_list = {}
             return position_network_score_list
 
+    def retrieve_position_network_score_counts_by_ballot_item(self, viewing_voter_id, google_civic_election_id):
+        """
+        The support/oppose counts (and who is supporting/opposing) for every ballot item in one voter's network,
+        computed in one grouped query, without creating a PositionNetworkScore object per row.
+        :param viewing_voter_id:
+        :param google_civic_election_id:
+        :return: dict of ballot_item_we_vote_id -> dict with support_count, oppose_count, support_we_vote_id_list,
+          support_name_list, oppose_we_vote_id_list and oppose_name_list
+        """
+        counts_by_ballot_item_we_vote_id = {}
+        # An entry marked both is_support and is_oppose is counted once, as support
+        support_filter = Q(is_support=True)
+        oppose_filter = Q(is_support=False, is_oppose=True)
+        try:
+            query = PositionNetworkScore.objects.using('readonly')\
+                .filter(viewing_voter_id=viewing_voter_id, google_civic_election_id=google_civic_election_id)\
+                .filter(Q(is_support=True) | Q(is_oppose=True))\
+                .annotate(
+                    ballot_item_we_vote_id=Coalesce(
+                        NullIf('candidate_we_vote_id', Value('')), NullIf('measure_we_vote_id', Value('')), Value('')),
+                    speaker_we_vote_id=Coalesce(
+                        NullIf('organization_we_vote_id', Value('')), NullIf('friend_voter_we_vote_id', Value('')),
+                        Value('')))\
+                .values('ballot_item_we_vote_id')\
+                .annotate(
+                    support_count=Count('id', filter=support_filter),
+                    oppose_count=Count('id', filter=oppose_filter),
+                    support_we_vote_id_list=ArrayAgg('speaker_we_vote_id', filter=support_filter, ordering='id'),
+                    support_name_list=ArrayAgg('speaker_display_name', filter=support_filter, ordering='id'),
+                    oppose_we_vote_id_list=ArrayAgg('speaker_we_vote_id', filter=oppose_filter, ordering='id'),
+                    oppose_name_list=ArrayAgg('speaker_display_name', filter=oppose_filter, ordering='id'))\
+                .order_by()
+            for one_count in query:
+                counts_by_ballot_item_we_vote_id[one_count['ballot_item_we_vote_id']] = {
+                    'support_count':            one_count['support_count'],
+                    'oppose_count':             one_count['oppose_count'],
+                    'support_we_vote_id_list':  one_count['support_we_vote_id_list'] or [],
+                    'support_name_list':        one_count['support_name_list'] or [],
+                    'oppose_we_vote_id_list':   one_count['oppose_we_vote_id_list'] or [],
+                    'oppose_name_list':         one_count['oppose_name_list'] or [],
+                }
+        except Exception as e:
+            logger.error("RETRIEVE_POSITION_NETWORK_SCORE_COUNTS_BY_BALLOT_ITEM_FAILED " + str(e))
+        return counts_by_ballot_item_we_vote_id
+
     def update_politician_we_vote_id_in_all_positions(
             self,
             candidate_we_vote_id='',
@@ -4427,16 +4559,33 @@ class PositionListManager(models.Manager):
         }
         return json_data
 
-    def update_position_network_scores_for_one_position(self, one_position):
+    def update_position_network_scores_for_one_position(self, one_position, in_background=None):
         """
-        When one position changes, update all of the PositionNetworkScore entries needed for rapid score counts
+        When one position changes, update all of the PositionNetworkScore entries needed for rapid score counts.
+        The entries for every follower (or friend) are written with a few set-based queries, not one
+        update_or_create per follower.
         :param one_position:
+        :param in_background: Hand the work to the position network score queue instead of doing it on this thread.
+          Defaults to POSITION_NETWORK_SCORES_UPDATED_IN_BACKGROUND.
         :return:
         """
         status = "UPDATE_POSITION_NETWORK_SCORES_FOR_ONE_POSITION "
         public_positions_updated = 0
         friends_only_positions_updated = 0
 
+        if in_background is None:
+            in_background = POSITION_NETWORK_SCORES_UPDATED_IN_BACKGROUND
+        if in_background and hasattr(one_position, "voter_entering_position"):
+            queue_position_network_score_update(one_position)
+            status += "QUEUED "
+            json_data = {
+                'success': True,
+                'status': status,
+                'friends_only_positions_updated': friends_only_positions_updated,
+                'public_positions_updated': public_positions_updated,
+            }
+            return json_data
+
         if not hasattr(one_position, "voter_entering_position"):
             status += "NOT_A_POSITION_OBJECT "
             json_data = {
@@ -4514,26 +4663,17 @@ class PositionListManager(models.Manager):
 
         # Public Positions
         if one_position.is_public_position() and positive_value_exists(one_position.organization_we_vote_id):
-            # Find all of the voter's following this organization
-            follow_organization_list_manager = FollowOrganizationList()
-            voters_following_list = \
-                follow_organization_list_manager.retrieve_follow_organization_by_organization_we_vote_id(
-                    one_position.organization_we_vote_id)
-
-            critical_variables_exist = True
-            save_public_position = True
-            delete_public_position = False
-            ignore_friend_voter_we_vote_id = None
             candidate_we_vote_id = None
             measure_we_vote_id = None
             support_or_oppose = None
+            critical_variables_exist = True
+            delete_public_position = False
             if positive_value_exists(one_position.candidate_campaign_we_vote_id):
                 candidate_we_vote_id = one_position.candidate_campaign_we_vote_id
             elif positive_value_exists(one_position.contest_measure_we_vote_id):
                 measure_we_vote_id = one_position.contest_measure_we_vote_id
             else:
                 # If not candidate or measure, do not save
-                save_public_position = False
                 critical_variables_exist = False
 
             if one_position.is_support_or_positive_rating():
@@ -4542,74 +4682,39 @@ class PositionListManager(models.Manager):
                 support_or_oppose = False
             else:
                 # If not support or oppose, do not save, and also delete prior entries
-                save_public_position = False
                 delete_public_position = True
 
+            # If this is your own position, do not save it as a public position
             organization_belongs_to_voter_with_position = \
                 one_position.organization_we_vote_id == linked_organization_we_vote_id
 
-            if critical_variables_exist and (save_public_position or delete_public_position):
-                for follow_organization in voters_following_list:
-                    voter_that_is_following_id = follow_organization.voter_id
-                    voter_that_is_following_we_vote_id = follow_organization.voter_we_vote_id()
-
-                    voter_ids_match = voter_with_position_we_vote_id == voter_that_is_following_we_vote_id
-
-                    if one_position.is_public_position():
-                        # If this is your own position, do not save it as a public position
-                        if not organization_belongs_to_voter_with_position and not voter_ids_match:
-                            if save_public_position:
-                                # Add entry to position_network_score table
-                                update_results = position_manager.update_or_create_position_network_score(
-                                    voter_that_is_following_id, voter_that_is_following_we_vote_id,
-                                    one_position.google_civic_election_id,
-                                    one_position.organization_we_vote_id, ignore_friend_voter_we_vote_id,
-                                    one_position.speaker_display_name,
-                                    candidate_we_vote_id, measure_we_vote_id,
-                                    support_or_oppose)
-                                if update_results['position_network_score_updated']:
-                                    public_positions_updated += 1
-                            elif delete_public_position:
-                                delete_results = position_manager.delete_one_position_network_score(
-                                    voter_that_is_following_id, voter_that_is_following_we_vote_id,
-                                    one_position.google_civic_election_id,
-                                    one_position.organization_we_vote_id, ignore_friend_voter_we_vote_id,
-                                    candidate_we_vote_id, measure_we_vote_id)
-                                if delete_results['position_network_score_deleted']:
-                                    public_positions_updated += 1
-                    else:
-                        # Make sure to delete entries for this position since it is no longer public
-                        delete_results = position_manager.delete_one_position_network_score(
-                            voter_that_is_following_id, voter_that_is_following_we_vote_id,
-                            one_position.google_civic_election_id,
-                            one_position.organization_we_vote_id, ignore_friend_voter_we_vote_id,
-                            candidate_we_vote_id, measure_we_vote_id)
-                        if delete_results['position_network_score_deleted']:
-                            public_positions_updated += 1
+            if critical_variables_exist and not organization_belongs_to_voter_with_position:
+                # Find all of the voters following this organization
+                viewing_voter_list = self.retrieve_voters_following_organization(
+                    one_position.organization_we_vote_id,
+                    ignore_voter_we_vote_id=voter_with_position_we_vote_id)
+                bulk_results = self.update_position_network_scores_in_bulk(
+                    viewing_voter_list, one_position.google_civic_election_id,
+                    organization_we_vote_id=one_position.organization_we_vote_id,
+                    speaker_display_name=one_position.speaker_display_name,
+                    candidate_we_vote_id=candidate_we_vote_id, measure_we_vote_id=measure_we_vote_id,
+                    support_or_oppose=support_or_oppose,
+                    delete_entries=delete_public_position)
+                status += bulk_results['status']
+                public_positions_updated += bulk_results['position_network_scores_changed']
 
         # Friends-only positions
         if one_position.is_friends_only_position() and positive_value_exists(one_position.voter_we_vote_id):
-            friend_manager = FriendManager()
-            friend_results = friend_manager.retrieve_friends_we_vote_id_list(one_position.voter_we_vote_id)
-            friends_we_vote_id_list = []
-            if friend_results['friends_we_vote_id_list_found']:
-                friends_we_vote_id_list = friend_results['friends_we_vote_id_list']
-
-            critical_variables_exist = True
-            save_for_friends = True
-            delete_for_friends = False
-            ignore_organization_voter_we_vote_id = None
             candidate_we_vote_id = None
             measure_we_vote_id = None
             support_or_oppose = None
-
-            # Don't try to
+            critical_variables_exist = True
+            delete_for_friends = False
             if positive_value_exists(one_position.candidate_campaign_we_vote_id):
                 candidate_we_vote_id = one_position.candidate_campaign_we_vote_id
             elif positive_value_exists(one_position.contest_measure_we_vote_id):
                 measure_we_vote_id = one_position.contest_measure_we_vote_id
             else:
-                save_for_friends = False
                 critical_variables_exist = False
 
             if one_position.is_support_or_positive_rating():
@@ -4617,36 +4722,22 @@ class PositionListManager(models.Manager):
             elif one_position.is_oppose_or_negative_rating():
                 support_or_oppose = False
             else:
-                # If not support or oppose, continue to next position
-                save_for_friends = False
+                # If not support or oppose, delete prior entries
                 delete_for_friends = True
 
-            if critical_variables_exist and (save_for_friends or delete_for_friends):
-                for voter_friend_we_vote_id in friends_we_vote_id_list:
-                    voter_friend_id = voter_manager.fetch_local_id_from_we_vote_id(voter_friend_we_vote_id)
-
-                    voter_ids_match = voter_with_position_id == voter_friend_id
-
-                    if not voter_ids_match:
-                        if save_for_friends:
-                            # Add entry to position_network_score table
-                            update_results = position_manager.update_or_create_position_network_score(
-                                voter_friend_id, voter_friend_we_vote_id,
-                                one_position.google_civic_election_id,
-                                ignore_organization_voter_we_vote_id, voter_with_position_we_vote_id,
-                                one_position.speaker_display_name,
-                                candidate_we_vote_id, measure_we_vote_id,
-                                support_or_oppose)
-                            if update_results['position_network_score_updated']:
-                                friends_only_positions_updated += 1
-                        elif delete_for_friends:
-                            delete_results = position_manager.delete_one_position_network_score(
-                                voter_friend_id, voter_friend_we_vote_id,
-                                one_position.google_civic_election_id,
-                                ignore_organization_voter_we_vote_id, voter_with_position_we_vote_id,
-                                candidate_we_vote_id, measure_we_vote_id)
-                            if delete_results['position_network_score_deleted']:
-                                friends_only_positions_updated += 1
+            if critical_variables_exist:
+                viewing_voter_list = self.retrieve_friends_of_voter(
+                    one_position.voter_we_vote_id,
+                    ignore_voter_id=voter_with_position_id)
+                bulk_results = self.update_position_network_scores_in_bulk(
+                    viewing_voter_list, one_position.google_civic_election_id,
+                    friend_voter_we_vote_id=voter_with_position_we_vote_id,
+                    speaker_display_name=one_position.speaker_display_name,
+                    candidate_we_vote_id=candidate_we_vote_id, measure_we_vote_id=measure_we_vote_id,
+                    support_or_oppose=support_or_oppose,
+                    delete_entries=delete_for_friends)
+                status += bulk_results['status']
+                friends_only_positions_updated += bulk_results['position_network_scores_changed']
 
         json_data = {
             'success':                          True,
@@ -4656,6 +4747,220 @@ class PositionListManager(models.Manager):
         }
         return json_data
 
+    def retrieve_voters_following_organization(self, organization_we_vote_id, ignore_voter_we_vote_id=None):
+        """
+        Everyone following this organization, as (voter_id, voter_we_vote_id) pairs, from one query joining
+        FollowOrganization to Voter. Read from the primary, so a follow saved a moment ago is included.
+        :param organization_we_vote_id:
+        :param ignore_voter_we_vote_id:
+        :return:
+        """
+        viewing_voter_list = []
+        try:
+            voter_we_vote_id_query = Voter.objects.filter(id=OuterRef('voter_id')).values('we_vote_id')[:1]
+            query = FollowOrganization.objects\
+                .filter(organization_we_vote_id=organization_we_vote_id, following_status=FOLLOWING)\
+                .annotate(following_voter_we_vote_id=Subquery(voter_we_vote_id_query))\
+                .values_list('voter_id', 'following_voter_we_vote_id')
+            for voter_id, voter_we_vote_id in query:
+                if positive_value_exists(ignore_voter_we_vote_id) and voter_we_vote_id == ignore_voter_we_vote_id:
+                    continue
+                viewing_voter_list.append((voter_id, voter_we_vote_id))
+        except Exception as e:
+            logger.error("RETRIEVE_VOTERS_FOLLOWING_ORGANIZATION_FAILED " + str(e))
+        return viewing_voter_list
+
+    def retrieve_friends_of_voter(self, voter_we_vote_id, ignore_voter_id=None):
+        """
+        This voter's friends, as (voter_id, voter_we_vote_id) pairs, in two queries
+        :param voter_we_vote_id:
+        :param ignore_voter_id:
+        :return:
+        """
+        viewing_voter_list = []
+        friend_manager = FriendManager()
+        friend_results = friend_manager.retrieve_friends_we_vote_id_list(voter_we_vote_id)
+        if not friend_results['friends_we_vote_id_list_found']:
+            return viewing_voter_list
+        try:
+            query = Voter.objects.using('readonly')\
+                .filter(we_vote_id__in=friend_results['friends_we_vote_id_list'])\
+                .values_list('id', 'we_vote_id')
+            for voter_id, friend_we_vote_id in query:
+                if positive_value_exists(ignore_voter_id) and voter_id == ignore_voter_id:
+                    continue
+                viewing_voter_list.append((voter_id, friend_we_vote_id))
+        except Exception as e:
+            logger.error("RETRIEVE_FRIENDS_OF_VOTER_FAILED " + str(e))
+        return viewing_voter_list
+
+    def update_position_network_scores_in_bulk(
+            self, viewing_voter_list, google_civic_election_id,
+            organization_we_vote_id=None, friend_voter_we_vote_id=None, speaker_display_name='',
+            candidate_we_vote_id=None, measure_we_vote_id=None, support_or_oppose=None, delete_entries=False):
+        """
+        Set-based version of PositionManager.update_or_create_position_network_score (and
+        delete_one_position_network_score) for one speaker and one ballot item, across many viewing voters.
+        For each chunk of viewers: one UPDATE for the entries that exist, one SELECT to find which viewers those were,
+        and one bulk INSERT for the rest (or a single DELETE).
+        :param viewing_voter_list: list of (voter_id, voter_we_vote_id)
+        :param google_civic_election_id:
+        :param organization_we_vote_id: The organization with the public position
+        :param friend_voter_we_vote_id: The friend sharing the friends-only position
+        :param speaker_display_name:
+        :param candidate_we_vote_id:
+        :param measure_we_vote_id:
+        :param support_or_oppose: True for support, False for oppose
+        :param delete_entries: Remove the entries instead (the position is no longer support or oppose)
+        :return:
+        """
+        status = ""
+        success = True
+        position_network_scores_changed = 0
+        viewing_voter_we_vote_id_by_id = {}
+        for voter_id, voter_we_vote_id in viewing_voter_list:
+            if positive_value_exists(voter_id) and positive_value_exists(voter_we_vote_id):
+                viewing_voter_we_vote_id_by_id[voter_id] = voter_we_vote_id
+        viewing_voter_id_list = list(viewing_voter_we_vote_id_by_id.keys())
+
+        if not positive_value_exists(organization_we_vote_id) and not positive_value_exists(friend_voter_we_vote_id) \
+                or not positive_value_exists(candidate_we_vote_id) and not positive_value_exists(measure_we_vote_id):
+            status += "UPDATE_POSITION_NETWORK_SCORES_IN_BULK-MISSING_SPEAKER_OR_BALLOT_ITEM "
+            results = {
+                'success':                          False,
+                'status':                           status,
+                'position_network_scores_changed':  position_network_scores_changed,
+            }
+            return results
+
+        is_support = positive_value_exists(support_or_oppose)
+        try:
+            for start in range(0, len(viewing_voter_id_list), POSITION_NETWORK_SCORE_BULK_CHUNK_SIZE):
+                viewing_voter_id_chunk = viewing_voter_id_list[start:start + POSITION_NETWORK_SCORE_BULK_CHUNK_SIZE]
+                score_query = PositionNetworkScore.objects.filter(viewing_voter_id__in=viewing_voter_id_chunk)
+                if delete_entries:
+                    # Matches delete_one_position_network_score
+                    score_query = score_query.filter(google_civic_election_id=google_civic_election_id)
+                    if positive_value_exists(candidate_we_vote_id):
+                        score_query = score_query.filter(candidate_we_vote_id=candidate_we_vote_id)
+                    else:
+                        score_query = score_query.filter(measure_we_vote_id=measure_we_vote_id)
+                    if positive_value_exists(organization_we_vote_id):
+                        score_query = score_query.filter(organization_we_vote_id=organization_we_vote_id)
+                    else:
+                        score_query = score_query.filter(friend_voter_we_vote_id=friend_voter_we_vote_id)
+                    number_deleted, details = score_query.delete()
+                    position_network_scores_changed += number_deleted
+                    continue
+
+                # Matches the lookup in update_or_create_position_network_score
+                if positive_value_exists(organization_we_vote_id):
+                    score_query = score_query.filter(organization_we_vote_id__iexact=organization_we_vote_id)
+                else:
+                    score_query = score_query.filter(friend_voter_we_vote_id__iexact=friend_voter_we_vote_id)
+                if positive_value_exists(candidate_we_vote_id):
+                    score_query = score_query.filter(candidate_we_vote_id__iexact=candidate_we_vote_id)
+                else:
+                    score_query = score_query.filter(measure_we_vote_id__iexact=measure_we_vote_id)
+
+                position_network_scores_changed += score_query.update(
+                    google_civic_election_id=google_civic_election_id,
+                    speaker_display_name=speaker_display_name,
+                    is_support=is_support,
+                    is_oppose=not is_support)
+                viewing_voter_ids_with_entry = set(score_query.values_list('viewing_voter_id', flat=True))
+                new_position_network_score_list = []
+                for viewing_voter_id in viewing_voter_id_chunk:
+                    if viewing_voter_id in viewing_voter_ids_with_entry:
+                        continue
+                    new_position_network_score_list.append(PositionNetworkScore(
+                        viewing_voter_id=viewing_voter_id,
+                        viewing_voter_we_vote_id=viewing_voter_we_vote_id_by_id[viewing_voter_id],
+                        google_civic_election_id=google_civic_election_id,
+                        organization_we_vote_id=organization_we_vote_id if organization_we_vote_id else None,
+                        friend_voter_we_vote_id=None if organization_we_vote_id else friend_voter_we_vote_id,
+                        speaker_display_name=speaker_display_name,
+                        candidate_we_vote_id=candidate_we_vote_id if candidate_we_vote_id else None,
+                        measure_we_vote_id=None if candidate_we_vote_id else measure_we_vote_id,
+                        is_support=is_support,
+                        is_oppose=not is_support,
+                    ))
+                if len(new_position_network_score_list):
+                    PositionNetworkScore.objects.bulk_create(
+                        new_position_network_score_list, batch_size=POSITION_NETWORK_SCORE_BULK_CHUNK_SIZE)
+                    position_network_scores_changed += len(new_position_network_score_list)
+            status += "POSITION_NETWORK_SCORES_UPDATED_IN_BULK: " + str(position_network_scores_changed) + " "
+        except Exception as e:
+            success = False
+            status += "UPDATE_POSITION_NETWORK_SCORES_IN_BULK-FAILED " + str(e) + " "
+            handle_exception(e, logger=logger, exception_message=status)
+
+        results = {
+            'success':                          success,
+            'status':                           status,
+            'position_network_scores_changed':  position_network_scores_changed,
+        }
+        return results
+
+
+position_network_score_queue = queue.Queue()
+position_network_score_queue_thread = None
+position_network_score_queue_lock = threading.Lock()
+
+
+def process_position_network_score_queue():
+    """
+    Runs on the position network score queue thread, updating scores for one changed position at a time
+    """
+    while True:
+        one_position = position_network_score_queue.get()
+        process_one_queued_position_network_score_update(one_position)
+
+
+def process_one_queued_position_network_score_update(one_position):
+    try:
+        PositionListManager().update_position_network_scores_for_one_position(one_position, in_background=False)
+    except Exception as e:
+        logger.error("PROCESS_POSITION_NETWORK_SCORE_QUEUE_FAILED " + str(e))
+    finally:
+        close_old_connections()
+        position_network_score_queue.task_done()
+
+
+def drain_position_network_score_queue():
+    """
+    Write the entries still waiting on the queue before this process stops, so no queued update is lost.
+    Registered with atexit the first time an update is queued.
+    :return:
+    """
+    while True:
+        try:
+            one_position = position_network_score_queue.get_nowait()
+        except queue.Empty:
+            break
+        process_one_queued_position_network_score_update(one_position)
+    # Wait for the update the queue thread may be in the middle of
+    position_network_score_queue.join()
+
+
+def queue_position_network_score_update(one_position):
+    """
+    Update the PositionNetworkScore entries for this position off the request thread. Entries still waiting
+    when the process stops are written by drain_position_network_score_queue on the way out.
+    :param one_position:
+    :return:
+    """
+    global position_network_score_queue_thread
+    with position_network_score_queue_lock:
+        if position_network_score_queue_thread is None or not position_network_score_queue_thread.is_alive():
+            if position_network_score_queue_thread is None:
+                atexit.register(drain_position_network_score_queue)
+            position_network_score_queue_thread = threading.Thread(
+                name='position_network_score_queue_thread', target=process_position_network_score_queue,
+                daemon=True)
+            position_network_score_queue_thread.start()
+    position_network_score_queue.put(one_position)
+
 
 class PositionManager(models.Manager):
 
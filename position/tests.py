@@ -0,0 +1,75 @@
+from django.test import TestCase
+
+from follow.models import FOLLOWING, FollowOrganization, STOP_FOLLOWING
+from position.models import PositionListManager, PositionNetworkScore
+from voter.models import Voter
+
+
+class UpdatePositionNetworkScoresInBulkTestCase(TestCase):
+    databases = ["default", "readonly"]
+
+    def setUp(self):
+        self.position_list_manager = PositionListManager()
+        self.viewing_voter_list = [(101, 'wv01voter101'), (102, 'wv01voter102'), (103, 'wv01voter103')]
+
+    def update_scores(self, viewing_voter_list, support_or_oppose=True, delete_entries=False):
+        return self.position_list_manager.update_position_network_scores_in_bulk(
+            viewing_voter_list, 4184,
+            organization_we_vote_id='wv01org1', speaker_display_name='Organization One',
+            candidate_we_vote_id='wv01cand1', support_or_oppose=support_or_oppose, delete_entries=delete_entries)
+
+    def test_creates_then_updates_one_entry_per_viewing_voter(self):
+        PositionNetworkScore.objects.create(
+            viewing_voter_id=101, viewing_voter_we_vote_id='wv01voter101', google_civic_election_id=4184,
+            organization_we_vote_id='WV01ORG1', candidate_we_vote_id='wv01cand1', is_oppose=True)
+
+        results = self.update_scores(self.viewing_voter_list)
+        self.assertTrue(results['success'], results['status'])
+        self.assertEqual(results['position_network_scores_changed'], 3)
+        self.assertEqual(PositionNetworkScore.objects.count(), 3, 'The existing entry matches case-insensitively')
+        for score in PositionNetworkScore.objects.all():
+            self.assertTrue(score.is_support)
+            self.assertFalse(score.is_oppose)
+            self.assertEqual(score.speaker_display_name, 'Organization One')
+            self.assertIsNone(score.friend_voter_we_vote_id)
+            self.assertIsNone(score.measure_we_vote_id)
+
+        results = self.update_scores(self.viewing_voter_list, support_or_oppose=False)
+        self.assertEqual(results['position_network_scores_changed'], 3)
+        self.assertEqual(PositionNetworkScore.objects.count(), 3, 'Updated in place, not inserted again')
+        self.assertEqual(PositionNetworkScore.objects.filter(is_oppose=True).count(), 3)
+
+    def test_delete_entries_only_removes_this_speaker_and_ballot_item(self):
+        self.update_scores(self.viewing_voter_list)
+        PositionNetworkScore.objects.create(
+            viewing_voter_id=101, viewing_voter_we_vote_id='wv01voter101', google_civic_election_id=4184,
+            organization_we_vote_id='wv01org2', candidate_we_vote_id='wv01cand1', is_support=True)
+
+        results = self.update_scores(self.viewing_voter_list[:2], delete_entries=True)
+        self.assertEqual(results['position_network_scores_changed'], 2)
+        self.assertEqual(
+            sorted(PositionNetworkScore.objects.values_list('viewing_voter_id', 'organization_we_vote_id')),
+            [(101, 'wv01org2'), (103, 'wv01org1')])
+
+    def test_missing_speaker_or_ballot_item_changes_nothing(self):
+        results = self.position_list_manager.update_position_network_scores_in_bulk(
+            self.viewing_voter_list, 4184, candidate_we_vote_id='wv01cand1', support_or_oppose=True)
+        self.assertFalse(results['success'])
+        results = self.position_list_manager.update_position_network_scores_in_bulk(
+            self.viewing_voter_list, 4184, organization_we_vote_id='wv01org1', support_or_oppose=True)
+        self.assertFalse(results['success'])
+        self.assertEqual(PositionNetworkScore.objects.count(), 0)
+
+    def test_voters_following_organization_includes_a_follow_saved_just_now(self):
+        voter = Voter.objects.create(we_vote_id='wv01voter201')
+        other_voter = Voter.objects.create(we_vote_id='wv01voter202')
+        FollowOrganization.objects.create(
+            voter_id=voter.id, organization_we_vote_id='wv01org1', following_status=FOLLOWING)
+        FollowOrganization.objects.create(
+            voter_id=other_voter.id, organization_we_vote_id='wv01org1', following_status=STOP_FOLLOWING)
+
+        viewing_voter_list = self.position_list_manager.retrieve_voters_following_organization('wv01org1')
+        self.assertEqual(viewing_voter_list, [(voter.id, 'wv01voter201')])
+        viewing_voter_list = self.position_list_manager.retrieve_voters_following_organization(
+            'wv01org1', ignore_voter_we_vote_id='wv01voter201')
+        self.assertEqual(viewing_voter_list, [])
@@ -1,7 +1,11 @@
+import codecs
 import csv
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import io
 import json
 import os
 import re
+import zlib
 
 import psycopg2
 import requests
@@ -9,10 +13,21 @@ import time
 from config.base import get_environment_variable
 from django.http import HttpResponse
 import wevote_functions.admin
-from wevote_functions.functions import positive_value_exists
+from wevote_functions.functions import convert_to_int, positive_value_exists
+
+try:
+    import zstandard  # Optional, "pip install zstandard" to allow compression='zstd'
+except ImportError:
+    zstandard = None
 
 logger = wevote_functions.admin.get_logger(__name__)
 
+RETRIEVE_SQL_TABLES_URL = "https://api.wevoteusa.org/apis/v1/retrieveSQLTables/"
+# Rows per keyset page read from Postgres by the server, so server memory stays bounded by one page
+RETRIEVE_SQL_TABLES_PAGE_SIZE = 50000
+# Rows per streamed request, after which the client resumes with last_id
+RETRIEVE_SQL_TABLES_MAXIMUM_ROWS_PER_REQUEST = 1000000
+
 # This api will only return the data from the following tables
 allowable_tables = [
     'candidate_candidatecampaign',
@@ -39,12 +54,18 @@ allowable_tables = [
 ]
 
 dummy_unique_id = 10000000
+# Each developer database sync worker process keeps its own connection, see open_sync_worker_connection
+sync_worker_connection = None
+SYNC_WORKERS_DEFAULT = 4
+# A page that can't be received or inserted is requested again from the same last_id, up to this many times
+SYNC_PAGE_MAXIMUM_ATTEMPTS = 3
 
 
 def retrieve_sql_tables_as_csv(table_name, start, end):
     """
     Extract one of the 15 allowable database tables to CSV (pipe delimited) and send it to the
-    developer's local WeVoteServer instance
+    developer's local WeVoteServer instance. Kept for older developer checkouts, which request fixed id windows
+    as JSON -- current ones use retrieve_sql_table_as_csv_stream.
     limit is used to specify a number of rows to return (this is the SQL LIMIT clause), non-zero or ignored
     offset is used to specify the first row to return (this is the SQL OFFSET clause), non-zero or ignored
     """
@@ -66,21 +87,16 @@ def retrieve_sql_tables_as_csv(table_name, start, end):
         csv_files = {}
         if table_name in allowable_tables:
             cur = conn.cursor()
-            csv_name = table_name + '.csvTemp'
-            print("exporting to: " + csv_name)
-            with open(csv_name, 'w') as file:
-                if positive_value_exists(end):
-                    sql = "COPY (SELECT * FROM public." + table_name + " WHERE id BETWEEN " + start + " AND " + end +\
-                          " ORDER BY id) TO STDOUT WITH DELIMITER '|' CSV HEADER NULL '\\N'"
-                else:
-                    sql = "COPY " + table_name + " TO STDOUT WITH DELIMITER '|' CSV HEADER NULL '\\N'"
-                cur.copy_expert(sql, file, size=8192)
-                logger.error("retrieve_tables sql: " + sql)
-            file.close()
-            with open(csv_name, 'r') as file2:
-                csv_files[table_name] = file2.read()
-            file2.close()
-            os.remove(csv_name)
+            csv_file = io.StringIO()
+            if positive_value_exists(end):
+                sql = "COPY (SELECT * FROM public." + table_name + " WHERE id BETWEEN " + start + " AND " + end +\
+                      " ORDER BY id) TO STDOUT WITH DELIMITER '|' CSV HEADER NULL '\\N'"
+            else:
+                sql = "COPY " + table_name + " TO STDOUT WITH DELIMITER '|' CSV HEADER NULL '\\N'"
+            cur.copy_expert(sql, csv_file, size=8192)
+            logger.error("retrieve_tables sql: " + sql)
+            csv_files[table_name] = csv_file.getvalue()
+            csv_file.close()
             if "exported" not in status:
                 status += "exported "
             status += table_name + "(" + start + "," + end + "), "
@@ -112,6 +128,125 @@ def retrieve_sql_tables_as_csv(table_name, start, end):
         return results
 
 
+def retrieve_sql_table_stream_compressor(compression):
+    if compression == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif compression == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor().compressobj()
+    return None
+
+
+def retrieve_sql_table_stream_decompressor(compression):
+    if compression == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    return None
+
+
+def retrieve_sql_table_as_csv_stream(table_name, last_id=0, compression='gzip',
+                                     maximum_rows=RETRIEVE_SQL_TABLES_MAXIMUM_ROWS_PER_REQUEST):
+    """
+    Generator that streams one of the allowable database tables as CSV (pipe delimited), compressed, for use in a
+    StreamingHttpResponse. Rows are read in keyset pages (WHERE id > last_id ORDER BY id), so neither the server nor the
+    developer's machine ever holds the whole table. The header line is sent first, and the client resumes by asking
+    for the rows after the largest id it received.
+    """
+    if table_name not in allowable_tables:
+        logger.error("retrieve_sql_table_as_csv_stream table_name '" + str(table_name) + "' is not allowed")
+        return
+    last_id = convert_to_int(last_id)
+    compressor = retrieve_sql_table_stream_compressor(compression)
+    t0 = time.time()
+    rows_sent = 0
+    conn = psycopg2.connect(
+        database=get_environment_variable('DATABASE_NAME'),
+        user=get_environment_variable('DATABASE_USER'),
+        password=get_environment_variable('DATABASE_PASSWORD'),
+        host=get_environment_variable('DATABASE_HOST'),
+        port=get_environment_variable('DATABASE_PORT')
+    )
+    try:
+        cur = conn.cursor()
+        include_header = True
+        while rows_sent < maximum_rows:
+            page_size = min(RETRIEVE_SQL_TABLES_PAGE_SIZE, maximum_rows - rows_sent)
+            # Find the id that ends this page, so that the COPY below can use a plain id range
+            cur.execute("SELECT id FROM public." + table_name + " WHERE id > %s ORDER BY id OFFSET %s LIMIT 1",
+                        (last_id, page_size - 1))
+            page_end = cur.fetchone()
+            where = "id > " + str(last_id)
+            if page_end:
+                where += " AND id <= " + str(page_end[0])
+            sql = "COPY (SELECT * FROM public." + table_name + " WHERE " + where + " ORDER BY id) TO STDOUT " \
+                  "WITH DELIMITER '|' CSV " + ("HEADER " if include_header else "") + "NULL '\\N'"
+            page = io.StringIO()
+            cur.copy_expert(sql, page, size=65536)
+            include_header = False
+            data = page.getvalue().encode('utf-8')
+            page.close()
+            if data:
+                yield compressor.compress(data) if compressor else data
+            if not page_end:
+                break
+            rows_sent += page_size
+            last_id = page_end[0]
+        conn.commit()
+    finally:
+        conn.close()
+    if compressor:
+        yield compressor.flush()
+    logger.error('Streaming the "' + table_name + '" table took ' + "{:.3f}".format(time.time() - t0) +
+                 ' seconds, rows sent before the last page: ' + str(rows_sent))
+
+
+def generate_lines_from_sql_table_stream(response, compression='gzip'):
+    """
+    Decompress the streamed retrieveSQLTables response on the fly, and yield it one line at a time
+    (with line endings, so csv.reader can rebuild fields that contain new lines)
+    """
+    decompressor = retrieve_sql_table_stream_decompressor(compression)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    for chunk in response.iter_content(chunk_size=65536):
+        if decompressor:
+            chunk = decompressor.decompress(chunk)
+        pending += decoder.decode(chunk)
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+class CsvLineStream(object):
+    """
+    Minimal file-like wrapper, so psycopg2's copy_from can read cleaned lines straight from a generator
+    """
+    def __init__(self, line_generator):
+        self.line_generator = line_generator
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.line_generator, None)
+            if line is None:
+                break
+            self.buffer += line
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        if self.buffer:
+            data, self.buffer = self.buffer, ''
+            return data
+        return next(self.line_generator, '')
+
+
 def clean_row(row, index):
     newstring = row[index].replace('\n', ' ').replace(',', ' ')
     newstring = ''.join(ch for ch in newstring if ch.isdigit() or ch.isalnum() or ch == ' ' or ch == '.' or ch == '_')
@@ -164,129 +299,152 @@ def save_off_database():
     time.sleep(20)
 
 
-def retrieve_sql_files_from_master_server(request):
+def open_sync_worker_connection():
+    """
+    Pool initializer: each sync worker process opens one connection to the local database, and reuses it for every
+    chunk of every table it is handed
     """
-    Get the json data, and create new entries in the developers local database
+    global sync_worker_connection
+    sync_worker_connection = psycopg2.connect(
+        database=get_environment_variable('DATABASE_NAME'),
+        user=get_environment_variable('DATABASE_USER'),
+        password=get_environment_variable('DATABASE_PASSWORD'),
+        host=get_environment_variable('DATABASE_HOST'),
+        port=get_environment_variable('DATABASE_PORT')
+    )
+
+
+def sync_one_table_from_master_server(table_name):
+    """
+    Runs in a sync worker process: stream one table from the master server into the local database
+    :param table_name:
     :return:
     """
     status = ''
-    t0 = time.time()
-
-    save_off_database()
+    success = True
+    t1 = time.time()
+    last_id = 0
+    final_lines_count = 0
+    if sync_worker_connection is None:
+        open_sync_worker_connection()
+    conn = sync_worker_connection
+    print('Starting on the ' + table_name + ' table')
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM " + table_name)  # Delete all existing data in this table
+        conn.commit()
+        print("... SQL executed: DELETE (all) FROM " + table_name)
 
-    for table_name in allowable_tables:
-        print('Starting on the ' + table_name + ' table, requesting up to 1,000,000 rows')
-        t1 = time.time()
-        dt = 0
-        start = 0
-        end = 999999
-        final_lines_count = 0
-        while end < 20000000:
+        page_attempts = 0
+        while True:
             t2 = time.time()
-            response = requests.get("https://api.wevoteusa.org/apis/v1/retrieveSQLTables/",
-                                    params={'table': table_name, 'start': start, 'end': end})
-            structured_json = json.loads(response.text)
-            if structured_json['success'] is False:
-                print("FAILED:  Did not receive '" + table_name + " from server")
+            page_attempts += 1
+            response = requests.get(RETRIEVE_SQL_TABLES_URL,
+                                    params={'table': table_name, 'last_id': last_id, 'compression': 'gzip'},
+                                    stream=True)
+            if response.status_code != 200:
+                status += "FAILED: Did not receive '" + table_name + "' from server, status code: " + \
+                          str(response.status_code) + ", after id " + str(last_id) + " "
+                response.close()
+                if page_attempts < SYNC_PAGE_MAXIMUM_ATTEMPTS:
+                    continue
+                success = False
                 break
 
-            data = structured_json['files'][table_name]
-            lines = data.splitlines()
-            if len(lines) == 1:
-                dt = time.time() - t1
-                print('... Retrieved ' + str(final_lines_count) + ' lines from the ' + table_name +
-                      ' table (as JSON) in ' + str(int(dt)) + ' seconds)')
+            line_reader = csv.reader(generate_lines_from_sql_table_stream(response, 'gzip'), delimiter='|')
+            header = next(line_reader, None)
+            if header is None:
+                response.close()
+                break
+            cursor_stats = {'last_id': last_id, 'rows_received': 0}
+            try:
+                cur.copy_from(CsvLineStream(generate_clean_csv_lines(table_name, header, line_reader, cursor_stats)),
+                              table_name, sep='|', size=16384, columns=header)
+                conn.commit()
+            except Exception as e0:
+                # None of this page was saved, so ask for it again from the same last_id
+                conn.rollback()
+                status += "FAILED_TABLE_INSERT: " + table_name + " after id " + str(last_id) + " -- " + str(e0) + " "
+                response.close()
+                if page_attempts < SYNC_PAGE_MAXIMUM_ATTEMPTS:
+                    continue
+                success = False
+                break
+            response.close()
+            if not positive_value_exists(cursor_stats['rows_received']) or cursor_stats['last_id'] <= last_id:
                 break
-            final_lines_count += len(lines)
-            print('... Intermediate line count from this request of 1M, returned ' + str(len(lines)) +
-                  " rows, cumulative is " + str(final_lines_count))
-
-            if len(lines) > 0:
-                try:
-                    conn = psycopg2.connect(
-                        database=get_environment_variable('DATABASE_NAME'),
-                        user=get_environment_variable('DATABASE_USER'),
-                        password=get_environment_variable('DATABASE_PASSWORD'),
-                        host=get_environment_variable('DATABASE_HOST'),
-                        port=get_environment_variable('DATABASE_PORT')
-                    )
-
-                    cur = conn.cursor()
-
-                    print("... Processing rows " + str(start) + " through " + str(end) + " of table " + table_name +
-                          " data received from master server.")
-                    if start == 0:
-                        cur.execute("DELETE FROM " + table_name)  # Delete all existing data in this table
-                        conn.commit()
-                        print("... SQL executed: DELETE (all) FROM " + table_name)
-
-                    with open(table_name + '.csvTemp', 'w') as csv_file:
-                        for s in lines:
-                            csv_file.write("%s\n" % s)
-                        csv_file.close()
-
-                    header = csv_file_to_clean_csv_file2(table_name)
-
-                    try:
-                        with open(table_name + '2.csvTemp', 'r') as file:
-                            cur.copy_from(file, table_name, sep='|', size=16384, columns=header)
-                            file.close()
-                    except Exception as e0:
-                        print("FAILED_TABLE_INSERT: " + table_name + " -- " + str(e0))
-                    conn.commit()
-                    conn.close()
-                    dt = time.time() - t1
-                    dt2 = time.time() - t2
-                    dtc = time.time() - t0
-                    print('... Processing and inserting the chunk of 1M from ' + table_name + ' table took ' +
-                          str(int(dt2)) + ' seconds, cumulative ' + str(int(dtc)) + ' seconds')
-
-                except Exception as e:
-                    status += "retrieve_tables retrieve_sql_files_from_master_server caught " + str(e)
-                    logger.error(status)
-
-                finally:
-                    start += 1000000
-                    end += 1000000
+            page_attempts = 0
+            last_id = cursor_stats['last_id']
+            final_lines_count += cursor_stats['rows_received']
+            print('... Streamed and inserted ' + str(cursor_stats['rows_received']) + ' rows from ' +
+                  table_name + ' in ' + str(int(time.time() - t2)) + ' seconds, cumulative ' +
+                  str(final_lines_count) + ' rows, resuming after id ' + str(last_id))
+
+        if not success:
+            # Leave the sequence alone, rather than make a partly copied table look complete
+            raise Exception("STOPPED_AFTER_ID_" + str(last_id) + "_WITH_" + str(final_lines_count) + "_ROWS_SAVED")
 
         # Update the last_value for this table so creating new entries doesn't
         #  throw "django Key (id)= already exists" error
-        try:
-            conn = psycopg2.connect(
-                database=get_environment_variable('DATABASE_NAME'),
-                user=get_environment_variable('DATABASE_USER'),
-                password=get_environment_variable('DATABASE_PASSWORD'),
-                host=get_environment_variable('DATABASE_HOST'),
-                port=get_environment_variable('DATABASE_PORT')
-            )
+        command = "SELECT setval('" + table_name + "_id_seq', (SELECT MAX(id) FROM \"" + table_name + "\"))"
+        cur.execute(command)
+        data_tuple = cur.fetchone()
+        print("... SQL executed: " + command + " and returned " + str(data_tuple[0]))
+        conn.commit()
+        command = "ALTER SEQUENCE " + table_name + "_id_seq START WITH " + str(data_tuple[0])
+        cur.execute(command)
+        conn.commit()
+        print("... SQL executed: " + command)
+        # To confirm:  SELECT * FROM information_schema.sequences where sequence_name like 'org%'
+    except Exception as e:
+        conn.rollback()
+        status += "retrieve_tables sync_one_table_from_master_server (" + table_name + ") caught " + str(e) + " "
+        success = False
+        logger.error(status)
 
-            cur = conn.cursor()
-            command = "SELECT setval('" + table_name + "_id_seq', (SELECT MAX(id) FROM \"" + table_name + "\"))"
-            cur.execute(command)
-            data_tuple = cur.fetchone()
-            print("... SQL executed: " + command + " and returned " + str(data_tuple[0]))
-            conn.commit()
-            command = "ALTER SEQUENCE " + table_name + "_id_seq START WITH " + str(data_tuple[0])
-            cur.execute(command)
-            conn.commit()
-            conn.close()
-            print("... SQL executed: " + command)
-            # To confirm:  SELECT * FROM information_schema.sequences where sequence_name like 'org%'
+    results = {
+        'success':      success,
+        'status':       status,
+        'table_name':   table_name,
+        'rows':         final_lines_count,
+        'seconds':      time.time() - t1,
+    }
+    return results
 
-        except Exception as e:
-            status += "... SQL FAILED: SELECT setval('" + \
-                      table_name + "_id_seq', (SELECT MAX(id) FROM \"" + table_name + "\")): " + str(e)
-            logger.error(status)
 
-        status += ", " + " loaded " + table_name
-        stat = 'Processing and loading table: ' + table_name + '  took ' + str(int(dt)) + ' seconds'
-        print("... " + stat)
-        status += stat
+def retrieve_sql_files_from_master_server(request):
+    """
+    Get the streamed table data from the master server, and create new entries in the developers local database.
+    The tables are loaded concurrently by a bounded pool of worker processes (one database connection per worker),
+    so the total time approaches that of the slowest single table.
+    :return:
+    """
+    status = ''
+    t0 = time.time()
+    number_of_workers = convert_to_int(request.GET.get('workers', SYNC_WORKERS_DEFAULT))
+    number_of_workers = max(1, min(number_of_workers, len(allowable_tables)))
 
-    minutes = (time.time() - t0)/60
-    print("Processing and loading " + str(len(allowable_tables)) + " tables took {:.1f}".format(minutes) + ' minutes')
+    save_off_database()
 
-    os.system('rm *.csvTemp')    # Clean up all the temp files
+    with ProcessPoolExecutor(max_workers=number_of_workers, initializer=open_sync_worker_connection) as executor:
+        futures = [executor.submit(sync_one_table_from_master_server, table_name)
+                   for table_name in allowable_tables]
+        for future in as_completed(futures):
+            try:
+                one_result = future.result()
+            except Exception as e:
+                status += "retrieve_tables sync worker caught " + str(e) + " "
+                logger.error(status)
+                continue
+            status += one_result['status']
+            stat = 'Processing and loading table: ' + one_result['table_name'] + ' (' + str(one_result['rows']) + \
+                   ' rows) took ' + str(int(one_result['seconds'])) + ' seconds'
+            print("... " + stat)
+            status += ", " + " loaded " + one_result['table_name'] + " " + stat
+
+    minutes = (time.time() - t0)/60
+    print("Processing and loading " + str(len(allowable_tables)) + " tables with " + str(number_of_workers) +
+          " workers took {:.1f}".format(minutes) + ' minutes')
 
     results = {
         'status': status,
@@ -302,184 +460,233 @@ def retrieve_sql_files_from_master_server(request):
 # processing with the debugger, open the csv files in Excel, and get a decent view of what is happening.  The diagnostic
 # function dump_row_col_labels_and_errors(table_name, header, row, '2000060') also is really good at figuring out what
 # field has problems, and it dumps the field numbers and names which helps determine what row processing functions need
-# to be added, like 'clean_row(row, 10)                      # ballot_item_display_name'
+# to be added, like '(CLEAN_TEXT, 10),                       # ballot_item_display_name' to TABLE_CLEANING_RULES
 # The data provided to the developers local is pretty good, but some of the cleanups removes commas, and other niceities
 # from text fields.  It should be good enough, and if not, this function is where it can be improved.
 # hint: temporarily comment out some lines in allowable_tables, so you can get to the problem table quicker
 # hint: Access https://pg.admin.wevote.us/  (view access to the production server Postgres) can really help, ask Dale
-def csv_file_to_clean_csv_file2(table_name):
-    csv_rows = []
-    with open(table_name + '.csvTemp', 'r') as csv_file2:
-        line_reader = csv.reader(csv_file2, delimiter='|')
-        header = None
-
-        skipped_rows = '... Skipped rows in ' + table_name + ': '
-        for row in line_reader:
-            # check_for_non_ascii(table_name, row)
-            try:
-                if header is None:
-                    header = row
-                    continue
-                if len(header) != len(row) or '|' in str(row):  # Messed up records with '|' in them
-                    skipped_rows += row[0] + ", "
-                    continue
-
-                if table_name == "ballot_ballotitem":
-                    clean_row(row, 10)                      # ballot_item_display_name
-                    clean_row(row, 12)                      # measure_subtitle
-                    clean_row(row, 14)                      # measure_text
-                    clean_row(row, 16)                      # no_vote_description
-                    clean_row(row, 17)                      # yes_vote_description
-                    # dump_row_col_labels_and_errors(table_name, header, row, '2000060')
-                elif table_name == "ballot_ballotreturned":
-                    clean_row(row, 6)                       # text_for_map_search
-                    substitute_null(row, 7, '0.0')          # latitude
-                    substitute_null(row, 8, '0.0')          # longitude
-                    # dump_row_col_labels_and_errors(table_name, header, row, '50490')
-                elif table_name == "candidate_candidatetoofficelink":
-                    if row[1] == '':                        # candidate_we_vote_id
-                        continue
-                elif table_name == "election_election":
-                    substitute_null(row, 2, '0')  # google_civic_election_id_new is an integer
-                    if row[8] == '' or row[8] == '\\N' or row[8] == '0':
-                        row[8] = get_dummy_unique_id()       # ballotpedia_election_id
-                    substitute_null(row, 8, '0')            #
-                    clean_row(row, 10)                      # internal_notes
-                    substitute_null(row, 2, 'f')            # election_preparation_finished
-                elif table_name == "politician_politician":
-                    row[2] = row[2].replace("\\", "")       # middle_name
-                    substitute_null(row, 7, 'U')            # gender
-                    substitute_null(row, 8, '\\N')          # birth_date
-                    row[9] = get_dummy_unique_id()          # bioguide_id, looks like we don't even use this anymore
-                    row[10] = get_dummy_unique_id()         # thomas_id, looks like we don't even use this anymore
-                    row[11] = get_dummy_unique_id()         # lis_id, looks like we don't even use this anymore
-                    row[12] = get_dummy_unique_id()         # govtrack_id, looks like we don't even use this anymore
-                    row[15] = get_dummy_unique_id()         # fec_id, looks like we don't even use this anymore
-                    row[19] = get_dummy_unique_id()         # maplight_id, looks like we don't even use this anymore
-                elif table_name == "polling_location_pollinglocation":
-                    clean_row(row, 2)                       # location_name
-                    row[2] = row[2].replace("\\", "")       # 'BIG BONE STATE PARK GARAGE BLDG\\'
-                    clean_row(row, 3)                       # polling_hours_text
-                    clean_row(row, 4)                       # directions_text
-                    clean_row(row, 5)                       # line1
-                    clean_row(row, 6)                       # line2
-                    substitute_null(row, 11, '0.00001')     # latitude
-                    substitute_null(row, 12, '0.00001')     # longitude
-                    substitute_null(row, 14, '\\N')         # google_response_address_not_found
-                elif table_name == "office_contestoffice":
-                    substitute_null(row, 4, '0')            # google_civic_election_id_new is an integer
-                    row[6] = get_dummy_unique_id()          # maplight_id, looks like we don't even use this anymore
-                    substitute_null(row, 24, '0')           # ballotpedia_office_id is an integer
-                    substitute_null(row, 28, '0')           # ballotpedia_district_id is an integer
-                    substitute_null(row, 29, '0')           # ballotpedia_election_id is an integer
-                    substitute_null(row, 30, '0')           # ballotpedia_race_id is an integer
-                    substitute_null(row, 33, '0')           # google_ballot_placement is an integer
-                    substitute_null(row, 40, 'f')           # ballotpedia_is_marquee is a bool
-                    substitute_null(row, 41, 'f')           # is_battleground_race is a bool
-                elif table_name == "candidate_candidatecampaign":
-                    row[2] = get_dummy_unique_id()          # maplight_id, looks like we don't even use this anymore
-                    substitute_null(row, 6, '0')            # politician_id
-                    clean_row(row, 8)                       # candidate_name |"Elizabeth Nelson ""Liz"" Johnson"|
-                    clean_row(row, 9)                       # google_civic_candidate_name
-                    clean_row(row, 24)                      # candidate_email
-                    substitute_null(row, 28, '0')           # wikipedia_page_id
-                    clean_row(row, 32)                      # twitter_description
-                    substitute_null(row, 33, '0')           # twitter_followers_count
-                    clean_row(row, 34)                      # twitter_location
-                    clean_row(row, 35)                      # twitter_name
-                    clean_row(row, 36)                      # twitter_profile_background_image_url_https
-                    substitute_null(row, 39, '0')           # twitter_user_id
-                    clean_row(row, 40)                      # ballot_guide_official_statement
-                    clean_row(row, 41)                      # contest_office_name
-                    substitute_null(row, 53, '0')           # ballotpedia_candidate_id
-                    clean_row(row, 57)                      # ballotpedia_candidate_summary
-                    substitute_null(row, 58, '0')           # ballotpedia_election_id
-                    substitute_null(row, 59, '0')           # ballotpedia_image_id
-                    substitute_null(row, 60, '0')           # ballotpedia_office_id
-                    substitute_null(row, 61, '0')           # ballotpedia_person_id
-                    substitute_null(row, 62, '0')           # ballotpedia_race_id
-                    substitute_null(row, 65, '0')           # crowdpac_candidate_id
-                    substitute_null(row, 71, '\\N')         # withdrawal_date
-                    substitute_null(row, 75, '0')           # candidate_year
-                    substitute_null(row, 76, '0')           # candidate_ultimate_election_date
-                    # dump_row_col_labels_and_errors(table_name, header, row, '4441')
-                elif table_name == "measure_contestmeasure":
-                    row[3] = row[3].replace('\n', '  ')     # measure_title
-                    clean_row(row, 4)                       #
-                    clean_row(row, 5)                       #
-                    clean_row(row, 6)                       # measure_url
-                    substitute_null(row, 17, '0')           # wikipedia_page_id is a bigint
-                    clean_row(row, 26)                      # ballotpedia_measure_name
-                    clean_row(row, 28)                      # ballotpedia_measure_summ
-                    clean_row(row, 29)                      # ballotpedia_measure_text
-                    clean_row(row, 32)                      # ballotpedia_no_vote_desc
-                    clean_row(row, 33)                      # ballotpedia_yes_vote_des
-                    substitute_null(row, 34, '0')           # google_ballot_placement is a bigint
-                    substitute_null(row, 39, '0')           # measure_year is an integer
-                    substitute_null(row, 40, '0')           # measure_ultimate_election_date is an integer
-                # elif table_name == 'office_contestofficevisitingotherelection':
-                #     pass   # no fixes needed
-                elif table_name == 'organization_organization':
-                    clean_row(row, 11)                      # organization_description
-                    clean_row(row, 12)                      # organization_address
-                    substitute_null(row, 23, '0')           # twitter_followers_count
-                    clean_row(row, 22)                      # twitter_description
-                    substitute_null(row, 31, '0')           # wikipedia_thumbnail_height
-                    substitute_null(row, 33, '0')           # wikipedia_thumbnail_width
-                    clean_row(row, 47)                      # issue_analysis_admin_notes
-                    # dump_row_col_labels_and_errors(table_name, header, row, '1')
-                elif table_name == 'position_positionentered':
-                    clean_row(row, 4)                       # ballot_item_display_name
-                    substitute_null(row, 5, '1970-01-01 00:00:00+00')
-                    clean_row(row, 15)                      #
-                    clean_row(row, 16)                      # vote_smart_rating_name
-                    clean_bigint_row(row, 18)               # contest_office_id
-                    clean_row(row, 22)                      # google_civic_candidate_name
-                    clean_row(row, 28)                      # statement_text
-                    clean_url(row, 30)                      # more_info_url
-                    clean_row(row, 37)                      # speaker_display_name
-                    clean_row(row, 43)                      # google_civic_measure_title
-                    clean_row(row, 44)                      # contest_office_name
-                    clean_row(row, 45)                      # political_party
-                    # dump_row_col_labels_and_errors(table_name, header, row, '33083')
-                elif table_name == 'voter_guide_voterguidepossibility':
-                    clean_url(row, 1)                       # voter_guide_possibility_url
-                    clean_row(row, 5)                       # ballot_items_raw
-                    clean_row(row, 6)                       # organization_name
-                    clean_row(row, 7)                       # organization_twitter_handle
-                    clean_row(row, 11)                      # internal_notes
-                    clean_row(row, 20)                      # contributor_comments
-                    clean_row(row, 22)                      # candidate_name
-                    # dump_row_col_labels_and_errors(table_name, header, row, '4')
-                elif table_name == 'voter_guide_voterguidepossibilityposition':
-                    substitute_null(row, 1, '0')            # voter_guide_possibility_parent_id
-                    substitute_null(row, 2, '0')            # possibility_position_number
-                    clean_row(row, 3)                       # ballot_item_name
-                    clean_row(row, 4)                       # candidate_we_vote_id
-                    clean_row(row, 5)                       # position_we_vote_id
-                    clean_row(row, 6)                       # measure_we_vote_id
-                    clean_row(row, 7)                       # statement_text
-                    substitute_null(row, 8, '0')            # google_civic_election_id
-                    clean_url(row, 10)                      # more_info_url
-                    clean_row(row, 13)                      # candidate_twitter_handle
-                    clean_row(row, 14)                      # organization_name
-                    clean_row(row, 15)                      # organization_twitter_handle
-                    clean_row(row, 16)                      # organization_we_vote_id
-                    # dump_row_col_labels_and_errors(table_name, header, row, '4')
-                elif table_name == 'voter_guide_voterguide':
-                    clean_row(row, 14)                      # twitter_description
-                    # dump_row_col_labels_and_errors(table_name, header, row, '3482')
-                csv_rows.append(row)
-            except Exception as e:
-                logger.error("csv_file_to_clean_csv_file2 (" + table_name + ") caught " + str(e))
 
-        csv_file2.close()
-        if ',' in skipped_rows:
-            print(skipped_rows + ' were skipped since they had pipe characters in the data')
-
-    with open(table_name + '2.csvTemp', 'w') as csv_file:
-        csvwriter = csv.writer(csv_file, delimiter='|')
-        for row in csv_rows:
+# The per-table cleanup rules, applied in order to each row as it streams by.  Each rule is (action, field index),
+# or (action, field index, value).  The field names are in the comments.
+CLEAN_TEXT = 'CLEAN_TEXT'                   # Remove new lines, commas and punctuation
+CLEAN_BIGINT = 'CLEAN_BIGINT'               # Non-numeric values become 0
+CLEAN_URL = 'CLEAN_URL'                     # Remove commas
+DUMMY_UNIQUE_ID = 'DUMMY_UNIQUE_ID'         # Replace with a dummy unique id
+DUMMY_UNIQUE_ID_IF_EMPTY = 'DUMMY_UNIQUE_ID_IF_EMPTY'  # Replace '', '\N' or '0' with a dummy unique id
+REMOVE_BACKSLASHES = 'REMOVE_BACKSLASHES'
+REPLACE_NEW_LINES = 'REPLACE_NEW_LINES'     # Replace new lines with value
+SKIP_ROW_IF_EMPTY = 'SKIP_ROW_IF_EMPTY'     # Don't copy the row to the local database if this field is empty
+SUBSTITUTE_NULL = 'SUBSTITUTE_NULL'         # Replace '\N' or '' with value
+
+TABLE_CLEANING_RULES = {
+    'ballot_ballotitem': [
+        (CLEAN_TEXT, 10),                       # ballot_item_display_name
+        (CLEAN_TEXT, 12),                       # measure_subtitle
+        (CLEAN_TEXT, 14),                       # measure_text
+        (CLEAN_TEXT, 16),                       # no_vote_description
+        (CLEAN_TEXT, 17),                       # yes_vote_description
+    ],
+    'ballot_ballotreturned': [
+        (CLEAN_TEXT, 6),                        # text_for_map_search
+        (SUBSTITUTE_NULL, 7, '0.0'),            # latitude
+        (SUBSTITUTE_NULL, 8, '0.0'),            # longitude
+    ],
+    'candidate_candidatetoofficelink': [
+        (SKIP_ROW_IF_EMPTY, 1),                 # candidate_we_vote_id
+    ],
+    'election_election': [
+        (SUBSTITUTE_NULL, 2, '0'),              # google_civic_election_id_new is an integer
+        (DUMMY_UNIQUE_ID_IF_EMPTY, 8),          # ballotpedia_election_id
+        (SUBSTITUTE_NULL, 8, '0'),              #
+        (CLEAN_TEXT, 10),                       # internal_notes
+        (SUBSTITUTE_NULL, 2, 'f'),              # election_preparation_finished
+    ],
+    'politician_politician': [
+        (REMOVE_BACKSLASHES, 2),                # middle_name
+        (SUBSTITUTE_NULL, 7, 'U'),              # gender
+        (SUBSTITUTE_NULL, 8, '\\N'),            # birth_date
+        (DUMMY_UNIQUE_ID, 9),                   # bioguide_id, looks like we don't even use this anymore
+        (DUMMY_UNIQUE_ID, 10),                  # thomas_id, looks like we don't even use this anymore
+        (DUMMY_UNIQUE_ID, 11),                  # lis_id, looks like we don't even use this anymore
+        (DUMMY_UNIQUE_ID, 12),                  # govtrack_id, looks like we don't even use this anymore
+        (DUMMY_UNIQUE_ID, 15),                  # fec_id, looks like we don't even use this anymore
+        (DUMMY_UNIQUE_ID, 19),                  # maplight_id, looks like we don't even use this anymore
+    ],
+    'polling_location_pollinglocation': [
+        (CLEAN_TEXT, 2),                        # location_name
+        (REMOVE_BACKSLASHES, 2),                # 'BIG BONE STATE PARK GARAGE BLDG\\'
+        (CLEAN_TEXT, 3),                        # polling_hours_text
+        (CLEAN_TEXT, 4),                        # directions_text
+        (CLEAN_TEXT, 5),                        # line1
+        (CLEAN_TEXT, 6),                        # line2
+        (SUBSTITUTE_NULL, 11, '0.00001'),       # latitude
+        (SUBSTITUTE_NULL, 12, '0.00001'),       # longitude
+        (SUBSTITUTE_NULL, 14, '\\N'),           # google_response_address_not_found
+    ],
+    'office_contestoffice': [
+        (SUBSTITUTE_NULL, 4, '0'),              # google_civic_election_id_new is an integer
+        (DUMMY_UNIQUE_ID, 6),                   # maplight_id, looks like we don't even use this anymore
+        (SUBSTITUTE_NULL, 24, '0'),             # ballotpedia_office_id is an integer
+        (SUBSTITUTE_NULL, 28, '0'),             # ballotpedia_district_id is an integer
+        (SUBSTITUTE_NULL, 29, '0'),             # ballotpedia_election_id is an integer
+        (SUBSTITUTE_NULL, 30, '0'),             # ballotpedia_race_id is an integer
+        (SUBSTITUTE_NULL, 33, '0'),             # google_ballot_placement is an integer
+        (SUBSTITUTE_NULL, 40, 'f'),             # ballotpedia_is_marquee is a bool
+        (SUBSTITUTE_NULL, 41, 'f'),             # is_battleground_race is a bool
+    ],
+    'candidate_candidatecampaign': [
+        (DUMMY_UNIQUE_ID, 2),                   # maplight_id, looks like we don't even use this anymore
+        (SUBSTITUTE_NULL, 6, '0'),              # politician_id
+        (CLEAN_TEXT, 8),                        # candidate_name |"Elizabeth Nelson ""Liz"" Johnson"|
+        (CLEAN_TEXT, 9),                        # google_civic_candidate_name
+        (CLEAN_TEXT, 24),                       # candidate_email
+        (SUBSTITUTE_NULL, 28, '0'),             # wikipedia_page_id
+        (CLEAN_TEXT, 32),                       # twitter_description
+        (SUBSTITUTE_NULL, 33, '0'),             # twitter_followers_count
+        (CLEAN_TEXT, 34),                       # twitter_location
+        (CLEAN_TEXT, 35),                       # twitter_name
+        (CLEAN_TEXT, 36),                       # twitter_profile_background_image_url_https
+        (SUBSTITUTE_NULL, 39, '0'),             # twitter_user_id
+        (CLEAN_TEXT, 40),                       # ballot_guide_official_statement
+        (CLEAN_TEXT, 41),                       # contest_office_name
+        (SUBSTITUTE_NULL, 53, '0'),             # ballotpedia_candidate_id
+        (CLEAN_TEXT, 57),                       # ballotpedia_candidate_summary
+        (SUBSTITUTE_NULL, 58, '0'),             # ballotpedia_election_id
+        (SUBSTITUTE_NULL, 59, '0'),             # ballotpedia_image_id
+        (SUBSTITUTE_NULL, 60, '0'),             # ballotpedia_office_id
+        (SUBSTITUTE_NULL, 61, '0'),             # ballotpedia_person_id
+        (SUBSTITUTE_NULL, 62, '0'),             # ballotpedia_race_id
+        (SUBSTITUTE_NULL, 65, '0'),             # crowdpac_candidate_id
+        (SUBSTITUTE_NULL, 71, '\\N'),           # withdrawal_date
+        (SUBSTITUTE_NULL, 75, '0'),             # candidate_year
+        (SUBSTITUTE_NULL, 76, '0'),             # candidate_ultimate_election_date
+    ],
+    'measure_contestmeasure': [
+        (REPLACE_NEW_LINES, 3, '  '),           # measure_title
+        (CLEAN_TEXT, 4),                        #
+        (CLEAN_TEXT, 5),                        #
+        (CLEAN_TEXT, 6),                        # measure_url
+        (SUBSTITUTE_NULL, 17, '0'),             # wikipedia_page_id is a bigint
+        (CLEAN_TEXT, 26),                       # ballotpedia_measure_name
+        (CLEAN_TEXT, 28),                       # ballotpedia_measure_summ
+        (CLEAN_TEXT, 29),                       # ballotpedia_measure_text
+        (CLEAN_TEXT, 32),                       # ballotpedia_no_vote_desc
+        (CLEAN_TEXT, 33),                       # ballotpedia_yes_vote_des
+        (SUBSTITUTE_NULL, 34, '0'),             # google_ballot_placement is a bigint
+        (SUBSTITUTE_NULL, 39, '0'),             # measure_year is an integer
+        (SUBSTITUTE_NULL, 40, '0'),             # measure_ultimate_election_date is an integer
+    ],
+    # 'office_contestofficevisitingotherelection': no fixes needed
+    'organization_organization': [
+        (CLEAN_TEXT, 11),                       # organization_description
+        (CLEAN_TEXT, 12),                       # organization_address
+        (SUBSTITUTE_NULL, 23, '0'),             # twitter_followers_count
+        (CLEAN_TEXT, 22),                       # twitter_description
+        (SUBSTITUTE_NULL, 31, '0'),             # wikipedia_thumbnail_height
+        (SUBSTITUTE_NULL, 33, '0'),             # wikipedia_thumbnail_width
+        (CLEAN_TEXT, 47),                       # issue_analysis_admin_notes
+    ],
+    'position_positionentered': [
+        (CLEAN_TEXT, 4),                        # ballot_item_display_name
+        (SUBSTITUTE_NULL, 5, '1970-01-01 00:00:00+00'),
+        (CLEAN_TEXT, 15),                       #
+        (CLEAN_TEXT, 16),                       # vote_smart_rating_name
+        (CLEAN_BIGINT, 18),                     # contest_office_id
+        (CLEAN_TEXT, 22),                       # google_civic_candidate_name
+        (CLEAN_TEXT, 28),                       # statement_text
+        (CLEAN_URL, 30),                        # more_info_url
+        (CLEAN_TEXT, 37),                       # speaker_display_name
+        (CLEAN_TEXT, 43),                       # google_civic_measure_title
+        (CLEAN_TEXT, 44),                       # contest_office_name
+        (CLEAN_TEXT, 45),                       # political_party
+    ],
+    'voter_guide_voterguidepossibility': [
+        (CLEAN_URL, 1),                         # voter_guide_possibility_url
+        (CLEAN_TEXT, 5),                        # ballot_items_raw
+        (CLEAN_TEXT, 6),                        # organization_name
+        (CLEAN_TEXT, 7),                        # organization_twitter_handle
+        (CLEAN_TEXT, 11),                       # internal_notes
+        (CLEAN_TEXT, 20),                       # contributor_comments
+        (CLEAN_TEXT, 22),                       # candidate_name
+    ],
+    'voter_guide_voterguidepossibilityposition': [
+        (SUBSTITUTE_NULL, 1, '0'),              # voter_guide_possibility_parent_id
+        (SUBSTITUTE_NULL, 2, '0'),              # possibility_position_number
+        (CLEAN_TEXT, 3),                        # ballot_item_name
+        (CLEAN_TEXT, 4),                        # candidate_we_vote_id
+        (CLEAN_TEXT, 5),                        # position_we_vote_id
+        (CLEAN_TEXT, 6),                        # measure_we_vote_id
+        (CLEAN_TEXT, 7),                        # statement_text
+        (SUBSTITUTE_NULL, 8, '0'),              # google_civic_election_id
+        (CLEAN_URL, 10),                        # more_info_url
+        (CLEAN_TEXT, 13),                       # candidate_twitter_handle
+        (CLEAN_TEXT, 14),                       # organization_name
+        (CLEAN_TEXT, 15),                       # organization_twitter_handle
+        (CLEAN_TEXT, 16),                       # organization_we_vote_id
+    ],
+    'voter_guide_voterguide': [
+        (CLEAN_TEXT, 14),                       # twitter_description
+    ],
+}
+
+
+def apply_table_cleaning_rules(table_name, row):
+    """
+    Apply the TABLE_CLEANING_RULES for this table to one row, in place
+    :return: False if the row should be skipped
+    """
+    for rule in TABLE_CLEANING_RULES.get(table_name, []):
+        action = rule[0]
+        index = rule[1]
+        if action == CLEAN_TEXT:
+            clean_row(row, index)
+        elif action == SUBSTITUTE_NULL:
+            substitute_null(row, index, rule[2])
+        elif action == CLEAN_URL:
+            clean_url(row, index)
+        elif action == CLEAN_BIGINT:
+            clean_bigint_row(row, index)
+        elif action == DUMMY_UNIQUE_ID:
+            row[index] = get_dummy_unique_id()
+        elif action == DUMMY_UNIQUE_ID_IF_EMPTY:
+            if row[index] in ('', '\\N', '0'):
+                row[index] = get_dummy_unique_id()
+        elif action == REMOVE_BACKSLASHES:
+            row[index] = row[index].replace("\\", "")
+        elif action == REPLACE_NEW_LINES:
+            row[index] = row[index].replace('\n', rule[2])
+        elif action == SKIP_ROW_IF_EMPTY:
+            if row[index] == '':
+                return False
+    return True
+
+
+def generate_clean_csv_lines(table_name, header, line_reader, cursor_stats):
+    """
+    Clean each incoming row as it streams by, and yield it as a pipe delimited line ready for copy_from.
+    cursor_stats['last_id'] is updated with the largest id seen (including skipped rows), so the caller can resume.
+    """
+    skipped_rows = '... Skipped rows in ' + table_name + ': '
+    line_buffer = io.StringIO()
+    csvwriter = csv.writer(line_buffer, delimiter='|')
+    for row in line_reader:
+        # check_for_non_ascii(table_name, row)
+        cursor_stats['rows_received'] += 1
+        if row and row[0].isnumeric():
+            cursor_stats['last_id'] = max(cursor_stats['last_id'], int(row[0]))
+        try:
+            if len(header) != len(row) or '|' in str(row):  # Messed up records with '|' in them
+                skipped_rows += row[0] + ", "
+                continue
+            if not apply_table_cleaning_rules(table_name, row):
+                continue
+            # dump_row_col_labels_and_errors(table_name, header, row, '2000060')
             csvwriter.writerow(row)
-    csv_file.close()
-    return header
+            yield line_buffer.getvalue()
+            line_buffer.seek(0)
+            line_buffer.truncate()
+        except Exception as e:
+            logger.error("generate_clean_csv_lines (" + table_name + ") caught " + str(e))
+
+    if ',' in skipped_rows:
+        print(skipped_rows + ' were skipped since they had pipe characters in the data')
@@ -7,20 +7,25 @@ from config.base import get_environment_variable
 from elasticsearch import Elasticsearch
 from organization.models import OrganizationManager
 from politician.models import PoliticianManager
+from search.models import KIND_OF_OWNER_POLITICIAN, retrieve_search_index, SEARCH_SCOPE_TO_KIND_OF_OWNER
 from voter.models import fetch_voter_id_from_voter_device_link
 import wevote_functions.admin
-from wevote_functions.functions import is_voter_device_id_valid, positive_value_exists
+from wevote_functions.functions import convert_to_int, is_voter_device_id_valid, positive_value_exists
 
 logger = wevote_functions.admin.get_logger(__name__)
 ELASTIC_SEARCH_CONNECTION_STRING = get_environment_variable("ELASTIC_SEARCH_CONNECTION_STRING")
+SEARCH_ALL_DEFAULT_PAGE_SIZE = 50
 
 
-def search_all_for_api(text_from_search_field='', voter_device_id='', search_scope_list=[]):
+def search_all_for_api(text_from_search_field='', voter_device_id='', search_scope_list=[],
+                       start_retrieve_at_this_number=0, maximum_number_to_retrieve=SEARCH_ALL_DEFAULT_PAGE_SIZE):
     """
 
     :param text_from_search_field:
     :param voter_device_id:
-    :param search_scope_list:
+    :param search_scope_list: Codes from SEARCH_SCOPE_TO_KIND_OF_OWNER. Empty to search everything.
+    :param start_retrieve_at_this_number:
+    :param maximum_number_to_retrieve:
     :return:
     """
     if not positive_value_exists(text_from_search_field):
@@ -59,51 +64,70 @@ def search_all_for_api(text_from_search_field='', voter_device_id='', search_sco
         }
         return results
 
-    # Example of querying ALL indexes
     search_results = []
-    search_count = 0
+    search_results_total = 0
     status = ""
-    politician_manager = PoliticianManager()
+    kind_of_owner_list = [SEARCH_SCOPE_TO_KIND_OF_OWNER[search_scope] for search_scope in search_scope_list
+                          if search_scope in SEARCH_SCOPE_TO_KIND_OF_OWNER]
     try:
-        results = politician_manager.search_politicians(name_search_terms=text_from_search_field)
-        politician_search_results_list = results['politician_search_results_list']
-        success = results['success']
-        if not positive_value_exists(success):
-            status += results['status']
-        for one_politician in politician_search_results_list:
-            # link_internal = "/office/" + one_search_result_dict['we_vote_id']
-            link_internal = ''
-
-            one_search_result = {
-                'result_title':             one_politician.display_full_name(),
-                'result_image':             one_politician.we_vote_hosted_profile_image_url_medium,
-                'result_subtitle':          "",
-                'result_summary':           "",
-                'result_score':             0,
-                'link_internal':            link_internal,
-                'kind_of_owner':            "POLITICIAN",
-                'google_civic_election_id': 0,
-                'state_code':               one_politician.state_code,
-                'twitter_handle':           one_politician.politician_twitter_handle,
-                'we_vote_id':               one_politician.we_vote_id,
-                'local_id':                 one_politician.id,
-            }
-            search_results.append(one_search_result)
-            search_count += 1
-
-        status += "SEARCH_ALL_COMPLETE"
-        success = True
-
+        search_index = retrieve_search_index()
+        if search_index is None:
+            status += "SEARCH_INDEX_NOT_READY "
+            success = False
+        else:
+            search_results_total, search_results = search_index.search(
+                text_from_search_field,
+                kind_of_owner_list=kind_of_owner_list,
+                start_retrieve_at_this_number=convert_to_int(start_retrieve_at_this_number),
+                maximum_number_to_retrieve=convert_to_int(maximum_number_to_retrieve))
+            status += "SEARCH_ALL_COMPLETE"
+            success = True
     except Exception as e:
-        status = 'POLITICIAN_SEARCH: ' + str(e) + " "
+        status += 'SEARCH_INDEX_FAILED: ' + str(e) + " "
         success = False
 
+    if not success and (not len(kind_of_owner_list) or KIND_OF_OWNER_POLITICIAN in kind_of_owner_list):
+        # Fall back to searching the Politician table directly
+        politician_manager = PoliticianManager()
+        try:
+            results = politician_manager.search_politicians(name_search_terms=text_from_search_field)
+            politician_search_results_list = results['politician_search_results_list']
+            success = results['success']
+            if not positive_value_exists(success):
+                status += results['status']
+            for one_politician in politician_search_results_list:
+                # link_internal = "/office/" + one_search_result_dict['we_vote_id']
+                link_internal = ''
+
+                one_search_result = {
+                    'result_title':             one_politician.display_full_name(),
+                    'result_image':             one_politician.we_vote_hosted_profile_image_url_medium,
+                    'result_subtitle':          "",
+                    'result_summary':           "",
+                    'result_score':             0,
+                    'link_internal':            link_internal,
+                    'kind_of_owner':            KIND_OF_OWNER_POLITICIAN,
+                    'google_civic_election_id': 0,
+                    'state_code':               one_politician.state_code,
+                    'twitter_handle':           one_politician.politician_twitter_handle,
+                    'we_vote_id':               one_politician.we_vote_id,
+                    'local_id':                 one_politician.id,
+                }
+                search_results.append(one_search_result)
+            search_results_total = len(search_results)
+            status += "SEARCH_ALL_COMPLETE_WITHOUT_INDEX"
+
+        except Exception as e:
+            status += 'POLITICIAN_SEARCH: ' + str(e) + " "
+            success = False
+
     results = {
         'status':                   status,
         'success':                  success,
         'text_from_search_field':   text_from_search_field,
         'voter_device_id':          voter_device_id,
-        'search_results_found':     True if search_count > 0 else False,
+        'search_results_found':     True if len(search_results) > 0 else False,
+        'search_results_total':     search_results_total,
         'search_results':           search_results,
     }
     return results
@@ -0,0 +1,61 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from politician.models import Politician, PoliticianManager
+from search.models import KIND_OF_OWNER_POLITICIAN, SearchIndex
+
+
+class Command(BaseCommand):
+    help = 'Compares PoliticianManager.search_politicians with the searchAll SearchIndex, over the full Politician ' \
+           'table, for search terms taken from random politician names. Nothing is written.'
+
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--searches', type=int, default=50, help='Number of search terms to time')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for choosing the search terms')
+
+    def handle(self, *args, **options):
+        politician_name_list = list(Politician.objects.using('readonly')
+                                    .exclude(politician_name__isnull=True).exclude(politician_name='')
+                                    .values_list('politician_name', flat=True))
+        if not len(politician_name_list):
+            self.stdout.write('No politicians to search.')
+            return
+        random.seed(options['seed'])
+        search_term_list = []
+        for politician_name in random.sample(politician_name_list, min(options['searches'], len(politician_name_list))):
+            name_word_list = politician_name.split()
+            # Mix full names, last names and the start of a name, as voters type them
+            search_term_list += [politician_name, name_word_list[-1],
+                                 politician_name[:max(3, len(politician_name) // 2)]]
+
+        start = time.perf_counter()
+        search_index = SearchIndex()
+        search_index.add_all_documents(KIND_OF_OWNER_POLITICIAN)
+        self.stdout.write('{count} politicians indexed in {seconds:.3f} seconds'.format(
+            count=len(search_index), seconds=time.perf_counter() - start))
+
+        politician_manager = PoliticianManager()
+
+        def search_with_icontains(search_term):
+            return len(politician_manager.search_politicians(name_search_terms=search_term)[
+                           'politician_search_results_list'])
+
+        def search_with_index(search_term):
+            return search_index.search(search_term, maximum_number_to_retrieve=50)[0]
+
+        for name, search in [('icontains', search_with_icontains), ('search index', search_with_index)]:
+            seconds_list = []
+            found_count = 0
+            for search_term in search_term_list:
+                start = time.perf_counter()
+                found_count += search(search_term)
+                seconds_list.append(time.perf_counter() - start)
+            seconds_list.sort()
+            self.stdout.write('{name:>12}: {searches} searches, median {median:8.2f} ms, slowest {slowest:8.2f} ms, '
+                              '{found} results'.format(
+                                  name=name, searches=len(seconds_list),
+                                  median=1000 * seconds_list[len(seconds_list) // 2],
+                                  slowest=1000 * seconds_list[-1], found=found_count))
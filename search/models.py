@@ -3,17 +3,25 @@
 # -*- coding: UTF-8 -*-
 
 from ballot.models import BallotReturnedManager
+import bisect
 from config.base import get_environment_variable
 from candidate.models import CandidateCampaign
+from datetime import timedelta
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.utils.timezone import localtime, now
 from elasticsearch import Elasticsearch
 from election.models import Election
 from measure.models import ContestMeasure
 from office.models import ContestOffice
-from organization.models import Organization
+from organization.models import INDIVIDUAL, Organization
+from politician.models import Politician
+import re
+import threading
+import time
+import unicodedata
 import wevote_functions.admin
-from wevote_functions.functions import positive_value_exists
+from wevote_functions.functions import convert_to_int, positive_value_exists
 
 logger = wevote_functions.admin.get_logger(__name__)
 STATE_CODE_MAP = {
@@ -278,6 +286,417 @@ def delete_organization_signal(sender, instance, **kwargs):
             logger.error(status)
 
 
+# In-process search index for searchAll
+#  Each worker builds its own index of politicians, upcoming candidates, organizations (not individuals) and upcoming
+#  measures in a background thread the first time someone searches (searchAll falls back to the Politician table
+#  until it is ready). Saves and deletes in this worker update it right away (see the signals
+#  below), saves in other workers are picked up every SEARCH_INDEX_REFRESH_SECONDS from date_last_updated, and the
+#  whole index is rebuilt every SEARCH_INDEX_REBUILD_SECONDS so deletes in other workers drop out.
+SEARCH_INDEX_REFRESH_SECONDS = 60
+SEARCH_INDEX_REBUILD_SECONDS = 3600
+SEARCH_INDEX_BUILD_RETRY_SECONDS = 300  # Wait this long after a failed build or refresh before trying again
+SEARCH_INDEX_PREFIX_EXPANSION_LIMIT = 500  # Most tokens one search word can match as a prefix
+SEARCH_INDEX_FUZZY_MINIMUM_LENGTH = 4  # Shorter words only match exactly or as a prefix
+SEARCH_INDEX_TITLE_WEIGHT = 3
+SEARCH_INDEX_TWITTER_HANDLE_WEIGHT = 2
+SEARCH_INDEX_EXACT_MATCH = 1.0
+SEARCH_INDEX_PREFIX_MATCH = 0.6
+SEARCH_INDEX_FUZZY_MATCH = 0.3
+
+KIND_OF_OWNER_CANDIDATE = 'CANDIDATE'
+KIND_OF_OWNER_MEASURE = 'MEASURE'
+KIND_OF_OWNER_ORGANIZATION = 'ORGANIZATION'
+KIND_OF_OWNER_POLITICIAN = 'POLITICIAN'
+# search_scope_list values accepted by searchAll
+SEARCH_SCOPE_TO_KIND_OF_OWNER = {
+    'CN': KIND_OF_OWNER_CANDIDATE,  # CANDIDATE_NAME
+    'MN': KIND_OF_OWNER_MEASURE,  # MEASURE_NAME
+    'ON': KIND_OF_OWNER_ORGANIZATION,  # ORGANIZATION_NAME
+    'PN': KIND_OF_OWNER_POLITICIAN,  # POLITICIAN_NAME
+}
+SEARCH_INDEX_WORD_SPLIT_PATTERN = re.compile(r'[^a-z0-9]+')
+
+
+def split_text_into_search_tokens(text):
+    if not positive_value_exists(text):
+        return []
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii').lower()
+    return [token for token in SEARCH_INDEX_WORD_SPLIT_PATTERN.split(text) if token]
+
+
+def generate_search_token_deletions(token):
+    return set(token[:index] + token[index + 1:] for index in range(len(token)))
+
+
+def generate_search_document(kind_of_owner, instance):
+    """
+    :param kind_of_owner:
+    :param instance: Politician, CandidateCampaign, Organization or ContestMeasure
+    :return: (result dict in the searchAll format, list of (text, weight)), or (None, None) if not searched
+    """
+    this_year = localtime(now()).year
+    if kind_of_owner == KIND_OF_OWNER_POLITICIAN:
+        title = instance.display_full_name()
+        twitter_handle = instance.politician_twitter_handle
+        result = {
+            'result_title':             title,
+            'result_image':             instance.we_vote_hosted_profile_image_url_medium,
+            'result_subtitle':          "",
+            'google_civic_election_id': 0,
+            'state_code':               instance.state_code,
+        }
+    elif kind_of_owner == KIND_OF_OWNER_CANDIDATE:
+        if not positive_value_exists(instance.candidate_year) or instance.candidate_year < this_year:
+            return None, None
+        title = instance.display_candidate_name()
+        twitter_handle = instance.candidate_twitter_handle
+        result = {
+            'result_title':             title,
+            'result_image':             instance.we_vote_hosted_profile_image_url_medium,
+            'result_subtitle':          instance.party if positive_value_exists(instance.party) else "",
+            'google_civic_election_id': convert_to_int(instance.google_civic_election_id),
+            'state_code':               instance.state_code,
+        }
+    elif kind_of_owner == KIND_OF_OWNER_ORGANIZATION:
+        if instance.organization_type == INDIVIDUAL:
+            return None, None
+        title = instance.organization_name
+        twitter_handle = instance.organization_twitter_handle
+        result = {
+            'result_title':             title,
+            'result_image':             instance.we_vote_hosted_profile_image_url_medium,
+            'result_subtitle':          "",
+            'google_civic_election_id': 0,
+            'state_code':               instance.state_served_code,
+        }
+    elif kind_of_owner == KIND_OF_OWNER_MEASURE:
+        if not positive_value_exists(instance.measure_year) or instance.measure_year < this_year:
+            return None, None
+        title = instance.measure_title
+        twitter_handle = ""
+        result = {
+            'result_title':             title,
+            'result_image':             "",
+            'result_subtitle':          "",
+            'google_civic_election_id': convert_to_int(instance.google_civic_election_id),
+            'state_code':               instance.state_code,
+        }
+    else:
+        return None, None
+
+    result.update({
+        'result_summary':   "",
+        'result_score':     0,
+        'link_internal':    "",
+        'kind_of_owner':    kind_of_owner,
+        'twitter_handle':   twitter_handle,
+        'we_vote_id':       instance.we_vote_id,
+        'local_id':         instance.id,
+    })
+    weighted_text_list = [(title, SEARCH_INDEX_TITLE_WEIGHT), (twitter_handle, SEARCH_INDEX_TWITTER_HANDLE_WEIGHT)]
+    return result, weighted_text_list
+
+
+def generate_search_index_queryset(kind_of_owner, changed_since=None):
+    this_year = localtime(now()).year
+    if kind_of_owner == KIND_OF_OWNER_POLITICIAN:
+        queryset = Politician.objects.using('readonly').only(
+            'id', 'we_vote_id', 'politician_name', 'first_name', 'last_name', 'google_civic_candidate_name',
+            'politician_twitter_handle', 'we_vote_hosted_profile_image_url_medium', 'state_code')
+        date_last_updated_field = 'date_last_updated'
+    elif kind_of_owner == KIND_OF_OWNER_CANDIDATE:
+        queryset = CandidateCampaign.objects.using('readonly').filter(candidate_year__gte=this_year).only(
+            'id', 'we_vote_id', 'candidate_name', 'candidate_year', 'candidate_twitter_handle', 'party',
+            'we_vote_hosted_profile_image_url_medium', 'google_civic_election_id', 'state_code')
+        date_last_updated_field = 'date_last_updated'
+    elif kind_of_owner == KIND_OF_OWNER_ORGANIZATION:
+        queryset = Organization.objects.using('readonly').exclude(organization_type=INDIVIDUAL).only(
+            'id', 'we_vote_id', 'organization_name', 'organization_type', 'organization_twitter_handle',
+            'we_vote_hosted_profile_image_url_medium', 'state_served_code')
+        date_last_updated_field = 'date_last_changed'
+    else:
+        queryset = ContestMeasure.objects.using('readonly').filter(measure_year__gte=this_year).only(
+            'id', 'we_vote_id', 'measure_title', 'measure_year', 'google_civic_election_id', 'state_code')
+        date_last_updated_field = 'date_last_updated'
+    if changed_since is not None:
+        queryset = queryset.filter(**{date_last_updated_field + '__gte': changed_since})
+    return queryset
+
+
+class SearchIndex(object):
+    """
+    Inverted index from lower case, accent-free tokens to documents, with prefix matching (over a sorted token list)
+    and fuzzy matching within one edit (over the tokens with one character deleted). Every search word has to match
+    each result, like the icontains search it replaces.
+    """
+    def __init__(self):
+        self.document_dict = {}  # (kind_of_owner, local_id) -> searchAll result dict
+        self.document_token_dict = {}  # (kind_of_owner, local_id) -> {token: weight}
+        self.postings_dict = {}  # token -> {(kind_of_owner, local_id): weight}
+        self.sorted_token_list = []
+        self.token_deletions_dict = {}  # token with one character deleted -> set of tokens
+        self.lock = threading.RLock()
+        self.date_refreshed = None
+        self.time_built = 0
+        self.time_refreshed = 0
+
+    def __len__(self):
+        return len(self.document_dict)
+
+    def add_document(self, kind_of_owner, instance, keep_tokens_sorted=True):
+        result, weighted_text_list = generate_search_document(kind_of_owner, instance)
+        document_key = (kind_of_owner, instance.id)
+        with self.lock:
+            self.remove_document(kind_of_owner, instance.id)
+            if result is None:
+                return
+            token_weight_dict = {}
+            for text, weight in weighted_text_list:
+                for token in split_text_into_search_tokens(text):
+                    token_weight_dict[token] = max(weight, token_weight_dict.get(token, 0))
+            self.document_dict[document_key] = result
+            self.document_token_dict[document_key] = token_weight_dict
+            for token, weight in token_weight_dict.items():
+                if token not in self.postings_dict:
+                    self.postings_dict[token] = {}
+                    if keep_tokens_sorted:
+                        bisect.insort(self.sorted_token_list, token)
+                    else:
+                        self.sorted_token_list.append(token)
+                    if len(token) >= SEARCH_INDEX_FUZZY_MINIMUM_LENGTH:
+                        for deletion in generate_search_token_deletions(token):
+                            self.token_deletions_dict.setdefault(deletion, set()).add(token)
+                self.postings_dict[token][document_key] = weight
+
+    def remove_document(self, kind_of_owner, local_id):
+        document_key = (kind_of_owner, local_id)
+        with self.lock:
+            self.document_dict.pop(document_key, None)
+            token_weight_dict = self.document_token_dict.pop(document_key, {})
+            for token in token_weight_dict:
+                postings = self.postings_dict.get(token)
+                if postings is None:
+                    continue
+                postings.pop(document_key, None)
+                if not len(postings):
+                    del self.postings_dict[token]
+                    token_index = bisect.bisect_left(self.sorted_token_list, token)
+                    if token_index < len(self.sorted_token_list) and self.sorted_token_list[token_index] == token:
+                        del self.sorted_token_list[token_index]
+                    if len(token) >= SEARCH_INDEX_FUZZY_MINIMUM_LENGTH:
+                        for deletion in generate_search_token_deletions(token):
+                            deletion_tokens = self.token_deletions_dict.get(deletion)
+                            if deletion_tokens is not None:
+                                deletion_tokens.discard(token)
+                                if not len(deletion_tokens):
+                                    del self.token_deletions_dict[deletion]
+
+    def add_all_documents(self, kind_of_owner, changed_since=None):
+        queryset = generate_search_index_queryset(kind_of_owner, changed_since=changed_since)
+        keep_tokens_sorted = changed_since is not None
+        for instance in queryset.iterator(chunk_size=2000):
+            try:
+                self.add_document(kind_of_owner, instance, keep_tokens_sorted=keep_tokens_sorted)
+            except Exception as err:
+                # One bad row (a Politician without any name, for example) is left out, not the whole index
+                logger.error("SEARCH_INDEX_ADD_DOCUMENT_FAILED " + str(kind_of_owner) + " " + str(instance.id) +
+                             ", err: " + str(err))
+        if not keep_tokens_sorted:
+            with self.lock:
+                self.sorted_token_list.sort()
+
+    def match_search_word(self, search_word):
+        """
+        :param search_word:
+        :return: dict of token -> how well it matches search_word
+        """
+        token_match_dict = {}
+        token_index = bisect.bisect_left(self.sorted_token_list, search_word)
+        while token_index < len(self.sorted_token_list) and \
+                len(token_match_dict) < SEARCH_INDEX_PREFIX_EXPANSION_LIMIT:
+            token = self.sorted_token_list[token_index]
+            if not token.startswith(search_word):
+                break
+            token_match_dict[token] = SEARCH_INDEX_EXACT_MATCH if token == search_word else SEARCH_INDEX_PREFIX_MATCH
+            token_index += 1
+        if len(search_word) >= SEARCH_INDEX_FUZZY_MINIMUM_LENGTH:
+            fuzzy_token_set = set(self.token_deletions_dict.get(search_word, set()))
+            for deletion in generate_search_token_deletions(search_word):
+                if deletion in self.postings_dict:
+                    fuzzy_token_set.add(deletion)
+                fuzzy_token_set.update(self.token_deletions_dict.get(deletion, set()))
+            for token in fuzzy_token_set:
+                if token not in token_match_dict:
+                    token_match_dict[token] = SEARCH_INDEX_FUZZY_MATCH
+        return token_match_dict
+
+    def search(self, text_from_search_field, kind_of_owner_list=None,
+               start_retrieve_at_this_number=0, maximum_number_to_retrieve=0):
+        """
+        :param text_from_search_field:
+        :param kind_of_owner_list: Only return these kinds of results
+        :param start_retrieve_at_this_number:
+        :param maximum_number_to_retrieve: 0 for all of them
+        :return: (number of matches, list of searchAll result dicts, best first)
+        """
+        search_word_list = list(dict.fromkeys(split_text_into_search_tokens(text_from_search_field)))
+        if not len(search_word_list):
+            return 0, []
+        start_retrieve_at_this_number = max(0, convert_to_int(start_retrieve_at_this_number))
+        with self.lock:
+            document_score_dict = None
+            for search_word in search_word_list:
+                word_score_dict = {}
+                for token, match_quality in self.match_search_word(search_word).items():
+                    for document_key, weight in self.postings_dict[token].items():
+                        if document_score_dict is not None and document_key not in document_score_dict:
+                            continue
+                        if kind_of_owner_list and document_key[0] not in kind_of_owner_list:
+                            continue
+                        score = weight * match_quality
+                        if score > word_score_dict.get(document_key, 0):
+                            word_score_dict[document_key] = score
+                if document_score_dict is None:
+                    document_score_dict = word_score_dict
+                else:
+                    document_score_dict = {document_key: document_score_dict[document_key] + score
+                                           for document_key, score in word_score_dict.items()}
+                if not len(document_score_dict):
+                    return 0, []
+
+            ranked_document_key_list = sorted(
+                document_score_dict,
+                key=lambda document_key: (-document_score_dict[document_key],
+                                          self.document_dict[document_key]['result_title'] or ''))
+            if positive_value_exists(maximum_number_to_retrieve):
+                page_document_key_list = ranked_document_key_list[
+                    start_retrieve_at_this_number:start_retrieve_at_this_number + maximum_number_to_retrieve]
+            else:
+                page_document_key_list = ranked_document_key_list[start_retrieve_at_this_number:]
+            search_results = []
+            for document_key in page_document_key_list:
+                one_search_result = dict(self.document_dict[document_key])
+                # Out of 100 for each search word matching a title exactly
+                one_search_result['result_score'] = \
+                    int(round(100 * document_score_dict[document_key] /
+                              (SEARCH_INDEX_TITLE_WEIGHT * len(search_word_list))))
+                search_results.append(one_search_result)
+        return len(ranked_document_key_list), search_results
+
+
+search_index = None
+search_index_build_lock = threading.Lock()
+search_index_time_build_failed = None
+
+
+def build_search_index():
+    """
+    Build the search index, or refresh or rebuild it when it is due. Runs in its own thread, started by
+    retrieve_search_index with search_index_build_lock held, and releases the lock when done.
+    :return:
+    """
+    global search_index, search_index_time_build_failed
+    from django.db import connection
+    try:
+        time_now = time.monotonic()
+        if search_index is None or time_now - search_index.time_built >= SEARCH_INDEX_REBUILD_SECONDS:
+            new_search_index = SearchIndex()
+            new_search_index.date_refreshed = now()
+            for kind_of_owner in SEARCH_SCOPE_TO_KIND_OF_OWNER.values():
+                new_search_index.add_all_documents(kind_of_owner)
+            new_search_index.time_built = new_search_index.time_refreshed = time.monotonic()
+            search_index = new_search_index
+        elif time_now - search_index.time_refreshed >= SEARCH_INDEX_REFRESH_SECONDS:
+            # Overlap with the last refresh, in case a save was still being committed (or replicated to readonly)
+            changed_since = search_index.date_refreshed - timedelta(seconds=SEARCH_INDEX_REFRESH_SECONDS)
+            date_refreshed = now()
+            for kind_of_owner in SEARCH_SCOPE_TO_KIND_OF_OWNER.values():
+                search_index.add_all_documents(kind_of_owner, changed_since=changed_since)
+            search_index.date_refreshed = date_refreshed
+            search_index.time_refreshed = time.monotonic()
+        search_index_time_build_failed = None
+    except Exception as err:
+        logger.error("BUILD_SEARCH_INDEX_FAILED, err: " + str(err))
+        search_index_time_build_failed = time.monotonic()
+    finally:
+        connection.close()
+        search_index_build_lock.release()
+
+
+def retrieve_search_index():
+    """
+    The search index for this worker. The first call starts building it off the request thread, and later calls
+    start a refresh or rebuild when one is due. Searches keep using the current index in the meantime.
+    :return: The SearchIndex, or None while the first build is still running (or has failed)
+    """
+    time_now = time.monotonic()
+    if search_index is not None and time_now - search_index.time_refreshed < SEARCH_INDEX_REFRESH_SECONDS:
+        return search_index
+    if search_index_time_build_failed is not None and \
+            time_now - search_index_time_build_failed < SEARCH_INDEX_BUILD_RETRY_SECONDS:
+        return search_index
+    if search_index_build_lock.acquire(blocking=False):
+        try:
+            threading.Thread(name='search_index_build_thread', target=build_search_index, daemon=True).start()
+        except Exception as err:
+            search_index_build_lock.release()
+            logger.error("SEARCH_INDEX_BUILD_THREAD_NOT_STARTED, err: " + str(err))
+    return search_index
+
+
+def update_search_index_for_instance(kind_of_owner, instance, deleted=False):
+    if search_index is None:
+        # Nothing to update until the first search builds the index
+        return
+    try:
+        if deleted:
+            search_index.remove_document(kind_of_owner, instance.id)
+        else:
+            search_index.add_document(kind_of_owner, instance)
+    except Exception as err:
+        logger.error("UPDATE_SEARCH_INDEX_FOR_INSTANCE " + str(kind_of_owner) + ", err: " + str(err))
+
+
+@receiver(post_save, sender=CandidateCampaign)
+def save_candidate_campaign_search_index_signal(sender, instance, **kwargs):
+    update_search_index_for_instance(KIND_OF_OWNER_CANDIDATE, instance)
+
+
+@receiver(post_delete, sender=CandidateCampaign)
+def delete_candidate_campaign_search_index_signal(sender, instance, **kwargs):
+    update_search_index_for_instance(KIND_OF_OWNER_CANDIDATE, instance, deleted=True)
+
+
+@receiver(post_save, sender=ContestMeasure)
+def save_contest_measure_search_index_signal(sender, instance, **kwargs):
+    update_search_index_for_instance(KIND_OF_OWNER_MEASURE, instance)
+
+
+@receiver(post_delete, sender=ContestMeasure)
+def delete_contest_measure_search_index_signal(sender, instance, **kwargs):
+    update_search_index_for_instance(KIND_OF_OWNER_MEASURE, instance, deleted=True)
+
+
+@receiver(post_save, sender=Organization)
+def save_organization_search_index_signal(sender, instance, **kwargs):
+    update_search_index_for_instance(KIND_OF_OWNER_ORGANIZATION, instance)
+
+
+@receiver(post_delete, sender=Organization)
+def delete_organization_search_index_signal(sender, instance, **kwargs):
+    update_search_index_for_instance(KIND_OF_OWNER_ORGANIZATION, instance, deleted=True)
+
+
+@receiver(post_save, sender=Politician)
+def save_politician_search_index_signal(sender, instance, **kwargs):
+    update_search_index_for_instance(KIND_OF_OWNER_POLITICIAN, instance)
+
+
+@receiver(post_delete, sender=Politician)
+def delete_politician_search_index_signal(sender, instance, **kwargs):
+    update_search_index_for_instance(KIND_OF_OWNER_POLITICIAN, instance, deleted=True)
+
+
 # @receiver(post_save)
 # def save_signal(sender, **kwargs):
 #     print("### save")
@@ -0,0 +1,148 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.utils.timezone import now
+
+from politician.models import Politician
+import search.models
+from search.models import build_search_index, KIND_OF_OWNER_ORGANIZATION, KIND_OF_OWNER_POLITICIAN, \
+    retrieve_search_index, SearchIndex, split_text_into_search_tokens
+
+
+class SearchIndexTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.search_index = SearchIndex()
+        for local_id, politician_name, twitter_handle in [
+                (1, 'Barbara Lee', 'RepBarbaraLee'),
+                (2, 'Barbara Boxer', ''),
+                (3, 'Lee Zeldin', 'RepLeeZeldin'),
+                (4, 'José Ramírez', '')]:
+            self.search_index.add_document(KIND_OF_OWNER_POLITICIAN, Politician(
+                id=local_id, we_vote_id='wv01pol' + str(local_id), politician_name=politician_name,
+                politician_twitter_handle=twitter_handle))
+
+    def search_titles(self, text_from_search_field, **kwargs):
+        return [one_result['result_title'] for one_result in
+                self.search_index.search(text_from_search_field, **kwargs)[1]]
+
+    def test_text_is_split_into_lower_case_tokens_without_accents(self):
+        self.assertEqual(split_text_into_search_tokens("José Ramírez-O'Neil, Jr."),
+                         ['jose', 'ramirez', 'o', 'neil', 'jr'])
+        self.assertEqual(split_text_into_search_tokens(None), [])
+        self.assertEqual(split_text_into_search_tokens('  ...  '), [])
+
+    def test_every_search_word_has_to_match_by_word_or_prefix(self):
+        self.assertEqual(self.search_titles('barbara lee'), ['Barbara Lee'])
+        self.assertEqual(self.search_titles('BARB'), ['Barbara Boxer', 'Barbara Lee'])
+        self.assertEqual(self.search_titles('jose'), ['José Ramírez'])
+        self.assertEqual(self.search_titles('repbarbara'), ['Barbara Lee'], 'Twitter handles are searched')
+        self.assertEqual(self.search_titles('barbara zeldin'), [])
+
+    def test_exact_matches_rank_above_prefix_and_fuzzy_matches(self):
+        self.assertEqual(self.search_titles('lee'), ['Barbara Lee', 'Lee Zeldin'])
+        self.assertEqual(self.search_titles('zeld'), ['Lee Zeldin'])
+        self.assertEqual(self.search_titles('boxr'), ['Barbara Boxer'], 'One character missing')
+        self.assertEqual(self.search_titles('barbarra'), ['Barbara Boxer', 'Barbara Lee'], 'One character extra')
+        self.assertEqual(self.search_titles('zeldim'), ['Lee Zeldin'], 'One character different')
+        self.assertEqual(self.search_titles('lea'), [], 'Short words are not matched fuzzily')
+
+        results_total, search_results = self.search_index.search('boxer')
+        self.assertEqual(search_results[0]['result_score'], 100)
+        results_total, search_results = self.search_index.search('boxr')
+        self.assertLess(search_results[0]['result_score'], 100)
+
+    def test_kind_of_owner_and_page_limit_results(self):
+        self.assertEqual(self.search_titles('barbara', kind_of_owner_list=[KIND_OF_OWNER_ORGANIZATION]), [])
+        self.assertEqual(self.search_titles('barbara', maximum_number_to_retrieve=1), ['Barbara Boxer'])
+        self.assertEqual(self.search_titles('barbara', start_retrieve_at_this_number=1), ['Barbara Lee'])
+        self.assertEqual(self.search_titles('barbara', start_retrieve_at_this_number=-5, maximum_number_to_retrieve=1),
+                         ['Barbara Boxer'], 'A negative start is read as the first result')
+        self.assertEqual(self.search_index.search('barbara', start_retrieve_at_this_number=5)[0], 2)
+
+    def test_removed_and_changed_documents_leave_no_tokens_behind(self):
+        self.search_index.remove_document(KIND_OF_OWNER_POLITICIAN, 2)
+        self.assertEqual(self.search_titles('boxer'), [])
+        self.assertNotIn('boxer', self.search_index.sorted_token_list)
+        self.assertNotIn('boxr', self.search_index.token_deletions_dict)
+
+        self.search_index.add_document(KIND_OF_OWNER_POLITICIAN, Politician(
+            id=3, we_vote_id='wv01pol3', politician_name='Lee Zeldin Jr'))
+        self.assertEqual(self.search_titles('repleezeldin'), [])
+        self.assertEqual(self.search_titles('zeldin jr'), ['Lee Zeldin Jr'])
+        self.assertEqual(len(self.search_index), 3)
+        self.assertEqual(self.search_index.sorted_token_list, sorted(self.search_index.postings_dict))
+
+
+class SearchIndexRefreshTestCase(TestCase):
+    databases = ["default", "readonly"]
+
+    def test_refresh_only_reads_politicians_changed_since_the_last_one(self):
+        politician = Politician.objects.create(politician_name='Barbara Lee')
+        unchanged_politician = Politician.objects.create(politician_name='Lee Zeldin')
+        search_index = SearchIndex()
+        search_index.add_all_documents(KIND_OF_OWNER_POLITICIAN)
+        self.assertEqual(len(search_index), 2)
+
+        politician.politician_name = 'Barbara J. Lee'
+        politician.save()
+        Politician.objects.filter(id=unchanged_politician.id).update(
+            politician_name='Not Read', date_last_updated=now() - timedelta(days=1))
+        search_index.add_all_documents(KIND_OF_OWNER_POLITICIAN, changed_since=now() - timedelta(minutes=1))
+        results_total, search_results = search_index.search('lee')
+        self.assertEqual([one_result['result_title'] for one_result in search_results],
+                         ['Barbara J. Lee', 'Lee Zeldin'])
+
+    def test_politician_that_cannot_be_indexed_is_skipped(self):
+        Politician.objects.create(politician_name='Barbara Lee')
+        Politician.objects.create(politician_name='Lee Zeldin')
+        Politician.objects.create()
+        original_display_full_name = Politician.display_full_name
+
+        def display_full_name(politician):
+            if politician.politician_name == 'Lee Zeldin':
+                raise TypeError('bad row')
+            return original_display_full_name(politician)
+
+        search_index = SearchIndex()
+        with mock.patch.object(Politician, 'display_full_name', display_full_name):
+            search_index.add_all_documents(KIND_OF_OWNER_POLITICIAN)
+        self.assertEqual(len(search_index), 2)
+        self.assertEqual(search_index.search('lee')[0], 1)
+
+
+@mock.patch('django.db.connection')
+class RetrieveSearchIndexTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, search.models, 'search_index', None)
+        self.addCleanup(setattr, search.models, 'search_index_time_build_failed', None)
+
+    def test_index_is_built_off_the_request_thread(self, connection):
+        with mock.patch('search.models.threading.Thread') as thread:
+            self.assertIsNone(retrieve_search_index())
+            self.assertIsNone(retrieve_search_index(), 'Only one build at a time')
+        self.assertEqual(thread.call_count, 1)
+        self.assertEqual(thread.call_args[1]['target'], build_search_index)
+
+        with mock.patch.object(SearchIndex, 'add_all_documents'):
+            build_search_index()
+        self.assertIsNotNone(retrieve_search_index())
+        self.assertFalse(search.models.search_index_build_lock.locked())
+
+    def test_failed_build_is_not_tried_again_right_away(self, connection):
+        search.models.search_index_build_lock.acquire()
+        with mock.patch.object(SearchIndex, 'add_all_documents', side_effect=Exception('database down')):
+            build_search_index()
+        self.assertIsNone(search.models.search_index)
+        self.assertIsNotNone(search.models.search_index_time_build_failed)
+        self.assertFalse(search.models.search_index_build_lock.locked())
+
+        with mock.patch('search.models.threading.Thread') as thread:
+            self.assertIsNone(retrieve_search_index())
+            self.assertEqual(thread.call_count, 0)
+            search.models.search_index_time_build_failed -= search.models.SEARCH_INDEX_BUILD_RETRY_SECONDS
+            retrieve_search_index()
+            self.assertEqual(thread.call_count, 1)
+        search.models.search_index_build_lock.release()
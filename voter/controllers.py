@@ -1,7 +1,7 @@
 # voter/controllers.py
 # Brought to you by We Vote. Be good.
 # -*- coding: UTF-8 -*-
-from .models import BALLOT_ADDRESS, fetch_voter_id_from_voter_device_link, \
+from .models import BALLOT_ADDRESS, fetch_voter_id_from_voter_device_link, invalidate_voter_identity_cache, \
     MAINTENANCE_STATUS_FLAGS_TASK_ONE, MAINTENANCE_STATUS_FLAGS_TASK_TWO, MAINTENANCE_STATUS_FLAGS_COMPLETED, \
     NOTIFICATION_VOTER_DAILY_SUMMARY_EMAIL, \
     NOTIFICATION_FRIEND_REQUESTS_EMAIL, NOTIFICATION_SUGGESTED_FRIENDS_EMAIL, \
@@ -2402,6 +2402,9 @@ def voter_merge_two_accounts_action(  # voterMergeTwoAccounts, part 2
     else:
         status += update_link_results['status']
         status += "VOTER_DEVICE_LINK_NOT_UPDATED "
+    # Every device of either voter may have the pre-merge identity cached
+    invalidate_voter_identity_cache(voter_device_id=voter_device_id, voter_id=from_voter.id)
+    invalidate_voter_identity_cache(voter_id=new_owner_voter.id)
 
     # Data healing scripts
     repair_results = position_list_manager.repair_all_positions_for_voter(new_owner_voter.id)
@@ -3315,10 +3318,13 @@ def voter_sign_out_for_api(voter_device_id, sign_out_all_devices=False):  # vote
                     status += refresh_results['status']
 
     if positive_value_exists(sign_out_all_devices):
+        # Forget the identity of the other devices while we can still look them up
+        invalidate_voter_identity_cache(voter_id=results['voter_id'])
         results = voter_device_link_manager.delete_all_voter_device_links(voter_device_id)
     else:
         results = voter_device_link_manager.delete_voter_device_link(voter_device_id)
     status += results['status']
+    invalidate_voter_identity_cache(voter_device_id=voter_device_id)
 
     results = {
         'success':  results['success'],
@@ -3734,6 +3740,9 @@ def voter_split_into_two_accounts_for_api(voter_device_id, split_off_twitter):
 
     # We do not duplicate any donations that have been made
 
+    invalidate_voter_identity_cache(voter_device_id=voter_device_id, voter_id=current_voter_id)
+    invalidate_voter_identity_cache(voter_id=split_off_voter_id)
+
     results = {
         'status': status,
         'success': success,
@@ -0,0 +1,23 @@
+# voter/middleware.py
+# Brought to you by We Vote. Be good.
+# -*- coding: UTF-8 -*-
+
+"""Voter identity middleware"""
+
+from voter.models import end_voter_identity_request_memo, start_voter_identity_request_memo
+
+
+class VoterIdentityCacheMiddleware(object):
+    """
+    Lets every call to fetch_voter_id_from_voter_device_link (and its siblings) made while handling one request share
+    a single voter_device_id -> voter identity lookup.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start_voter_identity_request_memo()
+        try:
+            return self.get_response(request)
+        finally:
+            end_voter_identity_request_memo()
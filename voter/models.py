@@ -2,8 +2,11 @@
 # Brought to you by We Vote. Be good.
 # -*- coding: UTF-8 -*-
 
+from django.core.cache import caches
 from django.db import (models, IntegrityError)
-from django.db.models import Q
+from django.db.models import Q, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.contrib.auth.models import (BaseUserManager, AbstractBaseUser)  # PermissionsMixin
 from django.core.validators import RegexValidator
 from datetime import datetime, timedelta
@@ -15,12 +18,14 @@ import pytz
 from sms.models import SMSManager
 import string
 import sys
+import threading
 from twitter.models import TwitterUserManager
 from validate_email import validate_email
 import wevote_functions.admin
 from wevote_functions.functions import extract_state_code_from_address_string, convert_to_int, generate_random_string, \
-    generate_voter_device_id, get_voter_api_device_id, positive_value_exists
+    generate_voter_device_id, get_voter_api_device_id, is_cache_shared_between_processes, positive_value_exists
 from wevote_settings.models import fetch_next_we_vote_id_voter_integer, fetch_site_unique_id_prefix
+from config.base import get_environment_variable_default
 
 
 logger = wevote_functions.admin.get_logger(__name__)
@@ -33,6 +38,15 @@ BALLOT_INTRO_FRIENDS_COMPLETED = 32  # ...the voter has reached out to at least
 BALLOT_INTRO_SHARE_COMPLETED = 64  # ...the voter has shared at least one item (no need for intro)
 BALLOT_INTRO_VOTE_COMPLETED = 128  # ...the voter learned about casting their vote (no need for intro)
 
+# voter_device_id -> voter identity. The request memo lives for one request (see voter/middleware.py), and the shared
+#  tier is a Django cache backend (see CACHES in config/base.py) holding voter_device_id -> voter_id and
+#  voter_id -> identity entries, which every explicit change to a VoterDeviceLink or Voter clears. Signing out has to
+#  take effect on every worker, so the shared tier is only used when this alias points at a backend all processes
+#  share (not LocMemCache). The TTL bounds how stale an entry can get if a change slips past those hooks
+#  (ex/ queryset.update).
+VOTER_IDENTITY_CACHE_ALIAS = get_environment_variable_default('VOTER_IDENTITY_CACHE_ALIAS', 'default')
+VOTER_IDENTITY_CACHE_TTL_SECONDS = 60
+
 INTERFACE_STATUS_THRESHOLD_ISSUES_FOLLOWED = 3
 INTERFACE_STATUS_THRESHOLD_ORGANIZATIONS_FOLLOWED = 5
 
@@ -3065,14 +3079,215 @@ class VoterDeviceLinkManager(models.Manager):
         return results
 
 
+voter_identity_request_memo = threading.local()
+
+
+def start_voter_identity_request_memo():
+    voter_identity_request_memo.identity_dict = {}
+
+
+def end_voter_identity_request_memo():
+    voter_identity_request_memo.identity_dict = None
+
+
+def get_voter_identity_request_memo():
+    # None outside of a request wrapped by VoterIdentityCacheMiddleware (ex/ management commands and batch threads)
+    return getattr(voter_identity_request_memo, 'identity_dict', None)
+
+
+def generate_voter_identity_cache_key(voter_device_id):
+    return 'voter_identity:' + str(voter_device_id)
+
+
+def generate_voter_identity_voter_cache_key(voter_id):
+    return 'voter_identity_voter:' + str(voter_id)
+
+
+def get_voter_identity_shared_cache():
+    """
+    The cache every worker reads voter identities from, or None when VOTER_IDENTITY_CACHE_ALIAS is a per-process
+    backend. Clearing a per-process cache on voterSignOut would leave every other worker resolving the signed out
+    voter_device_id, so in that case only the request memo is used.
+    :return:
+    """
+    try:
+        shared_cache = caches[VOTER_IDENTITY_CACHE_ALIAS]
+    except Exception as e:
+        logger.error("VOTER_IDENTITY_CACHE_NOT_AVAILABLE: " + str(e))
+        return None
+    if not is_cache_shared_between_processes(shared_cache):
+        return None
+    return shared_cache
+
+
+def invalidate_voter_identity_cache(voter_device_id='', voter_id=0):
+    """
+    Forget the cached identity for one voter_device_id, or for every voter_device_id linked to voter_id
+    :param voter_device_id:
+    :param voter_id:
+    :return:
+    """
+    voter_device_id_list = []
+    if positive_value_exists(voter_device_id):
+        voter_device_id_list.append(voter_device_id)
+    shared_cache = get_voter_identity_shared_cache()
+    if positive_value_exists(voter_id) and shared_cache is not None:
+        try:
+            voter_device_id_list += list(VoterDeviceLink.objects.filter(voter_id=voter_id)
+                                         .values_list('voter_device_id', flat=True))
+        except Exception as e:
+            logger.error("INVALIDATE_VOTER_IDENTITY_CACHE-DEVICE_LIST_ERROR: " + str(e))
+
+    identity_dict = get_voter_identity_request_memo()
+    if identity_dict is not None:
+        for one_voter_device_id in list(identity_dict.keys()):
+            if one_voter_device_id in voter_device_id_list or \
+                    positive_value_exists(voter_id) and identity_dict[one_voter_device_id]['voter_id'] == voter_id:
+                identity_dict.pop(one_voter_device_id, None)
+    if shared_cache is None:
+        return
+    cache_key_list = [generate_voter_identity_cache_key(one_voter_device_id)
+                      for one_voter_device_id in voter_device_id_list]
+    if positive_value_exists(voter_id):
+        cache_key_list.append(generate_voter_identity_voter_cache_key(voter_id))
+    if not cache_key_list:
+        return
+    try:
+        shared_cache.delete_many(cache_key_list)
+    except Exception as e:
+        logger.error("INVALIDATE_VOTER_IDENTITY_CACHE-CACHE_ERROR: " + str(e))
+
+
+def retrieve_voter_identity_from_voter_device_id(voter_device_id, include_is_signed_in=False):
+    """
+    Resolve a voter_device_id to the few voter values most API calls need, checking the request memo, then the
+    shared cache, and only then the database. Without a shared cache (the per-process LocMemCache default) that is
+    one query against readonly, which nothing outside this request keeps. With one, the refill reads the link and
+    the voter from the primary, so a link deleted a moment ago is not cached again from a lagging replica. Unknown
+    voter_device_ids are not cached, so a link created moments later is found right away.
+    is_signed_in requires the Facebook/Twitter/Apple link tables, so it is only computed (and then cached) when asked.
+    :param voter_device_id:
+    :param include_is_signed_in:
+    :return: dict with voter_id, voter_we_vote_id, linked_organization_we_vote_id, signed_in_with_email,
+        signed_in_with_sms_phone_number and is_signed_in (None until computed), or None if not found
+    """
+    if not positive_value_exists(voter_device_id):
+        return None
+
+    identity_dict = get_voter_identity_request_memo()
+    voter_identity = identity_dict.get(voter_device_id) if identity_dict is not None else None
+    shared_cache = get_voter_identity_shared_cache() if voter_identity is None else None
+    cache_key = generate_voter_identity_cache_key(voter_device_id)
+    voter_id = None
+    if shared_cache is not None:
+        try:
+            voter_id = shared_cache.get(cache_key)
+            if positive_value_exists(voter_id):
+                voter_identity = shared_cache.get(generate_voter_identity_voter_cache_key(voter_id))
+        except Exception as e:
+            logger.error("RETRIEVE_VOTER_IDENTITY-CACHE_ERROR: " + str(e))
+
+    if voter_identity is None:
+        voter_values_field_list = [
+            'id', 'we_vote_id', 'linked_organization_we_vote_id',
+            'email', 'primary_email_we_vote_id', 'email_ownership_is_verified',
+            'normalized_sms_phone_number', 'primary_sms_we_vote_id', 'sms_ownership_is_verified']
+        try:
+            if shared_cache is None:
+                voter_values = Voter.objects.using('readonly').filter(id=Subquery(
+                    VoterDeviceLink.objects.using('readonly').filter(voter_device_id=voter_device_id)
+                    .values('voter_id')[:1])).values(*voter_values_field_list).first()
+                if not voter_values:
+                    return None
+                voter_id = voter_values['id']
+            else:
+                if not positive_value_exists(voter_id):
+                    voter_id = VoterDeviceLink.objects.filter(voter_device_id=voter_device_id)\
+                        .values_list('voter_id', flat=True).first()
+                if not positive_value_exists(voter_id):
+                    return None
+                voter_values = Voter.objects.filter(id=voter_id).values(*voter_values_field_list).first()
+        except Exception as e:
+            logger.error("RETRIEVE_VOTER_IDENTITY-DATABASE_ERROR: " + str(e))
+            return None
+        if not voter_values:
+            voter_identity = {
+                'voter_id':                         voter_id,
+                'voter_we_vote_id':                 '',
+                'linked_organization_we_vote_id':   '',
+                'signed_in_with_email':             False,
+                'signed_in_with_sms_phone_number':  False,
+                'is_signed_in':                     False,
+            }
+        else:
+            voter = Voter(**voter_values)
+            voter_identity = {
+                'voter_id':                         voter.id,
+                'voter_we_vote_id':                 voter.we_vote_id,
+                'linked_organization_we_vote_id':   voter.linked_organization_we_vote_id,
+                'signed_in_with_email':             positive_value_exists(voter.signed_in_with_email()),
+                'signed_in_with_sms_phone_number':  positive_value_exists(voter.signed_in_with_sms_phone_number()),
+                'is_signed_in':                     None,
+            }
+        if shared_cache is not None:
+            try:
+                shared_cache.set_many({
+                    cache_key: voter_id,
+                    generate_voter_identity_voter_cache_key(voter_id): voter_identity,
+                }, VOTER_IDENTITY_CACHE_TTL_SECONDS)
+            except Exception as e:
+                logger.error("RETRIEVE_VOTER_IDENTITY-CACHE_ERROR: " + str(e))
+
+    if include_is_signed_in and voter_identity['is_signed_in'] is None:
+        voter = Voter(id=voter_identity['voter_id'], we_vote_id=voter_identity['voter_we_vote_id'])
+        voter_identity = dict(voter_identity)
+        voter_identity['is_signed_in'] = voter_identity['signed_in_with_email'] or \
+            voter_identity['signed_in_with_sms_phone_number'] or \
+            voter.signed_in_with_apple() or voter.signed_in_facebook() or voter.signed_in_twitter()
+        if shared_cache is not None:
+            try:
+                shared_cache.set(generate_voter_identity_voter_cache_key(voter_identity['voter_id']), voter_identity,
+                                 VOTER_IDENTITY_CACHE_TTL_SECONDS)
+            except Exception as e:
+                logger.error("RETRIEVE_VOTER_IDENTITY-CACHE_ERROR: " + str(e))
+
+    if identity_dict is not None:
+        identity_dict[voter_device_id] = voter_identity
+    return voter_identity
+
+
+@receiver(post_save, sender=Voter)
+def save_voter_identity_signal(sender, instance, **kwargs):
+    """
+    The cached identity of a voter is stored once under voter_id, so a save clears one cache key and does not need
+    to look up the voter's devices
+    """
+    if not positive_value_exists(instance.id):
+        return
+    identity_dict = get_voter_identity_request_memo()
+    if identity_dict is not None:
+        for one_voter_device_id in list(identity_dict.keys()):
+            if identity_dict[one_voter_device_id]['voter_id'] == instance.id:
+                identity_dict.pop(one_voter_device_id, None)
+    shared_cache = get_voter_identity_shared_cache()
+    if shared_cache is not None:
+        try:
+            shared_cache.delete(generate_voter_identity_voter_cache_key(instance.id))
+        except Exception as e:
+            logger.error("SAVE_VOTER_IDENTITY_SIGNAL-CACHE_ERROR: " + str(e))
+
+
+@receiver(post_save, sender=VoterDeviceLink)
+@receiver(post_delete, sender=VoterDeviceLink)
+def change_voter_device_link_identity_signal(sender, instance, **kwargs):
+    invalidate_voter_identity_cache(voter_device_id=instance.voter_device_id)
+
+
 # This method *just* returns the voter_id or 0
 def fetch_voter_id_from_voter_device_link(voter_device_id):
-    voter_device_link_manager = VoterDeviceLinkManager()
-    results = voter_device_link_manager.retrieve_voter_device_link_from_voter_device_id(
-        voter_device_id, read_only=True)
-    if results['voter_device_link_found']:
-        voter_device_link = results['voter_device_link']
-        return voter_device_link.voter_id
+    voter_identity = retrieve_voter_identity_from_voter_device_id(voter_device_id)
+    if voter_identity:
+        return voter_identity['voter_id']
     return 0
 
 
@@ -3130,18 +3345,10 @@ def fetch_api_voter_from_request(request):
 
 
 def fetch_voter_we_vote_id_from_voter_device_link(voter_device_id):
-    voter_device_link_manager = VoterDeviceLinkManager()
-    results = voter_device_link_manager.retrieve_voter_device_link_from_voter_device_id(voter_device_id,
-                                                                                        read_only=True)
-    if results['voter_device_link_found']:
-        voter_device_link = results['voter_device_link']
-        voter_id = voter_device_link.voter_id
-        voter_manager = VoterManager()
-        results = voter_manager.retrieve_voter_by_id(voter_id, read_only=True)
-        if results['voter_found']:
-            voter = results['voter']
-            return voter.we_vote_id
-        return ""
+    voter_identity = retrieve_voter_identity_from_voter_device_id(voter_device_id)
+    if voter_identity:
+        return voter_identity['voter_we_vote_id']
+    return None
 
 
 def retrieve_voter_authority(request):
@@ -5,7 +5,7 @@
 from ballot.models import OFFICE, CANDIDATE, MEASURE
 from candidate.controllers import retrieve_candidate_list_for_all_prior_elections_this_year, \
     retrieve_candidate_list_for_all_upcoming_elections
-from candidate.models import CandidateManager, CandidateListManager
+from candidate.models import CandidateCampaign, CandidateManager, CandidateListManager
 from config.base import get_environment_variable
 import copy
 from datetime import datetime, timedelta
@@ -42,8 +42,8 @@ from voter_guide.models import ENDORSEMENTS_FOR_CANDIDATE, ORGANIZATION_ENDORSIN
     VoterGuide, VoterGuideListManager, VoterGuideManager, \
     VoterGuidePossibility, VoterGuidePossibilityManager, VoterGuidePossibilityPosition
 import wevote_functions.admin
-from wevote_functions.functions import convert_to_int, is_voter_device_id_valid, positive_value_exists, \
-    process_request_from_master, is_link_to_video
+from wevote_functions.functions import AhoCorasickAutomaton, convert_to_int, is_voter_device_id_valid, \
+    LocalLruCache, positive_value_exists, process_request_from_master, is_link_to_video
 
 logger = wevote_functions.admin.get_logger(__name__)
 
@@ -51,6 +51,10 @@ VOTER_GUIDES_SYNC_URL = get_environment_variable("VOTER_GUIDES_SYNC_URL")  # vot
 WE_VOTE_API_KEY = get_environment_variable("WE_VOTE_API_KEY")
 WE_VOTE_SERVER_ROOT_URL = get_environment_variable("WE_VOTE_SERVER_ROOT_URL")
 
+CANDIDATE_HIGHLIGHTS_CACHE_SECONDS = 300
+# Keyed by the upcoming and prior election ids, so a new election set gets new highlights right away
+candidate_highlights_cache = LocalLruCache(max_size=4, ttl_seconds=CANDIDATE_HIGHLIGHTS_CACHE_SECONDS)
+
 # TODO: 9/17/19, URLs for sites excluded from highlighting - should be in the db
 URLS_TO_NEVER_HIGHLIGHT = [
     '*.google.com',
@@ -1930,18 +1934,92 @@ def voter_guide_possibility_retrieve_for_api(voter_device_id, voter_guide_possib
     return HttpResponse(json.dumps(json_data), content_type='application/json')
 
 
+def retrieve_default_candidate_highlights():
+    """
+    The 'DEFAULT' highlights (every candidate name and alternate name from upcoming elections, and prior elections
+    this year) with an AhoCorasickAutomaton over those names. They are built once per set of elections in each
+    worker, and rebuilt after CANDIDATE_HIGHLIGHTS_CACHE_SECONDS so candidate changes show up.
+    :return:
+    """
+    status = ""
+    election_manager = ElectionManager()
+    upcoming_results = election_manager.retrieve_upcoming_google_civic_election_id_list()
+    upcoming_google_civic_election_id_list = upcoming_results['upcoming_google_civic_election_id_list']
+    prior_results = election_manager.retrieve_prior_google_civic_election_id_list_this_year()
+    prior_google_civic_election_id_list = prior_results['prior_google_civic_election_id_list']
+    cache_key = (tuple(sorted(upcoming_google_civic_election_id_list)),
+                 tuple(sorted(prior_google_civic_election_id_list)))
+    cached_highlights = candidate_highlights_cache.get(cache_key)
+    if cached_highlights is not None:
+        return cached_highlights
+
+    highlight_list = []
+    names_already_included = set()
+    super_light_candidate_list = True
+    for google_civic_election_id_list, retrieve_candidate_list_function, prior in [
+            (upcoming_google_civic_election_id_list, retrieve_candidate_list_for_all_upcoming_elections, False),
+            (prior_google_civic_election_id_list, retrieve_candidate_list_for_all_prior_elections_this_year, True)]:
+        if not len(google_civic_election_id_list):
+            continue
+        results = retrieve_candidate_list_function(
+            google_civic_election_id_list, super_light_candidate_list=super_light_candidate_list)
+        if not results['candidate_list_found']:
+            status += results['status']
+            continue
+        for one_possible_candidate in results['candidate_list_light']:
+            name_list = [one_possible_candidate['name']]
+            if 'alternate_names' in one_possible_candidate:
+                name_list += one_possible_candidate['alternate_names']
+            for one_name in name_list:
+                if one_name in names_already_included:
+                    continue
+                names_already_included.add(one_name)
+                one_highlight = {
+                    'name':         one_name,
+                    'we_vote_id':   one_possible_candidate['we_vote_id'],
+                    'display':      'DEFAULT',
+                    'stance':       '',
+                }
+                if prior:
+                    one_highlight['prior'] = 1
+                highlight_list.append(one_highlight)
+
+    highlight_automaton = AhoCorasickAutomaton()
+    for one_highlight in highlight_list:
+        highlight_automaton.add(one_highlight['name'], one_highlight)
+    highlight_automaton.build()
+
+    cached_highlights = {
+        'status':               status,
+        'highlight_list':       highlight_list,
+        'highlight_automaton':  highlight_automaton,
+    }
+    candidate_highlights_cache.set(cache_key, cached_highlights)
+    return cached_highlights
+
+
 def voter_guide_possibility_highlights_retrieve_for_api(  # voterGuidePossibilityHighlightsRetrieve
         voter_device_id="",
         url_to_scan="",
         limit_to_existing=False,
         pdf_url="",
-        google_civic_election_id=0):
+        google_civic_election_id=0,
+        text_to_scan=""):
+    """
+    :param voter_device_id:
+    :param url_to_scan:
+    :param limit_to_existing:
+    :param pdf_url:
+    :param google_civic_election_id:
+    :param text_to_scan: The text of the page (or PDF). If passed in, we find the names here, and only return the
+      highlights found, with where they were found in 'match_list'
+    :return:
+    """
     status = "VOTER_GUIDE_POSSIBILITY_HIGHLIGHTS_RETRIEVE "
     success = True
     highlight_list = []
     voter_we_vote_id = ''
-    names_already_included_list = []
-    candidate_manager = CandidateManager()
+    names_already_included = set()
 
     # Once we know we have a voter_device_id to work with, get this working
     voter_guide_possibility_manager = VoterGuidePossibilityManager()
@@ -1958,6 +2036,15 @@ def voter_guide_possibility_highlights_retrieve_for_api(  # voterGuidePossibilit
             voter_device_id, voter_guide_possibility_id)
         if results['possible_position_list']:
             possible_position_list = results['possible_position_list']
+            candidate_we_vote_id_list = [one_possible_position['candidate_we_vote_id']
+                                         for one_possible_position in possible_position_list
+                                         if positive_value_exists(one_possible_position['candidate_we_vote_id'])]
+            candidate_dict = {}
+            if len(candidate_we_vote_id_list):
+                candidate_query = CandidateCampaign.objects.using('readonly') \
+                    .filter(we_vote_id__in=candidate_we_vote_id_list)
+                for one_candidate in candidate_query:
+                    candidate_dict[one_candidate.we_vote_id] = one_candidate
             for one_possible_position in possible_position_list:
                 if one_possible_position['position_we_vote_id']:
                     display = 'STORED'
@@ -1965,104 +2052,69 @@ def voter_guide_possibility_highlights_retrieve_for_api(  # voterGuidePossibilit
                     display = 'DELETED'
                 else:
                     display = 'POSSIBILITY'
-                if one_possible_position['ballot_item_name'] not in names_already_included_list:
-                    names_already_included_list.append(one_possible_position['ballot_item_name'])
+                name_list = [one_possible_position['ballot_item_name']]
+                one_candidate = candidate_dict.get(one_possible_position['candidate_we_vote_id'])
+                if one_candidate is not None:
+                    name_list.append(one_candidate.display_candidate_name())
+                    name_list += one_candidate.display_alternate_names_list()
+                for name_index, one_name in enumerate(name_list):
+                    # The ballot_item_name is always included, the candidate's names only if they have a value
+                    if (name_index > 0 and not positive_value_exists(one_name)) or one_name in names_already_included:
+                        continue
+                    names_already_included.add(one_name)
                     one_highlight = {
-                        'name':         one_possible_position['ballot_item_name'],
+                        'name':         one_name,
                         'we_vote_id':   one_possible_position['candidate_we_vote_id'],
                         'display':      display,
                         'stance':       one_possible_position['position_stance'],
                     }
                     highlight_list.append(one_highlight)
-                if positive_value_exists(one_possible_position['candidate_we_vote_id']):
-                    candidate_results = candidate_manager.retrieve_candidate_from_we_vote_id(
-                        one_possible_position['candidate_we_vote_id'])
-                    if candidate_results['candidate_found']:
-                        one_candidate = candidate_results['candidate']
-                        if positive_value_exists(one_candidate.display_candidate_name()) \
-                                and one_candidate.display_candidate_name() not in names_already_included_list:
-                            names_already_included_list.append(one_candidate.display_candidate_name())
-                            one_highlight = {
-                                'name':         one_candidate.display_candidate_name(),
-                                'we_vote_id':   one_possible_position['candidate_we_vote_id'],
-                                'display':      display,
-                                'stance':       one_possible_position['position_stance'],
-                            }
-                            highlight_list.append(one_highlight)
-                        alternate_names = one_candidate.display_alternate_names_list()
-                        for alternate_name in alternate_names:
-                            if positive_value_exists(alternate_name) \
-                                    and alternate_name not in names_already_included_list:
-                                names_already_included_list.append(alternate_name)
-                                one_highlight = {
-                                    'name':         alternate_name,
-                                    'we_vote_id':   one_possible_position['candidate_we_vote_id'],
-                                    'display':      display,
-                                    'stance':       one_possible_position['position_stance'],
-                                }
-                                highlight_list.append(one_highlight)
 
+    default_highlights = None
     if not positive_value_exists(limit_to_existing):
-        super_light_candidate_list = True
-        results = retrieve_candidate_list_for_all_upcoming_elections(
-            super_light_candidate_list=super_light_candidate_list)
-        if results['candidate_list_found']:
-            all_possible_candidates_list_light = results['candidate_list_light']
-            for one_possible_candidate in all_possible_candidates_list_light:
-                if one_possible_candidate['name'] not in names_already_included_list:
-                    names_already_included_list.append(one_possible_candidate['name'])
-                    one_highlight = {
-                        'name':         one_possible_candidate['name'],
-                        'we_vote_id':   one_possible_candidate['we_vote_id'],
-                        'display':      'DEFAULT',
-                        'stance':       '',
-                    }
-                    highlight_list.append(one_highlight)
-                if 'alternate_names' in one_possible_candidate:
-                    for one_alternate_name in one_possible_candidate['alternate_names']:
-                        if one_alternate_name not in names_already_included_list:
-                            names_already_included_list.append(one_alternate_name)
-                            one_highlight = {
-                                'name':         one_alternate_name,
-                                'we_vote_id':   one_possible_candidate['we_vote_id'],
-                                'display':      'DEFAULT',
-                                'stance':       '',
-                            }
-                            highlight_list.append(one_highlight)
-
-        results = retrieve_candidate_list_for_all_prior_elections_this_year(
-            super_light_candidate_list=super_light_candidate_list)
-        if results['candidate_list_found']:
-            all_possible_candidates_list_light = results['candidate_list_light']
-            for one_possible_candidate in all_possible_candidates_list_light:
-                if one_possible_candidate['name'] not in names_already_included_list:
-                    names_already_included_list.append(one_possible_candidate['name'])
-                    one_highlight = {
-                        'name':         one_possible_candidate['name'],
-                        'we_vote_id':   one_possible_candidate['we_vote_id'],
-                        'display':      'DEFAULT',
-                        'stance':       '',
-                        'prior':        1,
-                    }
-                    highlight_list.append(one_highlight)
-                if 'alternate_names' in one_possible_candidate:
-                    for one_alternate_name in one_possible_candidate['alternate_names']:
-                        if one_alternate_name not in names_already_included_list:
-                            names_already_included_list.append(one_alternate_name)
-                            one_highlight = {
-                                'name':         one_alternate_name,
-                                'we_vote_id':   one_possible_candidate['we_vote_id'],
-                                'display':      'DEFAULT',
-                                'stance':       '',
-                                'prior':        1,
-                            }
-                            highlight_list.append(one_highlight)
+        default_highlights = retrieve_default_candidate_highlights()
+        status += default_highlights['status']
+
+    match_list = []
+    if positive_value_exists(text_to_scan):
+        # Names from this voter guide possibility come first, and win over the DEFAULT highlight with the same name
+        highlight_automaton = AhoCorasickAutomaton()
+        for one_highlight in highlight_list:
+            highlight_automaton.add(one_highlight['name'], one_highlight)
+        found_list = highlight_automaton.find_all(text_to_scan, longest_only=False)
+        if default_highlights is not None:
+            found_list += [one_found for one_found in
+                           default_highlights['highlight_automaton'].find_all(text_to_scan, longest_only=False)
+                           if one_found[2]['name'] not in names_already_included]
+        found_list.sort(key=lambda one_found: (one_found[0], one_found[0] - one_found[1]))
+        highlights_found_list = []
+        highlight_names_found = set()
+        covered_through = 0
+        for start, end, one_highlight in found_list:
+            if start < covered_through:
+                continue
+            covered_through = end
+            match_list.append({
+                'name':         one_highlight['name'],
+                'we_vote_id':   one_highlight['we_vote_id'],
+                'start':        start,
+                'end':          end,
+            })
+            if one_highlight['name'] not in highlight_names_found:
+                highlight_names_found.add(one_highlight['name'])
+                highlights_found_list.append(one_highlight)
+        highlight_list = highlights_found_list
+        status += "TEXT_SCANNED_FOR_HIGHLIGHTS "
+    elif default_highlights is not None:
+        highlight_list += [one_highlight for one_highlight in default_highlights['highlight_list']
+                           if one_highlight['name'] not in names_already_included]
 
     json_data = {
         'status':               status,
         'success':              success,
         'url_to_scan':          url_to_scan,
         'highlight_list':       highlight_list,
+        'match_list':           match_list,
         'never_highlight_on':   URLS_TO_NEVER_HIGHLIGHT,
     }
     return json_data
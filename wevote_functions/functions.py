@@ -7,6 +7,10 @@ import json
 import random
 import re
 import string
+import threading
+import time
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from math import log10
 import django.utils.html
 import requests
@@ -531,6 +535,317 @@ class LocalSwitch(object):
             return False
 
 
+class LocalLruCache(object):
+    """
+    A small, thread-safe, in-process LRU cache with an optional time-to-live. Each gunicorn worker gets its own
+    copy, so only use this for values that are safe to be a little stale, or that are invalidated explicitly.
+    """
+    def __init__(self, max_size=1000, ttl_seconds=0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_seconds=None):
+        if ttl_seconds is None:
+            ttl_seconds = self.ttl_seconds
+        expires_at = time.monotonic() + ttl_seconds if ttl_seconds else 0
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def is_cache_shared_between_processes(django_cache):
+    """
+    LocMemCache and DummyCache keep their entries inside one process, so a delete or version stamp written through
+    them never reaches the other workers.
+    :param django_cache: one of django.core.cache.caches
+    :return:
+    """
+    return type(django_cache).__name__ not in ['DummyCache', 'LocMemCache']
+
+
+class TokenBucketRateLimiter(object):
+    """
+    Thread-safe token bucket. acquire() blocks until a token is available, so callers running in several threads
+    together stay under requests_per_second, while still allowing short bursts up to burst_size.
+    """
+    def __init__(self, requests_per_second=10, burst_size=None):
+        self.requests_per_second = float(requests_per_second)
+        self.burst_size = float(burst_size if burst_size else max(1, requests_per_second))
+        self._tokens = self.burst_size
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                current_time = time.monotonic()
+                self._tokens = min(self.burst_size,
+                                   self._tokens + (current_time - self._last_refill) * self.requests_per_second)
+                self._last_refill = current_time
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.requests_per_second
+            time.sleep(wait_seconds)
+
+
+class PooledHttpFetcher(object):
+    """
+    Sends GET requests to one provider from a bounded pool of worker threads. Each worker thread keeps its own
+    keep-alive requests.Session (a Session is not safe to share between threads), all threads share one
+    TokenBucketRateLimiter, and connection errors, timeouts, 429s and 5xx responses are retried with exponential
+    backoff plus random jitter. The worker threads (and so their open connections) live as long as this object,
+    so create one per provider at module level and reuse it.
+    """
+    RETRY_STATUS_CODE_LIST = [429, 500, 502, 503, 504]
+
+    def __init__(self, requests_per_second=10, number_of_threads=8, maximum_attempts=3, timeout_seconds=30,
+                 backoff_seconds=1.0, headers=None):
+        self.number_of_threads = max(1, number_of_threads)
+        self.maximum_in_flight = 2 * self.number_of_threads
+        self.maximum_attempts = max(1, maximum_attempts)
+        self.timeout_seconds = timeout_seconds
+        self.backoff_seconds = backoff_seconds
+        self.headers = headers
+        self.rate_limiter = TokenBucketRateLimiter(requests_per_second=requests_per_second)
+        self._executor = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if self.headers:
+                session.headers.update(self.headers)
+            self._local.session = session
+        return session
+
+    def _wait_before_retry(self, attempt, response=None):
+        wait_seconds = self.backoff_seconds * (2 ** (attempt - 1)) * (0.5 + random.random())
+        if response is not None and response.headers.get('Retry-After', '').isdigit():
+            wait_seconds = max(wait_seconds, int(response.headers['Retry-After']))
+        time.sleep(wait_seconds)
+
+    def get(self, url, params=None):
+        """
+        :param url:
+        :param params:
+        :return: the response. Once every attempt is used up, the last response is returned even if it is an
+          error, or the last connection error / timeout is raised.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            self.rate_limiter.acquire()
+            try:
+                response = self._session().get(url, params=params, timeout=self.timeout_seconds)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.maximum_attempts:
+                    raise
+                self._wait_before_retry(attempt)
+                continue
+            if response.status_code not in self.RETRY_STATUS_CODE_LIST or attempt >= self.maximum_attempts:
+                return response
+            self._wait_before_retry(attempt, response)
+
+    def map(self, fetch_function, item_list):
+        """
+        Calls fetch_function(item) for every item from the worker threads. fetch_function should only do network
+        work (calling self.get) and return its results, and must catch its own exceptions. At most
+        maximum_in_flight items are submitted ahead of the one the caller is waiting for, so a slow caller holds
+        that many results in memory at most, and items not yet started are cancelled if the caller stops early.
+        :param fetch_function:
+        :param item_list:
+        :return: generator of (item, fetch_function result), in the order of item_list. Results are yielded as soon
+          as they are ready, so the caller can store one result while later items are still being fetched.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.number_of_threads)
+        item_iterator = iter(item_list)
+        in_flight_queue = deque()
+        try:
+            for item in item_iterator:
+                in_flight_queue.append((item, self._executor.submit(fetch_function, item)))
+                if len(in_flight_queue) >= self.maximum_in_flight:
+                    break
+            while in_flight_queue:
+                item, future = in_flight_queue.popleft()
+                for next_item in item_iterator:
+                    in_flight_queue.append((next_item, self._executor.submit(fetch_function, next_item)))
+                    break
+                yield item, future.result()
+        finally:
+            # Reached when the caller stops iterating (or raises) before the end, as well as at the end
+            for item, future in in_flight_queue:
+                future.cancel()
+
+
+class AhoCorasickAutomaton(object):
+    """
+    Finds every one of many patterns in a text in one pass, however many patterns there are. Matching ignores case.
+    Add all patterns, call build() once, then call find_all() as often as needed (find_all does not change the
+    automaton, so one built automaton can be shared between threads).
+    """
+    def __init__(self):
+        self._goto = [{}]  # state -> {character: next state}
+        self._fail = [0]
+        self._output = [[]]  # state -> indexes of the patterns that end here
+        self._pattern_length_list = []
+        self._value_list = []
+        self._built = False
+
+    def __len__(self):
+        return len(self._value_list)
+
+    def add(self, pattern, value):
+        """
+        :param pattern:
+        :param value: returned with each match of this pattern
+        :return:
+        """
+        pattern = pattern.lower() if pattern else ''
+        if not pattern:
+            return
+        state = 0
+        for character in pattern:
+            next_state = self._goto[state].get(character)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][character] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(len(self._value_list))
+        self._pattern_length_list.append(len(pattern))
+        self._value_list.append(value)
+        self._built = False
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for character, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail_state = self._fail[state]
+                while fail_state and character not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(character, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        self._built = True
+
+    def find_all(self, text, whole_words_only=True, longest_only=True):
+        """
+        :param text:
+        :param whole_words_only: Skip matches that start or end inside a word
+        :param longest_only: Of overlapping matches, keep the one that starts first, and then the longest
+        :return: list of (start, end, value), in the order they appear in the text
+        """
+        if not self._built:
+            self.build()
+        if not text:
+            return []
+        text_lower = text.lower()
+        if len(text_lower) != len(text):
+            # A few characters change length when lower cased. Keep offsets lined up with the original text.
+            text_lower = ''.join(character.lower() if len(character.lower()) == 1 else character
+                                 for character in text)
+        match_list = []
+        state = 0
+        for position, character in enumerate(text_lower):
+            while state and character not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(character, 0)
+            for pattern_index in self._output[state]:
+                end = position + 1
+                start = end - self._pattern_length_list[pattern_index]
+                if whole_words_only and ((start > 0 and text[start - 1].isalnum()) or
+                                         (end < len(text) and text[end].isalnum())):
+                    continue
+                match_list.append((start, end, self._value_list[pattern_index]))
+        if longest_only:
+            match_list.sort(key=lambda match: (match[0], match[0] - match[1]))
+            longest_match_list = []
+            covered_through = 0
+            for match in match_list:
+                if match[0] >= covered_through:
+                    longest_match_list.append(match)
+                    covered_through = match[1]
+            return longest_match_list
+        match_list.sort(key=lambda match: (match[0], match[0] - match[1]))
+        return match_list
+
+
+class DuplicateKeyIndex(object):
+    """
+    Remembers which we_vote_ids (or other owner ids) have been seen with each key, so a whole batch of incoming
+    records can be checked for local duplicates in memory instead of with one query per record.
+    Keys are tuples. Use normalize() on strings that the matching query compares with __iexact.
+    """
+    def __init__(self):
+        self._owner_id_set_by_key = {}
+
+    def __len__(self):
+        return len(self._owner_id_set_by_key)
+
+    @staticmethod
+    def normalize(value):
+        return value.lower() if isinstance(value, str) else value
+
+    def add(self, key, owner_id=None):
+        self._owner_id_set_by_key.setdefault(key, set()).add(self.normalize(owner_id))
+
+    def has_match(self, key, excluded_owner_id=None):
+        """
+        :param key:
+        :param excluded_owner_id: Entries with this owner id (compared without case) are not counted as a match
+        :return: True if any entry other than excluded_owner_id was added with this key
+        """
+        owner_id_set = self._owner_id_set_by_key.get(key)
+        if not owner_id_set:
+            return False
+        if excluded_owner_id is None:
+            return True
+        return len(owner_id_set) > 1 or self.normalize(excluded_owner_id) not in owner_id_set
+
+
 def convert_pennies_integer_to_dollars_string(pennies_integer):
     cents_to_dollars_format_string = '{:,.2f}'
     dollars_string = cents_to_dollars_format_string.format(pennies_integer / 100)
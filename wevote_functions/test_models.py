@@ -2,8 +2,37 @@
 # Brought to you by We Vote. Be good.
 # -*- coding: UTF-8 -*-
 
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
 from django.test import TestCase
-from .functions import positive_value_exists
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from .functions import AhoCorasickAutomaton, DuplicateKeyIndex, is_cache_shared_between_processes, \
+    PooledHttpFetcher, positive_value_exists
+
+
+class StubProviderRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers every GET with {"path": ...}, except that the first request for any path ending in /flaky gets a 503
+    """
+    flaky_path_set = set()
+    flaky_path_set_lock = threading.Lock()
+
+    def do_GET(self):
+        with self.flaky_path_set_lock:
+            fail_this_request = self.path.endswith('/flaky') and self.path not in self.flaky_path_set
+            self.flaky_path_set.add(self.path)
+        body = json.dumps({'path': self.path}).encode('utf-8')
+        self.send_response(503 if fail_this_request else 200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
 
 
 class WeVoteFunctionsTestsModels(TestCase):
@@ -74,3 +103,87 @@ class WeVoteFunctionsTestsModels(TestCase):
         value_to_test = []
         self.assertEqual(positive_value_exists(value_to_test), False,
                          "Testing value: {value_to_test}, False expected".format(value_to_test=value_to_test))
+
+    def test_aho_corasick_automaton_find_all(self):
+        """
+        Names are found ignoring case, only as whole words, and the longest name wins where names overlap
+        :return:
+        """
+        automaton = AhoCorasickAutomaton()
+        for name in ['Al Smith', 'Smith', 'Alabama', 'José Ortiz']:
+            automaton.add(name, name)
+        text = "Vote for AL SMITH in Alabama, not Smithson. JOSÉ Ortiz too."
+        match_list = automaton.find_all(text)
+        self.assertEqual([value for start, end, value in match_list], ['Al Smith', 'Alabama', 'José Ortiz'])
+        for start, end, value in match_list:
+            self.assertEqual(text[start:end].lower(), value.lower())
+
+        match_list = automaton.find_all(text, longest_only=False)
+        self.assertIn('Smith', [value for start, end, value in match_list])
+
+    def test_duplicate_key_index(self):
+        """
+        A key matches when an entry other than the excluded owner (compared without case) was added with it
+        :return:
+        """
+        duplicate_key_index = DuplicateKeyIndex()
+        duplicate_key_index.add((1000, DuplicateKeyIndex.normalize('Measure A')), 'wv01meas1')
+        self.assertTrue(duplicate_key_index.has_match((1000, 'measure a')))
+        self.assertFalse(duplicate_key_index.has_match((1000, 'measure a'), excluded_owner_id='WV01MEAS1'))
+        self.assertTrue(duplicate_key_index.has_match((1000, 'measure a'), excluded_owner_id='wv01meas2'))
+        self.assertFalse(duplicate_key_index.has_match((1001, 'measure a')))
+
+        duplicate_key_index.add((1000, 'measure a'), 'wv01meas2')
+        self.assertTrue(duplicate_key_index.has_match((1000, 'measure a'), excluded_owner_id='wv01meas1'))
+
+    def test_is_cache_shared_between_processes(self):
+        self.assertFalse(is_cache_shared_between_processes(LocMemCache('test-local-memory', {})))
+        self.assertTrue(is_cache_shared_between_processes(FileBasedCache('/tmp/test-file-cache', {})))
+
+    def test_pooled_http_fetcher(self):
+        """
+        Fetch from a local stub server on several threads: results come back in order, and a 503 is retried
+        :return:
+        """
+        stub_server = ThreadingHTTPServer(('127.0.0.1', 0), StubProviderRequestHandler)
+        threading.Thread(target=stub_server.serve_forever, daemon=True).start()
+        base_url = 'http://127.0.0.1:' + str(stub_server.server_address[1])
+        try:
+            http_fetcher = PooledHttpFetcher(requests_per_second=1000, number_of_threads=4, backoff_seconds=0.01)
+            path_list = ['/ballot/' + str(index) for index in range(20)] + ['/ballot/flaky']
+
+            def fetch_one_path(path):
+                return http_fetcher.get(base_url + path).json()['path']
+
+            fetched_list = list(http_fetcher.map(fetch_one_path, path_list))
+            self.assertEqual([path for path, fetched_path in fetched_list], path_list)
+            self.assertEqual([fetched_path for path, fetched_path in fetched_list], path_list)
+
+            http_fetcher_without_retry = PooledHttpFetcher(maximum_attempts=1)
+            self.assertEqual(http_fetcher_without_retry.get(base_url + '/second/flaky').status_code, 503)
+        finally:
+            stub_server.shutdown()
+            stub_server.server_close()
+
+    def test_pooled_http_fetcher_map_window(self):
+        """
+        A slow caller holds at most maximum_in_flight results, and stopping early cancels the items not yet started
+        :return:
+        """
+        http_fetcher = PooledHttpFetcher(number_of_threads=2)
+        started_item_list = []
+
+        def fetch_one_item(item):
+            started_item_list.append(item)
+            return item * 10
+
+        fetched_generator = http_fetcher.map(fetch_one_item, range(100))
+        for item, fetched in fetched_generator:
+            self.assertEqual(fetched, item * 10)
+            time.sleep(0.01)
+            self.assertLessEqual(len(started_item_list), item + 1 + http_fetcher.maximum_in_flight)
+            if item == 9:
+                break
+        fetched_generator.close()
+        http_fetcher._executor.shutdown(wait=True)
+        self.assertLessEqual(len(started_item_list), 10 + http_fetcher.maximum_in_flight)
@@ -2,10 +2,14 @@
 # Brought to you by We Vote. Be good.
 # -*- coding: UTF-8 -*-
 
-from django.db import models
+from django.db import connection, models, transaction
+from config.base import get_environment_variable_default
 from exception.models import handle_record_found_more_than_one_exception,\
     handle_record_not_saved_exception
 import string
+import sys
+import threading
+import time
 import wevote_functions.admin
 from wevote_functions.functions import convert_to_int, generate_random_string, positive_value_exists
 
@@ -25,6 +29,32 @@ KIND_OF_ACTION_CHOICES = (
 
 logger = wevote_functions.admin.get_logger(__name__)
 
+# Each worker reserves this many we_vote_id integers at a time with one atomic UPDATE, and hands them out from memory.
+#  Integers still unused when a worker exits are skipped, so ids stay unique but are not gap-free or strictly ordered
+#  by creation time across workers. A block is only reserved (and committed right away) when the caller is not inside
+#  a transaction; inside one, a single integer is reserved in the caller's transaction and never kept in memory, so a
+#  rollback can't leave this worker holding integers the counter no longer covers. Set to 1 to reserve one integer
+#  per object (the default under test, where blocks left in memory would outlive each test's database).
+WE_VOTE_ID_INTEGER_BLOCK_SIZE = 1 if 'test' in sys.argv else \
+    max(convert_to_int(get_environment_variable_default('WE_VOTE_ID_INTEGER_BLOCK_SIZE', 50)), 1)
+
+# we_vote_id_last_setting_name -> [next_integer, last_integer_reserved]
+we_vote_id_integer_blocks = {}
+we_vote_id_integer_blocks_lock = threading.Lock()
+site_unique_id_prefix_cached = ''
+
+# Flags like batch_process_system_on are read on every pass of the batch process loop, so each worker keeps all of
+#  the settings in memory. At most once every WE_VOTE_SETTINGS_SNAPSHOT_SECONDS it reads the
+#  we_vote_settings_version counter (moved forward by save_setting) with a one row query, and reloads every setting
+#  only when the counter has changed. Set to 0 to read each setting from the database (always the case under test,
+#  where each test's transaction is rolled back and would leave stale settings in memory).
+WE_VOTE_SETTINGS_SNAPSHOT_SECONDS = 0 if 'test' in sys.argv else \
+    max(convert_to_int(get_environment_variable_default('WE_VOTE_SETTINGS_SNAPSHOT_SECONDS', 5)), 0)
+WE_VOTE_SETTINGS_VERSION_NAME = 'we_vote_settings_version'
+# The we_vote_id_last_* counters move forward many times a second during imports, through
+#  reserve_we_vote_id_integer_range. They are never kept in memory and never change the version.
+WE_VOTE_ID_LAST_SETTING_NAME_PREFIX = 'we_vote_id_last_'
+
 
 class WeVoteSetting(models.Model):
     """
@@ -58,7 +88,13 @@ class WeVoteSettingsManager(models.Manager):
         setting_name = setting_name.strip()
         try:
             if setting_name != '':
-                we_vote_setting = WeVoteSetting.objects.using('readonly').get(name=setting_name)
+                snapshot_results = we_vote_settings_snapshot.retrieve_we_vote_setting(setting_name)
+                if snapshot_results['snapshot_used']:
+                    if not snapshot_results['we_vote_setting_found']:
+                        return ''
+                    we_vote_setting = snapshot_results['we_vote_setting']
+                else:
+                    we_vote_setting = WeVoteSetting.objects.using('readonly').get(name=setting_name)
                 if we_vote_setting.value_type == WeVoteSetting.BOOLEAN:
                     return we_vote_setting.boolean_value
                 elif we_vote_setting.value_type == WeVoteSetting.INTEGER:
@@ -77,12 +113,25 @@ class WeVoteSettingsManager(models.Manager):
         return ''
 
     def fetch_setting_results(self, setting_name, read_only=True):
+        """
+        With read_only, the setting usually comes from this worker's in-memory snapshot. That we_vote_setting is
+        shared, so change settings with save_setting, or fetch with read_only=False first.
+        :param setting_name:
+        :param read_only:
+        :return:
+        """
         status = ""
         success = True
         setting_name = setting_name.strip()
         try:
             if setting_name != '':
-                if positive_value_exists(read_only):
+                snapshot_results = we_vote_settings_snapshot.retrieve_we_vote_setting(setting_name) \
+                    if positive_value_exists(read_only) else {'snapshot_used': False}
+                if snapshot_results['snapshot_used']:
+                    if not snapshot_results['we_vote_setting_found']:
+                        raise WeVoteSetting.DoesNotExist()
+                    we_vote_setting = snapshot_results['we_vote_setting']
+                elif positive_value_exists(read_only):
                     we_vote_setting = WeVoteSetting.objects.using('readonly').get(name=setting_name)
                 else:
                     we_vote_setting = WeVoteSetting.objects.get(name=setting_name)
@@ -194,6 +243,14 @@ class WeVoteSettingsManager(models.Manager):
             except Exception as e:
                 handle_record_not_saved_exception(e, logger=logger)
 
+        if we_vote_setting_id and not setting_name.startswith(WE_VOTE_ID_LAST_SETTING_NAME_PREFIX):
+            # Tell the other workers to reload their settings, and update ours right away
+            try:
+                move_we_vote_settings_version_forward()
+            except Exception as e:
+                handle_record_not_saved_exception(e, logger=logger)
+            we_vote_settings_snapshot.save_we_vote_setting(we_vote_setting)
+
         results = {
             'success':                  True if we_vote_setting_id else False,
             'we_vote_setting':          we_vote_setting,
@@ -215,6 +272,100 @@ class WeVoteSettingsManager(models.Manager):
             we_vote_setting.string_value = setting_value
         return we_vote_setting
 
+
+class WeVoteSettingsSnapshot(object):
+    """
+    This worker's in-memory copy of every WeVoteSetting, shared by all of its threads
+    """
+
+    def __init__(self, refresh_seconds=WE_VOTE_SETTINGS_SNAPSHOT_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        self.we_vote_setting_dict = {}
+        self.duplicate_setting_name_set = set()
+        self.version = None  # None until the settings are first loaded
+        self.version_checked_time = 0
+
+    def retrieve_we_vote_setting(self, setting_name):
+        """
+        Usually a dictionary lookup. When snapshot_used comes back False, the caller reads the database itself.
+        :param setting_name:
+        :return:
+        """
+        snapshot_used = False
+        we_vote_setting = None
+        if self.refresh_seconds > 0 and not setting_name.startswith(WE_VOTE_ID_LAST_SETTING_NAME_PREFIX):
+            try:
+                self.refresh_if_stale()
+                # Let the database report settings saved more than once, as it always has
+                snapshot_used = setting_name not in self.duplicate_setting_name_set
+                we_vote_setting = self.we_vote_setting_dict.get(setting_name)
+            except Exception as e:
+                logger.error("WE_VOTE_SETTINGS_SNAPSHOT_NOT_REFRESHED: " + str(e))
+                snapshot_used = False
+        return {
+            'snapshot_used':            snapshot_used,
+            'we_vote_setting':          we_vote_setting,
+            'we_vote_setting_found':    we_vote_setting is not None,
+        }
+
+    def refresh_if_stale(self):
+        if self.version is not None and time.time() - self.version_checked_time < self.refresh_seconds:
+            return
+        with self.lock:
+            if self.version is not None and time.time() - self.version_checked_time < self.refresh_seconds:
+                # Another thread checked while we waited
+                return
+            if self.version is None or self.version != fetch_we_vote_settings_version():
+                self.load_we_vote_settings()
+            self.version_checked_time = time.time()
+
+    def load_we_vote_settings(self):
+        # The version is read in the same query as the settings, so the two always match
+        we_vote_setting_dict = {}
+        duplicate_setting_name_set = set()
+        version = 0
+        we_vote_setting_query = WeVoteSetting.objects.using('readonly').exclude(
+            name__startswith=WE_VOTE_ID_LAST_SETTING_NAME_PREFIX)
+        for we_vote_setting in we_vote_setting_query:
+            if we_vote_setting.name is None:
+                continue
+            if we_vote_setting.name == WE_VOTE_SETTINGS_VERSION_NAME:
+                version = max(version, convert_to_int(we_vote_setting.integer_value))
+            if we_vote_setting.name in we_vote_setting_dict:
+                duplicate_setting_name_set.add(we_vote_setting.name)
+            we_vote_setting_dict[we_vote_setting.name] = we_vote_setting
+        for setting_name in duplicate_setting_name_set:
+            del we_vote_setting_dict[setting_name]
+        self.we_vote_setting_dict = we_vote_setting_dict
+        self.duplicate_setting_name_set = duplicate_setting_name_set
+        self.version = version
+
+    def save_we_vote_setting(self, we_vote_setting):
+        """
+        Write-through from save_setting, so this worker sees its own change before the next version check
+        :param we_vote_setting:
+        :return:
+        """
+        with self.lock:
+            if self.version is not None and we_vote_setting.name not in self.duplicate_setting_name_set:
+                self.we_vote_setting_dict[we_vote_setting.name] = we_vote_setting
+
+
+we_vote_settings_snapshot = WeVoteSettingsSnapshot()
+
+
+def fetch_we_vote_settings_version():
+    integer_value_list = list(WeVoteSetting.objects.using('readonly').filter(
+        name=WE_VOTE_SETTINGS_VERSION_NAME).values_list('integer_value', flat=True))
+    return max([convert_to_int(integer_value) for integer_value in integer_value_list], default=0)
+
+
+def move_we_vote_settings_version_forward():
+    # Same atomic UPDATE ... RETURNING as the we_vote_id counters, so concurrent saves never share a version
+    return reserve_we_vote_id_integer_range(WE_VOTE_SETTINGS_VERSION_NAME)[-1]
+
+
 # site_unique_id_prefix
 # we_vote_id_last_org_integer
 # we_vote_id_last_position_integer
@@ -324,6 +475,11 @@ def fetch_batch_process_system_search_twitter_on():
 
 
 def fetch_site_unique_id_prefix():
+    global site_unique_id_prefix_cached
+    if site_unique_id_prefix_cached:
+        # Once set, the prefix never changes for this server
+        return site_unique_id_prefix_cached
+
     we_vote_settings_manager = WeVoteSettingsManager()
     site_unique_id_prefix = we_vote_settings_manager.fetch_setting('site_unique_id_prefix')
 
@@ -342,15 +498,81 @@ def fetch_site_unique_id_prefix():
         we_vote_settings_manager.save_setting('site_unique_id_prefix', site_unique_id_prefix)
         # TODO Each We Vote site needs to keep a local copy of site_unique_id_prefix's that are in use, AND
         # TODO Each We Vote site also needs to publish site_unique_id_prefix's in use by that organization
+    elif positive_value_exists(site_unique_id_prefix):
+        site_unique_id_prefix_cached = site_unique_id_prefix
     return site_unique_id_prefix
 
 
+def reserve_we_vote_id_integer_range(we_vote_id_last_setting_name, number_to_reserve=1):
+    """
+    Atomically move the "last used" integer stored in WeVoteSetting forward by number_to_reserve, and return the
+    range of integers that now belong to the caller. One UPDATE ... RETURNING, so concurrent workers never get
+    overlapping ranges.
+    :param we_vote_id_last_setting_name:
+    :param number_to_reserve:
+    :return: range of reserved integers
+    """
+    number_to_reserve = max(convert_to_int(number_to_reserve), 1)
+    sql = "UPDATE {table} SET integer_value = COALESCE(integer_value, 0) + %s, value_type = %s " \
+          "WHERE name = %s RETURNING integer_value".format(table=WeVoteSetting._meta.db_table)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [number_to_reserve, WeVoteSetting.INTEGER, we_vote_id_last_setting_name])
+            returned_rows = cursor.fetchall()
+        if returned_rows:
+            # If the setting was ever saved twice, every copy moved forward, so the highest is safe to use
+            we_vote_id_last_integer = max(convert_to_int(one_row[0]) for one_row in returned_rows)
+        else:
+            # First id ever for this setting. Lock the table so that two workers can't both create the row.
+            with connection.cursor() as cursor:
+                cursor.execute("LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE".format(
+                    table=WeVoteSetting._meta.db_table))
+            we_vote_setting, created = WeVoteSetting.objects.get_or_create(
+                name=we_vote_id_last_setting_name,
+                defaults={'value_type': WeVoteSetting.INTEGER, 'integer_value': 0})
+            we_vote_id_last_integer = convert_to_int(we_vote_setting.integer_value) + number_to_reserve
+            WeVoteSetting.objects.filter(id=we_vote_setting.id).update(
+                integer_value=we_vote_id_last_integer, value_type=WeVoteSetting.INTEGER)
+    return range(we_vote_id_last_integer - number_to_reserve + 1, we_vote_id_last_integer + 1)
+
+
+def preallocate_we_vote_id_integers(we_vote_id_last_setting_name, number_needed):
+    """
+    For batch imports: make sure this worker already holds at least number_needed integers for this kind of
+    we_vote_id, so the next number_needed calls to fetch_next_we_vote_id_integer don't touch the database.
+    Does nothing inside a transaction, where a reserved block could be rolled back after we kept it.
+    :param we_vote_id_last_setting_name:
+    :param number_needed:
+    :return:
+    """
+    number_needed = convert_to_int(number_needed)
+    if number_needed <= 0 or WE_VOTE_ID_INTEGER_BLOCK_SIZE == 1 or connection.in_atomic_block:
+        return
+    with we_vote_id_integer_blocks_lock:
+        block = we_vote_id_integer_blocks.get(we_vote_id_last_setting_name)
+        number_held = block[1] - block[0] + 1 if block else 0
+        if number_held >= number_needed:
+            return
+        # Integers left in the old block are abandoned; a new range is always contiguous
+        reserved_range = reserve_we_vote_id_integer_range(
+            we_vote_id_last_setting_name, max(number_needed, WE_VOTE_ID_INTEGER_BLOCK_SIZE))
+        we_vote_id_integer_blocks[we_vote_id_last_setting_name] = [reserved_range[0], reserved_range[-1]]
+
+
 def fetch_next_we_vote_id_integer(we_vote_id_last_setting_name):
-    we_vote_settings_manager = WeVoteSettingsManager()
-    we_vote_id_last_integer = we_vote_settings_manager.fetch_setting(we_vote_id_last_setting_name)
-    we_vote_id_next_integer = convert_to_int(we_vote_id_last_integer)
-    we_vote_id_next_integer += 1
-    we_vote_settings_manager.save_setting(we_vote_id_last_setting_name, we_vote_id_next_integer)
+    with we_vote_id_integer_blocks_lock:
+        block = we_vote_id_integer_blocks.get(we_vote_id_last_setting_name)
+        if not block or block[0] > block[1]:
+            if connection.in_atomic_block or WE_VOTE_ID_INTEGER_BLOCK_SIZE == 1:
+                # Reserved in the caller's transaction, so it is given back if that transaction rolls back
+                return reserve_we_vote_id_integer_range(we_vote_id_last_setting_name, 1)[0]
+            # Not inside a transaction, so this block is committed as soon as it is reserved
+            reserved_range = reserve_we_vote_id_integer_range(
+                we_vote_id_last_setting_name, WE_VOTE_ID_INTEGER_BLOCK_SIZE)
+            block = [reserved_range[0], reserved_range[-1]]
+            we_vote_id_integer_blocks[we_vote_id_last_setting_name] = block
+        we_vote_id_next_integer = block[0]
+        block[0] += 1
     return we_vote_id_next_integer
 
 
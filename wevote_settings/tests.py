@@ -0,0 +1,137 @@
+from unittest import mock
+import threading
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+
+from wevote_settings.models import fetch_batch_process_system_on, fetch_next_we_vote_id_integer, \
+    fetch_we_vote_settings_version, preallocate_we_vote_id_integers, reserve_we_vote_id_integer_range, \
+    we_vote_id_integer_blocks, WeVoteSetting, WeVoteSettingsManager, WeVoteSettingsSnapshot
+
+
+class WeVoteSettingsSnapshotTestCase(TestCase):
+    databases = ["default", "readonly"]
+
+    def setUp(self):
+        self.we_vote_settings_manager = WeVoteSettingsManager()
+        self.we_vote_settings_manager.save_setting('batch_process_system_ballot_items_on', True)
+        self.we_vote_settings_snapshot = WeVoteSettingsSnapshot(refresh_seconds=60)
+
+    def test_snapshot_reads_from_memory_until_the_version_moves(self):
+        results = self.we_vote_settings_snapshot.retrieve_we_vote_setting('batch_process_system_ballot_items_on')
+        self.assertTrue(results['snapshot_used'])
+        self.assertTrue(results['we_vote_setting'].boolean_value)
+        with self.assertNumQueries(0):
+            results = self.we_vote_settings_snapshot.retrieve_we_vote_setting('batch_process_system_ballot_items_on')
+            self.assertTrue(results['we_vote_setting_found'])
+            results = self.we_vote_settings_snapshot.retrieve_we_vote_setting('never_saved_setting')
+            self.assertTrue(results['snapshot_used'])
+            self.assertFalse(results['we_vote_setting_found'])
+
+        version = fetch_we_vote_settings_version()
+        self.we_vote_settings_manager.save_setting('batch_process_system_ballot_items_on', False)
+        self.assertEqual(fetch_we_vote_settings_version(), version + 1)
+        results = self.we_vote_settings_snapshot.retrieve_we_vote_setting('batch_process_system_ballot_items_on')
+        self.assertTrue(results['we_vote_setting'].boolean_value, 'Not checked again until refresh_seconds pass')
+
+        self.we_vote_settings_snapshot.version_checked_time = 0
+        results = self.we_vote_settings_snapshot.retrieve_we_vote_setting('batch_process_system_ballot_items_on')
+        self.assertFalse(results['we_vote_setting'].boolean_value)
+
+    def test_write_through_and_settings_the_snapshot_leaves_to_the_database(self):
+        self.we_vote_settings_snapshot.retrieve_we_vote_setting('batch_process_system_ballot_items_on')
+        self.we_vote_settings_snapshot.save_we_vote_setting(
+            WeVoteSetting(name='batch_process_system_ballot_items_on', value_type=WeVoteSetting.BOOLEAN,
+                          boolean_value=False))
+        results = self.we_vote_settings_snapshot.retrieve_we_vote_setting('batch_process_system_ballot_items_on')
+        self.assertFalse(results['we_vote_setting'].boolean_value)
+
+        self.we_vote_settings_manager.save_setting('we_vote_id_last_org_integer', 10)
+        results = self.we_vote_settings_snapshot.retrieve_we_vote_setting('we_vote_id_last_org_integer')
+        self.assertFalse(results['snapshot_used'])
+
+        WeVoteSetting.objects.create(name='saved_twice', value_type=WeVoteSetting.STRING, string_value='one')
+        WeVoteSetting.objects.create(name='saved_twice', value_type=WeVoteSetting.STRING, string_value='two')
+        self.we_vote_settings_snapshot.load_we_vote_settings()
+        results = self.we_vote_settings_snapshot.retrieve_we_vote_setting('saved_twice')
+        self.assertFalse(results['snapshot_used'])
+
+    def test_flags_are_created_the_first_time_they_are_fetched(self):
+        self.assertTrue(fetch_batch_process_system_on())
+        results = self.we_vote_settings_manager.fetch_setting_results('batch_process_system_on')
+        self.assertTrue(results['we_vote_setting_found'], results['status'])
+        self.assertTrue(results['setting_value'])
+
+
+@mock.patch('wevote_settings.models.WE_VOTE_ID_INTEGER_BLOCK_SIZE', 5)
+class WeVoteIdIntegerBlockTestCase(TransactionTestCase):
+    """ Not wrapped in a transaction, so blocks of integers are reserved the way they are outside of tests. """
+    databases = ["default", "readonly"]
+
+    def setUp(self):
+        we_vote_id_integer_blocks.clear()
+
+    def tearDown(self):
+        we_vote_id_integer_blocks.clear()
+
+    def fetch_last_integer(self):
+        return WeVoteSetting.objects.get(name='we_vote_id_last_test_integer').integer_value
+
+    def test_block_is_reserved_once_and_handed_out_from_memory(self):
+        self.assertEqual(fetch_next_we_vote_id_integer('we_vote_id_last_test_integer'), 1)
+        self.assertEqual(self.fetch_last_integer(), 5)
+        with self.assertNumQueries(0):
+            integer_list = [fetch_next_we_vote_id_integer('we_vote_id_last_test_integer') for i in range(4)]
+        self.assertEqual(integer_list, [2, 3, 4, 5])
+        self.assertEqual(fetch_next_we_vote_id_integer('we_vote_id_last_test_integer'), 6)
+        self.assertEqual(self.fetch_last_integer(), 10)
+
+    def test_preallocate_reserves_at_least_the_number_needed(self):
+        fetch_next_we_vote_id_integer('we_vote_id_last_test_integer')
+        preallocate_we_vote_id_integers('we_vote_id_last_test_integer', 12)
+        self.assertEqual(self.fetch_last_integer(), 17, 'Integers 2 through 5 are abandoned')
+        with self.assertNumQueries(0):
+            integer_list = [fetch_next_we_vote_id_integer('we_vote_id_last_test_integer') for i in range(12)]
+        self.assertEqual(integer_list, list(range(6, 18)))
+
+        preallocate_we_vote_id_integers('we_vote_id_last_test_integer', 2)
+        self.assertEqual(self.fetch_last_integer(), 22, 'Never fewer than WE_VOTE_ID_INTEGER_BLOCK_SIZE')
+
+    def test_no_block_is_kept_from_a_transaction_that_rolls_back(self):
+        fetch_next_we_vote_id_integer('we_vote_id_last_test_integer')
+        we_vote_id_integer_blocks.clear()
+        try:
+            with transaction.atomic():
+                preallocate_we_vote_id_integers('we_vote_id_last_test_integer', 10)
+                self.assertEqual(fetch_next_we_vote_id_integer('we_vote_id_last_test_integer'), 6)
+                raise ValueError('roll back')
+        except ValueError:
+            pass
+        self.assertEqual(self.fetch_last_integer(), 5)
+        self.assertEqual(we_vote_id_integer_blocks, {})
+        self.assertEqual(fetch_next_we_vote_id_integer('we_vote_id_last_test_integer'), 6)
+        self.assertEqual(self.fetch_last_integer(), 10)
+
+    def test_concurrent_reservations_never_overlap(self):
+        reserve_we_vote_id_integer_range('we_vote_id_last_test_integer', 1)
+        reserved_range_list = []
+        reserved_range_list_lock = threading.Lock()
+
+        def reserve_ranges():
+            try:
+                for i in range(10):
+                    reserved_range = reserve_we_vote_id_integer_range('we_vote_id_last_test_integer', 3)
+                    with reserved_range_list_lock:
+                        reserved_range_list.append(reserved_range)
+            finally:
+                connection.close()
+
+        thread_list = [threading.Thread(target=reserve_ranges) for i in range(4)]
+        for one_thread in thread_list:
+            one_thread.start()
+        for one_thread in thread_list:
+            one_thread.join()
+
+        integer_list = sorted(one_integer for reserved_range in reserved_range_list for one_integer in reserved_range)
+        self.assertEqual(integer_list, list(range(2, 122)))
+        self.assertEqual(self.fetch_last_integer(), 121)